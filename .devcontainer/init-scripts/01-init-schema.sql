@@ -1,36 +1,155 @@
 -- Initialize the bsky database schema
 USE bsky_db;
 
--- Posts table with MariaDB optimizations
+-- Posts table with MariaDB optimizations, RANGE partitioned on saved_at.
+-- maintain_partitions.py splits dated partitions off p_future ahead of time
+-- and drops whole partitions for retention. Partitioning rules out FULLTEXT
+-- and needs saved_at in the primary key. The author's DID and handle live
+-- in authors (join on author_id).
 CREATE TABLE IF NOT EXISTS posts (
-    id BIGINT AUTO_INCREMENT PRIMARY KEY,
-    author_did VARCHAR(255) NOT NULL,
-    author_handle VARCHAR(255),
+    id BIGINT AUTO_INCREMENT,
+    author_id INT NOT NULL,
     text TEXT,
     created_at TIMESTAMP NULL,
     language VARCHAR(10),
     post_uri VARCHAR(500),
-    raw_data LONGTEXT,
-    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    raw_data LONGTEXT,  -- legacy JSON, see migrate_raw_data.py
+    raw_record MEDIUMBLOB,  -- zstd compressed DAG-CBOR, see ingest/codec.py
+    raw_segment INT,  -- or a reference into the segment files (bsky.py --raw-store segments)
+    raw_offset BIGINT,
+    raw_length INT,
+    saved_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     
-    INDEX idx_author_did (author_did),
-    INDEX idx_author_handle (author_handle),
+    PRIMARY KEY (id, saved_at),
+    INDEX idx_author_id (author_id),
     INDEX idx_created_at (created_at),
     INDEX idx_saved_at (saved_at),
     INDEX idx_language (language),
-    FULLTEXT INDEX idx_text_fulltext (text)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    INDEX idx_raw_segment (raw_segment)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE (UNIX_TIMESTAMP(saved_at)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
 
--- DID cache table
-CREATE TABLE IF NOT EXISTS did_cache (
-    did VARCHAR(255) PRIMARY KEY,
+-- One row per account (ingest/authors.py): the DID, its resolved handle and
+-- the resolution state. Posts reference it by author_id, so a resolved or
+-- changed handle is a single-row update. No foreign key: posts is partitioned
+-- next_retry_at is when an unresolved author is due for another resolution
+-- attempt (NULL: never), resolution_error why the last one failed
+-- (ingest/retry_schedule.py). did is binary-collated: DIDs are case-sensitive
+CREATE TABLE IF NOT EXISTS authors (
+    author_id INT AUTO_INCREMENT PRIMARY KEY,
+    did VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
     handle VARCHAR(255),
-    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    failed_attempts INT DEFAULT 0,
+    first_seen TIMESTAMP NULL DEFAULT NULL,
+    last_seen TIMESTAMP NULL DEFAULT NULL,
+    resolved_at TIMESTAMP NULL DEFAULT NULL,
+    failed_attempts INT NOT NULL DEFAULT 0,
+    resolution_error VARCHAR(32) NULL DEFAULT NULL,
+    next_retry_at TIMESTAMP NULL DEFAULT NULL,
     
+    UNIQUE KEY uk_did (did),
     INDEX idx_handle (handle),
+    INDEX idx_first_seen (first_seen),
+    INDEX idx_last_seen (last_seen),
     INDEX idx_resolved_at (resolved_at),
-    INDEX idx_failed_attempts (failed_attempts)
+    INDEX idx_next_retry_at (next_retry_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- One row per post URI the ingester has seen (ingest/dedupe.py): the unique
+-- key posts cannot have while partitioned on saved_at. post_id is the live
+-- post, deleted = 1 a tombstone that keeps replayed creates out. Binary
+-- collation: rkeys that differ only in case are different posts
+CREATE TABLE IF NOT EXISTS post_uris (
+    post_uri VARCHAR(500) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL PRIMARY KEY,
+    post_id BIGINT NULL,
+    deleted TINYINT(1) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    
+    INDEX idx_updated_at (updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Per-minute post counts, upserted by the ingester (ingest/rollups.py);
+-- the dashboard reads these instead of scanning posts
+CREATE TABLE IF NOT EXISTS post_rollup_language (
+    bucket DATETIME NOT NULL,
+    language VARCHAR(10) NOT NULL DEFAULT '',
+    posts INT NOT NULL DEFAULT 0,
+    
+    PRIMARY KEY (bucket, language)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS post_rollup_author (
+    bucket DATETIME NOT NULL,
+    author_id INT NOT NULL,
+    posts INT NOT NULL DEFAULT 0,
+    
+    PRIMARY KEY (bucket, author_id),
+    INDEX idx_author_bucket (author_id, bucket)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Optional per-collection record tables (bsky.py --collections), see ingest/routing.py
+CREATE TABLE IF NOT EXISTS likes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    author_did VARCHAR(255) NOT NULL,
+    record_uri VARCHAR(500),
+    subject VARCHAR(500),
+    created_at TIMESTAMP NULL,
+    raw_data LONGTEXT,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_author_did (author_did),
+    INDEX idx_subject (subject),
+    INDEX idx_saved_at (saved_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS reposts (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    author_did VARCHAR(255) NOT NULL,
+    record_uri VARCHAR(500),
+    subject VARCHAR(500),
+    created_at TIMESTAMP NULL,
+    raw_data LONGTEXT,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_author_did (author_did),
+    INDEX idx_subject (subject),
+    INDEX idx_saved_at (saved_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS follows (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    author_did VARCHAR(255) NOT NULL,
+    record_uri VARCHAR(500),
+    subject VARCHAR(500),
+    created_at TIMESTAMP NULL,
+    raw_data LONGTEXT,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_author_did (author_did),
+    INDEX idx_subject (subject),
+    INDEX idx_saved_at (saved_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS blocks (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    author_did VARCHAR(255) NOT NULL,
+    record_uri VARCHAR(500),
+    subject VARCHAR(500),
+    created_at TIMESTAMP NULL,
+    raw_data LONGTEXT,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_author_did (author_did),
+    INDEX idx_subject (subject),
+    INDEX idx_saved_at (saved_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Firehose cursor: last seq whose posts are all committed (resume point)
+CREATE TABLE IF NOT EXISTS ingest_cursor (
+    name VARCHAR(64) PRIMARY KEY,
+    seq BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Create user with proper permissions
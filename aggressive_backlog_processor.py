@@ -4,44 +4,10 @@ Aggressive backlog processor to resolve unresolved DIDs
 This can be run separately to catch up on the backlog
 """
 import sqlite3
-import threading
-import queue
-import time
-from atproto import IdResolver
+from ingest.resolver import DidResolver
 
-def resolve_handle_from_did_sync(did):
-    """Synchronous DID resolution"""
-    try:
-        resolver = IdResolver()
-        did_doc = resolver.did.resolve(did)
-        
-        # Extract handle from the DID document
-        handle = None
-        if did_doc and hasattr(did_doc, 'also_known_as') and did_doc.also_known_as:
-            for aka in did_doc.also_known_as:
-                if aka.startswith('at://'):
-                    handle = aka[5:]  # Remove 'at://' prefix
-                    break
-        
-        # If no handle found in also_known_as, try service endpoints
-        if not handle and did_doc and hasattr(did_doc, 'service') and did_doc.service:
-            for service in did_doc.service:
-                if hasattr(service, 'service_endpoint') and isinstance(service.service_endpoint, str):
-                    if service.service_endpoint.startswith('https://'):
-                        endpoint = service.service_endpoint
-                        if '.bsky.social' in endpoint:
-                            parts = endpoint.split('/')
-                            if len(parts) > 2:
-                                potential_handle = parts[2].split('.')[0]
-                                if potential_handle and not potential_handle.startswith('did:'):
-                                    handle = potential_handle + '.bsky.social'
-                                    break
-        
-        return handle
-        
-    except Exception as e:
-        print(f"Failed to resolve handle for {did}: {e}")
-        return None
+MAX_IN_FLIGHT = 32  # More aggressive processing
+RESOLVE_BATCH_SIZE = 100
 
 def cache_handle(did, handle):
     """Cache the DID to handle mapping"""
@@ -96,27 +62,6 @@ def get_unresolved_dids(limit=100):
     conn.close()
     return result
 
-def backlog_worker(work_queue, results_queue):
-    """Worker thread for processing backlog"""
-    worker_id = threading.current_thread().ident
-    
-    while True:
-        try:
-            did = work_queue.get(timeout=1)
-            if did is None:  # Shutdown signal
-                break
-                
-            print(f"Worker {worker_id} resolving {did}")
-            handle = resolve_handle_from_did_sync(did)
-            results_queue.put((did, handle))
-            work_queue.task_done()
-            
-        except queue.Empty:
-            continue
-        except Exception as e:
-            print(f"Worker {worker_id} error: {e}")
-            work_queue.task_done()
-
 def main():
     print("Aggressive Backlog Processor")
     print("=" * 40)
@@ -129,34 +74,19 @@ def main():
         print("No unresolved DIDs found!")
         return
     
-    # Create queues
-    work_queue = queue.Queue()
-    results_queue = queue.Queue()
-    
-    # Start worker threads
-    num_workers = 15  # More aggressive processing
-    workers = []
-    for i in range(num_workers):
-        worker = threading.Thread(target=backlog_worker, args=(work_queue, results_queue), daemon=True)
-        worker.start()
-        workers.append(worker)
-    
-    print(f"Started {num_workers} worker threads")
-    
-    # Queue work
-    for did, post_count in unresolved_dids:
-        work_queue.put(did)
-    
-    print(f"Queued {len(unresolved_dids)} DIDs for processing")
+    # One pooled resolver; each batch is resolved concurrently over its connections
+    resolver = DidResolver(max_in_flight=MAX_IN_FLIGHT)
+    print(f"Resolving with up to {MAX_IN_FLIGHT} concurrent requests")
     
-    # Process results as they come in
+    # Process results batch by batch
     processed = 0
     successful = 0
     failed = 0
     
-    while processed < len(unresolved_dids):
-        try:
-            did, handle = results_queue.get(timeout=30)
+    dids = [did for did, post_count in unresolved_dids]
+    for start in range(0, len(dids), RESOLVE_BATCH_SIZE):
+        handles = resolver.resolve_many(dids[start:start + RESOLVE_BATCH_SIZE])
+        for did, handle in handles.items():
             processed += 1
             
             if handle:
@@ -171,16 +101,8 @@ def main():
                 mark_resolution_failed(did)
                 failed += 1
                 print(f"✗ Failed to resolve {did} [{processed}/{len(unresolved_dids)}]")
-                
-        except queue.Empty:
-            print("Timeout waiting for results, continuing...")
-            break
     
-    # Shutdown workers
-    for _ in workers:
-        work_queue.put(None)
-    for worker in workers:
-        worker.join(timeout=5)
+    resolver.close()
     
     print(f"\nCompleted! Processed: {processed}, Successful: {successful}, Failed: {failed}")
 
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark selective CAR block extraction against CAR.from_bytes.
+
+Takes the #commit frames of a record_firehose.py recording, keeps the
+blocks of the ops decode_commit would route (post creates/updates by
+default), and times looking those blocks up through a full
+CAR.from_bytes parse versus ingest.car_reader.extract_blocks. Frame
+parsing is done up front and not timed. Also checks that both return the
+same records.
+
+    python benchmarks/car_extract.py sample.frames.zst
+    python benchmarks/car_extract.py sample.frames.zst --collections app.bsky.feed.like --rounds 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from atproto import CAR
+from atproto_firehose import parse_subscribe_repos_message
+from atproto_subscription.frames import Frame, MessageFrame
+
+from ingest.car_reader import extract_blocks, iter_sections
+from ingest.routing import POST_COLLECTION, build_routes, collection_of
+from replay_firehose import read_recording
+
+
+def load_commits(path, routes, limit):
+    """(CAR bytes, routed op CIDs) for every commit with at least one routed op"""
+    commits = []
+    for _, data in read_recording(path):
+        if limit and len(commits) >= limit:
+            break
+        frame = Frame.from_bytes(data)
+        if not isinstance(frame, MessageFrame) or frame.type != '#commit':
+            continue
+        commit = parse_subscribe_repos_message(frame)
+        cids = [op.cid for op in commit.ops
+                if op.cid and collection_of(op.path) in routes
+                and (op.action == 'create' or (op.action == 'update' and collection_of(op.path) == POST_COLLECTION))]
+        if cids:
+            commits.append((commit.blocks, cids))
+    return commits
+
+
+def full_parse(commits):
+    found = []
+    for blocks, cids in commits:
+        car = CAR.from_bytes(blocks)
+        found.append([car.blocks.get(cid) for cid in cids])
+    return found
+
+
+def selective(commits):
+    found = []
+    for blocks, cids in commits:
+        extracted = extract_blocks(blocks, cids)
+        found.append([extracted.get(cid) for cid in cids])
+    return found
+
+
+def measure(fn, commits, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = fn(commits)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CAR.from_bytes vs selective block extraction")
+    parser.add_argument('recording', help="file written by record_firehose.py")
+    parser.add_argument('--collections', default='',
+                        help="extra collections to route, as for bsky.py --collections")
+    parser.add_argument('--limit', type=int, default=0, help="use at most this many commits")
+    parser.add_argument('--rounds', type=int, default=3, help="best of this many runs per reader")
+    args = parser.parse_args()
+
+    routes = build_routes([c.strip() for c in args.collections.split(',') if c.strip()])
+    commits = load_commits(args.recording, routes, args.limit)
+    if not commits:
+        print("No commits with routed ops in the recording")
+        return
+    records = sum(len(cids) for _, cids in commits)
+    sections = sum(1 for blocks, _ in commits for _ in iter_sections(blocks))
+    car_bytes = sum(len(blocks) for blocks, _ in commits)
+
+    full_time, full_result = measure(full_parse, commits, args.rounds)
+    selective_time, selective_result = measure(selective, commits, args.rounds)
+    mismatches = sum(a != b for full, sel in zip(full_result, selective_result) for a, b in zip(full, sel))
+
+    print(f"{len(commits)} commits, {records} routed records out of {sections} blocks "
+          f"({car_bytes / len(commits):.0f} CAR bytes per commit)\n")
+    print(f"{'reader':<24}{'us/commit':>12}{'us/record':>12}{'commits/s':>12}")
+    for name, elapsed in [('CAR.from_bytes', full_time), ('extract_blocks', selective_time)]:
+        print(f"{name:<24}{elapsed / len(commits) * 1e6:>12.2f}{elapsed / records * 1e6:>12.2f}"
+              f"{len(commits) / elapsed:>12.0f}")
+    print(f"\nspeedup: {full_time / selective_time:.2f}x, {mismatches} mismatched records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark DID resolution throughput against a local mock PLC directory.
+
+Compares three ways of resolving the same set of DIDs:
+
+  per-call IdResolver   what bsky.py used to do: a new atproto IdResolver
+                        (new HTTP client, new connection) per DID, from
+                        --threads resolver threads
+  shared resolve()      ingest.resolver.DidResolver.resolve from the same
+                        threads, over one pooled client
+  resolve_many()        one DidResolver.resolve_many call per --batch DIDs
+
+and reports DIDs resolved per second for each. Starts
+benchmarks/mock_plc.py in-process unless --plc-url is given.
+
+    python benchmarks/did_resolver.py --dids 2000 --latency-ms 20
+    python benchmarks/did_resolver.py --plc-url http://127.0.0.1:2582 --in-flight 64
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from atproto import IdResolver
+
+from ingest.resolver import DidResolver, handle_from_did_doc
+from mock_plc import MockPlcDirectory
+
+
+def legacy_resolve(did, plc_url):
+    try:
+        return handle_from_did_doc(IdResolver(plc_url=plc_url).did.resolve(did))
+    except Exception:
+        return None
+
+
+def run_threads(resolve, dids, threads):
+    """Resolve dids from `threads` threads pulling from a shared list; returns {did: handle}"""
+    results = {}
+    position = iter(dids)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                did = next(position, None)
+            if did is None:
+                return
+            results[did] = resolve(did)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def measure(name, fn, dids):
+    # Resolvers print every failure; keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        results = fn(dids)
+        elapsed = time.perf_counter() - started
+    resolved = sum(1 for handle in results.values() if handle)
+    return name, resolved, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DID resolver throughput benchmark")
+    parser.add_argument('--dids', type=int, default=1000, help="distinct DIDs per run")
+    parser.add_argument('--threads', type=int, default=10, help="resolver threads (bsky.py --resolver-threads)")
+    parser.add_argument('--in-flight', type=int, default=32, help="DidResolver max_in_flight")
+    parser.add_argument('--batch', type=int, default=50, help="DIDs per resolve_many call")
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--plc-url', help="use this PLC directory instead of an in-process mock")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="mock PLC response latency")
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    directory = None
+    plc_url = args.plc_url
+    if plc_url is None:
+        directory = MockPlcDirectory(port=0, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                     error_rate=args.error_rate, seed=42).start()
+        plc_url = directory.url
+
+    def dids(run):
+        # Fresh DIDs per run so no layer can serve them from a cache
+        return [f"did:plc:bench{run}{i:019d}" for i in range(args.dids)]
+
+    shared = DidResolver(plc_url=plc_url, max_in_flight=args.in_flight, timeout=args.timeout)
+    batched = DidResolver(plc_url=plc_url, max_in_flight=args.in_flight, timeout=args.timeout)
+
+    def resolve_in_batches(run_dids):
+        results = {}
+        for start in range(0, len(run_dids), args.batch):
+            results.update(batched.resolve_many(run_dids[start:start + args.batch]))
+        return results
+
+    results = [
+        measure(f'per-call IdResolver x{args.threads}',
+                lambda d: run_threads(lambda did: legacy_resolve(did, plc_url), d, args.threads), dids(0)),
+        measure(f'shared resolve() x{args.threads}',
+                lambda d: run_threads(shared.resolve, d, args.threads), dids(1)),
+        measure(f'resolve_many({args.batch})', resolve_in_batches, dids(2)),
+    ]
+    shared.close()
+    batched.close()
+    if directory is not None:
+        directory.stop()
+
+    print(f"\n{args.dids} DIDs per run against {plc_url}"
+          + (f" ({args.latency_ms:g}ms +{args.jitter_ms:g}ms latency)" if directory else "")
+          + f", max {args.in_flight} in flight\n")
+    print(f"{'resolver':<28}{'resolved':>10}{'seconds':>10}{'DIDs/s':>10}")
+    baseline = results[0][2]
+    for name, resolved, elapsed in results:
+        print(f"{name:<28}{resolved:>10}{elapsed:>10.2f}{args.dids / elapsed:>10.0f}   {baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
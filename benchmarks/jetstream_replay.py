@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Jetstream stand-in and CPU comparison with the CBOR firehose.
+
+Converts a record_firehose.py / synthetic_firehose.py recording into the
+JSON events Jetstream would send (one per op, record decoded, time_us
+cursor). By default it then compares CPU time per post for the two input
+paths bsky.py has:
+
+  firehose  - every CBOR frame, decoded with ingest.decode.decode_frame
+  jetstream - only the events a wantedCollections filter lets through
+              (routed collections plus identity/account events), decoded
+              with ingest.jetstream.decode_jetstream_event after json.loads
+
+and checks that both produce the same post rows. Websocket receive cost is
+not included for either side; bytes on the wire per post are reported.
+
+    python benchmarks/jetstream_replay.py sample.frames.zst
+    python benchmarks/jetstream_replay.py sample.frames.zst --serve 6008 --rate 2000
+    python bsky.py --source jetstream --jetstream-url ws://127.0.0.1:6008/subscribe
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import libipld
+from atproto_firehose import parse_subscribe_repos_message
+from atproto_subscription.frames import Frame, MessageFrame
+
+from ingest.car_reader import extract_blocks
+from ingest.cursor import parse_event_time
+from ingest.decode import decode_frame
+from ingest.jetstream import decode_jetstream_event
+from ingest.routing import build_routes
+from replay_firehose import read_recording
+
+
+def json_form(value):
+    """libipld data model -> Jetstream JSON ({"$link"} for CIDs, {"$bytes"} otherwise)"""
+    if isinstance(value, dict):
+        return {key: json_form(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_form(item) for item in value]
+    if isinstance(value, bytes):
+        try:
+            return {'$link': libipld.encode_cid(value)}
+        except Exception:
+            return {'$bytes': base64.b64encode(value).decode('ascii').rstrip('=')}
+    return value
+
+
+def frame_events(data):
+    """Jetstream events (without time_us) for one raw firehose frame"""
+    frame = Frame.from_bytes(data)
+    if not isinstance(frame, MessageFrame):
+        return []
+    body = frame.body
+    if frame.type == '#commit':
+        commit = parse_subscribe_repos_message(frame)
+        blocks = extract_blocks(commit.blocks, [op.cid for op in commit.ops if op.cid])
+        events = []
+        for op in commit.ops:
+            collection, _, rkey = op.path.partition('/')
+            event_commit = {'rev': commit.rev, 'operation': op.action, 'collection': collection, 'rkey': rkey}
+            if op.action != 'delete' and op.cid:
+                event_commit['record'] = json_form(blocks.get(op.cid))
+                event_commit['cid'] = str(op.cid)
+            events.append({'did': commit.repo, 'kind': 'commit', 'commit': event_commit})
+        return events
+    if frame.type in ('#identity', '#handle'):
+        return [{'did': body.get('did'), 'kind': 'identity',
+                 'identity': {'did': body.get('did'), 'handle': body.get('handle'),
+                              'seq': body.get('seq'), 'time': body.get('time')}}]
+    if frame.type == '#account':
+        return [{'did': body.get('did'), 'kind': 'account',
+                 'account': {'did': body.get('did'), 'active': body.get('active'),
+                             'seq': body.get('seq'), 'time': body.get('time')}}]
+    return []
+
+
+def convert(path, limit=0):
+    """([raw frames], [(collection or None, time_us, JSON text)]) for a recording"""
+    frames, events = [], []
+    last_time_us = 0
+    for _, data in read_recording(path):
+        if limit and len(frames) >= limit:
+            break
+        frames.append(data)
+        frame = Frame.from_bytes(data)
+        event_dt = parse_event_time(frame.body.get('time')) if isinstance(frame, MessageFrame) else None
+        time_us = int(event_dt.timestamp() * 1e6) if event_dt else last_time_us
+        for event in frame_events(data):
+            # Jetstream cursors are unique and increasing
+            last_time_us = time_us = max(time_us, last_time_us + 1)
+            event['time_us'] = time_us
+            collection = event['commit']['collection'] if event['kind'] == 'commit' else None
+            events.append((collection, time_us, json.dumps(event)))
+    return frames, events
+
+
+def wanted(events, collections):
+    """What a server honouring wantedCollections sends"""
+    return [text for collection, _, text in events if collection is None or collection in collections]
+
+
+def post_rows(results):
+    return sorted((post['post_uri'], post['text'], post['created_at'], post['language'], post['action'],
+                   post['raw_record']) for result in results if result for post in result['posts'])
+
+
+def measure(decode, items, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.process_time()
+        results = [decode(item) for item in items]
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def compare(frames, events, routes, rounds):
+    messages = wanted(events, routes)
+    firehose_time, firehose_results = measure(lambda data: decode_frame(data, routes), frames, rounds)
+    jetstream_time, jetstream_results = measure(
+        lambda text: decode_jetstream_event(json.loads(text), routes), messages, rounds)
+
+    firehose_posts, jetstream_posts = post_rows(firehose_results), post_rows(jetstream_results)
+    posts = len(firehose_posts)
+    if not posts:
+        print("No posts in the recording")
+        return
+    print(f"{len(frames)} firehose frames, {len(events)} Jetstream events of which {len(messages)} pass "
+          f"wantedCollections={','.join(sorted(routes))}; {posts} posts\n")
+    print(f"{'input':<12}{'messages':>10}{'bytes/post':>12}{'CPU us/post':>14}{'posts/CPU s':>14}")
+    for name, count, size, elapsed in [
+        ('firehose', len(frames), sum(len(data) for data in frames), firehose_time),
+        ('jetstream', len(messages), sum(len(text.encode('utf-8')) for text in messages), jetstream_time),
+    ]:
+        print(f"{name:<12}{count:>10}{size / posts:>12.0f}{elapsed / posts * 1e6:>14.1f}{posts / elapsed:>14.0f}")
+    print(f"\njetstream uses {jetstream_time / firehose_time * 100:.0f}% of the firehose CPU per post; "
+          f"post rows {'identical' if firehose_posts == jetstream_posts else 'DIFFER'}")
+
+
+def serve(events, port, rate):
+    """Serve events like a Jetstream /subscribe endpoint (wantedCollections, cursor)"""
+    from websockets.exceptions import ConnectionClosed
+    from websockets.sync.server import serve as websocket_serve
+
+    def handler(websocket):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(websocket.request.path).query)
+        collections = set(query.get('wantedCollections', []))
+        cursor = int(query['cursor'][0]) if 'cursor' in query else 0
+        print(f"Client connected: {websocket.request.path}")
+        sent = 0
+        started = time.perf_counter()
+        try:
+            for collection, time_us, text in events:
+                if time_us <= cursor or (collections and collection is not None and collection not in collections):
+                    continue
+                if rate > 0:
+                    delay = started + sent / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                websocket.send(text)
+                sent += 1
+            print(f"Sent {sent} events, end of recording; holding the connection open")
+            for _ in websocket:  # like a live server with nothing new, until the client leaves
+                pass
+        except ConnectionClosed:
+            print(f"Client disconnected after {sent} events")
+
+    with websocket_serve(handler, '127.0.0.1', port, max_size=None) as server:
+        print(f"Serving Jetstream events on ws://127.0.0.1:{port}/subscribe")
+        server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jetstream replay server and CPU comparison")
+    parser.add_argument('recording', help="file written by record_firehose.py or synthetic_firehose.py")
+    parser.add_argument('--collections', default='',
+                        help="extra collections to route, as for bsky.py --collections")
+    parser.add_argument('--limit', type=int, default=0, help="use at most this many frames")
+    parser.add_argument('--rounds', type=int, default=3, help="best of this many runs per input")
+    parser.add_argument('--serve', type=int, metavar='PORT', help="serve the events instead of comparing")
+    parser.add_argument('--rate', type=float, default=0, help="events/s when serving (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    routes = build_routes([c.strip() for c in args.collections.split(',') if c.strip()])
+    frames, events = convert(args.recording, args.limit)
+    if args.serve is not None:
+        serve(events, args.serve, args.rate)
+    else:
+        compare(frames, events, routes, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
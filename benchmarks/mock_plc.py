@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Local mock of the PLC DID directory for offline load tests.
+
+Answers GET /<did> with a minimal DID document whose handle is derived from
+the DID itself, so any DID the synthetic firehose emits resolves
+consistently. Latency and failure behaviour are configurable:
+
+    --latency-ms / --jitter-ms  response delay (uniform jitter on top)
+    --error-rate                share of requests answered with HTTP 500
+    --not-found-rate            share of DIDs that are permanently unknown (404)
+
+Point bsky.py at it with --plc-url http://127.0.0.1:2582.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def handle_for_did(did):
+    return f"{did.rsplit(':', 1)[-1]}.synthetic.test"
+
+
+def did_document(did):
+    return {
+        '@context': ['https://www.w3.org/ns/did/v1'],
+        'id': did,
+        'alsoKnownAs': [f"at://{handle_for_did(did)}"],
+        'verificationMethod': [],
+        'service': [{
+            'id': '#atproto_pds',
+            'type': 'AtprotoPersonalDataServer',
+            'serviceEndpoint': 'https://pds.synthetic.test',
+        }],
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    # Room for a resolver opening its whole connection pool at once
+    request_queue_size = 256
+
+
+class MockPlcDirectory:
+    """Threaded HTTP server answering DID document lookups"""
+
+    def __init__(self, host='127.0.0.1', port=2582, latency_ms=20.0, jitter_ms=10.0,
+                 error_rate=0.0, not_found_rate=0.0, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'not_found': 0}
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _is_unknown(self, did):
+        # Stable per DID, so the same DID always 404s
+        digest = hashlib.sha256(did.encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], 'big') / 2 ** 32 < self.not_found_rate
+
+    def _handler_class(self):
+        directory = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real directory
+
+            def do_GET(self):
+                did = self.path.lstrip('/')
+                with directory._lock:
+                    delay = directory.latency + directory.random.random() * directory.jitter
+                    fail = directory.random.random() < directory.error_rate
+                    directory.stats['requests'] += 1
+                time.sleep(delay)
+
+                if fail:
+                    status, body, counter = 500, b'{"message": "mock failure"}', 'errors'
+                elif not did.startswith('did:plc:') or directory._is_unknown(did):
+                    status, body, counter = 404, b'{"message": "DID not registered"}', 'not_found'
+                else:
+                    status, body, counter = 200, json.dumps(did_document(did)).encode('utf-8'), 'ok'
+                with directory._lock:
+                    directory.stats[counter] += 1
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mock-plc', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock PLC DID directory")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2582)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--not-found-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    directory = MockPlcDirectory(args.host, args.port, args.latency_ms, args.jitter_ms,
+                                 args.error_rate, args.not_found_rate).start()
+    print(f"Mock PLC directory on {directory.url} "
+          f"({args.latency_ms:g}ms +{args.jitter_ms:g}ms, {args.error_rate:.0%} errors, "
+          f"{args.not_found_rate:.0%} unknown DIDs)")
+    try:
+        while True:
+            time.sleep(30)
+            print(f"  {directory.stats}")
+    except KeyboardInterrupt:
+        directory.stop()
+
+
+if __name__ == "__main__":
+    main()
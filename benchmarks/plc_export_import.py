@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark and check the PLC export importer (import_plc_export.py).
+
+Generates a synthetic export (--dids accounts with handle changes, legacy
+create operations, tombstones and nullified forks, sorted by createdAt),
+then:
+
+  - folds it without writing, unbounded and with --max-pending, and reports
+    the peak Python memory of each (tracemalloc)
+  - imports it into the SQLite stand-in and checks every authors row
+    against the expected latest state per DID
+  - imports a second, newer export page with --incremental semantics and
+    checks that only the new operations were applied
+
+With --recording, the export also covers the post authors of a
+record_firehose.py recording (minus --missing of them, standing in for
+accounts created after the snapshot) and the share of authors that
+resolve from authors is reported. --export imports a real export file
+instead of a synthetic one (no correctness checks).
+
+    python benchmarks/plc_export_import.py --dids 200000
+    python benchmarks/plc_export_import.py --export plc-export.jsonl.zst --recording sample.frames.zst
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zstandard
+from atproto_subscription.frames import Frame, MessageFrame
+
+from ingest.cursor import load_cursor
+from ingest.plc_export import PLC_CURSOR_NAME, PlcExportImporter
+from replay_firehose import read_recording
+from sqlite_standin import SQLitePool
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+SNAPSHOT_DAYS = 600
+
+
+def recording_authors(path):
+    authors = set()
+    for _, data in read_recording(path):
+        frame = Frame.from_bytes(data)
+        if isinstance(frame, MessageFrame) and frame.type == '#commit':
+            repo = frame.body.get('repo')
+            if repo:
+                authors.add(repo)
+    return sorted(authors)
+
+
+def created_at(offset_seconds):
+    return (EPOCH + timedelta(seconds=offset_seconds)).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def operation(rng, did, handle, legacy=False):
+    if legacy:
+        return {'type': 'create', 'handle': handle, 'service': 'https://bsky.social',
+                'signingKey': 'did:key:z' + did[8:], 'recoveryKey': 'did:key:z' + did[8:], 'prev': None,
+                'sig': 'x' * 86}
+    return {'type': 'plc_operation', 'alsoKnownAs': [f'at://{handle}'] if handle else [],
+            'services': {'atproto_pds': {'type': 'AtprotoPersonalDataServer',
+                                         'endpoint': f'https://pds{rng.randrange(100)}.example'}},
+            'rotationKeys': ['did:key:z' + did[8:]], 'verificationMethods': {'atproto': 'did:key:z' + did[8:]},
+            'prev': None, 'sig': 'x' * 86}
+
+
+def synthetic_ops(rng, dids, start, end, active=()):
+    """[(createdAt seconds, entry)] for accounts in dids, plus {did: (handle, resolution_error)} expected.
+
+    DIDs in `active` are posting, so never tombstoned or without a handle.
+    """
+    ops = []
+    expected = {}
+    for did in dids:
+        t = rng.uniform(start, end)
+        handle = f'user{rng.randrange(10**9)}.bsky.social'
+        ops.append((t, {'did': did, 'operation': operation(rng, did, handle, legacy=rng.random() < 0.1)}))
+        state = (handle, None)
+        roll = rng.random()
+        if roll < 0.3:
+            # Handle changes, sometimes with a nullified fork in between
+            for _ in range(rng.randint(1, 3)):
+                t = rng.uniform(t, end)
+                if rng.random() < 0.1:
+                    ops.append((t, {'did': did, 'nullified': True,
+                                    'operation': operation(rng, did, f'fork{rng.randrange(10**9)}.example')}))
+                    t = rng.uniform(t, end)
+                handle = f'{rng.choice(["new", "custom", "moved"])}{rng.randrange(10**9)}.example.com'
+                ops.append((t, {'did': did, 'operation': operation(rng, did, handle)}))
+                state = (handle, None)
+        elif did in active:
+            pass
+        elif roll < 0.32:
+            ops.append((rng.uniform(t, end), {'did': did, 'operation': {'type': 'plc_tombstone', 'prev': None}}))
+            state = (None, 'tombstoned')
+        elif roll < 0.33:
+            ops.append((rng.uniform(t, end), {'did': did, 'operation': operation(rng, did, None)}))
+            state = (None, 'no_handle')
+        expected[did] = state
+    return ops, expected
+
+
+def write_export(path, ops):
+    ops.sort(key=lambda op: op[0])
+    with open(path, 'wb') as f:
+        writer = zstandard.ZstdCompressor(level=3).stream_writer(f)
+        for t, entry in ops:
+            entry.setdefault('nullified', False)
+            entry['cid'] = 'bafyrei' + 'a' * 52
+            entry['createdAt'] = created_at(t)
+            writer.write(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n')
+        writer.close()
+
+
+def fold_peak_mb(path, max_pending):
+    importer = PlcExportImporter(None, max_pending=max_pending, dry_run=True)
+    tracemalloc.start()
+    importer.import_file(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1048576
+
+
+def timed_import(pool, path, max_pending, since=None):
+    importer = PlcExportImporter(pool, since=since, max_pending=max_pending)
+    started = time.perf_counter()
+    importer.import_file(path)
+    importer.flush()
+    return importer.stats(), time.perf_counter() - started
+
+
+def mismatches(pool, expected):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT did, handle, resolution_error FROM authors')
+        actual = {did: (handle, error) for did, handle, error in cursor.fetchall()}
+    return sum(actual.get(did) != state for did, state in expected.items())
+
+
+def report(name, stats, elapsed):
+    print(f"{name:<14}{stats['lines']:>10}{stats['operations']:>12}{stats['older_skipped']:>10}"
+          f"{stats['rows_loaded']:>10}{stats['flushes']:>9}{elapsed:>9.1f}{stats['lines'] / elapsed:>11.0f}")
+
+
+def coverage(pool, authors):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT did FROM authors WHERE handle IS NOT NULL')
+        cached = {row[0] for row in cursor.fetchall()}
+    hits = sum(author in cached for author in authors)
+    print(f"\n{hits}/{len(authors)} recording authors ({hits / len(authors) * 100:.1f}%) resolve from authors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PLC export importer benchmark")
+    parser.add_argument('--dids', type=int, default=100000, help="synthetic accounts")
+    parser.add_argument('--new-dids', type=int, default=5000, help="accounts in the incremental page")
+    parser.add_argument('--max-pending', type=int, default=20000, help="importer max_pending")
+    parser.add_argument('--export', help="import this export file instead of a synthetic one")
+    parser.add_argument('--recording', help="report handle coverage of this recording's authors")
+    parser.add_argument('--missing', type=float, default=0.03,
+                        help="share of recording authors left out of the synthetic export")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    authors = recording_authors(args.recording) if args.recording else []
+    workdir = tempfile.mkdtemp(prefix='plc-export-')
+    pool = SQLitePool(os.path.join(workdir, 'bench.db'))
+    print(f"{'import':<14}{'lines':>10}{'applied':>12}{'skipped':>10}{'DIDs':>10}{'loads':>9}{'seconds':>9}{'lines/s':>11}")
+
+    if args.export:
+        stats, elapsed = timed_import(pool, args.export, args.max_pending)
+        report('full', stats, elapsed)
+        if authors:
+            coverage(pool, authors)
+        return
+
+    dids = [f'did:plc:{rng.getrandbits(96):024x}' for _ in range(args.dids)]
+    dids += [author for author in authors if author.startswith('did:') and rng.random() >= args.missing]
+    snapshot = SNAPSHOT_DAYS * 86400
+    ops, expected = synthetic_ops(rng, dids, 0, snapshot, active=set(authors))
+    full_path = os.path.join(workdir, 'export.jsonl.zst')
+    write_export(full_path, ops)
+
+    unbounded_mb = fold_peak_mb(full_path, len(dids) + 1)
+    bounded_mb = fold_peak_mb(full_path, args.max_pending)
+    stats, elapsed = timed_import(pool, full_path, args.max_pending)
+    report('full', stats, elapsed)
+    full_mismatches = mismatches(pool, expected)
+
+    # Newer page: new accounts plus changes to existing ones, after the snapshot
+    new_dids = [f'did:plc:new{i:021d}' for i in range(args.new_dids)]
+    page, page_expected = synthetic_ops(rng, new_dids, snapshot, snapshot + 86400)
+    for did in rng.sample(dids, min(len(dids), args.new_dids)):
+        handle = f'renamed{rng.randrange(10**9)}.example.com'
+        page.append((rng.uniform(snapshot, snapshot + 86400), {'did': did, 'operation': operation(rng, did, handle)}))
+        page_expected[did] = (handle, None)
+    # The page overlaps the snapshot by its last operations, like re-downloading from an older cursor
+    overlap = sorted(ops, key=lambda op: op[0])[-1000:]
+    page_path = os.path.join(workdir, 'page.jsonl.zst')
+    write_export(page_path, [(t, dict(entry)) for t, entry in overlap] + page)
+    expected.update(page_expected)
+
+    stats, elapsed = timed_import(pool, page_path, args.max_pending, since=load_cursor(pool, PLC_CURSOR_NAME))
+    report('incremental', stats, elapsed)
+    incremental_mismatches = mismatches(pool, expected)
+
+    print(f"\nfold peak memory: {unbounded_mb:.1f} MB unbounded, {bounded_mb:.1f} MB "
+          f"with max_pending={args.max_pending}")
+    print(f"authors mismatches: {full_mismatches} after full import, "
+          f"{incremental_mismatches} after incremental ({len(expected)} DIDs)")
+    if authors:
+        coverage(pool, authors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark storage formats for posts' raw records.
+
+Compares the legacy JSON raw_data (json.dumps with JSONExtra) with the
+ingest.codec blobs: DAG-CBOR, zstd and zstd with a trained dictionary.
+Reports bytes per post and encode/decode cost per post. Uses synthetic
+posts by default, or recent rows from MariaDB with --from-db.
+
+    python benchmarks/raw_record_codec.py --posts 20000
+    python benchmarks/raw_record_codec.py --from-db 50000 --save-dict .
+
+--save-dict writes raw_record.<dict_id>.dict into the given directory and
+refuses to replace an existing file: readers pick dictionaries by the id in
+each record, so a file must never change once records use it. Point
+RAW_RECORD_DICT at the new file to compress new records with it.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import libipld
+
+from ingest.codec import RecordCodec, save_dictionary, train_dictionary
+from ingest.decode import JSONExtra
+
+WORDS = ("the a to and of is in it you that for on this with just be are my not so have "
+         "but me what like all at your from was they out one about today people new good "
+         "time know love can really think now get we will more day want see make bluesky").split()
+LANGS = ['en'] * 6 + ['ja', 'pt', 'de', 'es', 'fr', 'ko']
+
+
+def fake_cid(rng):
+    return bytes([1, 0x71, 0x12, 0x20]) + rng.randbytes(32)
+
+
+def synthetic_post(rng):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 50)))
+    record = {
+        '$type': 'app.bsky.feed.post',
+        'text': text,
+        'langs': [rng.choice(LANGS)],
+        'createdAt': f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T1{rng.randint(0, 9)}:"
+                     f"{rng.randint(10, 59)}:{rng.randint(10, 59)}.{rng.randint(100, 999)}Z",
+    }
+    if rng.random() < 0.4:
+        ref = {'uri': f"at://did:plc:{rng.randbytes(12).hex()[:24]}/app.bsky.feed.post/3k{rng.randbytes(6).hex()}",
+               'cid': libipld.encode_cid(fake_cid(rng))}
+        record['reply'] = {'root': ref, 'parent': ref}
+    if rng.random() < 0.2:
+        record['embed'] = {
+            '$type': 'app.bsky.embed.images',
+            'images': [{
+                'alt': '',
+                'image': {'$type': 'blob', 'ref': fake_cid(rng), 'mimeType': 'image/jpeg',
+                          'size': rng.randint(10000, 900000)},
+                'aspectRatio': {'width': 1000, 'height': rng.randint(500, 1500)},
+            }],
+        }
+    return record
+
+
+def records_from_db(limit):
+    import mysql.connector
+    from ingest.codec import decode_record
+    conn = mysql.connector.connect(host='mariadb', database='bsky_db', user='bsky_user',
+                                   password='bsky_password', port=3306)
+    cursor = conn.cursor()
+    cursor.execute('SELECT raw_record, raw_data FROM posts ORDER BY id DESC LIMIT %s', (limit,))
+    records = [decode_record(raw_record if raw_record is not None else raw_data)
+               for raw_record, raw_data in cursor.fetchall() if raw_record is not None or raw_data]
+    conn.close()
+    return records
+
+
+def measure(name, encode, decode, records):
+    started = time.perf_counter()
+    blobs = [encode(r) for r in records]
+    encode_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for blob in blobs:
+        decode(blob)
+    decode_time = time.perf_counter() - started
+    n = len(records)
+    total = sum(len(b) for b in blobs)
+    return name, total / n, encode_time / n * 1e6, decode_time / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw record codec benchmark")
+    parser.add_argument('--posts', type=int, default=20000, help="number of synthetic posts")
+    parser.add_argument('--from-db', type=int, default=0, help="use this many recent posts from MariaDB instead")
+    parser.add_argument('--train-fraction', type=float, default=0.2,
+                        help="share of the records used to train the dictionary")
+    parser.add_argument('--save-dict', metavar='DIR',
+                        help="write the trained dictionary to DIR/raw_record.<dict_id>.dict")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.from_db:
+        records = records_from_db(args.from_db)
+    else:
+        rng = random.Random(args.seed)
+        records = [synthetic_post(rng) for _ in range(args.posts)]
+
+    split = max(1, int(len(records) * args.train_fraction))
+    train, test = records[:split], records[split:] or records
+    dictionary = train_dictionary(libipld.encode_dag_cbor(r) for r in train)
+    if args.save_dict:
+        try:
+            path = save_dictionary(dictionary, args.save_dict)
+        except FileExistsError as e:
+            parser.error(f"not replacing existing dictionary {e.filename}")
+        print(f"Saved {len(dictionary.as_bytes())} byte dictionary to {path}")
+
+    plain, with_dict = RecordCodec(), RecordCodec(dictionary)
+    results = [
+        measure('json (legacy raw_data)', lambda r: json.dumps(r, cls=JSONExtra).encode('utf-8'),
+                lambda b: json.loads(b), test),
+        measure('dag-cbor', libipld.encode_dag_cbor, libipld.decode_dag_cbor, test),
+        measure('dag-cbor + zstd', plain.encode, plain.decode, test),
+        measure('dag-cbor + zstd + dict', with_dict.encode, with_dict.decode, test),
+    ]
+
+    print(f"\n{len(test)} posts ({len(train)} used for dictionary training)\n")
+    print(f"{'format':<26}{'bytes/post':>12}{'encode us':>12}{'decode us':>12}")
+    baseline = results[0][1]
+    for name, size, encode_us, decode_us in results:
+        print(f"{name:<26}{size:>12.1f}{encode_us:>12.2f}{decode_us:>12.2f}   {size / baseline * 100:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Record raw firehose frames to a compressed file for replay_firehose.py.
+
+    python benchmarks/record_firehose.py sample.frames.zst --duration 300
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest.decode_pipeline import RawFirehoseSubscribeReposClient
+from ingest.recording import FrameRecorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record raw firehose frames")
+    parser.add_argument('output', help="recording file to write (zstd compressed)")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to record")
+    parser.add_argument('--max-frames', type=int, default=0, help="stop after this many frames (0 = no limit)")
+    parser.add_argument('--cursor', type=int, help="start from this firehose seq instead of live")
+    args = parser.parse_args()
+
+    recorder = FrameRecorder(args.output)
+    client = RawFirehoseSubscribeReposClient({'cursor': args.cursor} if args.cursor is not None else None)
+
+    def on_frame(frame):
+        recorder.write(frame)
+        if args.max_frames and recorder.frames >= args.max_frames:
+            client.stop()
+
+    timer = threading.Timer(args.duration, client.stop)
+    timer.daemon = True
+    timer.start()
+    started = time.time()
+    try:
+        client.start(on_frame)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        timer.cancel()
+        recorder.close()
+
+    elapsed = time.time() - started
+    print(f"Recorded {recorder.frames} frames ({recorder.bytes / 1048576:.1f} MB raw, "
+          f"{os.path.getsize(args.output) / 1048576:.1f} MB on disk) in {elapsed:.0f}s "
+          f"({recorder.frames / elapsed:.0f} frames/s) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded firehose session through bsky.py's ingest path.
+
+Frames from a record_firehose.py recording are fed to
+bsky.on_message_handler at the recorded pace (--speed 1), N times faster
+(--speed N) or as fast as possible (--speed 0), with the batched writer
+running against MariaDB or a SQLite stand-in. Reports posts/sec, p50/p99
+handler latency per message, DB round trips per post and peak RSS.
+
+    python benchmarks/replay_firehose.py sample.frames.zst --db sqlite
+    python benchmarks/replay_firehose.py sample.frames.zst --db mariadb --speed 10
+
+DID resolution workers are off by default so runs stay offline; pass
+--resolver-threads to include them. --bulk-threshold N attaches the
+LOAD DATA bulk loader (0 puts every batch through it).
+"""
+import argparse
+import contextlib
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from atproto_subscription.frames import Frame, MessageFrame
+from ingest.bulk_load import BulkLoader
+
+import bsky
+from ingest.recording import read_recording
+from sqlite_standin import SQLitePool
+
+
+class _CountingCursor:
+    def __init__(self, cursor, pool):
+        self._cursor = cursor
+        self._pool = pool
+
+    def execute(self, *args, **kwargs):
+        self._pool.count()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._pool.count()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _CountingConnection:
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs), self._pool)
+
+    def commit(self):
+        self._pool.count()
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class CountingPool:
+    """Wraps a pool and counts statements and commits sent to the database"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.round_trips += 1
+
+    @contextmanager
+    def connection(self):
+        with self.pool.connection() as conn:
+            yield _CountingConnection(conn, self)
+
+    def stats(self):
+        return self.pool.stats()
+
+    def close_all(self):
+        self.pool.close_all()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def replay(args):
+    if args.db == 'sqlite':
+        path = args.sqlite_path or os.path.join(tempfile.mkdtemp(prefix='bsky-replay-'), 'replay.db')
+        backend = SQLitePool(path)
+    else:
+        backend = bsky.db_pool
+    pool = CountingPool(backend)
+    bsky.db_pool = pool
+    bsky.post_writer.pool = pool
+    bsky.identity_updater.pool = pool
+    bsky.rollups.pool = pool
+    bsky.author_directory.pool = pool
+    if args.bulk_threshold is not None:
+        bsky.post_writer.bulk = BulkLoader()
+        bsky.post_writer.bulk_threshold = args.bulk_threshold
+    os.makedirs('errors', exist_ok=True)
+
+    bsky.warm_handle_cache()
+    workers = bsky.start_resolution_workers(args.resolver_threads) if args.resolver_threads else []
+    bsky.post_writer.start()
+    bsky.identity_updater.start()
+    bsky.rollups.start()
+    bsky.author_directory.start()
+
+    latencies = []
+    frames = 0
+    handler_errors = 0
+    started = time.perf_counter()
+    for offset, data in read_recording(args.recording):
+        if args.limit and frames >= args.limit:
+            break
+        if args.speed > 0:
+            delay = started + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        frames += 1
+
+        frame = Frame.from_bytes(data)
+        if not isinstance(frame, MessageFrame):
+            continue
+        handler_started = time.perf_counter()
+        try:
+            bsky.on_message_handler(frame)
+        except Exception:
+            handler_errors += 1
+        latencies.append(time.perf_counter() - handler_started)
+
+    received = time.perf_counter()
+    bsky.post_writer.close()
+    bsky.identity_updater.stop()
+    bsky.rollups.stop()
+    bsky.author_directory.stop()
+    finished = time.perf_counter()
+
+    for _ in workers:
+        bsky.resolution_queue.put(None)
+    for worker in workers:
+        worker.join(timeout=5)
+    bsky.did_resolver.close()
+    writer_stats = bsky.post_writer.stats()
+    identity_stats = bsky.identity_updater.stats()
+    pool.close_all()
+
+    return {
+        'frames': frames,
+        'posts': bsky.posts_processed,
+        'rows_written': writer_stats['rows_written'],
+        'batches': writer_stats['batches'],
+        'handler_errors': handler_errors,
+        'receive_time': received - started,
+        'total_time': finished - started,
+        'latencies': sorted(latencies),
+        'round_trips': pool.round_trips,
+        'identity_updates': identity_stats['dids_updated'],
+        'network_handles': bsky.network_handles_cached,
+        'dedupe': bsky.post_dedupe.stats(),
+        'bulk': bsky.post_writer.bulk.stats() if bsky.post_writer.bulk is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded firehose frames through bsky.py")
+    parser.add_argument('recording', help="file written by record_firehose.py")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="1 = real time, N = N times faster, 0 = as fast as possible")
+    parser.add_argument('--db', choices=['sqlite', 'mariadb'], default='sqlite')
+    parser.add_argument('--sqlite-path', help="SQLite file (default: fresh temporary database)")
+    parser.add_argument('--limit', type=int, default=0, help="replay at most this many frames")
+    parser.add_argument('--resolver-threads', type=int, default=0)
+    parser.add_argument('--bulk-threshold', type=int,
+                        help="writer queue depth that switches to LOAD DATA batches (default: bulk load off)")
+    parser.add_argument('--verbose', action='store_true', help="keep bsky.py's per-post output")
+    args = parser.parse_args()
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with output:
+        result = replay(args)
+
+    latencies = result['latencies']
+    posts = result['posts']
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Replayed {result['frames']} frames ({posts} posts) against {args.db} "
+          f"at {'max' if args.speed <= 0 else f'{args.speed:g}x'} speed")
+    print(f"  throughput:   {posts / result['total_time']:.0f} posts/s "
+          f"({result['frames'] / result['receive_time']:.0f} frames/s received, "
+          f"{result['total_time']:.2f}s incl. writer drain)")
+    print(f"  latency:      p50 {percentile(latencies, 0.5) * 1e6:.0f}us, "
+          f"p99 {percentile(latencies, 0.99) * 1e6:.0f}us, max {percentile(latencies, 1.0) * 1e3:.1f}ms per message")
+    print(f"  database:     {result['round_trips']} round trips, "
+          f"{result['round_trips'] / posts if posts else 0:.3f} per post, "
+          f"{result['rows_written']} rows in {result['batches']} batches")
+    dedupe = result['dedupe']
+    print(f"  dedupe:       {dedupe['inserted']} inserted, {dedupe['duplicates']} duplicates, "
+          f"{dedupe['deletes'] + dedupe['deletes_buffered']} deleted ({dedupe['deletes_buffered']} while buffered), "
+          f"{dedupe['tombstones']} tombstones, {dedupe['tombstone_hits']} tombstone hits")
+    bulk = result['bulk']
+    if bulk is not None:
+        print(f"  bulk load:    {bulk['loads']} loads, {bulk['rows_staged']} rows staged, "
+              f"{bulk['rows_merged']} merged, {bulk['rows_per_second']:.0f} rows/s")
+    learned = result['identity_updates'] + result['network_handles']
+    if learned:
+        print(f"  handles:      {result['identity_updates']} from stream, {result['network_handles']} from network "
+              f"({result['identity_updates'] / learned * 100:.1f}% from stream)")
+    print(f"  peak RSS:     {peak_rss_mb:.1f} MB")
+    if result['handler_errors']:
+        print(f"  handler errors: {result['handler_errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for sharded ingest (bsky.py --mode shard-router/-worker).
+
+Loads a record_firehose.py (or synthetic_firehose.py --out) recording into
+memory, then for each worker count starts that many shard worker processes
+and routes every frame through a ShardRouter as fast as possible. A run
+ends when every worker has acked (committed) all frames sent to it.
+
+    python benchmarks/sharded_ingest.py syn.zst --workers 1,2,4,8
+
+Each worker writes to its own SQLite stand-in file, so the database is not
+the shared bottleneck here; with MariaDB every worker has its own
+connection pool instead. Workers talk to the router over Unix sockets,
+the same transport as TCP between hosts minus the network. Speedup can
+only approach the worker count on a machine with that many free cores.
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ingest.recording import read_recording
+from ingest.sharding import ShardRouter
+
+
+def run_worker(address, sqlite_path, workdir):
+    """Worker process: bsky.py's shard-worker path against a SQLite stand-in"""
+    os.chdir(workdir)
+    os.makedirs('errors', exist_ok=True)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import bsky
+        from ingest.sharding import ReceiverCursors, ShardWorker
+        from sqlite_standin import SQLitePool
+
+        pool = SQLitePool(sqlite_path)
+        bsky.db_pool = pool
+        bsky.post_writer.pool = pool
+        bsky.identity_updater.pool = pool
+        bsky.rollups.pool = pool
+        bsky.author_directory.pool = pool
+        bsky.catch_up.catching_up = True  # no per-post output
+        bsky.cursor_tracker = ReceiverCursors()
+        bsky.post_writer.on_committed = bsky.cursor_tracker.rows_committed
+        bsky.post_writer.on_failed = bsky.cursor_tracker.rows_failed
+        # Catch-up sized batches, but a short delay so the final flush does not dominate short runs
+        bsky.post_writer.set_batch_limits(500, 5000, 0.1)
+        bsky.post_writer.start()
+        bsky.identity_updater.start()
+        bsky.rollups.start()
+        bsky.author_directory.start()
+        ShardWorker(address, bsky.on_shard_frames, bsky.cursor_tracker, ack_interval=0.05).serve_forever()
+
+
+def wait_for_socket(path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Shard worker did not start listening on {path}")
+        time.sleep(0.05)
+
+
+def count_posts(paths):
+    total = 0
+    for path in paths:
+        with contextlib.closing(sqlite3.connect(path)) as conn:
+            total += conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+    return total
+
+
+def run(frames, num_workers, batch_size):
+    workdir = tempfile.mkdtemp(prefix='bsky-shards-')
+    addresses = [os.path.join(workdir, f"worker-{i}.sock") for i in range(num_workers)]
+    databases = [os.path.join(workdir, f"worker-{i}.db") for i in range(num_workers)]
+
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(address, database, workdir), daemon=True)
+                 for address, database in zip(addresses, databases)]
+    for process in processes:
+        process.start()
+    try:
+        for address in addresses:
+            wait_for_socket(address)
+
+        router = ShardRouter(addresses, batch_size=batch_size)
+        router.start()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        for data in frames:
+            router.route(data)
+        routed = time.perf_counter()
+        router_cpu = time.process_time() - cpu_started
+        drained = router.wait_drained(timeout=600)
+        finished = time.perf_counter()
+        shard_frames = [shard['frames'] for shard in router.stats()['shards'].values()]
+        router.close(drain_timeout=5)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(timeout=5)
+
+    return {
+        'workers': num_workers,
+        'drained': drained,
+        'route_time': routed - started,
+        'router_cpu': router_cpu,
+        'total_time': finished - started,
+        'posts': count_posts(databases),
+        'shard_frames': shard_frames,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure sharded ingest throughput for several worker counts")
+    parser.add_argument('recording', help="file written by record_firehose.py or synthetic_firehose.py --out")
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated worker counts to run")
+    parser.add_argument('--limit', type=int, default=0, help="use at most this many frames")
+    parser.add_argument('--batch-size', type=int, default=64, help="frames per router -> worker message")
+    args = parser.parse_args()
+
+    frames = []
+    for _, data in read_recording(args.recording):
+        if args.limit and len(frames) >= args.limit:
+            break
+        frames.append(data)
+    print(f"Loaded {len(frames)} frames, {os.cpu_count()} CPUs available")
+    if os.cpu_count() < max(int(n) for n in args.workers.split(',')):
+        print("⚠️ Fewer CPUs than workers: expect flat scaling past the CPU count")
+
+    baseline = None
+    for num_workers in [int(n) for n in args.workers.split(',')]:
+        result = run(frames, num_workers, args.batch_size)
+        rate = result['posts'] / result['total_time']
+        baseline = baseline or rate
+        balance = max(result['shard_frames']) / (sum(result['shard_frames']) / num_workers)
+        print(f"{num_workers:>3} workers: {result['posts']} posts, {rate:8.0f} posts/s, "
+              f"{len(frames) / result['total_time']:8.0f} frames/s, "
+              f"speedup {rate / baseline:.2f}x ({rate / baseline / num_workers * 100:.0f}% efficiency), "
+              f"router {result['router_cpu'] / len(frames) * 1e6:.1f}us CPU/frame, "
+              f"busiest shard {balance:.2f}x average"
+              + ("" if result['drained'] else ", NOT DRAINED"))
+
+
+if __name__ == "__main__":
+    main()
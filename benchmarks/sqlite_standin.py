@@ -0,0 +1,225 @@
+"""
+SQLite stand-in for MariaDB in offline benchmarks.
+
+SQLitePool looks like ingest.db_pool.ConnectionPool to the ingest code
+(connection() context manager, stats(), close_all()) and rewrites the
+MySQL dialect bsky.py uses into SQLite: %s placeholders, NOW(),
+DATE_ADD(NOW(), INTERVAL n SECOND), LEAST, INSERT IGNORE, SELECT ... FOR UPDATE, ON DUPLICATE KEY UPDATE (also after
+INSERT ... SELECT, with IF and GREATEST) and LOAD DATA LOCAL INFILE; session
+SET statements are ignored. Good enough to
+compare ingest-path versions against each other, not to predict MariaDB
+throughput.
+"""
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    author_id INTEGER NOT NULL,
+    text TEXT,
+    created_at TIMESTAMP,
+    language TEXT,
+    post_uri TEXT,
+    raw_data TEXT,
+    raw_record BLOB,
+    raw_segment INTEGER,
+    raw_offset INTEGER,
+    raw_length INTEGER,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_author_id ON posts (author_id);
+CREATE TABLE IF NOT EXISTS authors (
+    author_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    did TEXT NOT NULL UNIQUE,
+    handle TEXT,
+    first_seen TIMESTAMP,
+    last_seen TIMESTAMP,
+    resolved_at TIMESTAMP,
+    failed_attempts INTEGER NOT NULL DEFAULT 0,
+    resolution_error TEXT,
+    next_retry_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_next_retry_at ON authors (next_retry_at);
+CREATE TABLE IF NOT EXISTS post_uris (
+    post_uri TEXT PRIMARY KEY,
+    post_id INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS post_rollup_language (
+    bucket TIMESTAMP NOT NULL,
+    language TEXT NOT NULL DEFAULT '',
+    posts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, language)
+);
+CREATE TABLE IF NOT EXISTS post_rollup_author (
+    bucket TIMESTAMP NOT NULL,
+    author_id INTEGER NOT NULL,
+    posts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, author_id)
+);
+CREATE TABLE IF NOT EXISTS ingest_cursor (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+'''
+
+_LOAD_DATA_RE = re.compile(
+    r'LOAD\s+DATA\s+LOCAL\s+INFILE\s+%s\s+INTO\s+TABLE\s+(\w+).*?\(([^)]*)\)\s*$',
+    re.IGNORECASE | re.DOTALL)
+_INSERT_SELECT_RE = re.compile(r'^\s*INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*SELECT\b', re.IGNORECASE)
+_DATE_ADD_RE = re.compile(r'DATE_ADD\(NOW\(\), INTERVAL (.*?) SECOND\)', re.DOTALL)
+_TSV_ESCAPES = {b'\\': b'\\', b't': b'\t', b'n': b'\n', b'r': b'\r', b'0': b'\x00'}
+
+
+def translate(sql):
+    """Rewrite the MySQL statements used by the ingest path for SQLite"""
+    if sql.strip() == 'SELECT NOW()':
+        # Typed column name, so it comes back as a datetime like from MariaDB
+        return "SELECT datetime('now', 'localtime') AS \"now [timestamp]\""
+    sql = _DATE_ADD_RE.sub(r"datetime('now', 'localtime', (\1) || ' seconds')", sql)
+    sql = sql.replace('%s', '?').replace('NOW()', "datetime('now', 'localtime')").replace('LEAST(', 'MIN(')
+    sql = sql.replace('INSERT IGNORE', 'INSERT OR IGNORE').replace('FOR UPDATE', '')
+    if 'ON DUPLICATE KEY UPDATE' in sql:
+        if _INSERT_SELECT_RE.match(sql) and not re.search(r'\bWHERE\b', sql.split('ON DUPLICATE KEY UPDATE')[0]):
+            # SQLite needs a WHERE to tell the upsert clause from a join's ON
+            sql = sql.replace('ON DUPLICATE KEY UPDATE', 'WHERE true ON DUPLICATE KEY UPDATE')
+        sql = sql.replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET')
+        sql = re.sub(r'\bIF\(', 'IIF(', sql).replace('GREATEST(', 'MAX(')
+        sql = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', sql)
+    return sql
+
+
+def _tsv_value(field, declared):
+    """Undo LOAD DATA escaping and convert to the column's SQLite affinity"""
+    if field == b'\\N':
+        return None
+    value = re.sub(rb'\\(.)', lambda m: _TSV_ESCAPES.get(m.group(1), m.group(1)), field)
+    if 'INT' in declared:
+        return int(value)
+    if declared:
+        return value.decode('utf-8')
+    # CREATE TABLE ... AS SELECT declares both literals and BLOB columns as ''
+    return int(value) if value.isdigit() else value
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self._cursor = conn.cursor()
+        self._conn = conn
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        if sql.lstrip().upper().startswith('SET '):
+            return
+        load = _LOAD_DATA_RE.search(sql)
+        if load:
+            self._load_data(params[0], load.group(1), [c.strip() for c in load.group(2).split(',')])
+            return
+        self._cursor.execute(translate(sql), tuple(params or ()))
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+        if self.rowcount > 0 and _INSERT_SELECT_RE.match(sql):
+            # Match MariaDB: LAST_INSERT_ID() is the first id of the statement
+            self.lastrowid -= self.rowcount - 1
+
+    def _load_data(self, path, table, columns):
+        declared = {name: type_.upper() for _, name, type_, *_ in self._conn.execute(f'PRAGMA table_info({table})')}
+        with open(path, 'rb') as tsv:
+            lines = tsv.read().split(b'\n')[:-1]
+        rows = [tuple(_tsv_value(field, declared[column]) for field, column in zip(line.split(b'\t'), columns))
+                for line in lines]
+        self._cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+        self.rowcount = len(rows)
+        self.lastrowid = None
+
+    def executemany(self, sql, rows):
+        rows = [tuple(row) for row in rows]
+        self._cursor.executemany(translate(sql), rows)
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = None
+        if rows and sql.lstrip().upper().startswith('INSERT'):
+            # Match mysql-connector: lastrowid is the first id of a multi-row INSERT
+            last_id = self._conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            self.lastrowid = last_id - len(rows) + 1
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class _Connection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def cursor(self):
+        return _Cursor(self._conn)
+
+    def start_transaction(self):
+        # SQLite opens one implicitly on the first write; anything before this
+        # (e.g. bulk staging) was autocommitted on MariaDB, so end it here
+        self._conn.commit()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+class SQLitePool:
+    """Per-thread SQLite connections behind the ConnectionPool interface"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        with self.connection() as conn:
+            conn._conn.executescript(SCHEMA)
+            conn.commit()
+
+    def _get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                   detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        yield _Connection(self._get())
+
+    def stats(self):
+        with self._lock:
+            open_connections = len(self._connections)
+        return {'created': open_connections, 'closed': 0, 'checkouts': 0, 'waits': 0,
+                'wait_time_total': 0.0, 'max_wait_time': 0.0, 'health_checks': 0, 'reconnects': 0,
+                'discarded': 0, 'open': open_connections, 'size': open_connections, 'idle': 0,
+                'in_use': 0, 'avg_wait_time': 0.0}
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Synthetic firehose for load tests without a network.
+
+Produces valid #commit frames (DAG-CBOR header + body, CARv1 blocks holding
+the commit, an MST node and the record) for app.bsky.feed.post records,
+mixed with non-post noise ops (likes, reposts, follows, deletes) and the
+occasional #identity event. Author DIDs are drawn from a Zipf distribution,
+so a few accounts post constantly and most post rarely, like the real
+network.
+
+Write a recording for benchmarks/replay_firehose.py:
+
+    python benchmarks/synthetic_firehose.py --out synthetic.frames.zst --frames 200000 --rate 2000
+
+or serve a live websocket firehose, plus a mock PLC directory, for bsky.py:
+
+    python benchmarks/synthetic_firehose.py --serve 2583 --rate 20000 --plc-port 2582 --plc-error-rate 0.02
+    python bsky.py --firehose-url ws://127.0.0.1:2583/xrpc --plc-url http://127.0.0.1:2582
+"""
+import argparse
+import bisect
+import hashlib
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import libipld
+
+from ingest.recording import FrameRecorder
+
+DEFAULT_LANGUAGES = 'en:0.55,ja:0.15,pt:0.1,de:0.05,es:0.05,ko:0.04,fr:0.03,none:0.03'
+# Relative weights of the non-post ops
+NOISE_OPS = (('app.bsky.feed.like', 0.6), ('app.bsky.graph.follow', 0.15),
+             ('app.bsky.feed.repost', 0.12), ('delete', 0.13))
+WORDS = ("the a to and of is in it you that for on this with just be are my not so have but me what "
+         "like all at your from was they out one about today people new good time know love can really "
+         "think now get we will more day want see make bluesky post art game news music").split()
+TID_ALPHABET = '234567abcdefghijklmnopqrstuvwxyz'
+DID_ALPHABET = 'abcdefghijklmnopqrstuvwxyz234567'
+
+
+def varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def cid_for(block):
+    """CIDv1, dag-cbor codec, sha2-256 multihash"""
+    return bytes([0x01, 0x71, 0x12, 0x20]) + hashlib.sha256(block).digest()
+
+
+def encode_car(root, blocks):
+    header = libipld.encode_dag_cbor({'version': 1, 'roots': [root]})
+    out = [varint(len(header)), header]
+    for cid, block in blocks:
+        out.append(varint(len(cid) + len(block)))
+        out.append(cid)
+        out.append(block)
+    return b''.join(out)
+
+
+def parse_weights(spec):
+    """'en:0.6,ja:0.2' -> ([values], [cumulative weights])"""
+    values, weights = [], []
+    for item in spec.split(','):
+        value, weight = item.split(':')
+        values.append(None if value == 'none' else value)
+        weights.append(float(weight))
+    return values, list(itertools.accumulate(weights))
+
+
+class SyntheticFirehose:
+    """Generates firehose frames with a Zipf-skewed author population"""
+
+    def __init__(self, authors=100000, zipf_s=1.1, post_share=0.15, reply_ratio=0.3,
+                 embed_ratio=0.15, identity_share=0.002, post_delete_ratio=0.2,
+                 languages=DEFAULT_LANGUAGES, start_seq=1, seed=42):
+        self.random = random.Random(seed)
+        self.authors = authors
+        self.post_share = post_share
+        self.reply_ratio = reply_ratio
+        self.embed_ratio = embed_ratio
+        self.identity_share = identity_share
+        self.post_delete_ratio = post_delete_ratio  # share of deletes that remove a recent post
+        self.seq = start_seq
+        self.languages, self.language_weights = parse_weights(languages)
+        self.noise_ops = [op for op, _ in NOISE_OPS]
+        self.noise_weights = list(itertools.accumulate(weight for _, weight in NOISE_OPS))
+        # Zipf: rank k is chosen with probability proportional to 1 / k^s
+        self.author_weights = list(itertools.accumulate(1 / k ** zipf_s for k in range(1, authors + 1)))
+        self.recent_posts = []  # (uri, cid) of generated posts, for replies/likes/reposts
+        self.counts = {'frames': 0, 'posts': 0, 'post_deletes': 0, 'noise_ops': 0, 'identity': 0}
+
+    def _pick(self, values, cumulative):
+        return values[bisect.bisect_left(cumulative, self.random.random() * cumulative[-1])]
+
+    def author_did(self, rank):
+        digest = hashlib.sha256(f"synthetic-author-{rank}".encode('utf-8')).digest()
+        return 'did:plc:' + ''.join(DID_ALPHABET[b % 32] for b in digest[:24])
+
+    def _random_author(self):
+        rank = bisect.bisect_left(self.author_weights, self.random.random() * self.author_weights[-1])
+        return self.author_did(min(rank, self.authors - 1) + 1)
+
+    def _tid(self):
+        value = (time.time_ns() // 1000) << 10 | self.random.getrandbits(10)
+        return ''.join(TID_ALPHABET[(value >> (5 * i)) & 31] for i in reversed(range(13)))
+
+    def _now(self):
+        return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    def _strong_ref(self):
+        if not self.recent_posts:
+            did = self._random_author()
+            return {'uri': f"at://{did}/app.bsky.feed.post/{self._tid()}",
+                    'cid': libipld.encode_cid(cid_for(did.encode('utf-8')))}
+        uri, cid = self.random.choice(self.recent_posts)
+        return {'uri': uri, 'cid': cid}
+
+    def _post_record(self):
+        text = ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(2, 45)))
+        record = {'$type': 'app.bsky.feed.post', 'text': text, 'createdAt': self._now()}
+        language = self._pick(self.languages, self.language_weights)
+        if language:
+            record['langs'] = [language]
+        if self.random.random() < self.reply_ratio:
+            parent = self._strong_ref()
+            record['reply'] = {'root': parent, 'parent': parent}
+        if self.random.random() < self.embed_ratio:
+            image = self.random.randbytes(16)
+            record['embed'] = {
+                '$type': 'app.bsky.embed.images',
+                'images': [{'alt': '', 'image': {'$type': 'blob', 'ref': cid_for(image),
+                                                 'mimeType': 'image/jpeg',
+                                                 'size': self.random.randint(20000, 900000)}}],
+            }
+        return record
+
+    def _noise_record(self, collection):
+        if collection == 'app.bsky.graph.follow':
+            return {'$type': collection, 'subject': self._random_author(), 'createdAt': self._now()}
+        return {'$type': collection, 'subject': self._strong_ref(), 'createdAt': self._now()}
+
+    def _frame(self, header, body):
+        self.seq += 1
+        self.counts['frames'] += 1
+        return libipld.encode_dag_cbor(header) + libipld.encode_dag_cbor(body)
+
+    def _commit_frame(self, repo, action, path, record=None):
+        blocks = []
+        op = {'action': action, 'path': path, 'cid': None}
+        if record is not None:
+            block = libipld.encode_dag_cbor(record)
+            op['cid'] = cid_for(block)
+            blocks.append((op['cid'], block))
+        # MST node and signed commit, as a PDS would send them
+        mst = libipld.encode_dag_cbor({'l': None, 'e': [{'p': 0, 'k': path.encode('utf-8'),
+                                                           'v': op['cid'] or cid_for(path.encode('utf-8')),
+                                                           't': None}]})
+        mst_cid = cid_for(mst)
+        rev = self._tid()
+        commit = libipld.encode_dag_cbor({'did': repo, 'version': 3, 'data': mst_cid, 'rev': rev,
+                                          'prev': None, 'sig': self.random.randbytes(64)})
+        commit_cid = cid_for(commit)
+        blocks = [(commit_cid, commit), (mst_cid, mst)] + blocks
+        body = {
+            'seq': self.seq, 'rebase': False, 'tooBig': False, 'repo': repo,
+            'commit': commit_cid, 'rev': rev, 'since': None,
+            'blocks': encode_car(commit_cid, blocks),
+            'ops': [op], 'blobs': [], 'time': self._now(),
+        }
+        return self._frame({'op': 1, 't': '#commit'}, body)
+
+    def next_frame(self):
+        """Bytes of the next websocket frame"""
+        repo = self._random_author()
+        roll = self.random.random()
+        if roll < self.identity_share:
+            self.counts['identity'] += 1
+            return self._frame({'op': 1, 't': '#identity'},
+                               {'seq': self.seq, 'did': repo, 'time': self._now(),
+                                'handle': f"{repo.rsplit(':', 1)[-1]}.synthetic.test"})
+
+        if roll < self.identity_share + self.post_share:
+            record = self._post_record()
+            path = f"app.bsky.feed.post/{self._tid()}"
+            frame = self._commit_frame(repo, 'create', path, record)
+            self.recent_posts.append((f"at://{repo}/{path}",
+                                      libipld.encode_cid(cid_for(libipld.encode_dag_cbor(record)))))
+            if len(self.recent_posts) > 1000:
+                self.recent_posts = self.recent_posts[-500:]
+            self.counts['posts'] += 1
+            return frame
+
+        self.counts['noise_ops'] += 1
+        op = self._pick(self.noise_ops, self.noise_weights)
+        if op == 'delete':
+            if self.recent_posts and self.random.random() < self.post_delete_ratio:
+                uri, _ = self.recent_posts.pop(self.random.randrange(len(self.recent_posts)))
+                repo, path = uri[len('at://'):].split('/', 1)
+                self.counts['post_deletes'] += 1
+                return self._commit_frame(repo, 'delete', path)
+            return self._commit_frame(repo, 'delete', f"app.bsky.feed.like/{self._tid()}")
+        return self._commit_frame(repo, 'create', f"{op}/{self._tid()}", self._noise_record(op))
+
+    def frames(self, count):
+        for _ in range(count):
+            yield self.next_frame()
+
+
+def write_recording(generator, path, frames, rate):
+    recorder = FrameRecorder(path)
+    for i, frame in enumerate(generator.frames(frames)):
+        recorder.write(frame, offset=i / rate if rate > 0 else 0.0)
+    recorder.close()
+    print(f"Wrote {recorder.frames} frames ({generator.counts['posts']} posts, "
+          f"{generator.counts['post_deletes']} post deletes, "
+          f"{generator.counts['noise_ops']} noise ops, {generator.counts['identity']} identity events) to {path}")
+
+
+def serve(generator, port, rate):
+    """Serve frames to every websocket client at `rate` frames/s (0 = as fast as possible)"""
+    from websockets.sync.server import serve as websocket_serve
+    lock = threading.Lock()  # clients share one generator (and one seq sequence)
+
+    def handler(websocket):
+        print(f"Client connected: {websocket.request.path}")
+        started = time.monotonic()
+        sent = 0
+        try:
+            while True:
+                if rate > 0:
+                    delay = started + sent / rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                with lock:
+                    frame = generator.next_frame()
+                websocket.send(frame)
+                sent += 1
+        except Exception as e:
+            print(f"Client disconnected after {sent} frames: {e}")
+
+    with websocket_serve(handler, '127.0.0.1', port, max_size=None) as server:
+        print(f"Serving synthetic firehose on ws://127.0.0.1:{port}/xrpc at "
+              f"{'max' if rate <= 0 else rate} frames/s")
+        server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic firehose generator")
+    parser.add_argument('--out', help="write a recording file for replay_firehose.py")
+    parser.add_argument('--serve', type=int, metavar='PORT', help="serve a websocket firehose on this port")
+    parser.add_argument('--frames', type=int, default=100000, help="frames to write with --out")
+    parser.add_argument('--rate', type=float, default=2000, help="frames per second (0 = unthrottled)")
+    parser.add_argument('--authors', type=int, default=100000)
+    parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent of the author distribution")
+    parser.add_argument('--post-share', type=float, default=0.15, help="share of frames that create a post")
+    parser.add_argument('--reply-ratio', type=float, default=0.3)
+    parser.add_argument('--embed-ratio', type=float, default=0.15)
+    parser.add_argument('--identity-share', type=float, default=0.002)
+    parser.add_argument('--post-delete-ratio', type=float, default=0.2,
+                        help="share of delete ops that remove a recently created post")
+    parser.add_argument('--languages', default=DEFAULT_LANGUAGES, help="lang:weight list, 'none' = no langs")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--plc-port', type=int, help="also run a mock PLC directory on this port")
+    parser.add_argument('--plc-latency-ms', type=float, default=20.0)
+    parser.add_argument('--plc-error-rate', type=float, default=0.0)
+    parser.add_argument('--plc-not-found-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if not args.out and args.serve is None:
+        parser.error("pass --out FILE and/or --serve PORT")
+
+    generator = SyntheticFirehose(authors=args.authors, zipf_s=args.zipf, post_share=args.post_share,
+                                  reply_ratio=args.reply_ratio, embed_ratio=args.embed_ratio,
+                                  identity_share=args.identity_share, post_delete_ratio=args.post_delete_ratio,
+                                  languages=args.languages, seed=args.seed)
+    if args.out:
+        write_recording(generator, args.out, args.frames, args.rate)
+    if args.serve is not None:
+        if args.plc_port:
+            from mock_plc import MockPlcDirectory
+            directory = MockPlcDirectory(port=args.plc_port, latency_ms=args.plc_latency_ms,
+                                         error_rate=args.plc_error_rate,
+                                         not_found_rate=args.plc_not_found_rate).start()
+            print(f"Mock PLC directory on {directory.url}")
+        serve(generator, args.serve, args.rate)
+
+
+if __name__ == "__main__":
+    main()
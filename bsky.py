@@ -1,12 +1,32 @@
-import json
+import argparse
 import mysql.connector
+import os
 import threading
 import queue
 import time
-from datetime import datetime
-from atproto_client.models import get_or_create
-from atproto import CAR, models, IdResolver
+from collections import Counter
+from atproto import models
 from atproto_firehose import FirehoseSubscribeReposClient, parse_subscribe_repos_message
+from ingest.authors import AuthorDirectory
+from ingest.cursor import DEFAULT_CURSOR_NAME, CatchUpMonitor, CursorCheckpointer, CursorTracker, load_cursor
+from ingest.db_pool import ConnectionPool
+from ingest.decode import decode_commit, decode_frame
+from ingest.bulk_load import BulkLoader
+from ingest.dedupe import PostDeduplicator, PostDelete, PostUpdate
+from ingest.decode_pipeline import DecodePipeline, RawFirehoseSubscribeReposClient
+from ingest.handle_cache import HandleCache, MISS
+from ingest.identity import IDENTITY_EVENT_TYPES, UPSERT_AUTHOR_HANDLE_SQL, IdentityUpdater, identity_from_body
+from ingest.jetstream import DEFAULT_JETSTREAM_CURSOR_NAME, DEFAULT_JETSTREAM_URL, JetstreamClient, decode_jetstream_event
+from ingest.post_writer import PostWriter
+from ingest.resolver import DidResolver
+from ingest.retry_schedule import (MARK_FAILED_SQL, RETRY_STATE_SQL, RetryScheduler, due_for_resolution,
+                                   is_permanent, mark_failed_params)
+from ingest.rollups import RollupAggregator
+from ingest.routing import DEFAULT_ROUTES, RECORD_TABLES, build_routes, insert_record_sql
+from ingest.segment_store import DEFAULT_SEGMENT_DIR, INSERT_POSTS_SEGMENT_SQL, SegmentWriter
+from ingest.sharding import ReceiverCursors, ShardRouter, ShardWorker, check_authkey, frame_route_info, parse_address
+from ingest.single_flight import SingleFlight
+from ingest.spill import DEFAULT_SPILL_DIR, SpillQueue
 
 # Database configuration
 MYSQL_CONFIG = {
@@ -15,231 +35,194 @@ MYSQL_CONFIG = {
     'user': 'bsky_user',
     'password': 'bsky_password',
     'port': 3306,
-    'autocommit': True
+    'autocommit': True,
+    'allow_local_infile': True  # LOAD DATA bulk batches (ingest/bulk_load.py)
 }
 
-class JSONExtra(json.JSONEncoder):
-    """raw objects sometimes contain CID() objects, which
-    seem to be references to something elsewhere in bluesky.
-    So, we 'serialise' these as a string representation,
-    which is a hack but whatevAAAAR"""
-    def default(self, obj):
-        try:
-            result = json.JSONEncoder.default(self, obj)
-            return result
-        except:
-            return repr(obj)
+# Shared connection pool used by every DB helper and the post writer
+# (10 resolver threads + main thread + writers + retry scheduler)
+db_pool = ConnectionPool(MYSQL_CONFIG, size=16)
+
+# PLC directory and firehose endpoints (None = library defaults); overridable
+# with --plc-url / --firehose-url to run against local mocks
+PLC_URL = None
+FIREHOSE_URL = None
+
+# Shared DID resolver (pooled keep-alive connections, bounded in-flight
+# requests); main() rebuilds it with --plc-url and the limits from the CLI
+did_resolver = DidResolver(max_in_flight=32, timeout=5.0)
+RESOLVE_BATCH_SIZE = 50  # DIDs a resolution worker takes off the queue at once
+
+# In-memory DID -> handle cache in front of the authors table
+handle_cache = HandleCache(max_size=200000, ttl=6 * 3600, negative_ttl=600)
+HANDLE_CACHE_WARM_ROWS = 100000
+
+# DID -> author_id for the post writer; posts reference authors by author_id,
+# so a resolved handle is one authors row instead of an UPDATE over posts
+author_directory = AuthorDirectory(db_pool, max_size=500000, touch_interval=60.0)
+
+network_handles_cached = 0
+
+# Per-minute language/author counts for the dashboard, upserted every few seconds
+rollups = RollupAggregator(db_pool, flush_interval=5.0)
 
 # Initialize MySQL database
 def init_database():
     """Initialize database connection - tables already exist in MySQL"""
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        
-        # Test connection by checking if tables exist
-        cursor.execute("SHOW TABLES LIKE 'posts'")
-        posts_exists = cursor.fetchone()
-        
-        cursor.execute("SHOW TABLES LIKE 'did_cache'")
-        cache_exists = cursor.fetchone()
-        
-        if posts_exists and cache_exists:
-            print("✅ Connected to MySQL database successfully")
-        else:
-            print("⚠️ Warning: Expected tables not found in database")
-        
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Test connection by checking if tables exist
+            cursor.execute("SHOW TABLES LIKE 'posts'")
+            posts_exists = cursor.fetchone()
+            
+            cursor.execute("SHOW TABLES LIKE 'authors'")
+            authors_exists = cursor.fetchone()
+            
+            if posts_exists and authors_exists:
+                print("✅ Connected to MySQL database successfully")
+            else:
+                print("⚠️ Warning: Expected tables not found in database")
+            
     except mysql.connector.Error as e:
         print(f"❌ Failed to connect to MySQL database: {e}")
         raise
 
-def get_cached_handle(did):
-    """Get handle from cache if available"""
+def warm_handle_cache(limit=HANDLE_CACHE_WARM_ROWS):
+    """Preload the in-memory handle and author_id caches from the most recently seen authors"""
+    try:
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT did, handle, author_id FROM authors
+                ORDER BY last_seen DESC
+                LIMIT %s
+            ''', (limit,))
+            rows = cursor.fetchall()
+        loaded = handle_cache.warm([(did, handle) for did, handle, _ in rows])
+        author_directory.warm([(did, author_id) for did, _, author_id in rows])
+        print(f"Warmed handle cache with {loaded} DIDs")
+    except mysql.connector.Error as e:
+        print(f"Error warming handle cache: {e}")
+
+def resolution_states(dids):
+    """{did: (handle, resolved_at, next_retry_at, retry_due)} for the DIDs that have an authors row"""
+    if not dids:
+        return {}
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute('SELECT handle FROM did_cache WHERE did = %s', (did,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(RETRY_STATE_SQL.format(placeholders=','.join(['%s'] * len(dids))), dids)
+            rows = cursor.fetchall()
     except mysql.connector.Error as e:
-        print(f"Error getting cached handle for {did}: {e}")
-        return None
+        print(f"Error reading resolution state for {len(dids)} DIDs: {e}")
+        return {}  # Resolve them all rather than none
+    return {did: tuple(state) for did, *state in rows}
 
 def cache_handle(did, handle):
     """Cache the DID to handle mapping"""
+    global network_handles_cached
+    network_handles_cached += 1
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO did_cache (did, handle, resolved_at, failed_attempts)
-            VALUES (%s, %s, NOW(), 0)
-            ON DUPLICATE KEY UPDATE 
-            handle = VALUES(handle), 
-            resolved_at = VALUES(resolved_at), 
-            failed_attempts = 0
-        ''', (did, handle))
-        conn.commit()
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(UPSERT_AUTHOR_HANDLE_SQL, (did, handle))
+            conn.commit()
     except mysql.connector.Error as e:
         print(f"Error caching handle for {did}: {e}")
+    handle_cache.put(did, handle)
 
-def mark_resolution_failed(did):
-    """Mark that resolution failed for this DID"""
+def mark_resolution_failed(did, outcome='errors'):
+    """Mark that resolution failed for this DID and schedule its next attempt"""
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        
-        # Get current failed attempts or 0 if not exists
-        cursor.execute('SELECT failed_attempts FROM did_cache WHERE did = %s', (did,))
-        result = cursor.fetchone()
-        current_attempts = result[0] if result else 0
-        
-        cursor.execute('''
-            INSERT INTO did_cache (did, handle, resolved_at, failed_attempts)
-            VALUES (%s, NULL, NOW(), %s)
-            ON DUPLICATE KEY UPDATE 
-            handle = NULL,
-            resolved_at = NOW(), 
-            failed_attempts = %s
-        ''', (did, current_attempts + 1, current_attempts + 1))
-        conn.commit()
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            # One upsert; the backoff is computed from the stored failed_attempts
+            cursor.execute(MARK_FAILED_SQL, mark_failed_params(did, outcome))
+            conn.commit()
     except mysql.connector.Error as e:
         print(f"Error marking resolution failed for {did}: {e}")
-
-def should_retry_resolution(did):
-    """Check if we should retry resolution for a failed DID"""
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT failed_attempts, resolved_at 
-            FROM did_cache 
-            WHERE did = %s AND handle IS NULL
-        ''', (did,))
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result:
-            return True  # Never tried before
-        
-        failed_attempts, resolved_at = result
-        # Don't retry if failed more than 3 times
-        if failed_attempts >= 3:
-            return False
-        
-        # Retry after 1 hour for failed attempts
-        from datetime import timedelta
-        return datetime.now() - resolved_at > timedelta(hours=1)
-    except mysql.connector.Error as e:
-        print(f"Error checking retry status for {did}: {e}")
-        return True  # Default to retry on error
+    handle_cache.put_failure(did, permanent=is_permanent(outcome))
 
 # Global queues for thread communication
 resolution_queue = queue.Queue()  # DIDs to resolve
 update_queue = queue.Queue()      # Updates to apply to database
 
-def update_multiple_posts_handle(post_ids, handle):
-    """Update multiple posts' handles in a single transaction"""
-    if not post_ids:
-        return
-    
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        
-        # Use IN clause for better performance
-        placeholders = ','.join(['%s' for _ in post_ids])
-        cursor.execute(f'''
-            UPDATE posts 
-            SET author_handle = %s 
-            WHERE id IN ({placeholders})
-        ''', [handle] + post_ids)
-        
-        conn.commit()
-        conn.close()
-        
-        print(f"Updated {len(post_ids)} posts with handle @{handle}")
-    except mysql.connector.Error as e:
-        print(f"Error updating multiple posts: {e}")
+# One queued resolution per DID; posts by the same author that arrive while it
+# is queued or in flight do not queue the DID again
+resolution_flights = SingleFlight(max_keys=50000, stale_after=300)
 
-def update_post_handle(post_id, handle):
-    """Update a single post's handle in the database"""
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE posts SET author_handle = %s WHERE id = %s', (handle, post_id))
-        conn.commit()
-        conn.close()
-    except mysql.connector.Error as e:
-        print(f"Error updating post handle: {e}")
+# DIDs to resolve from the network even though authors has a handle for them:
+# their #identity event came without one, so the stored handle may be stale
+reresolve_dids = set()
 
-def save_post_to_db(author_did, author_handle, text, created_at, language, post_uri, raw_data):
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
-        
-        # Convert ISO datetime to MySQL format
-        if created_at:
-            try:
-                from datetime import datetime
-                # Parse the ISO datetime and convert to MySQL format
-                if created_at.endswith('Z'):
-                    created_at = created_at[:-1] + '+00:00'
-                dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                created_at = dt.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                created_at = None
+def resolve_dids(worker_id, dids):
+    """Serve DIDs from the cache or authors where possible, resolve the ones that are
+    due in one batch, and complete each DID's flight"""
+    to_check = []
+    forced = set()
+    for did in dids:
+        print(f"Worker {worker_id} processing DID: {did}")
         
-        cursor.execute('''
-            INSERT INTO posts (author_did, author_handle, text, created_at, language, post_uri, raw_data)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (author_did, author_handle, text, created_at, language, post_uri, raw_data))
-        post_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return post_id
-    except mysql.connector.Error as e:
-        print(f"Error saving post to database: {e}")
-        return None
-
-def resolve_handle_from_did_sync(did):
-    """Synchronous DID resolution for background thread"""
-    try:
-        resolver = IdResolver()
-        did_doc = resolver.did.resolve(did)
-        
-        # Extract handle from the DID document
-        handle = None
-        if did_doc and hasattr(did_doc, 'also_known_as') and did_doc.also_known_as:
-            for aka in did_doc.also_known_as:
-                if aka.startswith('at://'):
-                    handle = aka[5:]  # Remove 'at://' prefix
-                    break
-        
-        # If no handle found in also_known_as, try service endpoints
-        if not handle and did_doc and hasattr(did_doc, 'service') and did_doc.service:
-            for service in did_doc.service:
-                if hasattr(service, 'service_endpoint') and isinstance(service.service_endpoint, str):
-                    if service.service_endpoint.startswith('https://'):
-                        # Extract handle from service endpoint (common pattern)
-                        endpoint = service.service_endpoint
-                        if '.bsky.social' in endpoint:
-                            # Try to extract handle from the endpoint
-                            parts = endpoint.split('/')
-                            if len(parts) > 2:
-                                potential_handle = parts[2].split('.')[0]
-                                if potential_handle and not potential_handle.startswith('did:'):
-                                    handle = potential_handle + '.bsky.social'
-                                    break
-        
-        return handle
+        if did in reresolve_dids:
+            reresolve_dids.discard(did)
+            forced.add(did)
+            continue
         
-    except Exception as e:
-        print(f"Failed to resolve handle for {did}: {e}")
-        return None
+        # Check cache first
+        cached_handle = handle_cache.get(did)
+        if cached_handle is not MISS and cached_handle is not None:
+            resolution_flights.complete(did)
+            print(f"Worker {worker_id} found cached handle: {did} -> @{cached_handle}")
+            continue
+        to_check.append(did)
+    
+    # One query for the handles and retry schedules of the rest
+    states = resolution_states(to_check)
+    to_resolve = list(forced)
+    for did in to_check:
+        handle, resolved_at, next_retry_at, retry_due = states.get(did, (None, None, None, None))
+        if handle is not None:
+            handle_cache.put(did, handle)
+            resolution_flights.complete(did)
+            print(f"Worker {worker_id} found cached handle: {did} -> @{handle}")
+            continue
+        if not due_for_resolution(resolved_at, retry_due):
+            # Backing off or failed for good; the retry scheduler requeues it when due
+            handle_cache.put_failure(did, permanent=next_retry_at is None)
+            resolution_flights.complete(did)
+            print(f"Worker {worker_id} skipping {did} (next retry {next_retry_at or 'never'})")
+            continue
+        to_resolve.append(did)
+    if not to_resolve:
+        return
+    
+    # Resolve from network, concurrently over the shared resolver's connection pool
+    print(f"Worker {worker_id} attempting network resolution for {len(to_resolve)} DIDs")
+    results = did_resolver.resolve_outcomes(to_resolve)
+    
+    # Queue database updates
+    for did in to_resolve:
+        handle, outcome = results[did]
+        if handle:
+            # Cache it in memory before completing, so posts written from now on
+            # find the handle instead of starting another flight
+            handle_cache.put(did, handle)
+            resolution_flights.complete(did)
+            # One authors row; every post by this author sees it through author_id
+            update_queue.put(('cache_success', did, handle))
+            print(f"Worker {worker_id} resolved and cached: {did} -> @{handle}")
+        elif did in forced:
+            # The stored handle stays; the next post reads it from authors again
+            resolution_flights.complete(did)
+            print(f"Worker {worker_id} could not re-resolve {did} ({outcome}), keeping its stored handle")
+        else:
+            # Negative entry first, so posts arriving now do not start another flight
+            handle_cache.put_failure(did, permanent=is_permanent(outcome))
+            resolution_flights.complete(did)
+            update_queue.put(('cache_failure', did, outcome))
+            print(f"Worker {worker_id} failed to resolve handle for {did} ({outcome})")
 
 def did_resolution_worker():
     """Background worker thread for DID resolution"""
@@ -248,51 +231,34 @@ def did_resolution_worker():
     
     while True:
         try:
-            # Get work from queue (blocks until item available)
-            did, post_ids = resolution_queue.get(timeout=1)
-            
-            if did is None:  # Shutdown signal
-                print(f"Worker {worker_id} shutting down")
-                break
-                
-            print(f"Worker {worker_id} processing DID: {did} for {len(post_ids)} posts")
-            
-            # Check cache first
-            cached_handle = get_cached_handle(did)
-            if cached_handle is not None:
-                print(f"Worker {worker_id} found cached handle: {did} -> @{cached_handle}")
-                # Batch update all posts with this DID
-                update_queue.put(('update_posts_batch', post_ids, cached_handle))
-                resolution_queue.task_done()
-                continue
-            
-            # Check if we should retry failed resolutions
-            if not should_retry_resolution(did):
-                print(f"Worker {worker_id} skipping retry for {did} (too many failures)")
-                resolution_queue.task_done()
-                continue
-            
-            # Try to resolve from network
-            print(f"Worker {worker_id} attempting network resolution for {did}")
-            handle = resolve_handle_from_did_sync(did)
-            
-            # Queue database updates
-            if handle:
-                update_queue.put(('cache_success', did, handle))
-                # Batch update all posts for this DID
-                update_queue.put(('update_posts_batch', post_ids, handle))
-                print(f"Worker {worker_id} resolved and cached: {did} -> @{handle} (updating {len(post_ids)} posts)")
-            else:
-                update_queue.put(('cache_failure', did))
-                print(f"Worker {worker_id} failed to resolve handle for {did}")
-            
-            resolution_queue.task_done()
-            
+            # Get work from queue (blocks until item available), then whatever else is waiting
+            batch = [resolution_queue.get(timeout=1)]
         except queue.Empty:
             continue
+        while len(batch) < RESOLVE_BATCH_SIZE:
+            try:
+                batch.append(resolution_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        work = [did for did in batch if did is not None]
+        shutdown_signals = len(batch) - len(work)
+        try:
+            resolve_dids(worker_id, work)
         except Exception as e:
             print(f"Error in DID resolution worker {worker_id}: {e}")
+            # Don't leave flights open; the next post or the retry scheduler requeues these DIDs
+            for did in work:
+                resolution_flights.complete(did)
+        for _ in batch:
             resolution_queue.task_done()
+        
+        if shutdown_signals:
+            # Leave the other workers their shutdown signals
+            for _ in range(shutdown_signals - 1):
+                resolution_queue.put(None)
+            print(f"Worker {worker_id} shutting down")
+            break
 
 def process_database_updates():
     """Process queued database updates on main thread"""
@@ -301,18 +267,12 @@ def process_database_updates():
         while True:
             update_type, *args = update_queue.get_nowait()
             
-            if update_type == 'update_post':
-                post_id, handle = args
-                update_post_handle(post_id, handle)
-            elif update_type == 'update_posts_batch':
-                post_ids, handle = args
-                update_multiple_posts_handle(post_ids, handle)
-            elif update_type == 'cache_success':
+            if update_type == 'cache_success':
                 did, handle = args
                 cache_handle(did, handle)
             elif update_type == 'cache_failure':
-                did = args[0]
-                mark_resolution_failed(did)
+                did, outcome = args
+                mark_resolution_failed(did, outcome)
                 
             update_queue.task_done()
             updates_processed += 1
@@ -322,185 +282,636 @@ def process_database_updates():
             print(f"Processed {updates_processed} database updates")
         pass  # No more updates to process
 
-def process_backlog():
-    """Background thread to process unresolved posts from the database"""
+def queue_resolution(did):
+    """Queue a DID for handle resolution unless it is already queued or in flight"""
+    global resolutions_queued
     
-    while True:
-        try:
-            time.sleep(60)  # Check every minute
-            
-            # Get unresolved DIDs from database, grouped by frequency
-            conn = mysql.connector.connect(**MYSQL_CONFIG)
-            cursor = conn.cursor()
-            
-            # Get top unresolved DIDs that we haven't tried recently
-            cursor.execute('''
-                SELECT p.author_did, GROUP_CONCAT(p.id) as post_ids, COUNT(*) as post_count
-                FROM posts p
-                LEFT JOIN did_cache dc ON p.author_did = dc.did
-                WHERE p.author_handle IS NULL 
-                AND (dc.did IS NULL OR (dc.handle IS NULL AND dc.failed_attempts < 3))
-                GROUP BY p.author_did
-                ORDER BY post_count DESC
-                LIMIT 20
-            ''')
-            
-            backlog_items = cursor.fetchall()
-            conn.close()
-            
-            # Queue the most frequent unresolved DIDs for processing
-            for did, post_ids_str, _ in backlog_items:
-                post_ids = [int(pid) for pid in post_ids_str.split(',')]
-                resolution_queue.put((did, post_ids))
-                print(f"Backlog processor: Queued {did} with {len(post_ids)} posts")
-                
-                # Don't overwhelm the queue
-                if resolution_queue.qsize() > 50:
-                    break
-                    
-        except mysql.connector.Error as e:
-            print(f"Database error in backlog processor: {e}")
-        except Exception as e:
-            print(f"Error in backlog processor: {e}")
+    if not resolution_flights.join(did):
+        return False
+    resolution_queue.put(did)
+    resolutions_queued += 1
+    return True
+
+def requeue_resolution(did):
+    """Queue a network resolution of did that does not stop at its stored handle"""
+    reresolve_dids.add(did)
+    return queue_resolution(did)
+
+# Requeues unresolved authors whose authors.next_retry_at has come (jittered
+# exponential backoff, see ingest/retry_schedule.py), at most a batch per pass
+# minus what is still waiting in the resolution queue; started by main()
+retry_scheduler = RetryScheduler(db_pool, queue_resolution, pending=resolution_queue.qsize,
+                                 interval=30.0, batch_size=500)
 
-# Initialize the database
-init_database()
+# Handles learned from #identity events, applied in batches; network
+# resolution is only the fallback for DIDs the stream has not told us about
+identity_updater = IdentityUpdater(db_pool, handle_cache, reresolve=requeue_resolution)
 
-# Start background worker threads
-num_workers = 10  # Increased further for high volume
-workers = []
-for i in range(num_workers):
-    worker = threading.Thread(target=did_resolution_worker, daemon=True)
-    worker.start()
-    workers.append(worker)
+def on_posts_written(rows, post_ids):
+    """Writer callback: count committed posts (rows carry author_ids) into the rollups"""
+    rollups.add(rows)
 
-print(f"Started {num_workers} DID resolution worker threads")
+# Firehose cursor: frames are tracked until their rows are committed, and only
+# that watermark is checkpointed, so a restart never skips unwritten posts
+cursor_tracker = CursorTracker()
+cursor_checkpointer = None
+firehose_client = None
+CURSOR_UPDATE_EVERY = 1000  # frames between client.update_params() calls
+frames_since_cursor_update = 0
 
-# Start backlog processor thread
-backlog_thread = threading.Thread(target=process_backlog, daemon=True)
-backlog_thread.start()
-print("Started backlog processor thread")
+# Catch-up mode while replaying a backlog: bigger batches, no per-post logging
+catch_up = CatchUpMonitor(enter_lag=60, exit_lag=10)
+LIVE_BATCH_LIMITS = (10, 1000, 0.5)
+CATCH_UP_BATCH_LIMITS = (500, 5000, 2.0)
 
-# Track DIDs being resolved to batch requests
-pending_resolutions = {}  # did -> list of post_ids
+# Post creates/deletes/updates keyed by post URI, so replays and rewinds are no-ops
+post_dedupe = PostDeduplicator(on_deleted=rollups.remove)
+
+# Batched post writer (group commits instead of one INSERT per post), started by main()
+post_writer = PostWriter(
+    db_pool,
+    on_flushed=on_posts_written,
+    num_threads=2,
+    on_committed=cursor_tracker.rows_committed,
+    on_failed=cursor_tracker.rows_failed,
+    dedupe=post_dedupe,
+    authors=author_directory,
+)
+
+# Collections decoded from each commit (--collections adds optional record
+# tables); every other op is dropped before its block is touched
+routes = DEFAULT_ROUTES
+record_writers = {}  # collection -> PostWriter for its own table
+collection_counts = {'processed': Counter(), 'skipped': Counter()}
+
+# Decode process pool, only used when --decode-processes > 0
+decode_pipeline = None
+
+# Segment files for raw records, only used with --raw-store segments
+segment_writer = None
 
 # Statistics tracking
-import time
 last_stats_time = time.time()
 posts_processed = 0
 resolutions_queued = 0
 
-client = FirehoseSubscribeReposClient()
-
 # all of this undocumented horseshit is based on cargo-culting the bollocks out of
 # https://github.com/MarshalX/atproto/blob/main/examples/firehose/sub_repos.py
 # and
 # https://github.com/MarshalX/bluesky-feed-generator/blob/main/server/data_stream.py
 
 total_errors = 0  # Track total errors for debugging
-def on_message_handler(message):
-    global total_errors, posts_processed, resolutions_queued, last_stats_time
-    
-    # Process any pending database updates first
-    process_database_updates()
+
+def report_stats_if_due():
+    """Print periodic statistics and sync cached handles"""
+    global last_stats_time
     
-    # Print periodic statistics and sync cached handles
     current_time = time.time()
-    if current_time - last_stats_time > 30:  # Every 30 seconds
-        queue_size = resolution_queue.qsize()
-        update_queue_size = update_queue.qsize()
+    if current_time - last_stats_time <= 30:  # Every 30 seconds
+        return
+    
+    queue_size = resolution_queue.qsize()
+    update_queue_size = update_queue.qsize()
+    
+    writer_stats = post_writer.stats()
+    
+    print(f"Stats: {posts_processed} posts processed, {resolutions_queued} resolutions queued, "
+          f"Resolution queue: {queue_size}, Update queue: {update_queue_size}")
+    print(f"Writer: {writer_stats['rows_written']} rows inserted from {writer_stats['rows_flushed']} in "
+          f"{writer_stats['batches']} batches "
+          f"(avg {writer_stats['avg_batch_size']:.1f}, last {writer_stats['last_batch_size']}, "
+          f"target {writer_stats['target_batch_size']}), "
+          f"flush latency avg {writer_stats['avg_flush_latency'] * 1000:.1f}ms / "
+          f"max {writer_stats['max_flush_latency'] * 1000:.1f}ms, "
+          f"queue depth {writer_stats['queue_depth']} (max {writer_stats['max_queue_depth']}), "
+          f"dropped {writer_stats['rows_dropped']}, rejected {writer_stats['rows_rejected']}")
+    pool_stats = db_pool.stats()
+    print(f"DB pool: {pool_stats['in_use']}/{pool_stats['open']} in use (max {pool_stats['size']}), "
+          f"{pool_stats['checkouts']} checkouts, {pool_stats['waits']} waited "
+          f"(avg {pool_stats['avg_wait_time'] * 1000:.1f}ms, max {pool_stats['max_wait_time'] * 1000:.1f}ms), "
+          f"{pool_stats['reconnects']} reconnects, {pool_stats['discarded']} discarded")
+    cache_stats = handle_cache.stats()
+    print(f"Handle cache: {cache_stats['size']}/{cache_stats['max_size']} entries, "
+          f"{cache_stats['hits']} hits, {cache_stats['negative_hits']} negative hits, "
+          f"{cache_stats['misses']} misses ({cache_stats['hit_rate'] * 100:.1f}% hit rate), "
+          f"{cache_stats['evictions']} evictions, {cache_stats['expired']} expired")
+    identity_stats = identity_updater.stats()
+    learned = identity_stats['dids_updated'] + network_handles_cached
+    stream_share = identity_stats['dids_updated'] / learned * 100 if learned else 0.0
+    print(f"Identity: {identity_stats['events']} events, {identity_stats['dids_updated']} handles from stream vs "
+          f"{network_handles_cached} from network ({stream_share:.1f}% from stream), "
+          f"{identity_stats['handles_cleared']} cleared, {identity_stats['reresolutions']} re-resolved, "
+          f"{identity_stats['pending']} pending")
+    author_stats = author_directory.stats()
+    print(f"Authors: {author_stats['size']}/{author_stats['max_size']} author_ids cached "
+          f"({author_stats['hit_rate'] * 100:.1f}% hit rate), {author_stats['misses']} looked up, "
+          f"{author_stats['evictions']} evictions, {author_stats['touched']} last_seen refreshes "
+          f"({author_stats['pending_touches']} pending, {author_stats['touch_errors']} errors), "
+          f"{author_stats['unassigned']} rows dropped without an author_id")
+    dedupe_stats = post_dedupe.stats()
+    print(f"Dedupe: {dedupe_stats['inserted']} posts inserted, {dedupe_stats['duplicates']} duplicates skipped, "
+          f"{dedupe_stats['deletes']} deleted ({dedupe_stats['deletes_buffered']} while still buffered), "
+          f"{dedupe_stats['tombstones']} tombstones for unseen posts, "
+          f"{dedupe_stats['tombstone_hits']} creates of deleted posts skipped, {dedupe_stats['updates']} updates, "
+          f"{dedupe_stats['merge_misses']} bulk rows the merge did not insert")
+    rollup_stats = rollups.stats()
+    print(f"Rollups: {rollup_stats['posts_counted']} posts counted, {rollup_stats['language_rows']} language / "
+          f"{rollup_stats['author_rows']} author rows upserted in {rollup_stats['flushes']} flushes, "
+          f"{rollup_stats['pending_buckets']} buckets pending, {rollup_stats['flush_errors']} flush errors")
+    for writer in [post_writer, *record_writers.values()]:
+        if writer.spill is None:
+            continue
+        spill_stats = writer.stats()
+        state = "DB unreachable" if spill_stats['db_down'] else "DB ok"
+        print(f"Spill ({writer.name}): {spill_stats['spill_backlog_rows']} rows / "
+              f"{spill_stats['spill_backlog_bytes'] / 1024 / 1024:.1f}MB backlog, "
+              f"{spill_stats['rows_spilled']} spilled, {spill_stats['rows_drained']} drained "
+              f"({spill_stats['drain_rate']:.0f} rows/s), {spill_stats['drain_errors']} drain errors, {state}")
+    if post_writer.bulk is not None:
+        bulk_stats = post_writer.bulk.stats()
+        state = "active" if post_writer.bulk_active else "idle"
+        print(f"Bulk load ({state}): {bulk_stats['loads']} loads, {bulk_stats['rows_staged']} rows staged, "
+              f"{bulk_stats['rows_merged']} merged, {bulk_stats['rows_per_second']:.0f} rows/s "
+              f"(last batch {bulk_stats['last_rows_per_second']:.0f} rows/s)")
+    flight_stats = resolution_flights.stats()
+    print(f"Resolution flights: {flight_stats['flights']} DIDs in flight (max {flight_stats['max_flights']}), "
+          f"{flight_stats['coalesced']} posts coalesced, {flight_stats['keys_rejected']} DIDs rejected, "
+          f"{flight_stats['stale_restarted']} stale restarts")
+    resolver_stats = did_resolver.stats()
+    print(f"Resolver: {resolver_stats['requests']} requests, {resolver_stats['resolved']} resolved, "
+          f"{resolver_stats['not_found']} not found, {resolver_stats['tombstoned']} tombstoned, "
+          f"{resolver_stats['no_handle']} without handle, {resolver_stats['invalid']} invalid, "
+          f"{resolver_stats['errors']} errors, {resolver_stats['timeouts']} timeouts, "
+          f"{resolver_stats['in_flight']} in flight "
+          f"(max {resolver_stats['max_in_flight_seen']}), {resolver_stats['avg_request_time'] * 1000:.0f}ms avg")
+    retry_stats = retry_scheduler.stats()
+    print(f"Retry schedule: {retry_stats['queued']}/{retry_stats['due']} due DIDs queued in "
+          f"{retry_stats['passes']} passes ({retry_stats['in_flight']} already in flight), "
+          f"{retry_stats['passes_skipped']} passes skipped for a busy queue, {retry_stats['errors']} errors")
+    if isinstance(firehose_client, JetstreamClient):
+        jetstream_stats = firehose_client.stats()
+        print(f"Jetstream: {jetstream_stats['events']} events, {jetstream_stats['bytes'] / 1024 / 1024:.1f}MB received, "
+              f"{jetstream_stats['connects']} connects, {jetstream_stats['bad_messages']} bad messages")
+    if decode_pipeline is not None:
+        pipeline_stats = decode_pipeline.stats()
+        print(f"Decode pipeline: {pipeline_stats['frames_decoded']}/{pipeline_stats['frames_received']} frames "
+              f"decoded by {pipeline_stats['processes']} processes, "
+              f"frame queue {pipeline_stats['frame_queue_depth']} (max {pipeline_stats['max_frame_queue_depth']}), "
+              f"{pipeline_stats['inflight_chunks']} chunks in flight, {pipeline_stats['decode_errors']} decode errors, "
+              f"{pipeline_stats['pool_restarts']} pool restarts")
+    processed, skipped = collection_counts['processed'], collection_counts['skipped']
+    print("Ops processed: " + (", ".join(f"{c} {n}" for c, n in processed.most_common()) or "none"))
+    print("Ops skipped: " + (", ".join(f"{c} {n}" for c, n in skipped.most_common(8)) or "none"))
+    for collection, writer in record_writers.items():
+        record_stats = writer.stats()
+        print(f"{RECORD_TABLES[collection]} writer: {record_stats['rows_written']} rows in "
+              f"{record_stats['batches']} batches, queue depth {record_stats['queue_depth']}, "
+              f"dropped {record_stats['rows_dropped']}, rejected {record_stats['rows_rejected']}")
+    if segment_writer is not None:
+        segment_stats = segment_writer.stats()
+        print(f"Segments: {segment_stats['records']} records / {segment_stats['bytes'] / 1048576:.1f} MB appended, "
+              f"segment {segment_stats['segment_id']} at {segment_stats['segment_bytes'] / 1048576:.1f} MB, "
+              f"{segment_stats['syncs']} fsyncs, {segment_stats['segments_sealed']} sealed")
+    cursor_stats = cursor_tracker.stats()
+    mode = "catching up" if catch_up.catching_up else "live"
+    print(f"Cursor: {mode}, {catch_up.lag_seconds:.1f}s behind live, "
+          f"received seq {cursor_stats['received_seq']}, committed seq {cursor_stats['committed_seq']}, "
+          f"{cursor_stats['frames_in_flight']} frames in flight"
+          + (f", STALLED at {cursor_stats['stalled_at']} ({cursor_stats['rows_lost']} rows lost)"
+             if cursor_stats['stalled_at'] is not None else ""))
+    last_stats_time = current_time
+
+def track_frame(seq, event_time, row_count):
+    """Register a received frame with the cursor and update catch-up mode"""
+    global frames_since_cursor_update
+    
+    cursor_tracker.begin(seq, row_count)
+    
+    # Keep the client's reconnect cursor current, otherwise a reconnect rolls back
+    frames_since_cursor_update += 1
+    if seq is not None and firehose_client is not None and frames_since_cursor_update >= CURSOR_UPDATE_EVERY:
+        firehose_client.update_params({'cursor': seq})
+        frames_since_cursor_update = 0
+    
+    if catch_up.observe(event_time):
+        if catch_up.catching_up:
+            print(f"⏩ {catch_up.lag_seconds:.0f}s behind live, switching to catch-up mode")
+            for writer in [post_writer, *record_writers.values()]:
+                writer.set_batch_limits(*CATCH_UP_BATCH_LIMITS)
+        else:
+            print(f"✅ Caught up with live ({catch_up.lag_seconds:.1f}s behind)")
+            for writer in [post_writer, *record_writers.values()]:
+                writer.set_batch_limits(*LIVE_BATCH_LIMITS)
+
+def handle_decoded_posts(posts, errors, seq=None):
+    """Look up cached handles and hand decoded posts to the batched writer"""
+    global total_errors, posts_processed
+    
+    for post in posts:
+        author_did = post['author_did']
+        text = post['text']
+        
+        # Authors not in the handle cache are looked up (and resolved if due)
+        # by the resolution workers; the post itself only needs the DID (the
+        # writer swaps in the author_id). Known failures are negative entries
+        # and wait for their retry schedule.
+        cached_handle = handle_cache.get(author_did)
+        if cached_handle is MISS:
+            queue_resolution(author_did)
+            cached_handle = None
         
-        # Sync cached handles to posts
-        synced = sync_cached_handles_to_posts()
+        row = (author_did, text, post['created_at'],
+               post['language'], post['post_uri'], post['raw_record'])
+        post_writer.submit(PostUpdate(row) if post['action'] == 'update' else row, seq=seq)
+        posts_processed += 1
         
-        print(f"Stats: {posts_processed} posts processed, {resolutions_queued} resolutions queued, "
-              f"Resolution queue: {queue_size}, Update queue: {update_queue_size}")
-        last_stats_time = current_time
+        if not catch_up.catching_up:
+            handle_display = cached_handle or "resolving..."
+            print(f"Queued post from @{handle_display}: {text[:50]}{'...' if len(text) > 50 else ''}")
+    
+    for message, raw_json in errors:
+        total_errors += 1
+        error_filename = f'errors/{total_errors}.json'
+        with open(error_filename, 'w') as f:
+            f.write(raw_json)
+        print(f"Error processing message: {message}, saved to {error_filename}")
+
+def handle_decoded_commit(seq, event_time, decoded):
+    """Count routed/skipped ops and hand posts and other routed records to their writers"""
+    collection_counts['processed'].update(decoded['processed'])
+    collection_counts['skipped'].update(decoded['skipped'])
+    
+    records = decoded['records']
+    row_count = (len(decoded['posts']) + len(decoded['deletes'])
+                 + sum(len(rows) for rows in records.values()))
+    track_frame(seq, event_time, row_count)
+    
+    handle_decoded_posts(decoded['posts'], decoded['errors'], seq)
+    # Deletes queue behind the creates they may cancel (see ingest/dedupe.py)
+    for post_uri in decoded['deletes']:
+        post_writer.submit(PostDelete(post_uri), seq=seq)
+    for collection, rows in records.items():
+        writer = record_writers[collection]
+        for row in rows:
+            writer.submit(row, seq=seq)
+
+def on_message_handler(message):
+    # Process any pending database updates first
+    process_database_updates()
+    report_stats_if_due()
+    
+    seq = message.body.get('seq')
+    if message.type in IDENTITY_EVENT_TYPES:
+        identity_updater.submit(*identity_from_body(message.body))
+        track_frame(seq, message.body.get('time'), 0)
+        return
     
     commit = parse_subscribe_repos_message(message)
     if not isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit):
+        track_frame(seq, message.body.get('time'), 0)
         return
-    car = CAR.from_bytes(commit.blocks)
     
-    # Extract author DID from the commit
-    author_did = commit.repo
+    handle_decoded_commit(seq, commit.time, decode_commit(commit, routes))
+
+def on_decoded_frame(result):
+    """Pipeline mode: called in receive order with frames decoded by worker processes"""
+    process_database_updates()
+    report_stats_if_due()
+    if result['identity'] is not None:
+        identity_updater.submit(*result['identity'])
+    handle_decoded_commit(result['seq'], result['time'], result)
+
+def on_jetstream_event(event):
+    """Jetstream source: JSON events go through the same save path as decoded frames"""
+    on_decoded_frame(decode_jetstream_event(event, routes))
+
+def on_shard_frames(receiver_id, frames):
+    """Shard worker mode: decode frames forwarded by a router and save them as usual"""
+    process_database_updates()
+    report_stats_if_due()
+    for data in frames:
+        try:
+            result = decode_frame(data, routes)
+        except Exception as e:
+            print(f"Error decoding forwarded frame: {e}")
+            # Still register the seq so this router's watermark can move past it
+            info = frame_route_info(data)
+            if info is not None and info[1] is not None:
+                track_frame((receiver_id, info[1]), info[2], 0)
+            continue
+        if result is None:
+            continue
+        if result['seq'] is not None:
+            result['seq'] = (receiver_id, result['seq'])
+        on_decoded_frame(result)
+
+def start_resolution_workers(num_workers):
+    """Start background DID resolution worker threads"""
+    workers = []
+    for i in range(num_workers):
+        worker = threading.Thread(target=did_resolution_worker, daemon=True)
+        worker.start()
+        workers.append(worker)
+    
+    print(f"Started {num_workers} DID resolution worker threads")
+    return workers
+
+def attach_spill(writer, args):
+    """Give a writer its own spill directory; leftovers from a previous run are drained first"""
+    writer.spill = SpillQueue(os.path.join(args.spill_dir, writer.name))
+    writer.spill_threshold = args.spill_threshold
+    backlog = writer.spill.stats()['backlog_rows']
+    if backlog:
+        print(f"🔄 {backlog} spilled {writer.name} rows from a previous run will be drained")
+
+def read_shard_workers(args):
+    """Worker addresses from --shard-workers-file (one per line) or --shard-workers"""
+    if args.shard_workers_file:
+        with open(args.shard_workers_file) as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [a.strip() for a in args.shard_workers.split(',') if a.strip()]
+
+def run_shard_router(args):
+    """Receive the firehose and forward raw frames to shard workers by repo DID"""
+    global cursor_checkpointer, firehose_client
+    
+    init_database()
+    router = ShardRouter(read_shard_workers(args))
+    start_seq = None if args.no_resume else load_cursor(db_pool, args.cursor_name)
+    if start_seq is not None:
+        print(f"Resuming firehose from cursor {start_seq} ({args.cursor_name})")
+    router.start(start_seq)
+    
+    # The router's watermark only moves once every worker has committed its frames
+    cursor_checkpointer = CursorCheckpointer(db_pool, router, name=args.cursor_name)
+    cursor_checkpointer.start()
+    
+    params = {'cursor': start_seq} if start_seq is not None else None
+    firehose_client = RawFirehoseSubscribeReposClient(params, **({'base_uri': FIREHOSE_URL} if FIREHOSE_URL else {}))
+    state = {
+        'frames': 0,
+        'last_check': time.time(),
+        'last_stats': time.time(),
+        'workers_mtime': os.path.getmtime(args.shard_workers_file) if args.shard_workers_file else None,
+    }
+    
+    def on_raw_frame(data):
+        router.route(data)
+        state['frames'] += 1
+        if state['frames'] % CURSOR_UPDATE_EVERY == 0 and router.received_seq is not None:
+            firehose_client.update_params({'cursor': router.received_seq})
+        
+        now = time.time()
+        if args.shard_workers_file and now - state['last_check'] >= 5:
+            # Editing the workers file adds or removes workers without a restart
+            state['last_check'] = now
+            mtime = os.path.getmtime(args.shard_workers_file)
+            if mtime != state['workers_mtime']:
+                state['workers_mtime'] = mtime
+                router.set_workers(read_shard_workers(args))
+        if now - state['last_stats'] >= 30:
+            state['last_stats'] = now
+            stats = router.stats()
+            print(f"Router: {stats['frames_routed']}/{stats['frames_received']} frames routed, "
+                  f"received seq {stats['received_seq']}, committed seq {stats['committed_seq']}, "
+                  f"{stats['route_errors']} errors, {stats['rebalances']} rebalances, "
+                  f"{stats['frames_undelivered']} frames undelivered")
+            if stats['stalled']:
+                print(f"  ⚠️ Lost a shard worker, cursor stalled at {stats['stalled_at']}")
+            for address, shard in stats['shards'].items():
+                print(f"  {address}: {shard['frames']} frames, sent seq {shard['sent_seq']}, "
+                      f"acked seq {shard['acked_seq']}{'' if shard['connected'] else ', disconnected'}")
     
-    for op in commit.ops:
-        if op.action in ["create"] and op.cid:
-            raw = car.blocks.get(op.cid)
-            cooked = get_or_create(raw, strict=False)
-            try:
-                if cooked.py_type == "app.bsky.feed.post":
-                    # Extract post data
-                    text = getattr(cooked, 'text', '')
-                    created_at = getattr(cooked, 'created_at', '')
-                    langs = getattr(cooked, 'langs', [])
-                    language = langs[0] if langs else None
-                    
-                    # Construct post URI from the operation path
-                    post_uri = f"at://{author_did}/{op.path}"
-                    
-                    # Check cache for handle
-                    cached_handle = get_cached_handle(author_did)
-                    
-                    # Convert raw data to JSON string for storage
-                    raw_json = json.dumps(raw, cls=JSONExtra)
-                    
-                    # Save to database (fast, no network calls)
-                    post_id = save_post_to_db(author_did, cached_handle, text, created_at, language, post_uri, raw_json)
-                    posts_processed += 1
-                    
-                    # If no cached handle, queue for background resolution
-                    if cached_handle is None:
-                        if author_did in pending_resolutions:
-                            pending_resolutions[author_did].append(post_id)
-                        else:
-                            pending_resolutions[author_did] = [post_id]
-                            # Queue DID for resolution with current post_id
-                            resolution_queue.put((author_did, [post_id]))
-                            resolutions_queued += 1
-                    
-                    handle_display = cached_handle or "resolving..."
-                    print(f"Saved post from @{handle_display}: {text[:50]}{'...' if len(text) > 50 else ''}")
-            except Exception as e:
-                total_errors += 1
-                error_filename = f'errors/{total_errors}.json'
-                with open(error_filename, 'w') as f:
-                    json.dump(raw, f, indent=2, cls=JSONExtra)
-                print(f"Error processing message: {e}, saved to {error_filename}")
-
-def sync_cached_handles_to_posts():
-    """Sync cached handles to posts that haven't been updated yet"""
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = conn.cursor()
+        firehose_client.start(on_raw_frame)
+    finally:
+        print("Waiting for shard workers to commit...")
+        router.close()
+        cursor_checkpointer.stop()
+        print(f"Saved firehose cursor {cursor_checkpointer.saved_seq} ({args.cursor_name})")
+        db_pool.close_all()
+
+# Threaded-mode features the async ingester does not have (no cursor
+# checkpoints, record tables, segment store, spill queue or bulk load)
+ASYNC_UNSUPPORTED_OPTIONS = ('--decode-processes', '--resolver-threads', '--collections', '--raw-store',
+                             '--segment-dir', '--segment-size-mb', '--spill-dir', '--spill-threshold', '--no-spill',
+                             '--bulk-threshold', '--no-bulk-load', '--no-resume', '--cursor-name')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest Bluesky firehose posts into MariaDB")
+    parser.add_argument('--mode', choices=['threaded', 'async', 'shard-router', 'shard-worker'], default='threaded',
+                        help="threaded: worker threads + connection pool; async: single asyncio event loop; "
+                             "shard-router: receive and forward frames to shard workers by repo DID; "
+                             "shard-worker: ingest the frames a router forwards")
+    parser.add_argument('--decode-processes', type=int, default=0,
+                        help="decode frames in this many worker processes (0 = decode inline on the receive thread)")
+    parser.add_argument('--resolver-threads', type=int, default=10,
+                        help="number of DID resolution worker threads")
+    parser.add_argument('--resolver-in-flight', type=int, default=32,
+                        help="most concurrent DID document requests, shared by all resolver threads")
+    parser.add_argument('--resolve-timeout', type=float, default=5.0,
+                        help="timeout per DID document request, in seconds")
+    parser.add_argument('--collections', default='',
+                        help="comma-separated extra collections to store in their own tables "
+                             f"({', '.join(sorted(RECORD_TABLES))})")
+    parser.add_argument('--raw-store', choices=['db', 'segments'], default='db',
+                        help="db: raw records in posts.raw_record; segments: append-only files, "
+                             "posts keeps only a (segment, offset, length) reference")
+    parser.add_argument('--segment-dir', default=DEFAULT_SEGMENT_DIR,
+                        help="directory for raw record segment files")
+    parser.add_argument('--segment-size-mb', type=int, default=256,
+                        help="rotate segment files at this size")
+    parser.add_argument('--spill-dir', default=DEFAULT_SPILL_DIR,
+                        help="directory for rows spilled to disk while the database is down or behind")
+    parser.add_argument('--spill-threshold', type=int, default=15000,
+                        help="spill rows to disk once a writer queue holds this many rows")
+    parser.add_argument('--no-spill', action='store_true',
+                        help="block on a full writer queue and drop rows on database errors instead of spilling")
+    parser.add_argument('--bulk-threshold', type=int, default=5000,
+                        help="switch the post writer to LOAD DATA batches once its queue holds this many rows")
+    parser.add_argument('--no-bulk-load', action='store_true',
+                        help="always write posts with multi-row INSERTs, even when the queue is deep")
+    parser.add_argument('--source', choices=['firehose', 'jetstream'], default='firehose',
+                        help="firehose: CBOR frames from com.atproto.sync.subscribeRepos; "
+                             "jetstream: JSON events filtered server-side to the routed collections")
+    parser.add_argument('--jetstream-url', default=DEFAULT_JETSTREAM_URL,
+                        help="Jetstream subscribe endpoint, e.g. benchmarks/jetstream_replay.py --serve")
+    parser.add_argument('--firehose-url',
+                        help="firehose base URI (default wss://bsky.network/xrpc), e.g. a synthetic firehose")
+    parser.add_argument('--plc-url', help="PLC directory URL for DID resolution (default https://plc.directory)")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="ignore the saved firehose cursor and start from live")
+    parser.add_argument('--cursor-name',
+                        help="ingest_cursor row for this receiver (give each shard router its own; "
+                             f"default {DEFAULT_CURSOR_NAME}, or {DEFAULT_JETSTREAM_CURSOR_NAME} for --source jetstream)")
+    parser.add_argument('--shard-workers', default='',
+                        help="shard-router: comma-separated worker addresses (Unix socket path, or host:port "
+                             "with SHARD_AUTHKEY set)")
+    parser.add_argument('--shard-workers-file',
+                        help="shard-router: file with one worker address per line, re-read when it changes")
+    parser.add_argument('--shard-listen', default='localhost:7100',
+                        help="shard-worker: address to accept router connections on (TCP needs SHARD_AUTHKEY)")
+    args = parser.parse_args()
+    if args.source == 'jetstream' and (args.mode != 'threaded' or args.decode_processes > 0):
+        parser.error("--source jetstream only runs in threaded mode without --decode-processes")
+    if args.mode == 'async':
+        dests = {option: option[2:].replace('-', '_') for option in ASYNC_UNSUPPORTED_OPTIONS}
+        unsupported = [option for option, dest in dests.items() if getattr(args, dest) != parser.get_default(dest)]
+        if unsupported:
+            parser.error(f"--mode async does not support {', '.join(unsupported)}")
+    # Validated before main() starts any threads
+    args.collections = [c.strip() for c in args.collections.split(',') if c.strip()]
+    try:
+        args.routes = build_routes(args.collections)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.mode in ('shard-router', 'shard-worker'):
+        addresses = read_shard_workers(args) if args.mode == 'shard-router' else [args.shard_listen]
+        try:
+            for address in addresses:
+                check_authkey(parse_address(address))
+        except ValueError as e:
+            parser.error(str(e))
+    if args.cursor_name is None:
+        # time_us cursors and firehose seqs must not share a row
+        args.cursor_name = DEFAULT_JETSTREAM_CURSOR_NAME if args.source == 'jetstream' else DEFAULT_CURSOR_NAME
+    return args
+
+def main():
+    global decode_pipeline, cursor_checkpointer, cursor_tracker, firehose_client, routes, segment_writer
+    global PLC_URL, FIREHOSE_URL, did_resolver
+    
+    args = parse_args()
+    PLC_URL = args.plc_url
+    FIREHOSE_URL = args.firehose_url
+    did_resolver = DidResolver(plc_url=PLC_URL, max_in_flight=args.resolver_in_flight, timeout=args.resolve_timeout)
+    
+    if args.mode == 'async':
+        # Imported lazily so the threaded mode does not need aiomysql
+        from ingest.async_ingest import run_async_ingest
+        run_async_ingest(MYSQL_CONFIG, plc_url=PLC_URL, firehose_url=FIREHOSE_URL,
+                         resolver_concurrency=args.resolver_in_flight, resolve_timeout=args.resolve_timeout)
+        return
+    if args.mode == 'shard-router':
+        run_shard_router(args)
+        return
+    if args.mode == 'shard-worker':
+        # Seqs become (router, seq) pairs; each router gets its own watermark
+        cursor_tracker = ReceiverCursors()
+        post_writer.on_committed = cursor_tracker.rows_committed
+        post_writer.on_failed = cursor_tracker.rows_failed
+    
+    # Initialize the database
+    init_database()
+    warm_handle_cache()
+    
+    # Start background worker threads
+    workers = start_resolution_workers(args.resolver_threads)
+    
+    # Requeue failed resolutions as their retries come due
+    retry_scheduler.start()
+    print("Started retry scheduler thread")
+    
+    if args.raw_store == 'segments':
+        # Writer threads append each batch's records to the segment files and
+        # fsync them before inserting rows that only reference them
+        segment_writer = SegmentWriter(args.segment_dir, max_segment_bytes=args.segment_size_mb * 1024 * 1024)
+        post_writer.insert_sql = INSERT_POSTS_SEGMENT_SQL
+        post_writer.prepare_batch = segment_writer.externalize_rows
+        print(f"Writing raw records to segment files in {args.segment_dir}")
+    if not args.no_spill:
+        attach_spill(post_writer, args)
+    if not args.no_bulk_load:
+        post_writer.bulk = BulkLoader()
+        post_writer.bulk_threshold = args.bulk_threshold
+    post_writer.start()
+    identity_updater.start()
+    rollups.start()
+    author_directory.start()
+    
+    routes = args.routes
+    for collection in args.collections:
+        writer = PostWriter(
+            db_pool,
+            insert_sql=insert_record_sql(collection),
+            name=RECORD_TABLES[collection],
+            on_committed=cursor_tracker.rows_committed,
+            on_failed=cursor_tracker.rows_failed,
+        )
+        if not args.no_spill:
+            attach_spill(writer, args)
+        writer.start()
+        record_writers[collection] = writer
+    print(f"Routing collections: {', '.join(sorted(routes))}")
+    
+    if args.mode == 'shard-worker':
+        # Frames come from shard routers, which own the firehose cursors
+        shard_worker = ShardWorker(args.shard_listen, on_shard_frames, cursor_tracker)
+        run = shard_worker.serve_forever
+    else:
+        # Resume from the last checkpointed seq (everything up to it is committed)
+        start_seq = None if args.no_resume else load_cursor(db_pool, args.cursor_name)
+        params = None
+        if start_seq is not None:
+            print(f"Resuming firehose from cursor {start_seq}")
+            params = {'cursor': start_seq}
+        else:
+            print("No saved cursor, starting from live")
+        cursor_tracker.received_seq = cursor_tracker.committed_seq = start_seq
+        cursor_checkpointer = CursorCheckpointer(db_pool, cursor_tracker, name=args.cursor_name)
+        cursor_checkpointer.start()
+        
+        firehose_kwargs = {'base_uri': FIREHOSE_URL} if FIREHOSE_URL else {}
+        if args.source == 'jetstream':
+            # Records arrive as JSON; nothing to decode in worker processes
+            firehose_client = JetstreamClient(params, base_uri=args.jetstream_url, collections=sorted(routes))
+            run = lambda: firehose_client.start(on_jetstream_event)
+        elif args.decode_processes > 0:
+            # Receiver only enqueues raw frames; worker processes do all the decoding
+            decode_pipeline = DecodePipeline(on_decoded_frame, processes=args.decode_processes, routes=routes)
+            decode_pipeline.start()
+            firehose_client = RawFirehoseSubscribeReposClient(params, **firehose_kwargs)
+            run = lambda: firehose_client.start(decode_pipeline.submit)
+        else:
+            firehose_client = FirehoseSubscribeReposClient(params, **firehose_kwargs)
+            run = lambda: firehose_client.start(on_message_handler)
+    
+    try:
+        run()
+    finally:
+        if decode_pipeline is not None:
+            print("Draining decode pipeline...")
+            decode_pipeline.close()
         
-        cursor.execute('''
-            UPDATE posts p
-            JOIN did_cache dc ON p.author_did = dc.did
-            SET p.author_handle = dc.handle
-            WHERE p.author_handle IS NULL 
-            AND dc.handle IS NOT NULL
-        ''')
+        # Flush rows still waiting in the writer queue
+        print("Flushing post writer...")
+        post_writer.close()
+        for writer in record_writers.values():
+            writer.close()
+        if segment_writer is not None:
+            segment_writer.close()
+        identity_updater.stop()
+        rollups.stop()
+        author_directory.stop()
+        retry_scheduler.stop()
         
-        updated_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        # Everything the writer committed is now covered by the final checkpoint
+        if cursor_checkpointer is not None:
+            cursor_checkpointer.stop()
+            print(f"Saved firehose cursor {cursor_checkpointer.saved_seq}")
         
-        if updated_count > 0:
-            print(f"🔄 Synced {updated_count} posts with cached handles")
+        # Shutdown worker threads
+        print("Shutting down worker threads...")
+        for _ in workers:
+            resolution_queue.put(None)  # Shutdown signal
+        for worker in workers:
+            worker.join(timeout=5)
+        did_resolver.close()
         
-        return updated_count
-    except mysql.connector.Error as e:
-        print(f"Error syncing cached handles: {e}")
-        return 0
-
-try:
-    client.start(on_message_handler)
-finally:
-    # Shutdown worker threads
-    print("Shutting down worker threads...")
-    for _ in workers:
-        resolution_queue.put((None, None))  # Shutdown signal
-    for worker in workers:
-        worker.join(timeout=5)
\ No newline at end of file
+        # Apply handle updates the resolver workers queued instead of dropping them
+        process_database_updates()
+        db_pool.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -11,45 +11,64 @@ MYSQL_CONFIG = {
 }
 
 def view_cache_stats():
-    """View DID cache statistics"""
+    """View DID resolution statistics (authors table)"""
     conn = mysql.connector.connect(**MYSQL_CONFIG)
     cursor = conn.cursor()
     
-    # Total cached DIDs
-    cursor.execute('SELECT COUNT(*) FROM did_cache')
+    # DIDs with a resolution attempt (authors rows without one are not resolved yet)
+    cursor.execute('SELECT COUNT(*) FROM authors WHERE resolved_at IS NOT NULL')
     total_cached = cursor.fetchone()[0]
     
     # Successfully resolved
-    cursor.execute('SELECT COUNT(*) FROM did_cache WHERE handle IS NOT NULL')
+    cursor.execute('SELECT COUNT(*) FROM authors WHERE handle IS NOT NULL')
     successful = cursor.fetchone()[0]
     
     # Failed resolutions
-    cursor.execute('SELECT COUNT(*) FROM did_cache WHERE handle IS NULL')
+    cursor.execute('SELECT COUNT(*) FROM authors WHERE handle IS NULL AND resolved_at IS NOT NULL')
     failed = cursor.fetchone()[0]
     
     # Recent resolutions (last 24 hours)
     cursor.execute('''
-        SELECT COUNT(*) FROM did_cache 
+        SELECT COUNT(*) FROM authors 
         WHERE resolved_at > DATE_SUB(NOW(), INTERVAL 1 DAY)
     ''')
     recent = cursor.fetchone()[0]
     
+    # Failures by cause, and how many of them are still scheduled for a retry
+    cursor.execute('''
+        SELECT resolution_error, COUNT(*), SUM(next_retry_at IS NOT NULL), SUM(next_retry_at <= NOW())
+        FROM authors
+        WHERE handle IS NULL AND resolution_error IS NOT NULL
+        GROUP BY resolution_error
+        ORDER BY COUNT(*) DESC
+    ''')
+    failures = cursor.fetchall()
+    
     print(f"=== DID Cache Statistics ===")
     print(f"Total cached DIDs: {total_cached}")
     print(f"Successfully resolved: {successful}")
     print(f"Failed resolutions: {failed}")
+    for error, count, scheduled, due in failures:
+        print(f"  {error}: {count} ({scheduled or 0} scheduled for retry, {due or 0} due now)")
     print(f"Resolved in last 24h: {recent}")
     
     conn.close()
 
+def resolution_status(handle, failed_attempts, error, next_retry_at):
+    if handle:
+        return f"@{handle}"
+    retry = f"retry at {next_retry_at}" if next_retry_at else "no retry"
+    return f"FAILED: {error or 'unknown'} ({failed_attempts} attempts, {retry})"
+
 def view_recent_resolutions(limit=20):
     """View recent DID resolutions"""
     conn = mysql.connector.connect(**MYSQL_CONFIG)
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT did, handle, resolved_at, failed_attempts
-        FROM did_cache 
+        SELECT did, handle, resolved_at, failed_attempts, resolution_error, next_retry_at
+        FROM authors 
+        WHERE resolved_at IS NOT NULL
         ORDER BY resolved_at DESC 
         LIMIT %s
     ''', (limit,))
@@ -58,21 +77,26 @@ def view_recent_resolutions(limit=20):
     conn.close()
     
     print(f"=== Recent DID Resolutions ===")
-    for did, handle, resolved_at, failed_attempts in results:
-        status = f"@{handle}" if handle else f"FAILED ({failed_attempts} attempts)"
-        print(f"{resolved_at}: {did} -> {status}")
+    for did, handle, resolved_at, failed_attempts, error, next_retry_at in results:
+        print(f"{resolved_at}: {did} -> {resolution_status(handle, failed_attempts, error, next_retry_at)}")
 
 def clear_failed_cache():
     """Clear failed resolution attempts to allow retries"""
     conn = mysql.connector.connect(**MYSQL_CONFIG)
     cursor = conn.cursor()
     
-    cursor.execute('DELETE FROM did_cache WHERE handle IS NULL')
-    deleted = cursor.rowcount
+    # Posts reference authors rows, so only the resolution state is reset; the
+    # ingester's retry scheduler picks the rows up in batches
+    cursor.execute('''
+        UPDATE authors
+        SET resolved_at = NULL, failed_attempts = 0, resolution_error = NULL, next_retry_at = NOW()
+        WHERE handle IS NULL AND resolved_at IS NOT NULL
+    ''')
+    cleared = cursor.rowcount
     conn.commit()
     conn.close()
     
-    print(f"Cleared {deleted} failed resolution entries from cache")
+    print(f"Cleared {cleared} failed resolution entries from cache")
 
 def search_cache(search_term):
     """Search cache by handle or DID"""
@@ -80,8 +104,8 @@ def search_cache(search_term):
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT did, handle, resolved_at, failed_attempts
-        FROM did_cache 
+        SELECT did, handle, resolved_at, failed_attempts, resolution_error, next_retry_at
+        FROM authors 
         WHERE did LIKE %s OR handle LIKE %s
         ORDER BY resolved_at DESC
     ''', (f'%{search_term}%', f'%{search_term}%'))
@@ -90,34 +114,8 @@ def search_cache(search_term):
     conn.close()
     
     print(f"=== Cache entries matching '{search_term}' ===")
-    for did, handle, resolved_at, failed_attempts in results:
-        status = f"@{handle}" if handle else f"FAILED ({failed_attempts} attempts)"
-        print(f"{resolved_at}: {did} -> {status}")
-
-def rebuild_cache_from_posts():
-    """Rebuild cache from existing posts data"""
-    conn = mysql.connector.connect(**MYSQL_CONFIG)
-    cursor = conn.cursor()
-    
-    # Get unique DIDs with handles from posts
-    cursor.execute('''
-        SELECT DISTINCT author_did, author_handle 
-        FROM posts 
-        WHERE author_handle IS NOT NULL
-    ''')
-    
-    posts_data = cursor.fetchall()
-    
-    for did, handle in posts_data:
-        cursor.execute('''
-            INSERT IGNORE INTO did_cache (did, handle, resolved_at, failed_attempts)
-            VALUES (%s, %s, NOW(), 0)
-        ''', (did, handle))
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"Rebuilt cache from {len(posts_data)} existing posts")
+    for did, handle, resolved_at, failed_attempts, error, next_retry_at in results:
+        print(f"{resolved_at}: {did} -> {resolution_status(handle, failed_attempts, error, next_retry_at)}")
 
 if __name__ == "__main__":
     import sys
@@ -134,9 +132,7 @@ if __name__ == "__main__":
         elif command == "search" and len(sys.argv) > 2:
             search_term = sys.argv[2]
             search_cache(search_term)
-        elif command == "rebuild":
-            rebuild_cache_from_posts()
         else:
-            print("Usage: python cache_manager.py [stats|recent [limit]|clear|search <term>|rebuild]")
+            print("Usage: python cache_manager.py [stats|recent [limit]|clear|search <term>]")
     else:
         view_cache_stats()
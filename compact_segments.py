@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Compact raw record segment files (bsky.py --raw-store segments).
+
+For every sealed segment, counts the bytes still referenced from posts. A
+segment with no live records is deleted; one whose garbage share (records
+of rows deleted by retention, plus bytes orphaned by crashes) is above
+--min-garbage has its live records copied into a fresh segment, the posts
+references repointed, and the old file deleted. Readers holding a mapping
+of a deleted segment keep working; new reads follow the new references.
+
+Open segments left behind by a crashed ingester (not modified for
+--stale-minutes and not locked by a running writer) are sealed first so they
+can be compacted too.
+"""
+import argparse
+import fcntl
+import os
+import time
+
+import mysql.connector
+
+from ingest.segment_store import DEFAULT_SEGMENT_DIR, SegmentReader, SegmentWriter, list_segments, segment_path
+
+# Database configuration
+MYSQL_CONFIG = {
+    'host': 'mariadb',
+    'database': 'bsky_db',
+    'user': 'bsky_user',
+    'password': 'bsky_password',
+    'port': 3306,
+    'autocommit': True
+}
+
+UPDATE_CHUNK = 1000
+
+def seal_stale_segments(directory, stale_minutes):
+    """Seal .open segments nobody has appended to for a while and no writer holds"""
+    cutoff = time.time() - stale_minutes * 60
+    for segment_id, sealed, path in list_segments(directory):
+        if sealed or os.path.getmtime(path) >= cutoff:
+            continue
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            continue  # sealed by its writer meanwhile
+        with f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"Open segment {segment_id} is idle but still held by a writer, leaving it")
+                continue
+            if not os.path.exists(path):
+                continue  # the writer sealed it before releasing the lock
+            os.rename(path, segment_path(directory, segment_id, sealed=True))
+            print(f"Sealed stale open segment {segment_id}")
+
+def live_records(cursor, segment_id):
+    cursor.execute('''
+        SELECT id, raw_offset, raw_length FROM posts
+        WHERE raw_segment = %s
+        ORDER BY raw_offset
+    ''', (segment_id,))
+    return cursor.fetchall()
+
+def compact_segment(conn, reader, writer, segment_id, records):
+    """Copy live records to the compaction writer and repoint their rows"""
+    blobs = [reader.read(segment_id, offset, length) for _, offset, length in records]
+    refs = writer.append_many(blobs)
+    
+    cursor = conn.cursor()
+    updates = [(new_segment, new_offset, post_id, segment_id, offset)
+               for (post_id, offset, _), (new_segment, new_offset, _) in zip(records, refs)]
+    for i in range(0, len(updates), UPDATE_CHUNK):
+        # Rows deleted since we read them simply match nothing
+        cursor.executemany('''
+            UPDATE posts SET raw_segment = %s, raw_offset = %s
+            WHERE id = %s AND raw_segment = %s AND raw_offset = %s
+        ''', updates[i:i + UPDATE_CHUNK])
+        conn.commit()
+    cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Reclaim space in raw record segment files")
+    parser.add_argument('--segment-dir', default=DEFAULT_SEGMENT_DIR)
+    parser.add_argument('--min-garbage', type=float, default=0.5,
+                        help="compact segments whose unreferenced share is at least this")
+    parser.add_argument('--stale-minutes', type=int, default=60,
+                        help="seal open segments not written for this long")
+    parser.add_argument('--segment-size-mb', type=int, default=256,
+                        help="rotation size for the compacted output segments")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be done")
+    args = parser.parse_args()
+    
+    if not args.dry_run:
+        seal_stale_segments(args.segment_dir, args.stale_minutes)
+    
+    conn = mysql.connector.connect(**MYSQL_CONFIG)
+    cursor = conn.cursor()
+    reader = SegmentReader(args.segment_dir)
+    writer = SegmentWriter(args.segment_dir, max_segment_bytes=args.segment_size_mb * 1024 * 1024)
+    
+    reclaimed = 0
+    try:
+        for segment_id, sealed, path in list_segments(args.segment_dir):
+            if not sealed:
+                continue
+            size = os.path.getsize(path)
+            records = live_records(cursor, segment_id)
+            live_bytes = sum(length for _, _, length in records)
+            garbage = 1 - live_bytes / size if size else 1.0
+            
+            if records and garbage < args.min_garbage:
+                continue
+            action = "delete" if not records else f"compact {len(records)} live records"
+            print(f"Segment {segment_id}: {size / 1048576:.1f} MB, {garbage * 100:.0f}% garbage -> {action}")
+            if args.dry_run:
+                continue
+            
+            if records:
+                compact_segment(conn, reader, writer, segment_id, records)
+                # Anything inserted after our scan would still point here; never expected for a sealed segment
+                if live_records(cursor, segment_id):
+                    print(f"⚠️ Segment {segment_id} still referenced, keeping it")
+                    continue
+            os.remove(path)
+            reclaimed += size - live_bytes
+    finally:
+        writer.close()
+        reader.close()
+        conn.close()
+    
+    print(f"✅ Reclaimed {reclaimed / 1048576:.1f} MB")
+
+if __name__ == "__main__":
+    main()
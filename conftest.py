@@ -0,0 +1,56 @@
+"""
+Shared test fixtures: benchmarks/ on sys.path (the SQLite stand-in, the
+synthetic firehose and the mock PLC directory live there), a stand-in pool
+per test, and the post row and query helpers the writer-side tests use.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+import mysql.connector
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from sqlite_standin import SQLitePool
+
+POST_DID = 'did:plc:test'
+
+
+def post(n, text='hello', author=1, language='en'):
+    """A post row in INSERT_POSTS_SQL column order.
+
+    author is the author_id, or the DID for rows queued before
+    AuthorDirectory assigns one; the post is then in that DID's repo.
+    """
+    did = author if isinstance(author, str) else POST_DID
+    return (author, text, None, language, f'at://{did}/app.bsky.feed.post/{n}', b'\x01')
+
+
+def uri(n):
+    return post(n)[4]
+
+
+def query(pool, sql, params=()):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def count_posts(pool):
+    return query(pool, 'SELECT COUNT(*) FROM posts')[0][0]
+
+
+class DownPool:
+    """A pool whose database is unreachable"""
+
+    @contextmanager
+    def connection(self):
+        raise mysql.connector.errors.InterfaceError("Can't connect to MySQL server")
+        yield
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return SQLitePool(str(tmp_path / 'standin.db'))
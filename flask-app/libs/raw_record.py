@@ -0,0 +1,112 @@
+"""
+Lazy decoding of stored post records for the API.
+
+posts.raw_record holds a one-byte format tag followed by a zstd frame of the
+record's DAG-CBOR (format written by ingest/codec.py in the ingester):
+0x01 = plain zstd, 0x02 = zstd with a trained dictionary, loaded from
+DICTIONARY_DIR/raw_record.<dict_id>.dict by the id in the frame header. Older rows only
+have JSON text in posts.raw_data, and with the ingester's segment store the
+blob lives in a segment file referenced by (raw_segment, raw_offset,
+raw_length). Nothing is read or decompressed until a route actually asks
+for the record.
+
+Segment maps are cached across requests (LRU, like the ingester's
+SegmentReader) and zstd decompressors are per thread, since a
+ZstdDecompressor must not be used by two threads at once.
+"""
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+import libipld
+import zstandard
+
+FORMAT_ZSTD = 0x01
+FORMAT_ZSTD_DICT = 0x02
+DICTIONARY_PATH = os.environ.get('RAW_RECORD_DICT', 'raw_record.dict')
+DICTIONARY_DIR = os.environ.get('RAW_RECORD_DICT_DIR', os.path.dirname(DICTIONARY_PATH) or '.')
+SEGMENT_DIR = os.environ.get('RAW_SEGMENT_DIR', 'raw_segments')
+MAX_OPEN_SEGMENTS = 64
+
+_local = threading.local()
+_segment_maps = OrderedDict()  # segment -> mmap, least recently used first
+_segment_lock = threading.Lock()
+
+
+def _segment_map(segment, min_size):
+    segment_map = _segment_maps.get(segment)
+    if segment_map is not None and len(segment_map) >= min_size:
+        _segment_maps.move_to_end(segment)
+        return segment_map
+    if segment_map is not None:
+        # the open segment has grown since it was mapped
+        segment_map.close()
+        del _segment_maps[segment]
+
+    for suffix in ('.seg', '.seg.open'):
+        try:
+            with open(os.path.join(SEGMENT_DIR, f"{segment:08d}{suffix}"), 'rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        raise FileNotFoundError(f"Segment {segment} not found in {SEGMENT_DIR}")
+
+    _segment_maps[segment] = segment_map
+    while len(_segment_maps) > MAX_OPEN_SEGMENTS:
+        _, evicted = _segment_maps.popitem(last=False)
+        evicted.close()
+    return segment_map
+
+
+def read_segment_record(segment, offset, length):
+    """Read one record blob from a segment file via a cached mmap"""
+    with _segment_lock:
+        return _segment_map(segment, offset + length)[offset:offset + length]
+
+
+def _decompressor(dict_id):
+    """This thread's decompressor for a dictionary id (0 = no dictionary)"""
+    decompressors = getattr(_local, 'decompressors', None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+    if dict_id not in decompressors:
+        dict_data = None
+        if dict_id:
+            with open(os.path.join(DICTIONARY_DIR, f"raw_record.{dict_id}.dict"), 'rb') as f:
+                dict_data = zstandard.ZstdCompressionDict(f.read())
+        decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return decompressors[dict_id]
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, bytes):
+        try:
+            return libipld.encode_cid(value)
+        except Exception:
+            return value.hex()
+    return value
+
+
+def decode_raw_record(raw_record, raw_data=None, segment_ref=None):
+    """Return the stored record as a JSON-serialisable dict (None if the row has none)"""
+    if raw_record is None and segment_ref and segment_ref[0] is not None:
+        raw_record = read_segment_record(*segment_ref)
+    if raw_record is not None:
+        raw_record = bytes(raw_record)
+        tag = raw_record[0]
+        if tag not in (FORMAT_ZSTD, FORMAT_ZSTD_DICT):
+            raise ValueError(f"Unknown raw record format 0x{tag:02x}")
+        dict_id = zstandard.get_frame_parameters(raw_record[1:19]).dict_id if tag == FORMAT_ZSTD_DICT else 0
+        block = _decompressor(dict_id).decompress(raw_record[1:])
+        return _jsonable(libipld.decode_dag_cbor(block))
+    if raw_data:
+        return json.loads(raw_data)
+    return None
@@ -16,11 +16,12 @@ def register_routes(app):
         try:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT DISTINCT author_handle, author_did, COUNT(*) as post_count
-                FROM posts 
-                WHERE (author_handle LIKE %s OR author_did LIKE %s)
-                AND author_handle IS NOT NULL
-                GROUP BY author_handle, author_did
+                SELECT a.handle, a.did, COUNT(*) as post_count
+                FROM authors a
+                JOIN posts p ON p.author_id = a.author_id
+                WHERE (a.handle LIKE %s OR a.did LIKE %s)
+                AND a.handle IS NOT NULL
+                GROUP BY a.author_id, a.handle, a.did
                 ORDER BY post_count DESC
                 LIMIT 10
             ''', [f"%{query}%", f"%{query}%"])
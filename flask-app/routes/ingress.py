@@ -5,6 +5,56 @@ from utils import format_post_text, format_datetime
 import time
 from flask_socketio import emit
 
+# Post counts come from the per-minute rollup tables the ingester maintains
+# (post_rollup_language / post_rollup_author). The current minute is still
+# being filled, so the short windows cover the complete minutes before it.
+CURRENT_MINUTE = "(NOW() - INTERVAL SECOND(NOW()) SECOND)"
+
+
+def fetch_post_counts(cursor):
+    """(last minute, last 5 minutes, last hour, today) post counts"""
+    cursor.execute(f'''
+        SELECT
+            SUM(CASE WHEN bucket >= {CURRENT_MINUTE} - INTERVAL 1 MINUTE AND bucket < {CURRENT_MINUTE} THEN posts ELSE 0 END),
+            SUM(CASE WHEN bucket >= {CURRENT_MINUTE} - INTERVAL 5 MINUTE AND bucket < {CURRENT_MINUTE} THEN posts ELSE 0 END),
+            SUM(CASE WHEN bucket >= {CURRENT_MINUTE} - INTERVAL 1 HOUR AND bucket < {CURRENT_MINUTE} THEN posts ELSE 0 END),
+            SUM(CASE WHEN bucket >= CURDATE() THEN posts ELSE 0 END)
+        FROM post_rollup_language
+        WHERE bucket >= LEAST(CURDATE(), {CURRENT_MINUTE} - INTERVAL 1 HOUR)
+    ''')
+    return tuple(int(count or 0) for count in cursor.fetchone())
+
+
+def fetch_recent_languages(cursor, limit=5):
+    """Top languages over the last 5 minutes"""
+    cursor.execute(f'''
+        SELECT language, SUM(posts) as count 
+        FROM post_rollup_language 
+        WHERE bucket >= {CURRENT_MINUTE} - INTERVAL 5 MINUTE
+        AND language <> '' 
+        GROUP BY language 
+        ORDER BY count DESC 
+        LIMIT %s
+    ''', (limit,))
+    return [{'language': lang or 'Unknown', 'count': int(count)} 
+            for lang, count in cursor.fetchall()]
+
+
+def fetch_top_authors(cursor, limit=5):
+    """Most active authors with a known handle over the last 5 minutes"""
+    cursor.execute(f'''
+        SELECT a.handle, SUM(r.posts) as count 
+        FROM post_rollup_author r
+        JOIN authors a ON a.author_id = r.author_id
+        WHERE r.bucket >= {CURRENT_MINUTE} - INTERVAL 5 MINUTE
+        AND a.handle IS NOT NULL 
+        GROUP BY r.author_id, a.handle 
+        ORDER BY count DESC 
+        LIMIT %s
+    ''', (limit,))
+    return [{'handle': author, 'post_count': int(count), 'display_name': ''} 
+            for author, count in cursor.fetchall()]
+
 
 def register_socket_routes(socketio):
     # Socket.IO event handlers for real-time ingress monitoring
@@ -42,17 +92,7 @@ def register_socket_routes(socketio):
                     cursor = conn.cursor()
                     
                     # Get current metrics
-                    cursor.execute('SELECT COUNT(*) FROM posts WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 1 MINUTE)')
-                    posts_last_minute = cursor.fetchone()[0]
-                    
-                    cursor.execute('SELECT COUNT(*) FROM posts WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)')
-                    posts_last_5min = cursor.fetchone()[0]
-                    
-                    cursor.execute('SELECT COUNT(*) FROM posts WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 1 HOUR)')
-                    posts_last_hour = cursor.fetchone()[0]
-                    
-                    cursor.execute('SELECT COUNT(*) FROM posts WHERE DATE(saved_at) = CURDATE()')
-                    posts_today = cursor.fetchone()[0]
+                    posts_last_minute, posts_last_5min, posts_last_hour, posts_today = fetch_post_counts(cursor)
                     
                     ingress_rate = posts_last_minute
                     
@@ -60,36 +100,17 @@ def register_socket_routes(socketio):
                     ingress_rate_5min_avg = posts_last_5min / 5.0 if posts_last_5min else 0
                     
                     # Get recent languages
-                    cursor.execute('''
-                        SELECT language, COUNT(*) as count 
-                        FROM posts 
-                        WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-                        AND language IS NOT NULL 
-                        GROUP BY language 
-                        ORDER BY count DESC 
-                        LIMIT 5
-                    ''')
-                    recent_languages = [{'language': lang or 'Unknown', 'count': count} 
-                                    for lang, count in cursor.fetchall()]
+                    recent_languages = fetch_recent_languages(cursor)
                     
                     # Get active authors
-                    cursor.execute('''
-                        SELECT author_handle, COUNT(*) as count 
-                        FROM posts 
-                        WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-                        AND author_handle IS NOT NULL 
-                        GROUP BY author_handle 
-                        ORDER BY count DESC 
-                        LIMIT 5
-                    ''')
-                    top_active_authors = [{'handle': author, 'post_count': count, 'display_name': ''} 
-                                        for author, count in cursor.fetchall()]
+                    top_active_authors = fetch_top_authors(cursor)
                     
                     # Get most recent posts
                     cursor.execute('''
-                        SELECT author_handle, text, saved_at, language
-                        FROM posts 
-                        ORDER BY saved_at DESC 
+                        SELECT a.handle, p.text, p.saved_at, p.language
+                        FROM posts p
+                        JOIN authors a ON a.author_id = p.author_id
+                        ORDER BY p.saved_at DESC 
                         LIMIT 5
                     ''')
                     recent_posts = []
@@ -146,33 +167,8 @@ def register_routes(app):
         try:
             cursor = conn.cursor()
             
-            # Posts in the last minute
-            cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 1 MINUTE)
-            ''')
-            posts_last_minute = cursor.fetchone()[0]
-            
-            # Posts in the last 5 minutes
-            cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-            ''')
-            posts_last_5min = cursor.fetchone()[0]
-            
-            # Posts in the last hour
-            cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-            ''')
-            posts_last_hour = cursor.fetchone()[0]
-            
-            # Posts today
-            cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE DATE(saved_at) = CURDATE()
-            ''')
-            posts_today = cursor.fetchone()[0]
+            # Posts in the last minute, 5 minutes, hour and today
+            posts_last_minute, posts_last_5min, posts_last_hour, posts_today = fetch_post_counts(cursor)
             
             # Current ingress rate (posts per minute) - use actual last minute count
             ingress_rate = posts_last_minute
@@ -181,56 +177,31 @@ def register_routes(app):
             ingress_rate_5min_avg = posts_last_5min / 5.0 if posts_last_5min else 0
             
             # Languages in last 5 minutes
-            cursor.execute('''
-                SELECT language, COUNT(*) as count 
-                FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-                AND language IS NOT NULL 
-                GROUP BY language 
-                ORDER BY count DESC 
-                LIMIT 5
-            ''')
-            recent_languages = [{'language': lang or 'Unknown', 'count': count} 
-                            for lang, count in cursor.fetchall()]
+            recent_languages = fetch_recent_languages(cursor)
             
             # Top authors in last 5 minutes
-            cursor.execute('''
-                SELECT author_handle, COUNT(*) as count 
-                FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-                AND author_handle IS NOT NULL 
-                GROUP BY author_handle 
-                ORDER BY count DESC 
-                LIMIT 5
-            ''')
-            top_recent_authors = [{'handle': author, 'post_count': count, 'display_name': ''} 
-                                for author, count in cursor.fetchall()]
+            top_recent_authors = fetch_top_authors(cursor)
             
             # Active authors today
             cursor.execute('''
-                SELECT COUNT(DISTINCT author_did) FROM posts 
-                WHERE DATE(saved_at) = CURDATE()
+                SELECT COUNT(DISTINCT author_id) FROM post_rollup_author 
+                WHERE bucket >= CURDATE()
             ''')
             active_authors_today = cursor.fetchone()[0]
             
             # New authors today (authors who posted for the first time today)
             cursor.execute('''
-                SELECT COUNT(DISTINCT p1.author_did) 
-                FROM posts p1
-                WHERE DATE(p1.saved_at) = CURDATE()
-                AND NOT EXISTS (
-                    SELECT 1 FROM posts p2 
-                    WHERE p2.author_did = p1.author_did 
-                    AND DATE(p2.saved_at) < CURDATE()
-                )
+                SELECT COUNT(*) FROM authors
+                WHERE first_seen >= CURDATE()
             ''')
             new_authors_today = cursor.fetchone()[0]
             
             # Most recent posts (last 10)
             cursor.execute('''
-                SELECT author_handle, text, saved_at, language
-                FROM posts 
-                ORDER BY saved_at DESC 
+                SELECT a.handle, p.text, p.saved_at, p.language
+                FROM posts p
+                JOIN authors a ON a.author_id = p.author_id
+                ORDER BY p.saved_at DESC 
                 LIMIT 10
             ''')
             recent_posts = []
@@ -290,11 +261,11 @@ def register_routes(app):
             # Posts per minute for the last hour
             cursor.execute('''
                 SELECT 
-                    DATE_FORMAT(saved_at, '%Y-%m-%d %H:%i:00') as minute,
-                    COUNT(*) as count
-                FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-                GROUP BY DATE_FORMAT(saved_at, '%Y-%m-%d %H:%i:00')
+                    DATE_FORMAT(bucket, '%Y-%m-%d %H:%i:00') as minute,
+                    SUM(posts) as count
+                FROM post_rollup_language 
+                WHERE bucket >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
+                GROUP BY bucket
                 ORDER BY minute
             ''')
             
@@ -302,17 +273,17 @@ def register_routes(app):
             for minute_str, count in cursor.fetchall():
                 minute_data.append({
                     'time': minute_str,
-                    'count': count
+                    'count': int(count)
                 })
             
             # Posts per 5-minute interval for the last 4 hours
             cursor.execute('''
                 SELECT 
-                    DATE_FORMAT(saved_at, '%Y-%m-%d %H:%i:00') as time_slot,
-                    COUNT(*) as count
-                FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 4 HOUR)
-                GROUP BY FLOOR(UNIX_TIMESTAMP(saved_at) / 300)
+                    DATE_FORMAT(MIN(bucket), '%Y-%m-%d %H:%i:00') as time_slot,
+                    SUM(posts) as count
+                FROM post_rollup_language 
+                WHERE bucket >= DATE_SUB(NOW(), INTERVAL 4 HOUR)
+                GROUP BY FLOOR(UNIX_TIMESTAMP(bucket) / 300)
                 ORDER BY time_slot
             ''')
             
@@ -320,19 +291,18 @@ def register_routes(app):
             for time_slot, count in cursor.fetchall():
                 interval_data.append({
                     'time': time_slot,
-                    'count': count
+                    'count': int(count)
                 })
             
             # Language distribution over last hour
             cursor.execute('''
                 SELECT 
                     language,
-                    DATE_FORMAT(saved_at, '%Y-%m-%d %H:%i:00') as minute,
-                    COUNT(*) as count
-                FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-                AND language IS NOT NULL
-                GROUP BY language, DATE_FORMAT(saved_at, '%Y-%m-%d %H:%i:00')
+                    DATE_FORMAT(bucket, '%Y-%m-%d %H:%i:00') as minute,
+                    posts as count
+                FROM post_rollup_language 
+                WHERE bucket >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
+                AND language <> ''
                 ORDER BY minute, count DESC
             ''')
             
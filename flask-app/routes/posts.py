@@ -1,6 +1,11 @@
 from flask import request, jsonify, render_template
 from utils import  format_post_text, format_datetime, detect_political_phrases
 from libs.database import get_db_connection
+from libs.raw_record import decode_raw_record
+
+# Text search without a From Date only looks at posts saved this many days back
+SEARCH_WINDOW_DAYS = 7
+
 def register_routes(app):
     """Register routes for post-related API endpoints."""
   
@@ -27,6 +32,7 @@ def register_routes(app):
             per_page = min(int(request.args.get('per_page', 20)), 100)  # Max 100 per page
             sort_by = request.args.get('sort', 'saved_at')
             sort_order = request.args.get('order', 'desc')
+            search_days = max(int(request.args.get('search_days', SEARCH_WINDOW_DAYS)), 1)
             
             # Build WHERE clause
             where_conditions = []
@@ -34,23 +40,28 @@ def register_routes(app):
             
             # Text search
             if search_query:
-                if len(search_query) > 2:
-                    # Use FULLTEXT search for longer queries
-                    where_conditions.append("MATCH(text) AGAINST(%s IN NATURAL LANGUAGE MODE)")
-                    params.append(search_query)
+                # posts is partitioned on saved_at, which MariaDB does not allow
+                # together with a FULLTEXT index
+                where_conditions.append("text LIKE %s")
+                params.append(f"%{search_query}%")
+                # LIKE reads every row it may match: bound saved_at, the
+                # partitioning column, so only recent partitions are scanned
+                if date_from:
+                    where_conditions.append("p.saved_at >= %s")  # saved no earlier than created
+                    params.append(date_from)
                 else:
-                    # Use LIKE for shorter queries
-                    where_conditions.append("text LIKE %s")
-                    params.append(f"%{search_query}%")
+                    where_conditions.append("p.saved_at >= DATE_SUB(NOW(), INTERVAL %s DAY)")
+                    params.append(search_days)
             
             # Language filter
             if language:
                 where_conditions.append("language = %s")
                 params.append(language)
             
-            # Author filter
+            # Author filter: matched in authors, posts only carry author_id
             if author:
-                where_conditions.append("(author_handle LIKE %s OR author_did LIKE %s)")
+                where_conditions.append(
+                    "p.author_id IN (SELECT author_id FROM authors WHERE handle LIKE %s OR did LIKE %s)")
                 params.extend([f"%{author}%", f"%{author}%"])
             
             # Date range filter
@@ -74,7 +85,7 @@ def register_routes(app):
                 sort_order = 'desc'
             
             # Count total results
-            count_query = f"SELECT COUNT(*) FROM posts {where_clause}"
+            count_query = f"SELECT COUNT(*) FROM posts p {where_clause}"
             cursor = conn.cursor()
             cursor.execute(count_query, params)
             total_count = cursor.fetchone()[0]
@@ -83,12 +94,13 @@ def register_routes(app):
             offset = (page - 1) * per_page
             total_pages = (total_count + per_page - 1) // per_page
             
-            # Get posts
+            # Get posts (author_handle sorts by the joined alias)
             posts_query = f"""
                 SELECT 
-                    id, author_did, author_handle, text, created_at, 
-                    language, post_uri, saved_at
-                FROM posts 
+                    p.id, a.did AS author_did, a.handle AS author_handle, p.text, p.created_at, 
+                    p.language, p.post_uri, p.saved_at
+                FROM posts p
+                JOIN authors a ON a.author_id = p.author_id
                 {where_clause}
                 ORDER BY {sort_by} {sort_order.upper()}
                 LIMIT %s OFFSET %s
@@ -160,6 +172,7 @@ def register_routes(app):
                     'author': author,
                     'date_from': date_from,
                     'date_to': date_to,
+                    'search_days': search_days if search_query and not date_from else None,
                     'sort_by': sort_by,
                     'sort_order': sort_order
                 }
@@ -167,4 +180,34 @@ def register_routes(app):
             
         except Exception as e:
             conn.close()
-            return jsonify({'error': str(e)}), 500
\ No newline at end of file
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/posts/<int:post_id>/raw')
+    def get_post_raw_record(post_id):
+        """Original record of a post, decoded on demand"""
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT post_uri, raw_record, raw_data, raw_segment, raw_offset, raw_length
+                FROM posts WHERE id = %s
+            ''', (post_id,))
+            row = cursor.fetchone()
+            conn.close()
+            
+            if not row:
+                return jsonify({'error': 'Post not found'}), 404
+            
+            post_uri, raw_record, raw_data, *segment_ref = row
+            return jsonify({
+                'id': post_id,
+                'post_uri': post_uri,
+                'record': decode_raw_record(raw_record, raw_data, segment_ref)
+            })
+            
+        except Exception as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 500
@@ -3,7 +3,7 @@ from flask import  jsonify, render_template
 def register_routes(app):
     @app.route('/api/stats')
     def get_stats():
-        """Get database statistics"""
+        """Get database statistics from the per-minute rollup tables"""
         conn = get_db_connection()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
@@ -12,59 +12,60 @@ def register_routes(app):
             cursor = conn.cursor()
             
             # Total posts
-            cursor.execute('SELECT COUNT(*) FROM posts')
+            cursor.execute('SELECT COALESCE(SUM(posts), 0) FROM post_rollup_language')
             total_posts = cursor.fetchone()[0]
             
-            # Unique authors
-            cursor.execute('SELECT COUNT(DISTINCT author_did) FROM posts')
+            # Unique authors: everyone who has posted gets last_seen set
+            # (PLC export imports leave it NULL); an idx_last_seen range scan
+            cursor.execute('SELECT COUNT(*) FROM authors WHERE last_seen IS NOT NULL')
             unique_authors = cursor.fetchone()[0]
             
             # Posts today
             cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE DATE(saved_at) = CURDATE()
+                SELECT COALESCE(SUM(posts), 0) FROM post_rollup_language 
+                WHERE bucket >= CURDATE()
             ''')
             posts_today = cursor.fetchone()[0]
             
             # Posts this week
             cursor.execute('''
-                SELECT COUNT(*) FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+                SELECT COALESCE(SUM(posts), 0) FROM post_rollup_language 
+                WHERE bucket >= DATE_SUB(NOW(), INTERVAL 7 DAY)
             ''')
             posts_week = cursor.fetchone()[0]
             
-            # Top languages
+            # Top languages ('' = no language)
             cursor.execute('''
-                SELECT language, COUNT(*) as count 
-                FROM posts 
-                WHERE language IS NOT NULL 
+                SELECT language, SUM(posts) as count 
+                FROM post_rollup_language 
+                WHERE language <> '' 
                 GROUP BY language 
                 ORDER BY count DESC 
                 LIMIT 5
             ''')
-            languages = [{'language': lang or 'Unknown', 'count': count} 
+            languages = [{'language': lang or 'Unknown', 'count': int(count)} 
                         for lang, count in cursor.fetchall()]
             
             # Recent activity (posts per hour for last 24 hours)
             cursor.execute('''
                 SELECT 
-                    HOUR(saved_at) as hour,
-                    COUNT(*) as count
-                FROM posts 
-                WHERE saved_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-                GROUP BY HOUR(saved_at)
+                    HOUR(bucket) as hour,
+                    SUM(posts) as count
+                FROM post_rollup_language 
+                WHERE bucket >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
+                GROUP BY HOUR(bucket)
                 ORDER BY hour
             ''')
-            activity = [{'hour': hour, 'count': count} 
+            activity = [{'hour': hour, 'count': int(count)} 
                     for hour, count in cursor.fetchall()]
             
             conn.close()
             
             return jsonify({
-                'total_posts': total_posts,
+                'total_posts': int(total_posts),
                 'unique_authors': unique_authors,
-                'posts_today': posts_today,
-                'posts_week': posts_week,
+                'posts_today': int(posts_today),
+                'posts_week': int(posts_week),
                 'languages': languages,
                 'activity': activity
             })
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Bootstrap author handles from a PLC directory export instead of resolving
+every author over the network.
+
+Export files are the JSON lines plc.directory/export returns (one operation
+per line, in createdAt order), plain, .gz or .zst, or '-' for stdin:
+
+    python import_plc_export.py plc-export.jsonl.zst
+    python import_plc_export.py --incremental plc-export-since-last.jsonl
+
+Operations are folded into the latest handle per DID in at most
+--max-pending DIDs of memory and bulk-loaded with LOAD DATA (see
+ingest/plc_export.py). Rows the ingester resolved more recently than an
+operation are left alone, so this is safe to run next to a live
+ingester; posts see the new handles through their author_id.
+
+The createdAt of the last imported operation is kept in ingest_cursor;
+--incremental skips everything up to it, so appending newer export pages
+(plc.directory/export?after=<printed timestamp>) and re-running only
+applies the new operations.
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+
+from ingest.cursor import load_cursor
+from ingest.db_pool import ConnectionPool
+from ingest.plc_export import DEFAULT_MAX_PENDING, PLC_CURSOR_NAME, PlcExportImporter
+
+# Database configuration
+MYSQL_CONFIG = {
+    'host': 'mariadb',
+    'database': 'bsky_db',
+    'user': 'bsky_user',
+    'password': 'bsky_password',
+    'port': 3306,
+    'autocommit': True,
+    'allow_local_infile': True
+}
+
+def cursor_time(micros):
+    return datetime.fromtimestamp(micros / 1e6, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a PLC directory export into authors")
+    parser.add_argument('exports', nargs='+', help="export files (JSON lines, .gz/.zst, or - for stdin)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only apply operations newer than the last import")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="DIDs folded in memory before a bulk load")
+    parser.add_argument('--cursor-name', default=PLC_CURSOR_NAME, help="ingest_cursor row for the import position")
+    parser.add_argument('--dry-run', action='store_true', help="fold and count, write nothing")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(MYSQL_CONFIG, size=2)
+    since = None
+    if args.incremental:
+        since = load_cursor(pool, args.cursor_name)
+        if since is None:
+            print("⚠️ No previous import recorded, importing everything")
+        else:
+            print(f"🔄 Applying operations after {cursor_time(since)}")
+
+    importer = PlcExportImporter(pool, since=since, max_pending=args.max_pending,
+                                 cursor_name=args.cursor_name, dry_run=args.dry_run)
+    started = time.monotonic()
+    try:
+        for path in args.exports:
+            importer.import_file(path)
+            stats = importer.stats()
+            print(f"✓ {path}: {stats['lines']} lines so far, {stats['operations']} operations applied, "
+                  f"{stats['rows_loaded']} DIDs loaded in {stats['flushes']} bulk loads")
+        importer.flush()
+    finally:
+        pool.close_all()
+
+    stats = importer.stats()
+    elapsed = time.monotonic() - started
+    print(f"✅ {stats['operations']} operations in {elapsed:.1f}s ({stats['operations'] / elapsed if elapsed else 0:.0f}/s), "
+          f"{stats['rows_loaded']} DID rows loaded, {stats['tombstones']} tombstones, "
+          f"{stats['without_handle']} without handle, {stats['nullified']} nullified, "
+          f"{stats['older_skipped']} already imported, {stats['bad_lines']} bad lines")
+    if importer.last_created is not None:
+        print(f"Next export page: https://plc.directory/export?after={cursor_time(importer.last_created)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""
+Asyncio ingestion mode (bsky.py --mode async).
+
+Receiving from the firehose, batched MySQL writes and network DID resolution
+all run as tasks on a single event loop: aiomysql for the database,
+AsyncIdResolver for DID documents. Resolver tasks await their queue instead
+of polling it, and a monitor task measures event-loop lag so blocking work
+on the loop (e.g. slow CBOR decodes) shows up in the stats.
+
+Writes the same tables the threaded mode does: posts (creates, updates and
+deletes made idempotent through post_uris with the PostDeduplicator rules),
+authors (including handles from #identity/#handle events, batched like
+IdentityUpdater does) and the per-minute rollups. Failed resolutions follow the same
+retry schedule (ingest/retry_schedule.py), with a task in place of
+RetryScheduler. A post batch that fails is retried once, like PostWriter
+does, then dropped and counted; there is no spill queue in this mode.
+"""
+import asyncio
+import time
+
+import httpx
+from atproto import AsyncIdResolver, models
+from atproto_firehose import AsyncFirehoseSubscribeReposClient, parse_subscribe_repos_message
+from atproto_identity.exceptions import (PoorlyFormattedDidDocumentError, PoorlyFormattedDidError,
+                                         UnsupportedDidMethodError, UnsupportedDidWebPathError)
+
+from ingest.authors import INSERT_AUTHORS_SQL, SELECT_AUTHOR_IDS_SQL, TOUCH_SQL, AuthorDirectory
+from ingest.decode import decode_commit
+from ingest.dedupe import (CLAIM_URIS_SQL, DELETE_POSTS_SQL, DELETED_ROWS_SQL, RECORD_URIS_SQL, URI_STATE_SQL,
+                           PostDeduplicator, PostDelete, PostUpdate)
+from ingest.handle_cache import HandleCache, MISS
+from ingest.identity import (CLEAR_AUTHOR_HANDLE_SQL, IDENTITY_EVENT_TYPES, UPSERT_AUTHOR_HANDLE_SQL, IdentityUpdater,
+                             identity_from_body)
+from ingest.post_writer import INSERT_POSTS_SQL
+from ingest.resolver import handle_from_did_doc, status_outcome
+from ingest.retry_schedule import (DUE_SQL, MARK_FAILED_SQL, RETRY_STATE_SQL, due_for_resolution, is_permanent,
+                                   mark_failed_params)
+from ingest.rollups import DB_CLOCK_SQL, UPSERT_AUTHOR_ROLLUP_SQL, UPSERT_LANGUAGE_ROLLUP_SQL, RollupAggregator
+
+try:
+    import aiomysql
+except ImportError:  # optional dependency, only needed for --mode async
+    aiomysql = None
+
+_STOP = object()
+
+INVALID_DID_ERRORS = (PoorlyFormattedDidError, PoorlyFormattedDidDocumentError, UnsupportedDidMethodError,
+                      UnsupportedDidWebPathError)
+
+
+def failure_outcome(error):
+    """Resolver outcome (see ingest/resolver.py) for an exception from AsyncIdResolver"""
+    if isinstance(error, INVALID_DID_ERRORS):
+        return 'invalid'
+    # The DID resolvers wrap the httpx error they failed with
+    cause = error if isinstance(error, httpx.HTTPError) else error.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        return status_outcome(cause.response.status_code)
+    if isinstance(cause, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return 'timeouts'
+    return 'errors'
+
+
+class AsyncIngestor:
+    """Single event loop firehose consumer"""
+
+    def __init__(self, mysql_config, resolver_concurrency=50, resolve_timeout=10.0,
+                 batch_size=500, max_delay=0.5, max_queue_size=20000,
+                 stats_interval=30, lag_interval=0.5, rollup_interval=5.0, plc_url=None, firehose_url=None,
+                 retry_interval=30.0, retry_batch_size=500):
+        if aiomysql is None:
+            raise RuntimeError("Async mode needs the aiomysql package (pip install aiomysql)")
+
+        self.mysql_config = mysql_config
+        self.resolver_concurrency = resolver_concurrency
+        self.resolve_timeout = resolve_timeout
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.stats_interval = stats_interval
+        self.lag_interval = lag_interval
+        self.firehose_url = firehose_url
+        self.retry_interval = retry_interval
+        self.retry_batch_size = retry_batch_size
+
+        self.pool = None
+        self.resolver = AsyncIdResolver(plc_url=plc_url, timeout=resolve_timeout)
+        self.handle_cache = HandleCache()
+        self.post_queue = asyncio.Queue(maxsize=max_queue_size)
+        self.resolution_queue = asyncio.Queue()
+        self.pending_resolutions = set()  # DIDs queued or being resolved
+        self.reresolve_dids = set()  # resolved from the network despite a stored handle
+        # Counting/caching only; flushed through the aiomysql pool
+        self.rollups = RollupAggregator(None, flush_interval=rollup_interval)
+        self.authors = AuthorDirectory(None)
+        self.identities = IdentityUpdater(None, self.handle_cache, reresolve=self.requeue_resolution)
+        self.dedupe = PostDeduplicator(on_deleted=self.rollups.remove)
+        self.writer_task = None
+        self.tasks = []
+
+        self.stats = {
+            'posts_processed': 0,
+            'deletes_processed': 0,
+            'rows_written': 0,
+            'batches': 0,
+            'flush_errors': 0,
+            'rows_dropped': 0,
+            'resolutions_queued': 0,
+            'resolved': 0,
+            'resolution_failures': 0,
+            'retries_queued': 0,
+            'errors': 0,
+            'lag_last': 0.0,
+            'lag_max': 0.0,
+            'lag_total': 0.0,
+            'lag_samples': 0,
+        }
+
+    async def _create_pool(self):
+        config = self.mysql_config
+        return await aiomysql.create_pool(
+            host=config['host'], port=config.get('port', 3306),
+            user=config['user'], password=config['password'], db=config['database'],
+            charset='utf8mb4', autocommit=True,
+            minsize=2, maxsize=self.resolver_concurrency + 4,
+        )
+
+    async def _execute(self, sql, args=None, fetch=None, many=False):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                if many:
+                    await cursor.executemany(sql, args)
+                else:
+                    await cursor.execute(sql, args)
+                if fetch == 'one':
+                    return await cursor.fetchone()
+                if fetch == 'all':
+                    return await cursor.fetchall()
+                return cursor.lastrowid if many else cursor.rowcount
+
+    async def warm_handle_cache(self, limit=100000):
+        rows = await self._execute('''
+            SELECT did, handle, author_id FROM authors
+            ORDER BY last_seen DESC
+            LIMIT %s
+        ''', (limit,), fetch='all')
+        loaded = self.handle_cache.warm([(did, handle) for did, handle, _ in rows])
+        self.authors.warm([(did, author_id) for did, _, author_id in rows])
+        print(f"Warmed handle cache with {loaded} DIDs")
+
+    def queue_resolution(self, did):
+        if did in self.pending_resolutions:
+            return False
+        self.pending_resolutions.add(did)
+        self.resolution_queue.put_nowait(did)
+        return True
+
+    def requeue_resolution(self, did):
+        """Queue a network resolution of did that does not stop at its stored handle"""
+        self.reresolve_dids.add(did)
+        if not self.queue_resolution(did):
+            return False
+        self.stats['resolutions_queued'] += 1
+        return True
+
+    async def on_message(self, message):
+        if message.type in IDENTITY_EVENT_TYPES:
+            self.identities.submit(*identity_from_body(message.body))
+            return
+        commit = parse_subscribe_repos_message(message)
+        if not isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit):
+            return
+
+        decoded = decode_commit(commit)
+        for post in decoded['posts']:
+            did = post['author_did']
+            # Resolution tasks look uncached authors up; known failures wait for their retry
+            if self.handle_cache.get(did) is MISS and self.queue_resolution(did):
+                self.stats['resolutions_queued'] += 1
+            row = (did, post['text'], post['created_at'], post['language'], post['post_uri'], post['raw_record'])
+            await self.post_queue.put(PostUpdate(row) if post['action'] == 'update' else row)
+            self.stats['posts_processed'] += 1
+        # Queued behind the creates they cancel, like the threaded writer
+        for post_uri in decoded['deletes']:
+            await self.post_queue.put(PostDelete(post_uri))
+            self.stats['deletes_processed'] += 1
+        for error_message, _ in decoded['errors']:
+            self.stats['errors'] += 1
+            print(f"Error processing message: {error_message}")
+
+    async def _assign_authors(self, batch):
+        """Swap each row's DID for its author_id, creating missing authors (deletes pass through)"""
+        ids, missing = self.authors.cached(row[0] for row in batch if not isinstance(row, PostDelete))
+        if missing:
+            found = dict(await self._execute(
+                SELECT_AUTHOR_IDS_SQL.format(placeholders=','.join(['%s'] * len(missing))), missing, fetch='all'))
+            new = [did for did in missing if did not in found]
+            if new:
+                await self._execute(INSERT_AUTHORS_SQL, [(did,) for did in new], many=True)
+                found.update(await self._execute(
+                    SELECT_AUTHOR_IDS_SQL.format(placeholders=','.join(['%s'] * len(new))), new, fetch='all'))
+            self.authors.remember(found)
+            ids.update(found)
+        return self.authors.replace_dids(batch, ids)
+
+    async def _write_posts(self, batch):
+        """PostDeduplicator.write_batch over aiomysql; returns the inserted rows"""
+        counts = self.dedupe.new_counts()
+        ops, cancelled = self.dedupe.collapse(batch, counts)
+        if not ops:
+            self.dedupe.record(counts)
+            return []
+        uris = list(ops)
+        placeholders = ','.join(['%s'] * len(uris))
+        async with self.pool.acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(CLAIM_URIS_SQL, [(uri,) for uri in uris])
+                    await cursor.execute(URI_STATE_SQL.format(placeholders=placeholders), uris)
+                    state = {uri: (post_id, deleted) for uri, post_id, deleted in await cursor.fetchall()}
+                    inserts, removed_ids, tombstones = self.dedupe.resolve(ops, cancelled, state, counts)
+
+                    rows = [tuple(row) for _, row in inserts]
+                    post_ids = []
+                    if rows:
+                        # One multi-row INSERT, so the ids are consecutive from lastrowid
+                        cursor.max_stmt_length = float('inf')
+                        await cursor.executemany(INSERT_POSTS_SQL, rows)
+                        post_ids = list(range(cursor.lastrowid, cursor.lastrowid + len(rows)))
+                    deleted_rows = []
+                    if removed_ids:
+                        placeholders = ','.join(['%s'] * len(removed_ids))
+                        await cursor.execute(DELETED_ROWS_SQL.format(placeholders=placeholders), removed_ids)
+                        deleted_rows = await cursor.fetchall()
+                        await cursor.execute(DELETE_POSTS_SQL.format(placeholders=placeholders), removed_ids)
+                    records = self.dedupe.uri_records(inserts, post_ids, tombstones)
+                    if records:
+                        await cursor.executemany(RECORD_URIS_SQL, records)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+        counts['inserted'] = len(rows)
+        self.dedupe.record(counts)
+        self.dedupe.deleted(deleted_rows)
+        return rows
+
+    async def _flush_posts(self, batch):
+        """Write one batch, retrying once like PostWriter; returns the inserted rows, None if dropped.
+
+        Any error is caught: the writer task is the only consumer of the
+        bounded post_queue, so if it died on_message would block forever.
+        """
+        for attempt in range(2):
+            try:
+                return await self._write_posts(await self._assign_authors(batch))
+            except Exception as e:
+                print(f"Error flushing {len(batch)} posts to database (attempt {attempt + 1}): {e}")
+                self.stats['flush_errors'] += 1
+        self.stats['rows_dropped'] += len(batch)
+        return None
+
+    async def _writer(self):
+        """Group-commit queued posts until the _STOP sentinel, finishing the batch it ends"""
+        stopping = False
+        while not stopping:
+            first = await self.post_queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.post_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            rows = await self._flush_posts(batch)
+            if rows is None:
+                continue
+            self.stats['rows_written'] += len(rows)
+            self.stats['batches'] += 1
+            self.rollups.add(rows)
+
+    async def _resolve_handle(self, did):
+        """(handle or None, resolver outcome) for did"""
+        try:
+            did_doc = await asyncio.wait_for(self.resolver.did.resolve(did), self.resolve_timeout)
+        except asyncio.TimeoutError:
+            print(f"Timed out resolving handle for {did}")
+            return None, 'timeouts'
+        except Exception as e:
+            print(f"Failed to resolve handle for {did}: {e}")
+            return None, failure_outcome(e)
+        if did_doc is None:
+            return None, 'not_found'
+        handle = handle_from_did_doc(did_doc)
+        return handle, 'resolved' if handle else 'no_handle'
+
+    async def _resolution_worker(self):
+        while True:
+            did = await self.resolution_queue.get()
+            try:
+                await self._process_resolution(did)
+            except Exception as e:
+                print(f"Error in async DID resolution for {did}: {e}")
+            finally:
+                # Posts that arrive after this point start a new resolution round
+                self.pending_resolutions.discard(did)
+
+    async def _process_resolution(self, did):
+        forced = did in self.reresolve_dids
+        self.reresolve_dids.discard(did)
+        if not forced:
+            handle = self.handle_cache.get(did)
+            if handle is not MISS and handle is not None:
+                return
+            # One query for the stored handle and the retry schedule
+            row = await self._execute(RETRY_STATE_SQL.format(placeholders='%s'), (did,), fetch='one')
+            _, handle, resolved_at, next_retry_at, retry_due = row or (did, None, None, None, None)
+            if handle is not None:
+                self.handle_cache.put(did, handle)
+                return
+            if not due_for_resolution(resolved_at, retry_due):
+                self.handle_cache.put_failure(did, permanent=next_retry_at is None)
+                return
+
+        handle, outcome = await self._resolve_handle(did)
+        if handle:
+            await self._execute(UPSERT_AUTHOR_HANDLE_SQL, (did, handle))
+            self.handle_cache.put(did, handle)
+            self.stats['resolved'] += 1
+        elif forced:
+            # The stored handle stays; the next post reads it from authors again
+            print(f"Could not re-resolve {did} ({outcome}), keeping its stored handle")
+        else:
+            await self._execute(MARK_FAILED_SQL, mark_failed_params(did, outcome))
+            self.handle_cache.put_failure(did, permanent=is_permanent(outcome))
+            self.stats['resolution_failures'] += 1
+
+    async def schedule_retries(self):
+        """Queue authors whose next_retry_at has come, fewer while the queue is still busy"""
+        limit = self.retry_batch_size - self.resolution_queue.qsize()
+        if limit <= 0:
+            return
+        try:
+            rows = await self._execute(DUE_SQL, (limit,), fetch='all')
+        except aiomysql.Error as e:
+            print(f"Error reading due DID resolutions: {e}")
+            return
+        self.stats['retries_queued'] += sum(1 for (did,) in rows if self.queue_resolution(did))
+
+    async def _schedule_retries(self):
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            await self.schedule_retries()
+
+    async def _monitor_loop_lag(self):
+        """Measure how late the loop wakes us up; anything blocking the loop shows up here"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - started - self.lag_interval)
+            self.stats['lag_last'] = lag
+            self.stats['lag_max'] = max(self.stats['lag_max'], lag)
+            self.stats['lag_total'] += lag
+            self.stats['lag_samples'] += 1
+
+    async def flush_rollups(self):
+        language_rows, author_rows = self.rollups.take()
+        if not language_rows and not author_rows:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                # One transaction, so a failed flush can be re-queued as a whole
+                await conn.begin()
+                async with conn.cursor() as cursor:
+                    await cursor.execute(DB_CLOCK_SQL)
+                    self.rollups.set_db_time((await cursor.fetchone())[0])
+                    await cursor.executemany(UPSERT_LANGUAGE_ROLLUP_SQL, language_rows)
+                    await cursor.executemany(UPSERT_AUTHOR_ROLLUP_SQL, author_rows)
+                await conn.commit()
+        except aiomysql.Error as e:
+            print(f"Error flushing {len(language_rows) + len(author_rows)} rollup rows: {e}")
+            self.rollups.restore(language_rows, author_rows)
+            return
+        self.rollups.record_flush(language_rows, author_rows)
+
+    async def _flush_rollups(self):
+        while True:
+            await asyncio.sleep(self.rollups.flush_interval)
+            await self.flush_rollups()
+
+    async def flush_identities(self):
+        updates, clears = self.identities.take()
+        if not updates and not clears:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.begin()
+                async with conn.cursor() as cursor:
+                    if updates:
+                        await cursor.executemany(UPSERT_AUTHOR_HANDLE_SQL, updates)
+                    if clears:
+                        await cursor.executemany(CLEAR_AUTHOR_HANDLE_SQL, clears)
+                await conn.commit()
+        except aiomysql.Error as e:
+            print(f"Error applying {len(updates) + len(clears)} identity updates: {e}")
+            self.identities.restore(updates, clears)
+            return
+        self.identities.record_flush(updates, clears)
+
+    async def _flush_identities(self):
+        while True:
+            await asyncio.sleep(self.identities.flush_interval)
+            await self.flush_identities()
+
+    async def touch_authors(self):
+        chunks = self.authors.take_touches()
+        if not chunks:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    for chunk in chunks:
+                        await cursor.execute(TOUCH_SQL.format(placeholders=','.join(['%s'] * len(chunk))), chunk)
+        except aiomysql.Error as e:
+            print(f"Error refreshing last_seen for {sum(len(chunk) for chunk in chunks)} authors: {e}")
+            self.authors.record_touch(chunks, error=e)
+            return
+        self.authors.record_touch(chunks)
+
+    async def _touch_authors(self):
+        while True:
+            await asyncio.sleep(self.authors.touch_interval)
+            await self.touch_authors()
+
+    async def _report_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            stats = self.stats
+            samples = stats['lag_samples']
+            avg_lag = stats['lag_total'] / samples if samples else 0.0
+            cache_stats = self.handle_cache.stats()
+            dedupe_stats = self.dedupe.stats()
+            identity_stats = self.identities.stats()
+            print(f"Async stats: {stats['posts_processed']} posts and {stats['deletes_processed']} deletes processed, "
+                  f"{stats['rows_written']} rows in "
+                  f"{stats['batches']} batches ({stats['rows_dropped']} rows dropped after "
+                  f"{stats['flush_errors']} flush errors), post queue {self.post_queue.qsize()}, "
+                  f"resolution queue {self.resolution_queue.qsize()}, "
+                  f"{stats['resolved']} resolved / {stats['resolution_failures']} failed "
+                  f"({stats['retries_queued']} scheduled retries), "
+                  f"handle cache hit rate {cache_stats['hit_rate'] * 100:.1f}%")
+            print(f"Dedupe: {dedupe_stats['inserted']} inserted, {dedupe_stats['duplicates']} duplicates, "
+                  f"{dedupe_stats['deletes']} deleted, {dedupe_stats['updates']} updated, "
+                  f"{dedupe_stats['tombstone_hits']} tombstone hits")
+            print(f"Identity: {identity_stats['events']} events, {identity_stats['dids_updated']} handles updated, "
+                  f"{identity_stats['handles_cleared']} cleared, {identity_stats['reresolutions']} re-resolved, "
+                  f"{identity_stats['pending']} pending")
+            print(f"Event loop lag: last {stats['lag_last'] * 1000:.1f}ms, avg {avg_lag * 1000:.1f}ms, "
+                  f"max {stats['lag_max'] * 1000:.1f}ms")
+
+    async def _drain_posts(self, timeout=30):
+        """Queue _STOP behind the last posts and wait for the writer to commit them and exit"""
+        async def stop_writer():
+            await self.post_queue.put(_STOP)
+            await asyncio.wait([self.writer_task])
+
+        if self.writer_task is None or self.writer_task.done():
+            return
+
+        try:
+            await asyncio.wait_for(stop_writer(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Post writer did not finish within {timeout}s, {self.post_queue.qsize()} posts left unwritten")
+
+    async def run(self):
+        self.pool = await self._create_pool()
+        print("✅ Connected to MySQL database (async)")
+        await self.warm_handle_cache()
+        self.rollups.set_db_time((await self._execute(DB_CLOCK_SQL, fetch='one'))[0])
+
+        self.writer_task = asyncio.create_task(self._writer())
+        self.tasks.append(self.writer_task)
+        for _ in range(self.resolver_concurrency):
+            self.tasks.append(asyncio.create_task(self._resolution_worker()))
+        self.tasks.append(asyncio.create_task(self._flush_rollups()))
+        self.tasks.append(asyncio.create_task(self._flush_identities()))
+        self.tasks.append(asyncio.create_task(self._touch_authors()))
+        self.tasks.append(asyncio.create_task(self._schedule_retries()))
+        self.tasks.append(asyncio.create_task(self._monitor_loop_lag()))
+        self.tasks.append(asyncio.create_task(self._report_stats()))
+        print(f"Started async ingest with {self.resolver_concurrency} concurrent DID resolutions")
+
+        client = AsyncFirehoseSubscribeReposClient(**({'base_uri': self.firehose_url} if self.firehose_url else {}))
+        try:
+            await client.start(self.on_message)
+        finally:
+            await self._drain_posts()
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await self.flush_rollups()
+            await self.flush_identities()
+            await self.touch_authors()
+            self.pool.close()
+            await self.pool.wait_closed()
+
+
+def run_async_ingest(mysql_config, **kwargs):
+    """Entry point used by bsky.py --mode async"""
+    asyncio.run(AsyncIngestor(mysql_config, **kwargs).run())
@@ -0,0 +1,210 @@
+"""
+authors dimension table: one row per account, referenced by posts.author_id.
+
+Post rows only carry the integer author_id. The DID, the handle and the
+resolution state (resolved_at, failed_attempts; formerly did_cache) live in
+authors, so resolving or renaming an account updates one row instead of
+every post by it.
+
+AuthorDirectory assigns author_ids for the posts writer. Rows are queued
+with the author's DID in the author_id slot; right before a batch is
+inserted the writer calls assign() on its own connection, which looks the
+DIDs up in a bounded LRU and fetches the ones it has not seen with one
+SELECT. Only DIDs that are not in authors yet are inserted, with INSERT
+IGNORE rather than an upsert, which would burn an AUTO_INCREMENT value for
+every existing author it touched. Doing it at write time keeps the firehose
+thread off the database and lets spilled rows wait for the database like
+any others. last_seen is refreshed by a background thread in batched
+UPDATEs, at most once per touch_interval per author, instead of on every
+post; the same UPDATE sets first_seen for authors created without one (by
+the PLC export import). The async mode (ingest/async_ingest.py) drives the
+same cache through cached()/remember() and take_touches() on its own
+aiomysql pool.
+
+authors.did is binary-collated, so the SELECT hands back exactly the DIDs
+it was given. DIDs longer than the column are never inserted (they would be
+stored truncated); rows by them, or by any DID the SELECT did not return,
+are dropped and counted as unassigned rather than failing the batch.
+"""
+import threading
+from collections import OrderedDict
+
+import mysql.connector
+
+from ingest.dedupe import PostDelete
+from ingest.retry_schedule import FIRST_RETRY_DELAY
+
+# New authors come due for a scheduled resolution in case the live one is lost
+INSERT_AUTHORS_SQL = f'''
+    INSERT IGNORE INTO authors (did, first_seen, last_seen, next_retry_at)
+    VALUES (%s, NOW(), NOW(), DATE_ADD(NOW(), INTERVAL {FIRST_RETRY_DELAY} SECOND))
+'''
+
+SELECT_AUTHOR_IDS_SQL = 'SELECT did, author_id FROM authors WHERE did IN ({placeholders})'
+
+TOUCH_SQL = '''
+    UPDATE authors SET last_seen = NOW(), first_seen = COALESCE(first_seen, NOW())
+    WHERE author_id IN ({placeholders})
+'''
+
+TOUCH_CHUNK = 1000
+
+MAX_DID_LENGTH = 255  # authors.did VARCHAR(255)
+
+
+class AuthorDirectory:
+    """Thread-safe DID -> author_id map in front of the authors table"""
+
+    def __init__(self, pool, max_size=500000, touch_interval=60.0):
+        self.pool = pool
+        self.max_size = max_size
+        self.touch_interval = touch_interval
+
+        self._ids = OrderedDict()  # did -> author_id, least recently used first
+        self._seen = set()  # author_ids seen since the last last_seen refresh
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'unassigned': 0,
+            'touched': 0,
+            'touch_errors': 0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='author-directory', daemon=True)
+        self._thread.start()
+
+    def warm(self, rows):
+        """Preload (did, author_id) rows ordered most recent first; returns how many were loaded"""
+        rows = list(rows)[:self.max_size]
+        with self._lock:
+            # Oldest first, so the most recent rows end up most-recently-used
+            for did, author_id in reversed(rows):
+                self._ids[did] = author_id
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+        return len(rows)
+
+    def cached(self, dids):
+        """({did: author_id} for the cached dids, [dids to look up]); DIDs too long for authors are left out"""
+        ids = {}
+        missing = []
+        with self._lock:
+            for did in dict.fromkeys(dids):
+                if len(did) > MAX_DID_LENGTH:
+                    continue
+                author_id = self._ids.get(did)
+                if author_id is None:
+                    missing.append(did)
+                    continue
+                self._ids.move_to_end(did)
+                ids[did] = author_id
+                self._seen.add(author_id)
+            self._stats['hits'] += len(ids)
+            self._stats['misses'] += len(missing)
+        return ids, missing
+
+    def remember(self, found):
+        """Cache {did: author_id} pairs read from the database"""
+        with self._lock:
+            for did, author_id in found.items():
+                self._ids[did] = author_id
+                self._seen.add(author_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def author_ids(self, conn, dids):
+        """{did: author_id} for dids, creating missing authors on conn"""
+        ids, missing = self.cached(dids)
+        if not missing:
+            return ids
+        cursor = conn.cursor()
+        cursor.execute(SELECT_AUTHOR_IDS_SQL.format(placeholders=','.join(['%s'] * len(missing))), missing)
+        found = dict(cursor.fetchall())
+        new = [did for did in missing if did not in found]
+        if new:
+            cursor.executemany(INSERT_AUTHORS_SQL, [(did,) for did in new])
+            cursor.execute(SELECT_AUTHOR_IDS_SQL.format(placeholders=','.join(['%s'] * len(new))), new)
+            found.update(cursor.fetchall())
+        cursor.close()
+        self.remember(found)
+        ids.update(found)
+        return ids
+
+    def assign(self, conn, rows):
+        """Replace the DID in each post row's first column with its author_id"""
+        ids = self.author_ids(conn, [row[0] for row in rows if not isinstance(row, PostDelete)])
+        return self.replace_dids(rows, ids)
+
+    def replace_dids(self, rows, ids):
+        """Swap each post row's DID for its id in ids, dropping rows whose DID has none"""
+        assigned = []
+        for row in rows:
+            if isinstance(row, PostDelete):
+                assigned.append(row)
+            elif row[0] in ids:
+                assigned.append(type(row)((ids[row[0]],) + tuple(row[1:])))
+        unassigned = len(rows) - len(assigned)
+        if unassigned:
+            print(f"Dropped {unassigned} post rows whose author DID has no author_id")
+            with self._lock:
+                self._stats['unassigned'] += unassigned
+        return assigned
+
+    def _run(self):
+        while not self._stop.wait(self.touch_interval):
+            self.touch()
+
+    def take_touches(self):
+        """Swap out the author_ids seen since the last refresh, in TOUCH_CHUNK chunks"""
+        with self._lock:
+            seen, self._seen = list(self._seen), set()
+        return [seen[start:start + TOUCH_CHUNK] for start in range(0, len(seen), TOUCH_CHUNK)]
+
+    def record_touch(self, chunks, error=None):
+        with self._lock:
+            if error is None:
+                self._stats['touched'] += sum(len(chunk) for chunk in chunks)
+            else:
+                self._stats['touch_errors'] += 1
+
+    def touch(self):
+        """Set last_seen for every author seen since the previous call"""
+        chunks = self.take_touches()
+        if not chunks:
+            return 0
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                for chunk in chunks:
+                    cursor.execute(TOUCH_SQL.format(placeholders=','.join(['%s'] * len(chunk))), chunk)
+                conn.commit()
+        except mysql.connector.Error as e:
+            # last_seen is approximate anyway; the authors are touched again on their next post
+            print(f"Error refreshing last_seen for {sum(len(chunk) for chunk in chunks)} authors: {e}")
+            self.record_touch(chunks, error=e)
+            return 0
+        self.record_touch(chunks)
+        return sum(len(chunk) for chunk in chunks)
+
+    def stop(self):
+        """Stop the thread and write the last last_seen refresh"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.touch()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._ids)
+            stats['max_size'] = self.max_size
+            stats['pending_touches'] = len(self._seen)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
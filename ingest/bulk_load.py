@@ -0,0 +1,147 @@
+"""
+LOAD DATA bulk path for the posts writer (catch-up, backfills, spill drains).
+
+A bulk batch is serialized into one in-memory TSV buffer (MariaDB's default
+LOAD DATA format: tab separated, backslash escapes, \\N for NULL), written
+in one go to a file on tmpfs and streamed with LOAD DATA LOCAL INFILE into
+a per-connection temporary staging table. ingest.dedupe then claims the
+staged URIs and merges the rows into posts with a single
+INSERT ... SELECT that skips every URI that is already stored or
+tombstoned. PostWriter switches to this path on its own while its queue is
+deep and back to multi-row INSERTs once it has drained.
+
+Needs local_infile enabled on the server (MariaDB's default) and
+allow_local_infile in the client connection config.
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+
+STAGING_TABLE = 'posts_bulk_staging'
+DEFAULT_BULK_BATCH_SIZE = 10000
+# tmpfs where available, so the TSV buffer never touches a disk
+DEFAULT_TSV_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+_COLUMNS_RE = re.compile(r'INSERT\s+INTO\s+posts\s*\(([^)]*)\)', re.IGNORECASE)
+
+
+def insert_columns(insert_sql):
+    """Column names of a posts INSERT statement (INSERT_POSTS_SQL / INSERT_POSTS_SEGMENT_SQL)"""
+    match = _COLUMNS_RE.search(insert_sql)
+    if match is None:
+        raise ValueError("Bulk load only supports INSERT INTO posts (...) statements")
+    return [column.strip() for column in match.group(1).split(',')]
+
+
+def tsv_field(value):
+    """One value in LOAD DATA's default escaping"""
+    if value is None:
+        return b'\\N'
+    if isinstance(value, bytes):
+        data = value
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+    else:
+        data = str(value).encode('ascii')
+    return (data.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+            .replace(b'\r', b'\\r').replace(b'\x00', b'\\0'))
+
+
+def encode_tsv(rows):
+    return b''.join(b'\t'.join(tsv_field(value) for value in row) + b'\n' for row in rows)
+
+
+class BulkLoader:
+    """Stages post rows with LOAD DATA and merges them into posts set-based"""
+
+    def __init__(self, batch_size=DEFAULT_BULK_BATCH_SIZE, tsv_dir=DEFAULT_TSV_DIR):
+        self.batch_size = batch_size
+        self.tsv_dir = tsv_dir
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'loads': 0,
+            'rows_staged': 0,
+            'rows_merged': 0,
+            'tsv_bytes': 0,
+            'stage_time': 0.0,
+            'merge_time': 0.0,
+            'last_rows_per_second': 0.0,
+        }
+
+    def stage(self, conn, staged, insert_sql):
+        """LOAD DATA (ord, is_update, row) tuples into this connection's staging table.
+
+        Runs outside the merge transaction; the temporary table is private to
+        the connection and emptied first.
+        """
+        columns = insert_columns(insert_sql)
+        started = time.monotonic()
+        data = encode_tsv((ord_, int(is_update), *row) for ord_, is_update, row in staged)
+        cursor = conn.cursor()
+        # Same column types as posts, no partitioning or indexes
+        cursor.execute(f'''
+            CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} AS
+            SELECT 0 AS ord, 0 AS is_update, {', '.join(columns)} FROM posts LIMIT 0
+        ''')
+        cursor.execute(f'DELETE FROM {STAGING_TABLE}')
+        with tempfile.NamedTemporaryFile(dir=self.tsv_dir, prefix='posts-', suffix='.tsv') as tsv:
+            tsv.write(data)
+            tsv.flush()
+            cursor.execute(f'''
+                LOAD DATA LOCAL INFILE %s INTO TABLE {STAGING_TABLE}
+                CHARACTER SET utf8mb4 (ord, is_update, {', '.join(columns)})
+            ''', (tsv.name,))
+        cursor.close()
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats['loads'] += 1
+            self._stats['rows_staged'] += len(staged)
+            self._stats['tsv_bytes'] += len(data)
+            self._stats['stage_time'] += elapsed
+        return elapsed
+
+    def claim(self, cursor):
+        """Claim every staged URI in post_uris (see ingest.dedupe)"""
+        cursor.execute(f'INSERT IGNORE INTO post_uris (post_uri) SELECT post_uri FROM {STAGING_TABLE}')
+
+    def merge(self, cursor, insert_sql):
+        """Insert staged rows whose URI this transaction claimed, or updates of
+        live posts, in staging order; returns {post_uri: new post id}"""
+        columns = insert_columns(insert_sql)
+        started = time.monotonic()
+        cursor.execute(f'''
+            INSERT INTO posts ({', '.join(columns)})
+            SELECT {', '.join('s.' + column for column in columns)}
+            FROM {STAGING_TABLE} s
+            JOIN post_uris u ON u.post_uri = s.post_uri
+            WHERE u.deleted = 0 AND (u.post_id IS NULL OR s.is_update = 1)
+            ORDER BY s.ord
+        ''')
+        merged = cursor.rowcount
+        post_ids = {}
+        if merged > 0:
+            # One INSERT ... SELECT gets consecutive ids (innodb_autoinc_lock_mode 1)
+            first_id = cursor.lastrowid
+            cursor.execute('SELECT id, post_uri FROM posts WHERE id >= %s AND id < %s',
+                           (first_id, first_id + merged))
+            post_ids = {post_uri: post_id for post_id, post_uri in cursor.fetchall()}
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats['rows_merged'] += max(merged, 0)
+            self._stats['merge_time'] += elapsed
+        return post_ids
+
+    def record_batch(self, rows, elapsed):
+        """Throughput of the last bulk batch, staging through commit"""
+        with self._lock:
+            self._stats['last_rows_per_second'] = rows / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        busy = stats['stage_time'] + stats['merge_time']
+        stats['rows_per_second'] = stats['rows_staged'] / busy if busy else 0.0
+        return stats
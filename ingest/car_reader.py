@@ -0,0 +1,102 @@
+"""
+Selective block extraction from commit CARs.
+
+CAR.from_bytes decodes every block of a commit (the signed commit object,
+the MST nodes on the path to each changed key and the records) into a
+CID -> block dict, although the ingester only looks up the record blocks
+named by op.cid. extract_blocks walks the varint-framed sections over a
+memoryview instead, compares each section's CID bytes against the wanted
+set without copying, and only copies and DAG-CBOR decodes the matching
+blocks; commit and MST node blocks are stepped over undecoded. It stops
+as soon as every wanted CID has been found.
+
+Section layout (CARv1): varint(len(cid) + len(block)) | cid | block, after a
+varint-prefixed DAG-CBOR header. See benchmarks/car_extract.py for the
+comparison with CAR.from_bytes.
+"""
+import libipld
+
+CIDV0_PREFIX = b'\x12\x20'  # sha2-256 multihash, 32-byte digest
+CIDV0_LENGTH = 34
+
+
+def read_varint(view, pos):
+    """Unsigned LEB128 at pos; returns (value, position after it)"""
+    value = shift = 0
+    while True:
+        if pos >= len(view):
+            raise ValueError("Truncated varint in CAR")
+        byte = view[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def cid_length(view, pos):
+    """Length in bytes of the binary CID starting at pos"""
+    if view[pos:pos + 2] == CIDV0_PREFIX:
+        return CIDV0_LENGTH
+    start = pos
+    _, pos = read_varint(view, pos)      # version
+    _, pos = read_varint(view, pos)      # content codec
+    _, pos = read_varint(view, pos)      # multihash code
+    size, pos = read_varint(view, pos)   # digest length
+    return pos - start + size
+
+
+def cid_bytes(cid):
+    """Binary form of a CID (atproto CID object, CID string or bytes)"""
+    if isinstance(cid, (bytes, bytearray)):
+        return bytes(cid)
+    raw = getattr(cid, '_raw_byte_form', None)  # set on CIDs parsed from firehose CBOR
+    if raw is not None:
+        return raw
+    return libipld.decode_multibase(str(cid))[1]
+
+
+def iter_sections(data):
+    """Yield (cid, block) memoryviews for every section of a CAR, without copying"""
+    view = memoryview(data)
+    header_length, pos = read_varint(view, 0)
+    pos += header_length
+    end = len(view)
+    while pos < end:
+        section_length, pos = read_varint(view, pos)
+        section_end = pos + section_length
+        if section_end > end:
+            raise ValueError("Truncated section in CAR")
+        cid_end = pos + cid_length(view, pos)
+        yield view[pos:cid_end], view[cid_end:section_end]
+        pos = section_end
+
+
+def extract_blocks(data, cids):
+    """Decode only the blocks of `cids` from a CAR.
+
+    Returns {cid: decoded block} keyed by the objects passed in (so an
+    op.cid looks its block up directly); CIDs missing from the CAR are
+    left out, like car.blocks.get would return None for them.
+
+    It is a mapping, not one result per requested CID: ops with identical
+    records share a CID, and equal CIDs collapse into one entry holding
+    the one decoded block. Look blocks up per op with .get(op.cid); do not
+    count entries against the ops.
+    """
+    wanted = {}
+    for cid in cids:
+        wanted.setdefault(cid_bytes(cid), []).append(cid)
+    blocks = {}
+    if not wanted:
+        return blocks
+    for cid, block in iter_sections(data):
+        requested = wanted.pop(cid, None)  # memoryview hashes and compares like bytes
+        if requested is None:
+            continue
+        decoded = libipld.decode_dag_cbor(bytes(block))
+        for key in requested:
+            blocks[key] = decoded
+        if not wanted:
+            break
+    return blocks
@@ -0,0 +1,198 @@
+"""
+Compact storage codec for posts.raw_record.
+
+Records are stored as their DAG-CBOR encoding (what the PDS signed, CIDs
+intact) compressed with zstd, optionally against a dictionary trained on
+sample posts (see train_dictionary / benchmarks/raw_record_codec.py).
+Each blob starts with a one-byte format tag:
+
+    0x01  zstd, no dictionary
+    0x02  zstd with a trained dictionary
+
+New records are compressed with the dictionary at DICTIONARY_PATH. zstd
+writes the dictionary's id into every frame header, and readers load the
+matching raw_record.<dict_id>.dict from DICTIONARY_DIR, so retraining only
+adds a file: rows compressed with an older dictionary stay readable.
+
+Rows written before the codec existed hold JSON text in raw_data; the
+decode helpers accept those too, so readers do not care which one a row has.
+"""
+import json
+import os
+import threading
+
+import libipld
+import zstandard
+
+FORMAT_ZSTD = 0x01
+FORMAT_ZSTD_DICT = 0x02
+
+COMPRESSION_LEVEL = 3
+DICTIONARY_SIZE = 64 * 1024
+# Dictionary new records are compressed with
+DICTIONARY_PATH = os.environ.get('RAW_RECORD_DICT', 'raw_record.dict')
+# Every dictionary ever used for writing, as raw_record.<dict_id>.dict
+DICTIONARY_DIR = os.environ.get('RAW_RECORD_DICT_DIR', os.path.dirname(DICTIONARY_PATH) or '.')
+
+
+def dictionary_path(dict_id, directory=DICTIONARY_DIR):
+    return os.path.join(directory, f"raw_record.{dict_id}.dict")
+
+
+def load_dictionary(path=DICTIONARY_PATH):
+    """Load a trained zstd dictionary, or None if there is none at path"""
+    try:
+        with open(path, 'rb') as f:
+            return zstandard.ZstdCompressionDict(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def save_dictionary(dictionary, directory=DICTIONARY_DIR):
+    """Write a dictionary under its id; never replaces an existing file"""
+    path = dictionary_path(dictionary.dict_id(), directory)
+    with open(path, 'xb') as f:
+        f.write(dictionary.as_bytes())
+    return path
+
+
+def blob_dict_id(blob):
+    """Id of the dictionary a FORMAT_ZSTD_DICT blob was compressed with"""
+    return zstandard.get_frame_parameters(bytes(blob[1:19])).dict_id
+
+
+def train_dictionary(samples, dict_size=DICTIONARY_SIZE):
+    """Train a zstd dictionary from DAG-CBOR encoded sample records"""
+    return zstandard.train_dictionary(dict_size, list(samples))
+
+
+class RecordCodec:
+    """Encode/decode raw records; compressor state is per thread"""
+
+    def __init__(self, dictionary=None, level=COMPRESSION_LEVEL, dictionary_dir=DICTIONARY_DIR):
+        self.dictionary = dictionary
+        self.level = level
+        self.dictionary_dir = dictionary_dir
+        self._local = threading.local()
+        # dict_id -> dictionary, for reading records written with older dictionaries
+        self._dictionaries = {dictionary.dict_id(): dictionary} if dictionary is not None else {}
+        self._dictionaries_lock = threading.Lock()
+
+    def _compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self._local.compressor = compressor
+        return compressor
+
+    def _dictionary(self, dict_id):
+        with self._dictionaries_lock:
+            dictionary = self._dictionaries.get(dict_id)
+            if dictionary is None:
+                path = dictionary_path(dict_id, self.dictionary_dir)
+                dictionary = load_dictionary(path)
+                if dictionary is None:
+                    raise ValueError(f"Record was compressed with dictionary {dict_id}, "
+                                     f"which is missing (expected at {path})")
+                self._dictionaries[dict_id] = dictionary
+            return dictionary
+
+    def _decompressor(self, dict_id):
+        """Per-thread decompressor for a dictionary id (0 = no dictionary)"""
+        decompressors = getattr(self._local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            dictionary = self._dictionary(dict_id) if dict_id else None
+            decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressor
+
+    def encode(self, record):
+        """Compress a record (decoded dict or DAG-CBOR bytes) into a storage blob"""
+        block = record if isinstance(record, (bytes, bytearray, memoryview)) else libipld.encode_dag_cbor(record)
+        tag = FORMAT_ZSTD_DICT if self.dictionary is not None else FORMAT_ZSTD
+        return bytes([tag]) + self._compressor().compress(block)
+
+    def decode_bytes(self, blob):
+        """Storage blob -> DAG-CBOR bytes"""
+        tag = blob[0]
+        if tag not in (FORMAT_ZSTD, FORMAT_ZSTD_DICT):
+            raise ValueError(f"Unknown raw record format 0x{tag:02x}")
+        dict_id = blob_dict_id(blob) if tag == FORMAT_ZSTD_DICT else 0
+        return self._decompressor(dict_id).decompress(blob[1:])
+
+    def decode(self, blob):
+        """Storage blob (or legacy JSON raw_data) -> record dict"""
+        if blob is None:
+            return None
+        if isinstance(blob, str):
+            return json.loads(blob)
+        if blob[:1] == b'{':
+            return json.loads(blob.decode('utf-8'))
+        return libipld.decode_dag_cbor(self.decode_bytes(blob))
+
+
+def _jsonable(value):
+    """Replace CID bytes (and other bytes) with strings so a record can be JSON encoded"""
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, bytes):
+        try:
+            return libipld.encode_cid(value)
+        except Exception:
+            return value.hex()
+    return value
+
+
+def record_to_json(record):
+    """JSON text for a decoded record, with CIDs rendered as strings"""
+    return json.dumps(_jsonable(record))
+
+
+class LazyRecord:
+    """Holds a stored blob and only decompresses/decodes it when accessed"""
+
+    __slots__ = ('blob', '_codec', '_record')
+
+    def __init__(self, blob, codec=None):
+        self.blob = blob
+        self._codec = codec
+        self._record = None
+
+    @property
+    def record(self):
+        if self._record is None and self.blob is not None:
+            self._record = (self._codec or get_default_codec()).decode(self.blob)
+        return self._record
+
+    def __getitem__(self, key):
+        return self.record[key]
+
+    def get(self, key, default=None):
+        record = self.record
+        return record.get(key, default) if record else default
+
+    def to_json(self):
+        return record_to_json(self.record)
+
+
+_default_codec = None
+
+
+def get_default_codec():
+    """Process-wide codec using the dictionary at DICTIONARY_PATH (if present)"""
+    global _default_codec
+    if _default_codec is None:
+        _default_codec = RecordCodec(load_dictionary())
+    return _default_codec
+
+
+def encode_record(record):
+    return get_default_codec().encode(record)
+
+
+def decode_record(blob):
+    return get_default_codec().decode(blob)
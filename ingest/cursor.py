@@ -0,0 +1,184 @@
+"""
+Durable firehose cursor and catch-up detection.
+
+CursorTracker follows every received frame until all of its post rows are
+committed, and exposes the highest seq below which *everything* is committed.
+Only that seq is checkpointed to the ingest_cursor table, so a restart
+resumes exactly where durable data ends. Rows that the writer had to drop
+freeze the checkpoint at the last good seq instead of silently skipping
+past them.
+
+CatchUpMonitor compares event timestamps with the wall clock to tell how far
+behind live the consumer is, with hysteresis between live and catch-up mode.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import mysql.connector
+
+DEFAULT_CURSOR_NAME = 'firehose'
+
+
+def load_cursor(pool, name=DEFAULT_CURSOR_NAME):
+    """Return the last checkpointed seq, or None to start from live"""
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT seq FROM ingest_cursor WHERE name = %s', (name,))
+            result = cursor.fetchone()
+        return result[0] if result else None
+    except mysql.connector.Error as e:
+        print(f"Error loading firehose cursor: {e}")
+        return None
+
+
+def save_cursor(pool, seq, name=DEFAULT_CURSOR_NAME):
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO ingest_cursor (name, seq, updated_at)
+                VALUES (%s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                seq = VALUES(seq),
+                updated_at = VALUES(updated_at)
+            ''', (name, seq))
+            conn.commit()
+        return True
+    except mysql.connector.Error as e:
+        print(f"Error saving firehose cursor: {e}")
+        return False
+
+
+class CursorTracker:
+    """Track per-frame outstanding rows and the contiguous committed watermark"""
+
+    def __init__(self, start_seq=None):
+        self._frames = OrderedDict()  # seq -> outstanding rows (frames arrive in seq order)
+        self._lock = threading.Lock()
+        self.received_seq = start_seq
+        self.committed_seq = start_seq
+        self.stalled_at = None  # first seq whose rows were lost; checkpoint stays below it
+        self.rows_lost = 0
+
+    def begin(self, seq, rows):
+        """Register a received frame carrying `rows` post rows (0 = nothing to write)"""
+        if seq is None:
+            return
+        with self._lock:
+            self.received_seq = seq
+            self._frames[seq] = rows
+            self._advance()
+
+    def rows_committed(self, seqs):
+        with self._lock:
+            for seq in seqs:
+                if seq in self._frames:
+                    self._frames[seq] -= 1
+            self._advance()
+
+    def rows_failed(self, seqs):
+        with self._lock:
+            for seq in seqs:
+                if seq is None:
+                    continue
+                self.rows_lost += 1
+                if self.stalled_at is None or seq < self.stalled_at:
+                    self.stalled_at = seq
+                if seq in self._frames:
+                    self._frames[seq] -= 1
+            self._advance()
+
+    def _advance(self):
+        while self._frames:
+            seq, outstanding = next(iter(self._frames.items()))
+            if outstanding > 0:
+                break
+            self._frames.popitem(last=False)
+            if self.stalled_at is None or seq < self.stalled_at:
+                self.committed_seq = seq
+
+    def stats(self):
+        with self._lock:
+            return {
+                'received_seq': self.received_seq,
+                'committed_seq': self.committed_seq,
+                'frames_in_flight': len(self._frames),
+                'stalled_at': self.stalled_at,
+                'rows_lost': self.rows_lost,
+            }
+
+
+class CursorCheckpointer:
+    """Background thread that persists the committed watermark every few seconds"""
+
+    def __init__(self, pool, tracker, name=DEFAULT_CURSOR_NAME, interval=5):
+        self.pool = pool
+        self.tracker = tracker
+        self.name = name
+        self.interval = interval
+        self.saved_seq = tracker.committed_seq
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='cursor-checkpointer', daemon=True)
+        self._thread.start()
+
+    def checkpoint(self):
+        seq = self.tracker.committed_seq
+        if seq is not None and seq != self.saved_seq and save_cursor(self.pool, seq, self.name):
+            self.saved_seq = seq
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
+
+    def stop(self):
+        """Stop the thread and write a final checkpoint"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+        self.checkpoint()
+
+
+def parse_event_time(value):
+    """Parse a firehose `time` field (ISO 8601) into an aware datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+class CatchUpMonitor:
+    """Decide between live and catch-up mode from how old incoming events are"""
+
+    def __init__(self, enter_lag=60.0, exit_lag=10.0):
+        self.enter_lag = enter_lag
+        self.exit_lag = exit_lag
+        self.catching_up = False
+        self.lag_seconds = 0.0
+        self.last_checked = 0.0
+
+    def observe(self, event_time, check_interval=1.0):
+        """Update lag from an event timestamp; returns True when the mode flips"""
+        now = time.monotonic()
+        if now - self.last_checked < check_interval:
+            return False
+        event_dt = parse_event_time(event_time)
+        if event_dt is None:
+            return False
+        self.last_checked = now
+
+        self.lag_seconds = max(0.0, (datetime.now(timezone.utc) - event_dt).total_seconds())
+        if not self.catching_up and self.lag_seconds > self.enter_lag:
+            self.catching_up = True
+            return True
+        if self.catching_up and self.lag_seconds < self.exit_lag:
+            self.catching_up = False
+            return True
+        return False
@@ -0,0 +1,192 @@
+"""
+Process-wide MySQL connection pool.
+
+Connections are checked out per thread: nested checkouts on the same thread
+reuse the connection already held, so helpers can call each other freely.
+Idle connections are health-checked (ping with reconnect) before being handed
+out, and a connection that raised OperationalError is discarded so the next
+checkout gets a fresh one.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+
+class PoolTimeout(errors.PoolError):
+    """Raised when no connection became available within checkout_timeout"""
+
+
+# Errors that say the database is unreachable rather than that a statement was bad
+CONNECTION_ERRORS = (errors.OperationalError, errors.InterfaceError, PoolTimeout)
+
+
+class ConnectionPool:
+    """Bounded pool of mysql.connector connections shared by all threads"""
+
+    def __init__(self, config, size=16, health_check_interval=30, checkout_timeout=30):
+        self.config = dict(config)
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._closed = False  # set by close_all(); connections are closed on release from then on
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'max_wait_time': 0.0,
+            'health_checks': 0,
+            'reconnects': 0,
+            'discarded': 0,
+        }
+
+    def _create(self):
+        conn = mysql.connector.connect(**self.config)
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats['closed'] += 1
+
+    def _discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            self._stats['discarded'] += 1
+
+    def _health_check(self, conn, last_used):
+        """Ping connections that sat idle for a while; reconnect if the server dropped them"""
+        if time.monotonic() - last_used < self.health_check_interval:
+            return conn
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except mysql.connector.Error:
+            pass
+        with self._lock:
+            self._stats['reconnects'] += 1
+        try:
+            conn.reconnect(attempts=2, delay=1)
+            return conn
+        except mysql.connector.Error:
+            self._discard(conn)
+            return None
+
+    def _acquire(self):
+        started = time.monotonic()
+        waited = False
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                with self._lock:
+                    can_create = self._open < self.size
+                    if can_create:
+                        self._open += 1
+                if can_create:
+                    try:
+                        conn = self._create()
+                    except mysql.connector.Error:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    last_used = time.monotonic()
+                else:
+                    waited = True
+                    remaining = self.checkout_timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No database connection available after {self.checkout_timeout}s")
+                    try:
+                        conn, last_used = self._idle.get(timeout=min(remaining, 1.0))
+                    except queue.Empty:
+                        continue
+
+            conn = self._health_check(conn, last_used)
+            if conn is not None:
+                break
+
+        wait_time = time.monotonic() - started
+        with self._lock:
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['max_wait_time'] = max(self._stats['max_wait_time'], wait_time)
+        return conn
+
+    def _release(self, conn):
+        if self._closed:
+            self._close(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the current thread (re-entrant)"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        broken = False
+        try:
+            yield conn
+        except (errors.OperationalError, errors.InterfaceError):
+            # Lost connection / server gone away: never hand this one out again
+            broken = True
+            raise
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            if broken:
+                self._discard(conn)
+            else:
+                self._release(conn)
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones are closed when their owner releases them"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def stats(self):
+        """Snapshot of pool size and checkout wait metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        waits = stats['waits']
+        stats['avg_wait_time'] = stats['wait_time_total'] / waits if waits else 0.0
+        return stats
@@ -0,0 +1,187 @@
+"""
+Decoding of firehose commits into flat post rows.
+
+Shared by the inline handler in bsky.py and the decode worker processes of
+ingest.decode_pipeline, so nothing in here may touch the database or any
+process-local state.
+"""
+import json
+from collections import Counter
+from datetime import datetime
+
+from atproto_client.models import get_or_create
+from atproto_firehose import parse_subscribe_repos_message
+from atproto_subscription.frames import Frame, MessageFrame
+
+from ingest.car_reader import extract_blocks
+from ingest.codec import encode_record
+from ingest.identity import IDENTITY_EVENT_TYPES, identity_from_body
+from ingest.routing import DEFAULT_ROUTES, POST_COLLECTION, collection_of, record_subject
+
+
+MAX_LANGUAGE_LENGTH = 10  # posts.language VARCHAR(10)
+
+
+class JSONExtra(json.JSONEncoder):
+    """raw objects sometimes contain CID() objects, which
+    seem to be references to something elsewhere in bluesky.
+    So, we 'serialise' these as a string representation,
+    which is a hack but whatevAAAAR"""
+    def default(self, obj):
+        try:
+            result = json.JSONEncoder.default(self, obj)
+            return result
+        except:
+            return repr(obj)
+
+
+def to_mysql_datetime(created_at):
+    """Convert an ISO datetime from a record to MySQL DATETIME format (None if unparseable)"""
+    if not created_at:
+        return created_at
+    try:
+        # Parse the ISO datetime and convert to MySQL format
+        if created_at.endswith('Z'):
+            created_at = created_at[:-1] + '+00:00'
+        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    except:
+        return None
+
+
+def post_language(langs):
+    """posts.language for a record's langs: the first tag if it is a string that fits, else None.
+
+    langs is untrusted record content; a longer value would fail the whole
+    batch under MariaDB's strict mode.
+    """
+    if not isinstance(langs, (list, tuple)) or not langs:
+        return None
+    lang = langs[0]
+    return lang if isinstance(lang, str) and len(lang) <= MAX_LANGUAGE_LENGTH else None
+
+
+def new_result():
+    """Empty decode result (see decode_commit)"""
+    return {'posts': [], 'deletes': [], 'records': {}, 'errors': [],
+            'processed': Counter(), 'skipped': Counter()}
+
+
+def add_record(result, author_did, path, collection, action, raw):
+    """Turn one routed create/update record into a post dict or record row in `result`.
+
+    raw is the record as libipld decodes it (CIDs and bytes as bytes);
+    shared by the CBOR firehose and the Jetstream input (ingest.jetstream).
+    """
+    result['processed'][collection] += 1
+    try:
+        if collection == POST_COLLECTION:
+            # langs is checked by post_language; a malformed one would make
+            # the model fall back to a plain dict and lose the post
+            cooked = get_or_create({key: value for key, value in raw.items() if key != 'langs'}, strict=False)
+            if cooked.py_type == POST_COLLECTION:
+                result['posts'].append({
+                    'author_did': author_did,
+                    'text': getattr(cooked, 'text', ''),
+                    'created_at': to_mysql_datetime(getattr(cooked, 'created_at', '')),
+                    'language': post_language(raw.get('langs')),
+                    # Construct post URI from the operation path
+                    'post_uri': f"at://{author_did}/{path}",
+                    # Compressed DAG-CBOR of the original record (see ingest.codec)
+                    'raw_record': encode_record(raw),
+                    'action': action,
+                })
+        else:
+            # Other collections are stored as-is, no model round trip
+            result['records'].setdefault(collection, []).append((
+                author_did,
+                f"at://{author_did}/{path}",
+                record_subject(raw),
+                to_mysql_datetime(raw.get('createdAt') if isinstance(raw, dict) else None),
+                json.dumps(raw, cls=JSONExtra),
+            ))
+    except Exception as e:
+        result['errors'].append((str(e), json.dumps(raw, indent=2, cls=JSONExtra)))
+
+
+def decode_commit(commit, routes=DEFAULT_ROUTES):
+    """Decode the ops of a Commit whose collection is in `routes`.
+
+    Ops are filtered on their path prefix first; the CAR is only scanned when
+    at least one create/update op is routed, and only the routed ops' blocks
+    are decoded (ingest.car_reader). Returns a dict with:
+      posts     - post dicts (author_did, text, created_at, language, post_uri, raw_record,
+                  action 'create' or 'update')
+      deletes   - URIs of deleted posts
+      records   - {collection: [(author_did, record_uri, subject, created_at, raw_data)]}
+      errors    - (message, raw_json) for records that failed to decode
+      processed - Counter of routed ops per collection
+      skipped   - Counter of ops dropped per collection
+    """
+    # Extract author DID from the commit
+    author_did = commit.repo
+
+    result = new_result()
+    routed = []
+    for op in commit.ops:
+        collection = collection_of(op.path)
+        if op.action == "delete" and collection == POST_COLLECTION and collection in routes:
+            # No block to decode: the URI is all a delete needs
+            result['processed'][collection] += 1
+            result['deletes'].append(f"at://{author_did}/{op.path}")
+        elif (op.action == "create" or (op.action == "update" and collection == POST_COLLECTION)) \
+                and op.cid and collection in routes:
+            routed.append((op, collection))
+        else:
+            result['skipped'][collection] += 1
+    if not routed:
+        return result
+
+    blocks = extract_blocks(commit.blocks, [op.cid for op, _ in routed])
+    for op, collection in routed:
+        add_record(result, author_did, op.path, collection, op.action, blocks.get(op.cid))
+    return result
+
+
+def decode_frame(data, routes=DEFAULT_ROUTES):
+    """Decode one raw websocket frame into a picklable result dict (None to skip)"""
+    frame = Frame.from_bytes(data)
+    if not isinstance(frame, MessageFrame):
+        return None
+
+    result = {
+        'type': frame.type,
+        'seq': frame.body.get('seq'),
+        'time': frame.body.get('time'),
+        'repo': None,
+        'identity': None,
+        'posts': [],
+        'deletes': [],
+        'records': {},
+        'errors': [],
+        'processed': Counter(),
+        'skipped': Counter(),
+    }
+    if frame.type == '#commit':
+        commit = parse_subscribe_repos_message(frame)
+        result['repo'] = commit.repo
+        result.update(decode_commit(commit, routes))
+    elif frame.type in IDENTITY_EVENT_TYPES:
+        result['identity'] = identity_from_body(frame.body)
+    return result
+
+
+def decode_frames(frames, routes=DEFAULT_ROUTES):
+    """Worker entry point: decode a chunk of raw frames, preserving their order"""
+    results = []
+    for data in frames:
+        try:
+            result = decode_frame(data, routes)
+        except Exception as e:
+            result = {'type': None, 'seq': None, 'time': None, 'repo': None, 'identity': None,
+                      'posts': [], 'deletes': [], 'records': {},
+                      'errors': [(f"Frame decode failed: {e}", 'null')],
+                      'processed': Counter(), 'skipped': Counter()}
+        if result is not None:
+            results.append(result)
+    return results
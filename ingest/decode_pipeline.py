@@ -0,0 +1,177 @@
+"""
+Multi-process decode pipeline for firehose frames.
+
+The websocket receiver only enqueues raw frame bytes. A dispatcher thread
+groups them into chunks and hands each chunk to a process pool that runs
+ingest.decode.decode_frames (CBOR frame decode, CAR parsing, record
+models, JSON serialisation). A consumer thread collects the results strictly
+in submission order, so commits from the same repo DID are always delivered
+in the order they arrived on the socket.
+
+A worker process that dies (OOM kill, crash in a native decoder) breaks the
+whole pool; the dispatcher then replaces it with a fresh one and carries on.
+Chunks that fail in the pool are decoded again in the consumer thread, so
+their frames still reach the callback (and the cursor) in order instead of
+being skipped.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from atproto_firehose import FirehoseSubscribeReposClient
+
+from ingest.decode import decode_frames
+from ingest.routing import DEFAULT_ROUTES
+
+_STOP = object()
+
+
+class RawFirehoseSubscribeReposClient(FirehoseSubscribeReposClient):
+    """Firehose client that passes undecoded frame bytes to the callback"""
+
+    def _decode_frame(self, raw_frame):
+        if isinstance(raw_frame, str):
+            # skip text frames, same as the stock client
+            return None
+        return raw_frame
+
+
+class DecodePipeline:
+    """Receiver queue -> process pool decode -> ordered result callback"""
+
+    def __init__(self, on_result, processes=4, max_queued_frames=20000,
+                 chunk_size=64, max_chunk_delay=0.05, max_inflight_chunks=None,
+                 routes=DEFAULT_ROUTES):
+        self.on_result = on_result
+        self.routes = routes
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.max_chunk_delay = max_chunk_delay
+
+        self.frames = queue.Queue(maxsize=max_queued_frames)
+        # Futures in submission order; bounded so slow decoding pushes back on the receiver
+        self.inflight = queue.Queue(maxsize=max_inflight_chunks or processes * 4)
+
+        self.executor = None
+        self.threads = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'frames_received': 0,
+            'frames_decoded': 0,
+            'chunks': 0,
+            'decode_errors': 0,
+            'callback_errors': 0,
+            'pool_restarts': 0,
+            'max_frame_queue_depth': 0,
+        }
+
+    def _new_executor(self):
+        # spawn (not fork) so workers never inherit sockets, locks or DB connections
+        context = multiprocessing.get_context('spawn')
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+
+    def start(self):
+        self.executor = self._new_executor()
+        for target, name in ((self._dispatch_loop, 'decode-dispatcher'), (self._consume_loop, 'decode-consumer')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        print(f"Started decode pipeline with {self.processes} worker processes")
+
+    def submit(self, frame):
+        """Receiver callback: enqueue raw frame bytes (blocks when the pipeline is full)"""
+        self.frames.put(frame)
+        depth = self.frames.qsize()
+        with self._lock:
+            self._stats['frames_received'] += 1
+            if depth > self._stats['max_frame_queue_depth']:
+                self._stats['max_frame_queue_depth'] = depth
+
+    def close(self, timeout=30):
+        """Decode and deliver everything already received, then stop"""
+        self.frames.put(_STOP)
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['frame_queue_depth'] = self.frames.qsize()
+        stats['inflight_chunks'] = self.inflight.qsize()
+        stats['processes'] = self.processes
+        return stats
+
+    def _next_chunk(self):
+        first = self.frames.get()
+        if first is _STOP:
+            return None, True
+        chunk = [first]
+        deadline = time.monotonic() + self.max_chunk_delay
+        while len(chunk) < self.chunk_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                frame = self.frames.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if frame is _STOP:
+                return chunk, True
+            chunk.append(frame)
+        return chunk, False
+
+    def _dispatch_loop(self):
+        while True:
+            chunk, stopping = self._next_chunk()
+            if chunk:
+                future = self._submit_chunk(chunk)
+                self.inflight.put((future, chunk))
+                with self._lock:
+                    self._stats['chunks'] += 1
+            if stopping:
+                self.inflight.put(_STOP)
+                break
+
+    def _submit_chunk(self, chunk):
+        while True:
+            try:
+                return self.executor.submit(decode_frames, chunk, self.routes)
+            except BrokenProcessPool as e:
+                # Chunks already submitted to the dead pool fail in the consumer
+                print(f"Decode worker process died ({e}), starting a new process pool")
+                broken, self.executor = self.executor, self._new_executor()
+                broken.shutdown(wait=False)
+                with self._lock:
+                    self._stats['pool_restarts'] += 1
+
+    def _consume_loop(self):
+        while True:
+            item = self.inflight.get()
+            if item is _STOP:
+                break
+            future, chunk = item
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Error decoding chunk of {len(chunk)} frames in the pool ({e}), decoding it inline")
+                with self._lock:
+                    self._stats['decode_errors'] += len(chunk)
+                # decode_frames turns per-frame failures into error results, it does not raise
+                results = decode_frames(chunk, self.routes)
+
+            with self._lock:
+                self._stats['frames_decoded'] += len(chunk)
+            for result in results:
+                try:
+                    self.on_result(result)
+                except Exception as e:
+                    print(f"Error handling decoded frame: {e}")
+                    with self._lock:
+                        self._stats['callback_errors'] += 1
@@ -0,0 +1,245 @@
+"""
+Idempotent post writes: duplicate creates, deletes and updates by post URI.
+
+posts is partitioned on saved_at, so it cannot carry a unique key on
+post_uri alone. The unpartitioned post_uris table is that key instead: one
+row per URI the ingester has seen, holding the live post id, or deleted = 1
+for a tombstone. post_uri is binary-collated, so URIs whose rkeys differ
+only in case are different posts. PostWriter hands every batch to
+PostDeduplicator.write_batch, which in one transaction
+
+  1. claims the batch's URIs (INSERT IGNORE); a URI another writer thread
+     is claiming or deleting blocks until that transaction commits,
+  2. reads their state back; post_id IS NULL AND deleted = 0 marks a claim
+     this transaction made,
+  3. inserts only posts whose URI was unclaimed, deletes the rows of
+     deleted or updated posts, and records the new ids and tombstones.
+
+Deletes travel through the writer queue as PostDelete rows, in firehose
+order behind the create they cancel, so a delete whose post is still
+buffered (same batch, or spilled to disk) never lets it reach posts, and
+the tombstone makes a later replay of the create a no-op. Updates
+(PostUpdate rows) replace the post row. Replays and cursor rewinds only
+cost the claim round trips.
+
+With a BulkLoader (ingest.bulk_load) the created/updated rows are staged
+with LOAD DATA first; claiming and inserting them are then one
+INSERT ... SELECT each instead of multi-row VALUES lists.
+
+collapse() and resolve() hold the rules without touching the database, so
+the async ingester (ingest.async_ingest) runs the same steps over aiomysql.
+"""
+import threading
+import time
+from collections import namedtuple
+
+# A delete op for a post, queued to the post writer like a row
+PostDelete = namedtuple('PostDelete', ['post_uri'])
+
+POST_URI_INDEX = 4  # post_uri column in INSERT_POSTS_SQL / INSERT_POSTS_SEGMENT_SQL rows
+
+
+class PostUpdate(tuple):
+    """A post row from an update op: replaces the stored post instead of being a duplicate"""
+    __slots__ = ()
+
+
+CLAIM_URIS_SQL = 'INSERT IGNORE INTO post_uris (post_uri) VALUES (%s)'
+
+URI_STATE_SQL = '''
+    SELECT post_uri, post_id, deleted FROM post_uris
+    WHERE post_uri IN ({placeholders})
+    FOR UPDATE
+'''
+
+DELETED_ROWS_SQL = 'SELECT saved_at, language, author_id FROM posts WHERE id IN ({placeholders})'
+
+DELETE_POSTS_SQL = 'DELETE FROM posts WHERE id IN ({placeholders})'
+
+RECORD_URIS_SQL = '''
+    INSERT INTO post_uris (post_uri, post_id, deleted)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE post_id = VALUES(post_id), deleted = VALUES(deleted)
+'''
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+class PostDeduplicator:
+    """PostWriter batch hook that makes post creates/deletes/updates idempotent.
+
+    on_deleted(rows), if set, is called after commit with (saved_at,
+    language, author_id) of every post row that was removed, so per-minute
+    rollups can be corrected.
+    """
+
+    def __init__(self, on_deleted=None):
+        self.on_deleted = on_deleted
+        self._lock = threading.Lock()
+        self._stats = {
+            'inserted': 0,
+            'duplicates': 0,
+            'deletes': 0,
+            'deletes_buffered': 0,
+            'tombstones': 0,
+            'tombstone_hits': 0,
+            'updates': 0,
+            'merge_misses': 0,
+        }
+
+    def new_counts(self):
+        return dict.fromkeys(self._stats, 0)
+
+    def collapse(self, rows, counts):
+        """One final op per URI, in queue order: (ops, URIs whose create the batch also deletes)"""
+        ops = {}  # uri -> ('create' | 'update', row) or ('delete', None)
+        cancelled = set()  # URIs whose create this batch also deletes
+        for row in rows:
+            uri = row.post_uri if isinstance(row, PostDelete) else row[POST_URI_INDEX]
+            previous = ops.get(uri)
+            if isinstance(row, PostDelete):
+                if previous is not None and previous[0] == 'delete':
+                    counts['duplicates'] += 1
+                    continue
+                if previous is not None:
+                    cancelled.add(uri)
+                ops[uri] = ('delete', None)
+            elif isinstance(row, PostUpdate):
+                if previous is not None and previous[0] == 'delete':
+                    counts['tombstone_hits'] += 1
+                    continue
+                ops[uri] = (previous[0] if previous is not None else 'update', row)
+            elif previous is not None:
+                counts['duplicates'] += 1
+            else:
+                ops[uri] = ('create', row)
+        return ops, cancelled
+
+    def resolve(self, ops, cancelled, state, counts):
+        """Decide each op against post_uris state {uri: (post_id, deleted)} read under the claim.
+
+        Returns (inserts as [(uri, row)], post ids to delete, URIs to tombstone).
+        """
+        inserts = []
+        removed_ids = []
+        tombstones = []
+        for uri, (action, row) in ops.items():
+            post_id, deleted = state.get(uri, (None, 0))
+            claimed = post_id is None and not deleted
+            if action == 'delete':
+                if deleted:
+                    counts['duplicates'] += 1
+                    continue
+                if post_id is not None:
+                    removed_ids.append(post_id)
+                    counts['deletes'] += 1
+                elif uri in cancelled:
+                    counts['deletes_buffered'] += 1  # never reached posts
+                else:
+                    counts['tombstones'] += 1  # delete of a post we never saw
+                tombstones.append(uri)
+            elif deleted:
+                counts['tombstone_hits'] += 1
+            elif claimed:
+                inserts.append((uri, row))
+            elif action == 'update':
+                removed_ids.append(post_id)
+                inserts.append((uri, row))
+                counts['updates'] += 1
+            else:
+                counts['duplicates'] += 1
+        return inserts, removed_ids, tombstones
+
+    @staticmethod
+    def uri_records(inserts, post_ids, tombstones):
+        """RECORD_URIS_SQL parameters for a resolved batch"""
+        return [(uri, post_id, 0) for (uri, _), post_id in zip(inserts, post_ids)] + [(uri, None, 1) for uri in tombstones]
+
+    def deleted(self, deleted_rows):
+        """Report removed post rows to on_deleted after commit"""
+        if deleted_rows and self.on_deleted is not None:
+            try:
+                self.on_deleted(deleted_rows)
+            except Exception as e:
+                print(f"Error in post delete callback: {e}")
+
+    def write_batch(self, conn, rows, insert_sql, bulk=None):
+        """Apply a batch; returns (inserted rows, their post ids) like PostWriter._write_batch"""
+        counts = self.new_counts()
+        started = time.monotonic()
+
+        ops, cancelled = self.collapse(rows, counts)
+        if not ops:
+            self.record(counts)
+            return [], []
+
+        uris = list(ops)
+        if bulk is not None:
+            staged = [(ord_, action == 'update', row)
+                      for ord_, (action, row) in enumerate(ops.values()) if action != 'delete']
+            if staged:
+                bulk.stage(conn, staged, insert_sql)
+            else:
+                bulk = None  # only deletes
+        conn.start_transaction()
+        try:
+            cursor = conn.cursor()
+            if bulk is not None:
+                bulk.claim(cursor)
+                cursor.executemany(CLAIM_URIS_SQL, [(uri,) for uri, (action, _) in ops.items() if action == 'delete'])
+            else:
+                cursor.executemany(CLAIM_URIS_SQL, [(uri,) for uri in uris])
+            cursor.execute(URI_STATE_SQL.format(placeholders=_placeholders(uris)), uris)
+            state = {uri: (post_id, deleted) for uri, post_id, deleted in cursor.fetchall()}
+            inserts, removed_ids, tombstones = self.resolve(ops, cancelled, state, counts)
+
+            inserted_rows = [tuple(row) for _, row in inserts]
+            post_ids = []
+            if bulk is not None:
+                # Same rows the loop above picked, chosen by the same rules in SQL
+                new_ids = bulk.merge(cursor, insert_sql)
+                missed = sum(uri not in new_ids for uri, _ in inserts)
+                if missed:
+                    # A row the loop picked but the merge did not insert; counted, not fatal
+                    print(f"Bulk merge inserted no row for {missed} posts")
+                    counts['merge_misses'] = missed
+                    inserts = [(uri, row) for uri, row in inserts if uri in new_ids]
+                    inserted_rows = [tuple(row) for _, row in inserts]
+                post_ids = [new_ids.get(uri) for uri, _ in inserts]
+            elif inserted_rows:
+                cursor.executemany(insert_sql, inserted_rows)
+                first_id = cursor.lastrowid
+                post_ids = list(range(first_id, first_id + len(inserted_rows)))
+            deleted_rows = []
+            if removed_ids:
+                cursor.execute(DELETED_ROWS_SQL.format(placeholders=_placeholders(removed_ids)), removed_ids)
+                deleted_rows = cursor.fetchall()
+                cursor.execute(DELETE_POSTS_SQL.format(placeholders=_placeholders(removed_ids)), removed_ids)
+
+            records = self.uri_records(inserts, post_ids, tombstones)
+            if records:
+                cursor.executemany(RECORD_URIS_SQL, records)
+            conn.commit()
+            cursor.close()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+        counts['inserted'] = len(inserted_rows)
+        self.record(counts)
+        if bulk is not None:
+            bulk.record_batch(len(rows), time.monotonic() - started)
+        self.deleted(deleted_rows)
+        return [row for _, row in inserts], post_ids
+
+    def record(self, counts):
+        with self._lock:
+            for key, value in counts.items():
+                self._stats[key] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
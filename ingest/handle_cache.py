@@ -0,0 +1,96 @@
+"""
+In-process DID -> handle cache that sits in front of the authors table.
+
+Bounded LRU with per-entry TTL. Negative entries (DIDs that failed to
+resolve, or have no handle in authors yet) are cached with a shorter TTL so
+that prolific unresolved authors do not hit MySQL on every post.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by HandleCache.get() when the DID is not cached at all
+MISS = object()
+
+
+class HandleCache:
+    """Thread-safe LRU/TTL cache of DID -> handle (None = known negative)"""
+
+    def __init__(self, max_size=200000, ttl=6 * 3600, negative_ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._entries = OrderedDict()  # did -> (handle, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'puts': 0,
+        }
+
+    def get(self, did):
+        """Return the cached handle, None for a negative entry, or MISS"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(did)
+            if entry is None:
+                self._stats['misses'] += 1
+                return MISS
+
+            handle, expires_at = entry
+            if expires_at < now:
+                del self._entries[did]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return MISS
+
+            self._entries.move_to_end(did)
+            if handle is None:
+                self._stats['negative_hits'] += 1
+            else:
+                self._stats['hits'] += 1
+            return handle
+
+    def put(self, did, handle, ttl=None):
+        """Cache a resolved handle (or None as a negative entry)"""
+        if ttl is None:
+            ttl = self.ttl if handle is not None else self.negative_ttl
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._entries[did] = (handle, expires_at)
+            self._entries.move_to_end(did)
+            self._stats['puts'] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def put_failure(self, did, permanent=False):
+        """Record that resolution failed for this DID; permanent failures stay cached as long as handles"""
+        self.put(did, None, ttl=self.ttl if permanent else None)
+
+    def invalidate(self, did):
+        with self._lock:
+            self._entries.pop(did, None)
+
+    def warm(self, rows):
+        """Load (did, handle) rows ordered most recent first; returns the number loaded"""
+        loaded = 0
+        # Insert oldest first so the most recent rows end up most-recently-used
+        for did, handle in reversed(list(rows)):
+            self.put(did, handle)
+            loaded += 1
+        return loaded
+
+    def stats(self):
+        """Snapshot of hit/miss/eviction counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,165 @@
+"""
+In-stream handle maintenance from #identity (and legacy #handle) events.
+
+Identity events carry the account's current handle, so authors can be
+kept fresh without a network round trip. Events are collapsed per DID
+(latest wins) and flushed in batches by a background thread: one
+multi-row authors upsert, then the in-memory handle cache. Posts reference
+authors by author_id, so they pick up the new handle through the join.
+
+An event whose handle is handle.invalid clears the stored one and resets
+the author to never resolved, so the UI stops showing the stale handle and
+the author's next post resolves the DID document again. An event with no
+handle at all (a key rotation, say) says nothing about the handle: the
+stored one stays, and the DID is handed to the reresolve callback so the
+DID document is fetched again and decides.
+
+The async mode (ingest/async_ingest.py) batches events in the same class
+and flushes them through take()/restore()/record_flush() on its own
+aiomysql pool.
+"""
+import threading
+
+import mysql.connector
+
+IDENTITY_EVENT_TYPES = ('#identity', '#handle')
+INVALID_HANDLE = 'handle.invalid'  # sent by relays when handle verification fails
+
+UPSERT_AUTHOR_HANDLE_SQL = '''
+    INSERT INTO authors (did, handle, resolved_at, failed_attempts)
+    VALUES (%s, %s, NOW(), 0)
+    ON DUPLICATE KEY UPDATE
+    handle = VALUES(handle),
+    resolved_at = VALUES(resolved_at),
+    failed_attempts = 0,
+    resolution_error = NULL,
+    next_retry_at = NULL
+'''
+
+CLEAR_AUTHOR_HANDLE_SQL = '''
+    UPDATE authors SET handle = NULL, resolved_at = NULL, failed_attempts = 0,
+    resolution_error = NULL, next_retry_at = NULL
+    WHERE did = %s
+'''
+
+
+def identity_from_body(body):
+    """(did, handle) from an #identity/#handle frame body; handle is None when
+    the event has none and INVALID_HANDLE when the relay could not verify it"""
+    return body.get('did'), body.get('handle') or None
+
+
+class IdentityUpdater:
+    """Batches handle updates from the firehose into authors"""
+
+    def __init__(self, pool, handle_cache, flush_interval=1.0, max_batch=1000, reresolve=None):
+        self.pool = pool
+        self.handle_cache = handle_cache
+        self.reresolve = reresolve  # reresolve(did): resolve did from the network despite a stored handle
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._pending = {}  # did -> handle (None: clear it), latest event wins
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'events': 0,
+            'events_without_handle': 0,
+            'reresolutions': 0,
+            'dids_updated': 0,
+            'handles_cleared': 0,
+            'batches': 0,
+            'flush_errors': 0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='identity-updater', daemon=True)
+        self._thread.start()
+
+    def submit(self, did, handle):
+        if not did:
+            return
+        with self._lock:
+            self._stats['events'] += 1
+            if handle:
+                self._pending[did] = handle if handle != INVALID_HANDLE else None
+            else:
+                self._stats['events_without_handle'] += 1
+                # Older pending events must not overwrite what the resolution finds
+                self._pending.pop(did, None)
+            pending = len(self._pending)
+        if not handle or handle == INVALID_HANDLE:
+            self.handle_cache.invalidate(did)
+        if not handle and self.reresolve is not None and self.reresolve(did):
+            with self._lock:
+                self._stats['reresolutions'] += 1
+        if pending >= self.max_batch:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def take(self):
+        """Swap out the pending events as (UPSERT_AUTHOR_HANDLE_SQL, CLEAR_AUTHOR_HANDLE_SQL) params"""
+        with self._lock:
+            batch, self._pending = list(self._pending.items()), {}
+        return [(did, handle) for did, handle in batch if handle], [(did,) for did, handle in batch if not handle]
+
+    def restore(self, updates, clears):
+        """Keep events whose flush failed for the next one, unless newer events replaced them"""
+        with self._lock:
+            self._stats['flush_errors'] += 1
+            for did, handle in updates:
+                self._pending.setdefault(did, handle)
+            for (did,) in clears:
+                self._pending.setdefault(did, None)
+
+    def record_flush(self, updates, clears):
+        """Apply a committed flush to the handle cache"""
+        for did, handle in updates:
+            self.handle_cache.put(did, handle)
+        for (did,) in clears:
+            # Again: a resolution may have cached the old handle before the commit
+            self.handle_cache.invalidate(did)
+        with self._lock:
+            self._stats['dids_updated'] += len(updates)
+            self._stats['handles_cleared'] += len(clears)
+            self._stats['batches'] += 1
+
+    def flush(self):
+        updates, clears = self.take()
+        if not updates and not clears:
+            return 0
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                if updates:
+                    cursor.executemany(UPSERT_AUTHOR_HANDLE_SQL, updates)
+                if clears:
+                    cursor.executemany(CLEAR_AUTHOR_HANDLE_SQL, clears)
+                conn.commit()
+        except mysql.connector.Error as e:
+            print(f"Error applying {len(updates) + len(clears)} identity updates: {e}")
+            self.restore(updates, clears)
+            return 0
+        self.record_flush(updates, clears)
+        return len(updates) + len(clears)
+
+    def stop(self):
+        """Stop the thread and apply whatever is still pending"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
@@ -0,0 +1,187 @@
+"""
+Jetstream input: JSON events instead of CBOR frames and CAR blocks.
+
+Jetstream (github.com/bluesky-social/jetstream) re-serves the firehose as
+one JSON event per op, with the record already decoded, and filters by
+collection on the server. Asking for the routed collections
+(wantedCollections) means the ingester only receives post ops (plus any
+--collections) and the identity/account events Jetstream always sends, so
+there is no CBOR frame, CAR or MST to decode at all.
+
+decode_jetstream_event turns an event into the same result dict
+ingest.decode.decode_frame returns, so bsky.py saves it through the same
+path. Records are converted back to the libipld data model ({"$link"} ->
+CID bytes, {"$bytes"} -> bytes) first, so raw_record blobs are the same as
+for the CBOR firehose. Event time_us is the resume cursor; it is stored
+under its own ingest_cursor name because it is not a firehose seq.
+"""
+import base64
+import json
+import threading
+import urllib.parse
+from datetime import datetime, timezone
+
+import libipld
+
+from ingest.decode import JSONExtra, add_record, new_result
+from ingest.identity import identity_from_body
+from ingest.routing import DEFAULT_ROUTES, POST_COLLECTION
+
+DEFAULT_JETSTREAM_URL = 'wss://jetstream2.us-east.bsky.network/subscribe'
+DEFAULT_JETSTREAM_CURSOR_NAME = 'jetstream'
+
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+def record_from_json(value):
+    """Jetstream's JSON form of a record -> libipld data model"""
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if '$link' in value:
+                return libipld.decode_multibase(value['$link'])[1]
+            if '$bytes' in value:
+                encoded = value['$bytes']
+                return base64.b64decode(encoded + '=' * (-len(encoded) % 4))
+        return {key: record_from_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [record_from_json(item) for item in value]
+    return value
+
+
+def event_time(time_us):
+    """ISO 8601 time for an event's time_us, for catch-up detection"""
+    if time_us is None:
+        return None
+    return datetime.fromtimestamp(time_us / 1e6, timezone.utc).isoformat()
+
+
+def decode_jetstream_event(event, routes=DEFAULT_ROUTES):
+    """Decode one Jetstream event into a decode_frame-style result dict"""
+    kind = event.get('kind')
+    author_did = event.get('did')
+    result = new_result()
+    result.update({
+        'type': f"#{kind}",
+        'seq': event.get('time_us'),
+        'time': event_time(event.get('time_us')),
+        'repo': None,
+        'identity': None,
+    })
+    if kind == 'identity':
+        identity = event.get('identity') or {}
+        result['identity'] = identity_from_body({'did': author_did, **identity})
+        return result
+    if kind != 'commit':
+        return result
+
+    commit = event.get('commit') or {}
+    result['repo'] = author_did
+    collection = commit.get('collection')
+    action = commit.get('operation')
+    path = f"{collection}/{commit.get('rkey')}"
+    if collection not in routes:
+        # Not asked for, or a server without wantedCollections support
+        result['skipped'][collection] += 1
+    elif action == 'delete':
+        if collection == POST_COLLECTION:
+            result['processed'][collection] += 1
+            result['deletes'].append(f"at://{author_did}/{path}")
+        else:
+            result['skipped'][collection] += 1
+    elif action == 'create' or (action == 'update' and collection == POST_COLLECTION):
+        try:
+            raw = record_from_json(commit.get('record'))
+        except Exception as e:
+            result['errors'].append((f"Undecodable Jetstream record: {e}",
+                                     json.dumps(commit.get('record'), indent=2, cls=JSONExtra)))
+            return result
+        add_record(result, author_did, path, collection, action, raw)
+    else:
+        result['skipped'][collection] += 1
+    return result
+
+
+class JetstreamClient:
+    """Websocket client for a Jetstream /subscribe endpoint.
+
+    Mirrors the parts of the atproto firehose client bsky.py uses:
+    start(on_event) blocks, update_params({'cursor': time_us}) sets where a
+    reconnect resumes, stop() ends start(). Reconnects with backoff.
+    """
+
+    def __init__(self, params=None, base_uri=DEFAULT_JETSTREAM_URL, collections=(POST_COLLECTION,)):
+        self.base_uri = base_uri
+        self.collections = list(collections)
+        self._params = dict(params or {})
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._websocket = None
+        self._stats = {
+            'connects': 0,
+            'events': 0,
+            'bytes': 0,
+            'bad_messages': 0,
+        }
+
+    def update_params(self, params):
+        with self._lock:
+            self._params.update(params)
+
+    def url(self):
+        with self._lock:
+            params = dict(self._params)
+        query = [('wantedCollections', collection) for collection in self.collections]
+        query += [(key, value) for key, value in params.items() if value is not None]
+        return f"{self.base_uri}?{urllib.parse.urlencode(query)}"
+
+    def start(self, on_event):
+        from websockets.sync.client import connect
+
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            url = self.url()
+            try:
+                with connect(url, max_size=None) as websocket:
+                    self._websocket = websocket
+                    with self._lock:
+                        self._stats['connects'] += 1
+                    print(f"Connected to Jetstream at {url}")
+                    delay = RECONNECT_DELAY
+                    for message in websocket:
+                        try:
+                            event = json.loads(message)
+                        except ValueError:
+                            with self._lock:
+                                self._stats['bad_messages'] += 1
+                            continue
+                        with self._lock:
+                            self._stats['events'] += 1
+                            self._stats['bytes'] += len(message)
+                        try:
+                            on_event(event)
+                        except Exception as e:
+                            print(f"Error handling Jetstream event: {e}")
+            except (OSError, ConnectionError) as e:
+                print(f"Jetstream connection error: {e}")
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                # websockets' ConnectionClosed and handshake errors
+                print(f"Jetstream connection closed: {e}")
+            finally:
+                self._websocket = None
+            if self._stop.wait(delay):
+                break
+            print(f"🔄 Reconnecting to {self.url()}")
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def stop(self):
+        self._stop.set()
+        websocket = self._websocket
+        if websocket is not None:
+            websocket.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,231 @@
+"""
+authors bootstrap from a PLC directory export.
+
+plc.directory/export serves every PLC operation as JSON lines in createdAt
+order ({"did", "operation", "cid", "nullified", "createdAt"}); saved to
+disk (optionally gzip or zstd compressed) it covers nearly every account
+the firehose will ever show, so authors can be filled without one
+network resolution per author.
+
+PlcExportImporter streams the file line by line and folds operations into
+the latest state per DID in a dict of at most max_pending DIDs. When the
+dict is full (and at the end) it is written out: one LOAD DATA into a
+per-connection temporary table, then one INSERT ... SELECT upsert into
+authors. Because the export is in time order, a DID flushed early is
+simply overwritten by its later operations in a later flush, so memory
+stays bounded whatever the export size.
+
+The upsert only replaces a row when the operation is at least as new as
+what authors already has (resolved_at is set to the operation's
+createdAt), or when the row has no handle, so handles the
+ingester resolved or learned from #identity events after the export are
+kept and re-importing the same file is a no-op. A replaced row also drops
+its retry schedule (next_retry_at): tombstoned DIDs are stored without a
+handle and with resolution_error 'tombstoned', operations without a handle
+with 'no_handle', so the ingester treats them as permanent failures (see
+ingest/retry_schedule.py) and never resolves them. DIDs new to authors get
+an author_id but no first_seen/last_seen until they post. Nullified
+operations are skipped.
+
+The createdAt of the last operation read is checkpointed in ingest_cursor
+(as microseconds since the epoch) after every flush; incremental imports
+skip everything up to it. See import_plc_export.py.
+"""
+import gzip
+import io
+import json
+import sys
+import tempfile
+import time
+from datetime import timezone
+
+import zstandard
+
+from ingest.bulk_load import DEFAULT_TSV_DIR, encode_tsv
+from ingest.cursor import parse_event_time, save_cursor
+
+PLC_CURSOR_NAME = 'plc_export'
+DEFAULT_MAX_PENDING = 200000
+IMPORT_TABLE = 'authors_import'
+MAX_HANDLE_LENGTH = 255
+
+# The conditions read authors.handle/resolved_at before they are assigned
+# (MySQL applies the assignments left to right), so those two come last
+MERGE_SQL = f'''
+    INSERT INTO authors (did, handle, resolved_at, failed_attempts, resolution_error)
+    SELECT did, handle, resolved_at, 0, resolution_error FROM {IMPORT_TABLE}
+    ON DUPLICATE KEY UPDATE
+    failed_attempts = IF(authors.handle IS NULL OR authors.resolved_at IS NULL
+                         OR authors.resolved_at <= VALUES(resolved_at),
+                         0, authors.failed_attempts),
+    resolution_error = IF(authors.handle IS NULL OR authors.resolved_at IS NULL
+                          OR authors.resolved_at <= VALUES(resolved_at),
+                          VALUES(resolution_error), authors.resolution_error),
+    next_retry_at = IF(authors.handle IS NULL OR authors.resolved_at IS NULL
+                       OR authors.resolved_at <= VALUES(resolved_at),
+                       NULL, authors.next_retry_at),
+    handle = IF(authors.handle IS NULL OR authors.resolved_at IS NULL
+                OR authors.resolved_at <= VALUES(resolved_at),
+                VALUES(handle), authors.handle),
+    resolved_at = GREATEST(COALESCE(authors.resolved_at, VALUES(resolved_at)), VALUES(resolved_at))
+'''
+
+
+def open_export(path):
+    """Binary line iterator over an export file ('-' for stdin, .gz/.zst by extension)"""
+    if path == '-':
+        return sys.stdin.buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+
+def operation_handle(operation):
+    """(handle or None, tombstoned) for a PLC operation"""
+    op_type = operation.get('type')
+    if op_type == 'plc_tombstone':
+        return None, True
+    if op_type == 'create':
+        # Legacy genesis operation: the handle is its own field
+        handle = operation.get('handle')
+    else:
+        handle = None
+        for aka in operation.get('alsoKnownAs') or ():
+            if isinstance(aka, str) and aka.startswith('at://'):
+                handle = aka[5:]
+                break
+    if not isinstance(handle, str) or not handle or len(handle) > MAX_HANDLE_LENGTH:
+        return None, False
+    return handle, False
+
+
+def micros(created):
+    """Microseconds since the epoch for an aware datetime (the cursor unit)"""
+    return round(created.timestamp() * 1e6)
+
+
+class PlcExportImporter:
+    """Folds PLC export operations into authors in bounded memory"""
+
+    def __init__(self, pool, since=None, max_pending=DEFAULT_MAX_PENDING, tsv_dir=DEFAULT_TSV_DIR,
+                 cursor_name=PLC_CURSOR_NAME, dry_run=False):
+        self.pool = pool
+        self.since = since  # skip operations created at or before this (microseconds)
+        self.max_pending = max_pending
+        self.tsv_dir = tsv_dir
+        self.cursor_name = cursor_name
+        self.dry_run = dry_run
+        self.last_created = since
+
+        self._pending = {}  # did -> (handle, resolved_at, resolution_error), latest operation wins
+        self._stats = {
+            'lines': 0,
+            'bad_lines': 0,
+            'operations': 0,
+            'nullified': 0,
+            'older_skipped': 0,
+            'tombstones': 0,
+            'without_handle': 0,
+            'flushes': 0,
+            'rows_loaded': 0,
+            'load_time': 0.0,
+        }
+
+    def import_file(self, path):
+        export = open_export(path)
+        try:
+            for line in export:
+                self.feed_line(line)
+        finally:
+            if export is not sys.stdin.buffer:
+                export.close()
+
+    def feed_line(self, line):
+        self._stats['lines'] += 1
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            if line.strip():
+                self._stats['bad_lines'] += 1
+            return
+        if not isinstance(entry, dict):
+            self._stats['bad_lines'] += 1
+            return
+        self.feed(entry)
+
+    def feed(self, entry):
+        """Fold one export entry into the pending state"""
+        did = entry.get('did')
+        operation = entry.get('operation')
+        created_at = parse_event_time(entry.get('createdAt'))
+        if not isinstance(did, str) or not isinstance(operation, dict) or created_at is None:
+            self._stats['bad_lines'] += 1
+            return
+        if entry.get('nullified'):
+            self._stats['nullified'] += 1
+            return
+        created = micros(created_at)
+        if self.since is not None and created <= self.since:
+            self._stats['older_skipped'] += 1
+            return
+
+        self._stats['operations'] += 1
+        handle, tombstoned = operation_handle(operation)
+        error = None
+        if tombstoned:
+            self._stats['tombstones'] += 1
+            error = 'tombstoned'
+        elif handle is None:
+            self._stats['without_handle'] += 1
+            error = 'no_handle'
+        resolved_at = created_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self._pending[did] = (handle, resolved_at, error)
+        if self.last_created is None or created > self.last_created:
+            self.last_created = created
+        if len(self._pending) >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        """Write the pending DIDs to authors and checkpoint the cursor"""
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        started = time.monotonic()
+        if not self.dry_run:
+            data = encode_tsv((did, *state) for did, state in batch.items())
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # resolved_at values are UTC
+                cursor.execute("SET time_zone = '+00:00'")
+                cursor.execute(f'''
+                    CREATE TEMPORARY TABLE IF NOT EXISTS {IMPORT_TABLE} (
+                        did VARCHAR(255) NOT NULL,
+                        handle VARCHAR(255),
+                        resolved_at TIMESTAMP NULL,
+                        resolution_error VARCHAR(32)
+                    )
+                ''')
+                cursor.execute(f'DELETE FROM {IMPORT_TABLE}')
+                with tempfile.NamedTemporaryFile(dir=self.tsv_dir, prefix='plc-', suffix='.tsv') as tsv:
+                    tsv.write(data)
+                    tsv.flush()
+                    cursor.execute(f'''
+                        LOAD DATA LOCAL INFILE %s INTO TABLE {IMPORT_TABLE}
+                        CHARACTER SET utf8mb4 (did, handle, resolved_at, resolution_error)
+                    ''', (tsv.name,))
+                cursor.execute(MERGE_SQL)
+                conn.commit()
+                cursor.close()
+            # Everything read so far is in authors now
+            save_cursor(self.pool, self.last_created, self.cursor_name)
+        self._stats['flushes'] += 1
+        self._stats['rows_loaded'] += len(batch)
+        self._stats['load_time'] += time.monotonic() - started
+        return len(batch)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['pending'] = len(self._pending)
+        return stats
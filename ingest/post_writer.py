@@ -0,0 +1,486 @@
+"""
+Batched writer stage for firehose posts.
+
+The firehose handler pushes rows into a bounded queue and returns immediately.
+One or more writer threads drain the queue and flush the rows as a single
+multi-row INSERT (executemany) with one commit per batch. A batch is flushed
+when it reaches the current batch size or when the oldest row has waited
+longer than max_delay seconds, whichever comes first.
+
+With a SpillQueue attached (ingest.spill), rows are appended to disk
+instead of blocking the firehose when the queue is past spill_threshold,
+and instead of being dropped when the database is unreachable. A drainer
+thread replays the spilled rows in bulk once the database accepts writes
+and the live queue has room again. Only connection errors count as the
+database being down: a batch that fails for any other reason (e.g. a value
+too long for its column) is split until the rows that fail on their own
+are found, and those are rejected and counted so the rest, spilled or not,
+still get written.
+
+With a BulkLoader attached (ingest.bulk_load, needs dedupe), the writer
+switches to LOAD DATA batches of bulk.batch_size rows while the queue is
+at least bulk_threshold deep, and back once it is down to a quarter of
+that. Spill drains always use it.
+"""
+import queue
+import threading
+import time
+
+from ingest.db_pool import CONNECTION_ERRORS
+
+INSERT_POSTS_SQL = '''
+    INSERT INTO posts (author_id, text, created_at, language, post_uri, raw_record)
+    VALUES (%s, %s, %s, %s, %s, %s)
+'''
+
+_STOP = object()
+
+
+class PostWriter:
+    """Bounded queue + writer threads that group-commit post rows.
+
+    Connections come from the shared ConnectionPool. Rows are 6-tuples in
+    INSERT_POSTS_SQL column order. With authors set (an
+    ingest.authors.AuthorDirectory) they are queued with the author's DID
+    in the author_id column and get the author_id assigned on the writer's
+    connection right before the insert. After every successful flush
+    on_flushed(rows, post_ids) is called from the writer thread, so callers
+    can hand the new post IDs to the DID resolution path. Rows may carry the
+    firehose seq they came from; on_committed(seqs) / on_failed(seqs) report
+    which of them reached the database so the cursor can be checkpointed.
+
+    Post IDs are derived from the first AUTO_INCREMENT value of the
+    multi-row INSERT. MariaDB hands out consecutive IDs for a single
+    multi-row INSERT with the default innodb_autoinc_lock_mode (1).
+
+    insert_sql/name let the same writer feed other tables (see
+    ingest.routing for the per-collection record tables). prepare_batch,
+    if set, may rewrite a batch's rows right before they are inserted
+    (ingest.segment_store uses it to move raw records out of the row).
+    dedupe, if set, takes over writing each batch (ingest.dedupe skips
+    duplicate post URIs and applies queued PostDelete rows); on_flushed
+    then only sees the rows it inserted.
+    bulk, if set, is passed to dedupe for large batches (see above).
+
+    Spilled rows are fsynced before on_committed fires for their seqs, so
+    the cursor may move past them; they reach on_flushed when drained.
+    """
+
+    def __init__(self, pool, on_flushed=None, num_threads=1, max_queue_size=20000,
+                 min_batch_size=10, max_batch_size=1000, max_delay=0.5,
+                 target_latency=0.2, on_committed=None, on_failed=None,
+                 insert_sql=INSERT_POSTS_SQL, name='post', prepare_batch=None,
+                 spill=None, spill_threshold=None, probe_interval=5.0, dedupe=None,
+                 bulk=None, bulk_threshold=None, authors=None):
+        if bulk is not None and dedupe is None:
+            raise ValueError("Bulk load merges through dedupe; pass both")
+        self.pool = pool
+        self.authors = authors
+        self.dedupe = dedupe
+        self.bulk = bulk
+        self.bulk_threshold = bulk_threshold or max_queue_size // 4
+        self.bulk_active = False
+        self.spill = spill
+        self.spill_threshold = spill_threshold or max_queue_size * 3 // 4
+        self.probe_interval = probe_interval
+        self.db_down = False
+        self.insert_sql = insert_sql
+        self.prepare_batch = prepare_batch
+        self.name = name
+        self.on_flushed = on_flushed
+        self.on_committed = on_committed
+        self.on_failed = on_failed
+        self.num_threads = num_threads
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = min_batch_size
+        self.threads = []
+
+        self._overflow = []  # (row, seq) waiting to be appended to the spill queue
+        self._overflow_since = 0.0
+        self._overflow_lock = threading.Lock()
+        self._drainer = None
+        self._stop_draining = threading.Event()
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'rows_queued': 0,
+            'rows_flushed': 0,  # rows in committed batches
+            'rows_written': 0,  # rows inserted: with dedupe, fewer than rows_flushed
+            'batches': 0,
+            'flush_errors': 0,
+            'rows_dropped': 0,
+            'last_batch_size': 0,
+            'max_batch_size_seen': 0,
+            'flush_time_total': 0.0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+            'max_queue_depth': 0,
+            'rows_spilled': 0,
+            'rows_drained': 0,
+            'drain_errors': 0,
+            'rows_rejected': 0,  # rows that failed on their own, dropped so the rest get written
+            'bulk_batches': 0,
+        }
+
+    def start(self):
+        """Start the writer threads"""
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._writer_loop, name=f"{self.name}-writer-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        if self.spill is not None:
+            self._drainer = threading.Thread(target=self._drain_loop, name=f"{self.name}-spill-drainer", daemon=True)
+            self._drainer.start()
+        print(f"Started {self.num_threads} {self.name} writer thread(s)")
+
+    def submit(self, row, seq=None, timeout=None):
+        """Queue a row for writing. Blocks when the queue is full (backpressure),
+        unless a spill queue is attached: then the row goes to disk instead."""
+        if self.spill is not None and (self.db_down or self.queue.qsize() >= self.spill_threshold):
+            self._add_overflow(row, seq)
+            return
+        self.queue.put((row, seq), timeout=timeout)
+        depth = self.queue.qsize()
+        with self._lock:
+            self._stats['rows_queued'] += 1
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+
+    def set_batch_limits(self, min_batch_size, max_batch_size, max_delay):
+        """Retune batching at runtime, e.g. larger batches while catching up"""
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batch_size = min(max(self.batch_size, min_batch_size), max_batch_size)
+
+    def close(self, timeout=30):
+        """Flush everything still queued and stop the writer threads.
+
+        Spilled rows that are not drained yet stay on disk for the next run.
+        """
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads = []
+        if self.spill is not None:
+            self._stop_draining.set()
+            if self._drainer is not None:
+                self._drainer.join(timeout=timeout)
+                self._drainer = None
+            self._flush_overflow()
+            self.spill.close()
+            backlog = self.spill.stats()['backlog_rows']
+            if backlog:
+                print(f"⚠️ {backlog} spilled {self.name} rows left in {self.spill.directory} for the next run")
+
+    def stats(self):
+        """Snapshot of writer counters: batch size, flush latency and queue depth"""
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats['batches']
+        stats['queue_depth'] = self.queue.qsize()
+        stats['target_batch_size'] = self.batch_size
+        stats['avg_batch_size'] = stats['rows_flushed'] / batches if batches else 0.0
+        stats['avg_flush_latency'] = stats['flush_time_total'] / batches if batches else 0.0
+        stats['db_down'] = self.db_down
+        stats['bulk_active'] = self.bulk_active
+        if self.spill is not None:
+            spill_stats = self.spill.stats()
+            stats['spill_backlog_rows'] = spill_stats['backlog_rows']
+            stats['spill_backlog_bytes'] = spill_stats['backlog_bytes']
+            stats['drain_rate'] = spill_stats['drain_rate']
+        return stats
+
+    def _add_overflow(self, row, seq):
+        """Buffer a row for the spill queue; appended (and fsynced) a batch at a time"""
+        with self._overflow_lock:
+            if not self._overflow:
+                self._overflow_since = time.monotonic()
+            self._overflow.append((row, seq))
+            full = len(self._overflow) >= self.max_batch_size
+        if full:
+            self._flush_overflow()
+
+    def _flush_overflow(self):
+        with self._overflow_lock:
+            items, self._overflow = self._overflow, []
+        if items:
+            self._spill_items(items)
+
+    def _spill_items(self, items):
+        """Append rows to the spill queue; returns False if even that failed"""
+        try:
+            self.spill.append([row for row, _ in items])
+        except OSError as e:
+            print(f"Error spilling {len(items)} {self.name} rows to {self.spill.directory}: {e}")
+            with self._lock:
+                self._stats['rows_dropped'] += len(items)
+            self._notify(self.on_failed, [seq for _, seq in items])
+            return False
+        with self._lock:
+            self._stats['rows_spilled'] += len(items)
+        self._notify(self.on_committed, [seq for _, seq in items])
+        return True
+
+    def _drain_loop(self):
+        """Move spilled rows back into the database once it keeps up again"""
+        retry_at = 0.0
+        while not self._stop_draining.wait(min(self.max_delay, 0.2)):
+            with self._overflow_lock:
+                overflow_due = self._overflow and time.monotonic() - self._overflow_since >= self.max_delay
+            if overflow_due:
+                self._flush_overflow()
+
+            if time.monotonic() < retry_at or self.queue.qsize() >= self.spill_threshold // 2:
+                continue  # backing off, or live rows first
+            while not self._stop_draining.is_set():
+                drained = self._drain_once()
+                if drained is None:
+                    retry_at = time.monotonic() + self.probe_interval
+                if not drained or self.queue.qsize() >= self.spill_threshold // 2:
+                    break
+
+    def _drain_once(self):
+        """Write one spilled batch: True if there may be more, False if empty, None on error"""
+        rows, position = self.spill.read_batch(self.max_batch_size)
+        try:
+            if not rows:
+                if self.db_down:
+                    with self.pool.connection() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute('SELECT 1')
+                        cursor.fetchall()
+                        cursor.close()
+                    self._set_db_down(False)
+                return False
+            batch = self.prepare_batch(rows) if self.prepare_batch is not None else rows
+            written, post_ids = self._write_isolating(batch, bulk=self.bulk is not None)
+        except Exception as e:  # like _flush: the drainer thread must survive anything
+            print(f"Error draining {len(rows)} spilled {self.name} rows: {e}")
+            with self._lock:
+                self._stats['drain_errors'] += 1
+            if isinstance(e, CONNECTION_ERRORS):
+                self._set_db_down(True)
+                return None
+            if isinstance(e, OSError):
+                return None  # preparing hit a disk error; try again later
+            # Anything else fails the same way every time and would hold the
+            # drain position for good (_write_isolating only raises connection errors)
+            print(f"Rejected {len(rows)} spilled {self.name} rows that could not be prepared")
+            self.spill.commit(position, len(rows))
+            with self._lock:
+                self._stats['rows_rejected'] += len(rows)
+            return True
+
+        self.spill.commit(position, len(rows))
+        self._set_db_down(False)
+        with self._lock:
+            self._stats['rows_drained'] += len(rows)
+        if self.on_flushed:
+            try:
+                self.on_flushed(written, post_ids)
+            except Exception as e:
+                print(f"Error in post writer flush callback: {e}")
+        return True
+
+    def _set_db_down(self, down):
+        if down == self.db_down:
+            return
+        self.db_down = down
+        if down:
+            print(f"⚠️ Database unreachable, spilling {self.name} rows to {self.spill.directory}")
+        else:
+            print(f"✅ Database reachable again, draining spilled {self.name} rows")
+
+    def _update_bulk_mode(self):
+        """Enter bulk mode while the queue is deep, leave it once mostly drained"""
+        if self.bulk is None:
+            return
+        depth = self.queue.qsize()
+        if not self.bulk_active and depth >= self.bulk_threshold:
+            self.bulk_active = True
+            print(f"⏩ {self.name} queue at {depth} rows, switching to LOAD DATA bulk batches")
+        elif self.bulk_active and depth < self.bulk_threshold // 4:
+            self.bulk_active = False
+            print(f"✅ {self.name} queue down to {depth} rows, back to multi-row INSERTs")
+
+    def _collect_batch(self):
+        """Block for the first row, then gather more until size or time trigger fires.
+
+        Returns (items, stopping, bulk).
+        """
+        first = self.queue.get()
+        if first is _STOP:
+            return None, True, False
+
+        self._update_bulk_mode()
+        bulk = self.bulk_active
+        limit = self.bulk.batch_size if bulk else self.batch_size
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True, bulk
+            batch.append(item)
+        return batch, False, bulk
+
+    def _adapt_batch_size(self, latency):
+        """Grow batches while writes are fast and rows are waiting, shrink when slow"""
+        if latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif self.queue.qsize() >= self.batch_size:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def _write_batch(self, conn, batch, bulk=False):
+        """Insert a batch; returns (rows written, their post ids)"""
+        if self.authors is not None:
+            batch = self.authors.assign(conn, batch)
+        if self.dedupe is not None:
+            return self.dedupe.write_batch(conn, batch, self.insert_sql, bulk=self.bulk if bulk else None)
+        cursor = conn.cursor()
+        cursor.executemany(self.insert_sql, batch)
+        first_id = cursor.lastrowid
+        conn.commit()
+        cursor.close()
+        if not first_id:
+            return batch, [None] * len(batch)
+        return batch, list(range(first_id, first_id + len(batch)))
+
+    def _write_once(self, batch, bulk):
+        with self.pool.connection() as conn:
+            try:
+                return self._write_batch(conn, batch, bulk)
+            except Exception as e:
+                if not isinstance(e, CONNECTION_ERRORS):
+                    conn.rollback()
+                raise
+
+    def _write_isolating(self, batch, bulk=False):
+        """Write a batch on a pooled connection; returns (rows written, their post ids).
+
+        Connection errors are raised. On any other error the batch is split
+        in halves that are written on their own, down to single rows, which
+        get one more try (e.g. after a deadlock) before they are rejected.
+        """
+        try:
+            return self._write_once(batch, bulk)
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            print(f"Error writing {len(batch)} {self.name} rows, isolating the failing ones: {e}")
+            with self._lock:
+                self._stats['flush_errors'] += 1
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            first_rows, first_ids = self._write_isolating(batch[:middle], bulk)
+            last_rows, last_ids = self._write_isolating(batch[middle:], bulk)
+            return list(first_rows) + list(last_rows), list(first_ids) + list(last_ids)
+        try:
+            return self._write_once(batch, bulk)
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            print(f"Rejected a {self.name} row that fails on its own: {e}")
+        with self._lock:
+            self._stats['rows_rejected'] += 1
+        return [], []
+
+    def _flush(self, items, bulk=False):
+        """Write one batch, retrying once on a fresh pooled connection"""
+        if self.spill is not None and self.db_down:
+            self._spill_items(items)
+            return
+
+        batch = [row for row, _ in items]
+        seqs = [seq for _, seq in items]
+        started = time.monotonic()
+        written = post_ids = None
+        # Worth spilling: the database is unreachable, or preparing hit a disk
+        # error; anything else would fail the same way when drained
+        spillable = False
+        # Any error is caught, not just database ones: the writer threads are
+        # the only consumers of the bounded queue, so if they died submit()
+        # would block the firehose callback forever
+        try:
+            if self.prepare_batch is not None:
+                batch = self.prepare_batch(batch)
+            attempts = 2
+        except Exception as e:
+            print(f"Error preparing {len(batch)} {self.name} rows: {e}")
+            with self._lock:
+                self._stats['flush_errors'] += 1
+            spillable = isinstance(e, OSError)
+            attempts = 0
+        for attempt in range(attempts):
+            try:
+                written, post_ids = self._write_isolating(batch, bulk)
+                break
+            except Exception as e:
+                print(f"Error flushing {len(batch)} {self.name} rows to database (attempt {attempt + 1}): {e}")
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+                spillable = isinstance(e, CONNECTION_ERRORS)
+                if not spillable:
+                    break  # _write_isolating only raises connection errors; don't retry a bug
+
+        if post_ids is None and self.spill is not None and spillable:
+            if attempts:
+                self._set_db_down(True)
+            self._spill_items(items)  # the unprepared rows; the drainer prepares them again
+            return
+
+        latency = time.monotonic() - started
+        with self._lock:
+            if post_ids is None:
+                self._stats['rows_dropped'] += len(batch)
+            else:
+                self._stats['rows_flushed'] += len(batch)
+                self._stats['rows_written'] += len(written)
+                self._stats['batches'] += 1
+                self._stats['bulk_batches'] += int(bulk)
+                self._stats['last_batch_size'] = len(batch)
+                self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+                self._stats['flush_time_total'] += latency
+                self._stats['last_flush_latency'] = latency
+                self._stats['max_flush_latency'] = max(self._stats['max_flush_latency'], latency)
+        if not bulk:
+            self._adapt_batch_size(latency)  # bulk batches say nothing about INSERT latency
+
+        if post_ids is None:
+            self._notify(self.on_failed, seqs)
+            return
+        if self.on_flushed:
+            try:
+                self.on_flushed(written, post_ids)
+            except Exception as e:
+                print(f"Error in post writer flush callback: {e}")
+        self._notify(self.on_committed, seqs)
+
+    def _notify(self, callback, seqs):
+        if callback is None:
+            return
+        try:
+            callback(seqs)
+        except Exception as e:
+            print(f"Error in post writer seq callback: {e}")
+
+    def _writer_loop(self):
+        while True:
+            batch, stopping, bulk = self._collect_batch()
+            if batch:
+                self._flush(batch, bulk)
+            if stopping:
+                break
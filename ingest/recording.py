@@ -0,0 +1,67 @@
+"""
+Recorded firehose sessions for offline benchmarks.
+
+A recording is a zstd stream: an 8 byte magic followed by one entry per
+websocket frame, each a big-endian (float64 seconds since recording start,
+uint32 length) header and the raw frame bytes exactly as received.
+"""
+import struct
+import time
+
+import zstandard
+
+MAGIC = b'BSKYFRM1'
+_ENTRY = struct.Struct('>dI')
+
+
+class FrameRecorder:
+    """Append raw frames to a compressed recording file"""
+
+    def __init__(self, path, level=3):
+        self._file = open(path, 'wb')
+        self._writer = zstandard.ZstdCompressor(level=level).stream_writer(self._file)
+        self._writer.write(MAGIC)
+        self._started = time.monotonic()
+        self.frames = 0
+        self.bytes = 0
+
+    def write(self, frame, offset=None):
+        """Append a frame; offset defaults to the time since the recorder was created"""
+        if isinstance(frame, str):
+            return
+        if offset is None:
+            offset = time.monotonic() - self._started
+        self._writer.write(_ENTRY.pack(offset, len(frame)))
+        self._writer.write(frame)
+        self.frames += 1
+        self.bytes += len(frame)
+
+    def close(self):
+        self._writer.close()  # also closes the underlying file
+
+
+def _read_exact(reader, size):
+    data = b''
+    while len(data) < size:
+        chunk = reader.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_recording(path):
+    """Yield (seconds since start, frame bytes) for every recorded frame"""
+    with open(path, 'rb') as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+        if _read_exact(reader, len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a firehose recording")
+        while True:
+            header = _read_exact(reader, _ENTRY.size)
+            if len(header) < _ENTRY.size:
+                return
+            offset, length = _ENTRY.unpack(header)
+            frame = _read_exact(reader, length)
+            if len(frame) < length:
+                return  # truncated by an interrupted recorder
+            yield offset, frame
@@ -0,0 +1,216 @@
+"""
+DID resolution shared by the ingester's resolver threads and the backlog
+processor.
+
+DidResolver replaces building a fresh atproto IdResolver per DID (a new
+HTTP client and TCP/TLS connection for every lookup, no timeout). One
+asyncio loop on a background thread owns a pooled httpx.AsyncClient with
+keep-alive connections; at most max_in_flight requests run at a time and
+each has its own timeout. Callers stay synchronous: resolve(did) for one
+DID, resolve_many(dids) to fan a batch out over the pool, resolve_outcomes(dids)
+to also learn why a DID did not resolve (see status_outcome and
+ingest/retry_schedule.py).
+
+handle_from_did_doc and status_outcome are also used by the async ingester's
+resolver.
+"""
+import asyncio
+import threading
+import time
+import urllib.parse
+
+import httpx
+from atproto_core.did_doc import DidDocument, is_valid_did_doc
+
+DEFAULT_PLC_URL = 'https://plc.directory'
+DEFAULT_MAX_IN_FLIGHT = 32
+DEFAULT_TIMEOUT = 5.0
+
+
+def handle_from_did_doc(did_doc):
+    """Extract the handle from a resolved DID document (None if it has none)"""
+    handle = None
+    if did_doc and hasattr(did_doc, 'also_known_as') and did_doc.also_known_as:
+        for aka in did_doc.also_known_as:
+            if aka.startswith('at://'):
+                handle = aka[5:]  # Remove 'at://' prefix
+                break
+
+    # If no handle found in also_known_as, try service endpoints
+    if not handle and did_doc and hasattr(did_doc, 'service') and did_doc.service:
+        for service in did_doc.service:
+            if hasattr(service, 'service_endpoint') and isinstance(service.service_endpoint, str):
+                if service.service_endpoint.startswith('https://'):
+                    # Extract handle from service endpoint (common pattern)
+                    endpoint = service.service_endpoint
+                    if '.bsky.social' in endpoint:
+                        # Try to extract handle from the endpoint
+                        parts = endpoint.split('/')
+                        if len(parts) > 2:
+                            potential_handle = parts[2].split('.')[0]
+                            if potential_handle and not potential_handle.startswith('did:'):
+                                handle = potential_handle + '.bsky.social'
+                                break
+
+    return handle
+
+
+def status_outcome(status_code):
+    """Resolution outcome for a non-200 response from the DID document host"""
+    if status_code == 410:
+        return 'tombstoned'  # plc.directory serves deactivated DIDs as 410 Gone
+    if status_code == 404:
+        return 'not_found'
+    if 400 <= status_code < 500 and status_code not in (408, 429):
+        return 'invalid'
+    return 'errors'
+
+
+def did_document_url(did, plc_url=DEFAULT_PLC_URL):
+    """Where a DID's document lives: the PLC directory, or /.well-known for did:web"""
+    if did.startswith('did:plc:'):
+        return f"{plc_url}/{did}"
+    if did.startswith('did:web:'):
+        host = urllib.parse.unquote(did[len('did:web:'):])
+        return f"https://{host}/.well-known/did.json"
+    raise ValueError(f"Unsupported DID method: {did}")
+
+
+class DidResolver:
+    """Shared DID -> handle resolver with pooled connections and bounded concurrency"""
+
+    def __init__(self, plc_url=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, timeout=DEFAULT_TIMEOUT,
+                 keepalive=None):
+        self.plc_url = (plc_url or DEFAULT_PLC_URL).rstrip('/')
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        # httpcore polls every idle pooled connection on each request, so a
+        # pool as large as max_in_flight costs more CPU than the handshakes
+        # it saves; a quarter of it stays warm
+        self.keepalive = keepalive if keepalive is not None else max(1, max_in_flight // 4)
+
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'resolved': 0,
+            'no_handle': 0,
+            'not_found': 0,
+            'tombstoned': 0,
+            'invalid': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'in_flight': 0,
+            'max_in_flight_seen': 0,
+            'request_time': 0.0,
+        }
+
+    def start(self):
+        """Start the resolver loop (done on first use)"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.timeout),
+                    limits=httpx.Limits(max_connections=self.max_in_flight,
+                                        max_keepalive_connections=self.keepalive),
+                    follow_redirects=True,
+                )
+                self._semaphore = asyncio.Semaphore(self.max_in_flight)
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='did-resolver', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    def resolve(self, did):
+        """Handle for one DID; None if it has none, is unknown or the lookup failed"""
+        return self.resolve_many([did]).get(did)
+
+    def resolve_many(self, dids):
+        """Resolve a batch concurrently; returns {did: handle or None}"""
+        return {did: handle for did, (handle, _) in self.resolve_outcomes(dids).items()}
+
+    def resolve_outcomes(self, dids):
+        """Resolve a batch concurrently; returns {did: (handle or None, outcome)}
+
+        outcome is one of the stats counters: resolved, no_handle, not_found,
+        tombstoned, invalid, errors or timeouts.
+        """
+        dids = list(dict.fromkeys(dids))
+        if not dids:
+            return {}
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._resolve_all(dids), self._loop)
+        # Every request has its own timeout; this only guards against a wedged loop
+        results = future.result(timeout=self.timeout * (len(dids) // self.max_in_flight + 2))
+        return dict(zip(dids, results))
+
+    async def _resolve_all(self, dids):
+        return await asyncio.gather(*(self._resolve(did) for did in dids))
+
+    async def _resolve(self, did):
+        async with self._semaphore:
+            with self._lock:
+                self._stats['requests'] += 1
+                self._stats['in_flight'] += 1
+                self._stats['max_in_flight_seen'] = max(self._stats['max_in_flight_seen'], self._stats['in_flight'])
+            started = time.monotonic()
+            outcome, handle = 'errors', None
+            try:
+                response = await self._client.get(did_document_url(did, self.plc_url))
+                if response.status_code != 200:
+                    outcome = status_outcome(response.status_code)
+                    if outcome in ('errors', 'invalid'):
+                        print(f"Failed to resolve handle for {did}: HTTP {response.status_code}")
+                else:
+                    document = response.json()
+                    if is_valid_did_doc(document) and document.get('id') == did:
+                        handle = handle_from_did_doc(DidDocument.from_dict(document))
+                        outcome = 'resolved' if handle else 'no_handle'
+                    else:
+                        outcome = 'invalid'
+                        print(f"Invalid DID document for {did}")
+            except httpx.TimeoutException:
+                outcome = 'timeouts'
+                print(f"Timed out resolving handle for {did}")
+            except ValueError as e:
+                # Unsupported DID method, or a body that is not a DID document
+                outcome = 'invalid'
+                print(f"Failed to resolve handle for {did}: {e}")
+            except Exception as e:
+                print(f"Failed to resolve handle for {did}: {e}")
+            finally:
+                with self._lock:
+                    self._stats['in_flight'] -= 1
+                    self._stats[outcome] += 1
+                    self._stats['request_time'] += time.monotonic() - started
+            return handle, outcome
+
+    def close(self):
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result(timeout=self.timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
+        loop.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        done = stats['requests'] - stats['in_flight']
+        stats['avg_request_time'] = stats['request_time'] / done if done else 0.0
+        return stats
@@ -0,0 +1,151 @@
+"""
+Persistent retry schedule for DID resolutions that failed.
+
+authors.next_retry_at holds when an unresolved author is next due for a
+network resolution; NULL means never again on its own (resolved, failed
+permanently, or out of attempts). Identity events and successful
+resolutions clear it.
+
+Failures are classified by the resolver's outcome. Tombstoned DIDs (410),
+unknown DIDs (404), documents without a handle and malformed DIDs or
+documents are permanent: retrying does not help, and a later handle change
+arrives as an #identity event anyway. Timeouts, 5xx/429 responses and
+connection errors are transient and back off exponentially from
+BASE_DELAY, doubling per consecutive failure up to MAX_DELAY, each delay
+scaled by a random factor in [1 - JITTER, 1 + JITTER] so DIDs that failed
+together (a PLC outage) do not come due together. After MAX_ATTEMPTS
+transient failures the author is left alone.
+
+mark_failed_params() feeds MARK_FAILED_SQL, one upsert that computes the
+next attempt from the stored failed_attempts, so recording a failure needs
+no read first. RetryScheduler pulls due DIDs in batches with one indexed
+range scan (idx_next_retry_at) and hands them to the resolver queue.
+
+New authors are inserted with next_retry_at FIRST_RETRY_DELAY ahead: the
+live path resolves them right away, the schedule only catches the ones
+whose resolution got lost (rejected flight, restart).
+"""
+import random
+import threading
+
+import mysql.connector
+
+BASE_DELAY = 60  # seconds after the first transient failure
+MAX_DELAY = 86400
+MAX_ATTEMPTS = 14  # transient failures before giving up, about 4 days of retries
+JITTER = 0.5
+FIRST_RETRY_DELAY = 300
+
+# Resolver outcomes (ingest/resolver.py) that retrying will not fix
+PERMANENT_FAILURES = frozenset(('tombstoned', 'not_found', 'no_handle', 'invalid'))
+
+# next_retry_at is assigned before failed_attempts, so it reads the count
+# before this failure (MySQL evaluates assignments left to right). A NULL
+# jitter (permanent failure) makes the interval, and so next_retry_at, NULL.
+MARK_FAILED_SQL = f'''
+    INSERT INTO authors (did, resolved_at, failed_attempts, resolution_error, next_retry_at)
+    VALUES (%s, NOW(), 1, %s, DATE_ADD(NOW(), INTERVAL FLOOR({BASE_DELAY} * %s) SECOND))
+    ON DUPLICATE KEY UPDATE
+    next_retry_at = IF(handle IS NOT NULL OR failed_attempts + 1 >= {MAX_ATTEMPTS}, NULL,
+                       DATE_ADD(NOW(), INTERVAL FLOOR(
+                           LEAST({MAX_DELAY}, {BASE_DELAY} * POW(2, LEAST(failed_attempts, 20))) * %s) SECOND)),
+    failed_attempts = failed_attempts + 1,
+    resolution_error = VALUES(resolution_error),
+    resolved_at = VALUES(resolved_at)
+'''
+
+# retry_due is computed by the database: next_retry_at is on its clock, not ours
+RETRY_STATE_SQL = '''
+    SELECT did, handle, resolved_at, next_retry_at, next_retry_at <= NOW() AS retry_due
+    FROM authors WHERE did IN ({placeholders})
+'''
+
+DUE_SQL = '''
+    SELECT did FROM authors
+    WHERE next_retry_at <= NOW()
+    ORDER BY next_retry_at
+    LIMIT %s
+'''
+
+
+def is_permanent(outcome):
+    return outcome in PERMANENT_FAILURES
+
+
+def mark_failed_params(did, outcome, rng=random):
+    """MARK_FAILED_SQL parameters for a failed resolution of did"""
+    jitter = None if is_permanent(outcome) else rng.uniform(1 - JITTER, 1 + JITTER)
+    return (did, outcome, jitter, jitter)
+
+
+def due_for_resolution(resolved_at, retry_due):
+    """Whether an author without a handle should be resolved now, from a RETRY_STATE_SQL row"""
+    if resolved_at is None:
+        return True  # never tried
+    return bool(retry_due)  # NULL when no retry is scheduled
+
+
+class RetryScheduler:
+    """Background thread queueing authors whose next_retry_at has come"""
+
+    def __init__(self, pool, enqueue, pending=None, interval=30.0, batch_size=500):
+        self.pool = pool
+        self.enqueue = enqueue  # did -> True if it was queued (False: already in flight)
+        self.pending = pending  # () -> DIDs already waiting in the queue
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'passes': 0,
+            'passes_skipped': 0,
+            'due': 0,
+            'queued': 0,
+            'in_flight': 0,
+            'errors': 0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='retry-scheduler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        """Queue up to batch_size due DIDs, fewer while the queue is still busy; returns how many"""
+        limit = self.batch_size - (self.pending() if self.pending is not None else 0)
+        if limit <= 0:
+            with self._lock:
+                self._stats['passes_skipped'] += 1
+            return 0
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(DUE_SQL, (limit,))
+                due = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+        except mysql.connector.Error as e:
+            print(f"Error reading due DID resolutions: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return 0
+        queued = sum(1 for did in due if self.enqueue(did))
+        with self._lock:
+            self._stats['passes'] += 1
+            self._stats['due'] += len(due)
+            self._stats['queued'] += queued
+            self._stats['in_flight'] += len(due) - queued
+        return queued
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,167 @@
+"""
+Per-minute post counts maintained at ingest time.
+
+Every committed batch of post rows is counted into in-memory buckets keyed
+by (minute, language) and (minute, author_id). A background thread
+flushes them every few seconds as additive upserts into post_rollup_language
+and post_rollup_author, so the dashboards (flask-app routes/stats.py and
+routes/ingress.py) sum a few hundred rollup rows instead of scanning posts.
+
+Buckets use the database clock at commit time, the clock that stamps
+posts.saved_at and that the dashboards compare against with NOW() and
+CURDATE(). The ingester reads NOW() at start and with every flush and
+applies the offset to its own clock, so buckets are right whatever the
+ingester host's clock or time zone. Unknown languages are stored as ''.
+Deleted posts are subtracted from the bucket of their saved_at (see
+ingest.dedupe).
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+UPSERT_LANGUAGE_ROLLUP_SQL = '''
+    INSERT INTO post_rollup_language (bucket, language, posts)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE posts = posts + VALUES(posts)
+'''
+
+UPSERT_AUTHOR_ROLLUP_SQL = '''
+    INSERT INTO post_rollup_author (bucket, author_id, posts)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE posts = posts + VALUES(posts)
+'''
+
+DB_CLOCK_SQL = 'SELECT NOW()'
+
+
+def minute_bucket(moment=None):
+    return (moment or datetime.now()).replace(second=0, microsecond=0)
+
+
+class RollupAggregator:
+    """Counts committed post rows per minute and flushes them as upserts"""
+
+    def __init__(self, pool, flush_interval=5.0):
+        self.pool = pool
+        self.flush_interval = flush_interval
+
+        self._clock_offset = timedelta(0)  # database clock minus ours
+        self._languages = Counter()  # (bucket, language) -> posts
+        self._authors = Counter()    # (bucket, author_id) -> posts
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            'posts_counted': 0,
+            'posts_uncounted': 0,
+            'language_rows': 0,
+            'author_rows': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+        }
+
+    def start(self):
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(DB_CLOCK_SQL)
+                self.set_db_time(cursor.fetchone()[0])
+                cursor.close()
+        except mysql.connector.Error as e:
+            print(f"Error reading the database clock for rollups: {e}")
+        self._thread = threading.Thread(target=self._run, name='rollup-flusher', daemon=True)
+        self._thread.start()
+
+    def set_db_time(self, db_now):
+        """Align buckets with the database clock, given its NOW()"""
+        self._clock_offset = db_now - datetime.now()
+
+    def now(self):
+        """Current time on the database clock"""
+        return datetime.now() + self._clock_offset
+
+    def add(self, rows):
+        """Count post rows (INSERT_POSTS_SQL column order, author_id assigned) committed just now"""
+        bucket = minute_bucket(self.now())
+        with self._lock:
+            for row in rows:
+                self._languages[(bucket, row[3] or '')] += 1
+                self._authors[(bucket, row[0])] += 1
+            self._stats['posts_counted'] += len(rows)
+
+    def remove(self, rows):
+        """Uncount deleted posts, given as (saved_at, language, author_id)"""
+        with self._lock:
+            for saved_at, language, author_id in rows:
+                bucket = minute_bucket(saved_at)
+                self._languages[(bucket, language or '')] -= 1
+                self._authors[(bucket, author_id)] -= 1
+            self._stats['posts_uncounted'] += len(rows)
+
+    def take(self):
+        """Swap out the pending buckets as (language rows, author rows) upsert params"""
+        with self._lock:
+            languages, self._languages = self._languages, Counter()
+            authors, self._authors = self._authors, Counter()
+        return ([(bucket, language, posts) for (bucket, language), posts in languages.items() if posts],
+                [(bucket, author_id, posts) for (bucket, author_id), posts in authors.items() if posts])
+
+    def restore(self, language_rows, author_rows):
+        """Put back buckets whose flush failed; they are added to on the next one"""
+        with self._lock:
+            for bucket, language, posts in language_rows:
+                self._languages[(bucket, language)] += posts
+            for bucket, author_id, posts in author_rows:
+                self._authors[(bucket, author_id)] += posts
+            self._stats['flush_errors'] += 1
+
+    def record_flush(self, language_rows, author_rows):
+        with self._lock:
+            self._stats['language_rows'] += len(language_rows)
+            self._stats['author_rows'] += len(author_rows)
+            self._stats['flushes'] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        language_rows, author_rows = self.take()
+        if not language_rows and not author_rows:
+            return 0
+        try:
+            with self.pool.connection() as conn:
+                # One transaction, so a failed flush can be put back as a whole
+                conn.start_transaction()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(DB_CLOCK_SQL)
+                    self.set_db_time(cursor.fetchone()[0])
+                    cursor.executemany(UPSERT_LANGUAGE_ROLLUP_SQL, language_rows)
+                    cursor.executemany(UPSERT_AUTHOR_ROLLUP_SQL, author_rows)
+                    conn.commit()
+                except mysql.connector.Error:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+        except mysql.connector.Error as e:
+            print(f"Error flushing {len(language_rows) + len(author_rows)} rollup rows: {e}")
+            self.restore(language_rows, author_rows)
+            return 0
+        self.record_flush(language_rows, author_rows)
+        return len(language_rows) + len(author_rows)
+
+    def stop(self):
+        """Stop the thread and flush what is still counted"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending_buckets'] = len(self._languages) + len(self._authors)
+        return stats
@@ -0,0 +1,51 @@
+"""
+Collection routing table for firehose ops.
+
+Every op path starts with its collection NSID ("app.bsky.feed.post/3k..."),
+so ops can be routed, or dropped, before their CAR block is looked up or
+decoded. Posts always go to the posts table; the collections listed in
+RECORD_TABLES can optionally be routed to their own tables, which share
+one generic schema (see 01-init-schema.sql).
+"""
+
+POST_COLLECTION = "app.bsky.feed.post"
+
+# collection NSID -> table for optional record routes
+RECORD_TABLES = {
+    'app.bsky.feed.like': 'likes',
+    'app.bsky.feed.repost': 'reposts',
+    'app.bsky.graph.follow': 'follows',
+    'app.bsky.graph.block': 'blocks',
+}
+
+DEFAULT_ROUTES = frozenset([POST_COLLECTION])
+
+
+def collection_of(path):
+    """Collection NSID of an op path ('app.bsky.feed.post/3k...' -> 'app.bsky.feed.post')"""
+    return path.split('/', 1)[0]
+
+
+def build_routes(extra_collections=()):
+    """Set of collections to decode: posts plus any optional record collections"""
+    unknown = [c for c in extra_collections if c not in RECORD_TABLES]
+    if unknown:
+        raise ValueError(f"No table for collection(s): {', '.join(unknown)} "
+                         f"(known: {', '.join(sorted(RECORD_TABLES))})")
+    return DEFAULT_ROUTES | frozenset(extra_collections)
+
+
+def insert_record_sql(collection):
+    """INSERT statement for a routed non-post collection (rows from record_row())"""
+    return f'''
+    INSERT INTO {RECORD_TABLES[collection]} (author_did, record_uri, subject, created_at, raw_data)
+    VALUES (%s, %s, %s, %s, %s)
+'''
+
+
+def record_subject(record):
+    """What a like/repost/follow/block points at: a record URI or a DID"""
+    subject = record.get('subject') if isinstance(record, dict) else None
+    if isinstance(subject, dict):
+        return subject.get('uri')
+    return subject
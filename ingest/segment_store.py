@@ -0,0 +1,208 @@
+"""
+Append-only segment files for cold raw records.
+
+With bsky.py --raw-store segments the compressed record blobs (ingest.codec)
+are appended to rotating files on local disk instead of going into the
+posts row; the row keeps only (raw_segment, raw_offset, raw_length).
+
+Layout: one directory of numbered files. The segment currently being
+appended to is named NNNNNNNN.seg.open and is renamed to NNNNNNNN.seg once
+it is full (sealed). Segment ids are allocated by exclusive file creation,
+so the ingester and compact_segments.py can both create segments safely.
+The writer holds an exclusive flock on its open segment until it is sealed,
+so compaction only seals open segments whose writer is gone.
+
+Bytes are fsynced before the rows that reference them are committed (once
+per writer batch), so a committed reference always points at durable data.
+A crash in between only leaves unreferenced bytes, which compaction drops.
+"""
+import fcntl
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from ingest.codec import LazyRecord
+from ingest.dedupe import PostDelete
+
+DEFAULT_SEGMENT_DIR = 'raw_segments'
+DEFAULT_MAX_SEGMENT_BYTES = 256 * 1024 * 1024
+
+SEALED_SUFFIX = '.seg'
+OPEN_SUFFIX = '.seg.open'
+_SEGMENT_RE = re.compile(r'^(\d{8})\.seg(\.open)?$')
+
+INSERT_POSTS_SEGMENT_SQL = '''
+    INSERT INTO posts (author_id, text, created_at, language, post_uri,
+                       raw_segment, raw_offset, raw_length)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+def segment_path(directory, segment_id, sealed=True):
+    return os.path.join(directory, f"{segment_id:08d}{SEALED_SUFFIX if sealed else OPEN_SUFFIX}")
+
+
+def list_segments(directory):
+    """[(segment_id, sealed, path)] in id order"""
+    segments = []
+    for name in os.listdir(directory):
+        match = _SEGMENT_RE.match(name)
+        if match:
+            segments.append((int(match.group(1)), match.group(2) is None, os.path.join(directory, name)))
+    return sorted(segments)
+
+
+class SegmentWriter:
+    """Appends blobs to the open segment, rotating at max_segment_bytes"""
+
+    def __init__(self, directory=DEFAULT_SEGMENT_DIR, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.segment_id = None
+        self._file = None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'records': 0,
+            'bytes': 0,
+            'syncs': 0,
+            'segments_sealed': 0,
+        }
+
+    def _open_next_segment(self):
+        existing = list_segments(self.directory)
+        segment_id = existing[-1][0] + 1 if existing else 1
+        while True:
+            path = segment_path(self.directory, segment_id, sealed=False)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+                break
+            except FileExistsError:
+                segment_id += 1
+        # Released when the file is closed, by _seal or by the process exiting
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self.segment_id = segment_id
+        self._file = os.fdopen(fd, 'ab')
+        self._size = 0
+
+    def _seal(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.rename(segment_path(self.directory, self.segment_id, sealed=False),
+                  segment_path(self.directory, self.segment_id, sealed=True))
+        self._file = None
+        self._stats['segments_sealed'] += 1
+
+    def _append(self, blob):
+        if self._file is None:
+            self._open_next_segment()
+        elif self._size and self._size + len(blob) > self.max_segment_bytes:
+            self._seal()
+            self._open_next_segment()
+        offset = self._size
+        self._file.write(blob)
+        self._size += len(blob)
+        self._stats['records'] += 1
+        self._stats['bytes'] += len(blob)
+        return self.segment_id, offset, len(blob)
+
+    def append_many(self, blobs):
+        """Append blobs and fsync once; returns [(segment, offset, length)]"""
+        with self._lock:
+            refs = [self._append(blob) for blob in blobs]
+            self.sync()
+        return refs
+
+    def sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._stats['syncs'] += 1
+
+    def externalize_rows(self, rows):
+        """PostWriter prepare_batch hook: swap each row's raw_record blob for its segment reference.
+
+        PostDelete rows carry no record and pass through; the row type
+        (e.g. ingest.dedupe.PostUpdate) is kept.
+        """
+        refs = iter(self.append_many([row[5] for row in rows if not isinstance(row, PostDelete)]))
+        return [row if isinstance(row, PostDelete) else type(row)(row[:5] + next(refs)) for row in rows]
+
+    def close(self, seal=True):
+        with self._lock:
+            if self._file is not None:
+                if seal:
+                    self._seal()
+                else:
+                    self.sync()
+                    self._file.close()
+                    self._file = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['segment_id'] = self.segment_id
+        stats['segment_bytes'] = self._size
+        return stats
+
+
+class SegmentReader:
+    """Memory-mapped random access to segment records.
+
+    Keeps up to max_open_segments maps open (LRU). The open segment keeps
+    growing, so a read past the end of its current map remaps it.
+    """
+
+    def __init__(self, directory=DEFAULT_SEGMENT_DIR, max_open_segments=64):
+        self.directory = directory
+        self.max_open_segments = max_open_segments
+        self._maps = OrderedDict()  # segment_id -> mmap
+        self._lock = threading.Lock()
+
+    def _map(self, segment_id, min_size):
+        segment_map = self._maps.get(segment_id)
+        if segment_map is not None and len(segment_map) >= min_size:
+            self._maps.move_to_end(segment_id)
+            return segment_map
+        if segment_map is not None:
+            segment_map.close()
+            del self._maps[segment_id]
+
+        for sealed in (True, False):
+            try:
+                with open(segment_path(self.directory, segment_id, sealed), 'rb') as f:
+                    segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise FileNotFoundError(f"Segment {segment_id} not found in {self.directory}")
+
+        self._maps[segment_id] = segment_map
+        while len(self._maps) > self.max_open_segments:
+            _, evicted = self._maps.popitem(last=False)
+            evicted.close()
+        return segment_map
+
+    def read(self, segment_id, offset, length):
+        """Return the record bytes at (segment, offset, length)"""
+        with self._lock:
+            segment_map = self._map(segment_id, offset + length)
+            if offset + length > len(segment_map):
+                raise ValueError(f"Record {segment_id}:{offset}+{length} is past the end of the segment")
+            return segment_map[offset:offset + length]
+
+    def record(self, segment_id, offset, length):
+        """LazyRecord for a posts row's (raw_segment, raw_offset, raw_length)"""
+        return LazyRecord(self.read(segment_id, offset, length))
+
+    def close(self):
+        with self._lock:
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
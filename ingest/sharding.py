@@ -0,0 +1,545 @@
+"""
+Horizontal ingest sharding by repo DID.
+
+A router process (bsky.py --mode shard-router) receives the firehose,
+peeks at each frame's repo DID without parsing its CAR blocks, and forwards
+the raw frame to the worker that owns the DID on a consistent hash ring.
+Workers (bsky.py --mode shard-worker) decode and write as usual, each with
+its own connection pool, handle cache and writers. Because every event for
+a DID goes to the same worker, per-repo ordering is preserved.
+
+Transport is multiprocessing.connection: "host:port" for TCP, or a path
+for a Unix socket. TCP connections must be authenticated with SHARD_AUTHKEY
+(there is no default key); Unix sockets rely on file permissions and use it
+only if set. Messages are plain bytes, never pickles: the router sends
+batches of raw frames, each prefixed with its length, and an empty message
+when it is done; workers answer with their committed cursor watermark for
+that router as an 8-byte seq. The router checkpoints the
+minimum over all workers that still have frames outstanding, so a restart
+never skips rows a worker had not committed. A worker that disconnects is
+not sent anything more; the router's cursor stays at what that worker had
+acked, so the frames it never got are replayed after a restart.
+
+Workers can be added (or removed) at runtime: the router drains every
+shard, then swaps in the new ring. Consistent hashing moves only about
+1/N of the DIDs to a newly added worker.
+"""
+import bisect
+import hashlib
+import os
+import queue
+import struct
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import libipld
+
+from ingest.cursor import CursorTracker
+
+SHARD_AUTHKEY = os.environ.get('SHARD_AUTHKEY', '').encode() or None
+DEFAULT_VNODES = 64
+
+_FRAME_LENGTH = struct.Struct('>I')
+_ACK = struct.Struct('>q')
+
+
+def parse_address(value):
+    """'host:port' -> (host, port); anything else is a Unix socket path"""
+    value = value.strip()
+    host, sep, port = value.rpartition(':')
+    if sep and port.isdigit() and not value.startswith('/'):
+        return host or 'localhost', int(port)
+    return value
+
+
+def format_address(address):
+    return f"{address[0]}:{address[1]}" if isinstance(address, tuple) else address
+
+
+def check_authkey(address):
+    """Refuse TCP transport (a parsed address) without SHARD_AUTHKEY"""
+    if isinstance(address, tuple) and SHARD_AUTHKEY is None:
+        raise ValueError(f"SHARD_AUTHKEY must be set to use TCP shard address {format_address(address)}")
+
+
+def pack_frames(frames):
+    """One message for a batch of raw frames"""
+    return b''.join(_FRAME_LENGTH.pack(len(data)) + data for data in frames)
+
+
+def unpack_frames(message):
+    frames = []
+    offset = 0
+    while offset < len(message):
+        (length,) = _FRAME_LENGTH.unpack_from(message, offset)
+        offset += _FRAME_LENGTH.size
+        if offset + length > len(message):
+            raise ValueError(f"Frame of {length} bytes runs past the end of the batch")
+        frames.append(message[offset:offset + length])
+        offset += length
+    return frames
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, members, vnodes=DEFAULT_VNODES):
+        self.members = list(members)
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            raise ValueError("Hash ring has no members")
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def moved_fraction(self, other, samples=10000):
+        """Estimate the share of keys that change owner between two rings"""
+        moved = sum(self.owner(f"did:plc:sample{i}") != other.owner(f"did:plc:sample{i}") for i in range(samples))
+        return moved / samples
+
+
+def frame_route_info(data):
+    """(type, seq, time, did) from a raw frame without touching its CAR blocks; None for error frames"""
+    header, body = libipld.decode_dag_cbor_multi(data)
+    if header.get('op') != 1:
+        return None
+    return header.get('t'), body.get('seq'), body.get('time'), body.get('repo') or body.get('did')
+
+
+class _Shard:
+    """Router-side state for one worker connection"""
+
+    def __init__(self, address):
+        self.address = address
+        self.conn = None
+        self.connected = True
+        self.buffer = []
+        self.buffered_since = 0.0
+        self.send_lock = threading.Lock()
+        self.sent_seq = None    # highest seq handed to this worker
+        self.acked_seq = None   # worker's committed watermark for those frames
+        self.frames = 0
+        self.thread = None
+
+    @property
+    def outstanding(self):
+        return self.sent_seq is not None and (self.acked_seq is None or self.acked_seq < self.sent_seq)
+
+
+class ShardRouter:
+    """Routes raw firehose frames to shard workers by hash of the repo DID.
+
+    Exposes committed_seq like CursorTracker, so CursorCheckpointer can
+    persist the router's cursor unchanged.
+    """
+
+    def __init__(self, addresses, batch_size=64, max_delay=0.05, vnodes=DEFAULT_VNODES):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.vnodes = vnodes
+        self.shards = {}
+        self.ring = None
+        self.received_seq = None
+        self._committed_seq = None
+        self.stalled = False  # a worker was lost: committed_seq never passes stalled_at again
+        self.stalled_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._stats = {
+            'frames_received': 0,
+            'frames_routed': 0,
+            'frames_unrouted': 0,
+            'route_errors': 0,
+            'frames_undelivered': 0,
+            'rebalances': 0,
+        }
+        self._initial_addresses = [format_address(parse_address(a)) for a in addresses]
+
+    def start(self, start_seq=None):
+        self.received_seq = self._committed_seq = start_seq
+        for address in self._initial_addresses:
+            self._connect(address)
+        self.ring = HashRing(self.shards, self.vnodes)
+        self._flusher = threading.Thread(target=self._flush_loop, name='shard-flusher', daemon=True)
+        self._flusher.start()
+        print(f"Routing firehose to {len(self.shards)} shard workers: {', '.join(self.shards)}")
+
+    def _connect(self, address):
+        check_authkey(parse_address(address))
+        shard = _Shard(address)
+        shard.conn = Client(parse_address(address), authkey=SHARD_AUTHKEY)
+        shard.thread = threading.Thread(target=self._ack_loop, args=(shard,), name=f"shard-acks-{address}", daemon=True)
+        shard.thread.start()
+        self.shards[address] = shard
+        return shard
+
+    def _ack_loop(self, shard):
+        while True:
+            try:
+                (seq,) = _ACK.unpack(shard.conn.recv_bytes(_ACK.size))
+            except (EOFError, OSError, struct.error) as e:
+                if not self._stop.is_set() and shard.address in self.shards:
+                    self._disconnected(shard, e)
+                return
+            with self._lock:
+                shard.acked_seq = seq
+
+    def route(self, data):
+        """Receiver callback: forward one raw frame to the worker owning its repo DID"""
+        try:
+            info = frame_route_info(data)
+        except Exception as e:
+            print(f"Error reading frame for routing: {e}")
+            with self._lock:
+                self._stats['route_errors'] += 1
+            return
+        with self._lock:
+            self._stats['frames_received'] += 1
+        if info is None:
+            return
+        _, seq, _, did = info
+        if not did:
+            with self._lock:
+                if seq is not None:
+                    self.received_seq = seq
+                self._stats['frames_unrouted'] += 1
+            return
+
+        shard = self.shards[self.ring.owner(did)]
+        with shard.send_lock:
+            if not shard.connected:
+                # Neither buffered nor counted as sent: the cursor is already stalled below it
+                with self._lock:
+                    self._stats['frames_undelivered'] += 1
+                return
+            if not shard.buffer:
+                shard.buffered_since = time.monotonic()
+            shard.buffer.append(data)
+            with self._lock:
+                # sent_seq first, so committed_seq never covers a frame the worker has not got
+                if seq is not None:
+                    shard.sent_seq = self.received_seq = seq
+                shard.frames += 1
+                self._stats['frames_routed'] += 1
+            if len(shard.buffer) >= self.batch_size:
+                self._send(shard)
+
+    def _send(self, shard):
+        """Send a shard's buffered frames; caller holds shard.send_lock"""
+        if not shard.connected or not shard.buffer:
+            return
+        frames, shard.buffer = shard.buffer, []
+        try:
+            # Blocks while the worker is behind, which pushes back on the receiver
+            shard.conn.send_bytes(pack_frames(frames))
+        except (EOFError, OSError) as e:
+            shard.buffer = frames + shard.buffer  # kept, never counted as delivered
+            with self._lock:
+                self._stats['frames_undelivered'] += len(frames)
+            self._disconnected(shard, e)
+
+    def _disconnected(self, shard, error):
+        """Stop routing to a lost worker and stall the cursor at what it had committed"""
+        with self._lock:
+            if not shard.connected:
+                return
+            shard.connected = False
+            bound = shard.acked_seq if shard.acked_seq is not None else self._committed_seq
+            if not self.stalled:
+                self.stalled_at = bound
+            elif bound is None or self.stalled_at is None:
+                self.stalled_at = None
+            else:
+                self.stalled_at = min(self.stalled_at, bound)
+            self.stalled = True
+        print(f"⚠️ Shard worker {shard.address} disconnected ({error or type(error).__name__}), "
+              f"cursor stalled at {self.stalled_at}; restart to replay from there")
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.max_delay):
+            now = time.monotonic()
+            for shard in list(self.shards.values()):
+                if shard.buffer and now - shard.buffered_since >= self.max_delay:
+                    with shard.send_lock:
+                        self._send(shard)
+
+    def flush(self):
+        for shard in list(self.shards.values()):
+            with shard.send_lock:
+                self._send(shard)
+
+    @property
+    def committed_seq(self):
+        """Highest seq below which every routed frame is committed by its worker"""
+        with self._lock:
+            if self.stalled and self.stalled_at is None:
+                return self._committed_seq  # lost a worker before anything was committed
+            bound = self.received_seq
+            for shard in self.shards.values():
+                if not shard.outstanding:
+                    continue
+                if shard.acked_seq is None:
+                    return self._committed_seq  # nothing proven for this worker yet
+                bound = shard.acked_seq if bound is None else min(bound, shard.acked_seq)
+            if self.stalled and bound is not None:
+                bound = min(bound, self.stalled_at)
+            if bound is not None and (self._committed_seq is None or bound > self._committed_seq):
+                self._committed_seq = bound
+            return self._committed_seq
+
+    def wait_drained(self, timeout=30):
+        """Flush and wait until every worker has acked all frames sent to it"""
+        self.flush()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not any(shard.outstanding for shard in self.shards.values() if shard.connected):
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def set_workers(self, addresses, drain_timeout=30):
+        """Rebalance onto a new worker list: drain in-flight frames, then swap the ring"""
+        addresses = [format_address(parse_address(a)) for a in addresses]
+        if sorted(addresses) == sorted(self.shards):
+            return
+        if not self.wait_drained(drain_timeout):
+            print(f"⚠️ Shards not drained after {drain_timeout}s, rebalancing anyway "
+                  f"(events for moved DIDs may be applied out of order)")
+
+        for address in [a for a in self.shards if a not in addresses]:
+            shard = self.shards.pop(address)
+            self._close_shard(shard)
+        for address in addresses:
+            if address not in self.shards:
+                self._connect(address)
+        old_ring, self.ring = self.ring, HashRing(self.shards, self.vnodes)
+        with self._lock:
+            self._stats['rebalances'] += 1
+        print(f"🔄 Rebalanced onto {len(self.shards)} shard workers, "
+              f"~{old_ring.moved_fraction(self.ring) * 100:.0f}% of DIDs moved")
+
+    def _close_shard(self, shard):
+        with shard.send_lock:
+            self._send(shard)
+            if shard.connected:
+                try:
+                    shard.conn.send_bytes(b'')  # this router is done
+                except (EOFError, OSError):
+                    pass
+        shard.conn.close()
+
+    def close(self, drain_timeout=30):
+        """Send what is buffered and wait for the final acks before disconnecting"""
+        if not self.wait_drained(drain_timeout):
+            print(f"⚠️ Shard workers did not ack everything within {drain_timeout}s")
+        committed = self.committed_seq
+        self._stop.set()
+        for shard in list(self.shards.values()):
+            self._close_shard(shard)
+        self.shards = {}
+        return committed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['shards'] = {
+                address: {'frames': shard.frames, 'sent_seq': shard.sent_seq, 'acked_seq': shard.acked_seq,
+                          'outstanding': shard.outstanding, 'connected': shard.connected}
+                for address, shard in self.shards.items()
+            }
+        stats['received_seq'] = self.received_seq
+        stats['committed_seq'] = self.committed_seq
+        stats['stalled'] = self.stalled
+        stats['stalled_at'] = self.stalled_at
+        return stats
+
+
+class ReceiverCursors:
+    """Worker-side CursorTracker per connected router.
+
+    Frame seqs are tagged (receiver_id, seq) so several routers, each with
+    its own cursor, can share one worker and its writers.
+    """
+
+    def __init__(self):
+        self.trackers = {}
+        self._lock = threading.Lock()
+
+    def add(self, receiver_id):
+        with self._lock:
+            self.trackers[receiver_id] = CursorTracker()
+
+    def remove(self, receiver_id):
+        with self._lock:
+            self.trackers.pop(receiver_id, None)
+
+    def committed_seq(self, receiver_id):
+        tracker = self.trackers.get(receiver_id)
+        return tracker.committed_seq if tracker is not None else None
+
+    def _by_receiver(self, keys):
+        grouped = {}
+        for key in keys:
+            if key is not None:
+                grouped.setdefault(key[0], []).append(key[1])
+        return grouped
+
+    def begin(self, key, rows):
+        if key is None:
+            return
+        tracker = self.trackers.get(key[0])
+        if tracker is not None:
+            tracker.begin(key[1], rows)
+
+    def rows_committed(self, keys):
+        for receiver_id, seqs in self._by_receiver(keys).items():
+            tracker = self.trackers.get(receiver_id)
+            if tracker is not None:
+                tracker.rows_committed(seqs)
+
+    def rows_failed(self, keys):
+        for receiver_id, seqs in self._by_receiver(keys).items():
+            tracker = self.trackers.get(receiver_id)
+            if tracker is not None:
+                tracker.rows_failed(seqs)
+
+    def stats(self):
+        """Same keys as CursorTracker.stats, aggregated over receivers"""
+        with self._lock:
+            per_receiver = [tracker.stats() for tracker in self.trackers.values()]
+        committed = [s['committed_seq'] for s in per_receiver if s['committed_seq'] is not None]
+        received = [s['received_seq'] for s in per_receiver if s['received_seq'] is not None]
+        stalled = [s['stalled_at'] for s in per_receiver if s['stalled_at'] is not None]
+        return {
+            'received_seq': max(received) if received else None,
+            'committed_seq': min(committed) if committed else None,
+            'frames_in_flight': sum(s['frames_in_flight'] for s in per_receiver),
+            'stalled_at': min(stalled) if stalled else None,
+            'rows_lost': sum(s['rows_lost'] for s in per_receiver),
+        }
+
+
+class ShardWorker:
+    """Accepts router connections and feeds their frames to one handler thread.
+
+    handler(receiver_id, frames) runs on the thread calling serve_forever(),
+    in arrival order per router. Committed watermarks from `cursors` are
+    acked back to each router every ack_interval seconds.
+    """
+
+    def __init__(self, address, handler, cursors, ack_interval=0.5, max_queued_batches=256):
+        self.address = parse_address(address)
+        self.handler = handler
+        self.cursors = cursors
+        self.ack_interval = ack_interval
+        self.batches = queue.Queue(maxsize=max_queued_batches)
+        self.listener = None
+        self.connections = {}  # receiver_id -> Connection
+        self._next_receiver_id = 1
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {
+            'receivers': 0,
+            'batches': 0,
+            'frames': 0,
+            'handler_errors': 0,
+        }
+
+    def serve_forever(self):
+        check_authkey(self.address)
+        self.listener = Listener(self.address, authkey=SHARD_AUTHKEY)
+        print(f"Shard worker listening on {format_address(self.address)}")
+        for target, name in ((self._accept_loop, 'shard-accept'), (self._ack_loop, 'shard-acker')):
+            threading.Thread(target=target, name=name, daemon=True).start()
+
+        while not self._stop.is_set():
+            try:
+                receiver_id, frames = self.batches.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.handler(receiver_id, frames)
+            except Exception as e:
+                print(f"Error handling shard batch: {e}")
+                with self._lock:
+                    self._stats['handler_errors'] += 1
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['frames'] += len(frames)
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            except AuthenticationError as e:
+                print(f"Rejected shard connection: {e}")
+                continue
+            with self._lock:
+                receiver_id = self._next_receiver_id
+                self._next_receiver_id += 1
+                self.connections[receiver_id] = conn
+                self._stats['receivers'] += 1
+            self.cursors.add(receiver_id)
+            print(f"Router {receiver_id} connected")
+            threading.Thread(target=self._receive_loop, args=(receiver_id, conn),
+                             name=f"shard-receive-{receiver_id}", daemon=True).start()
+
+    def _receive_loop(self, receiver_id, conn):
+        while True:
+            try:
+                message = conn.recv_bytes()
+            except (EOFError, OSError):
+                break
+            if not message:
+                break
+            try:
+                frames = unpack_frames(message)
+            except (struct.error, ValueError) as e:
+                print(f"Malformed batch from router {receiver_id}: {e}")
+                break
+            self.batches.put((receiver_id, frames))
+        print(f"Router {receiver_id} disconnected")
+        with self._lock:
+            self.connections.pop(receiver_id, None)
+        self.cursors.remove(receiver_id)
+        conn.close()
+
+    def _ack_loop(self):
+        last_acked = {}
+        while not self._stop.wait(self.ack_interval):
+            with self._lock:
+                connections = list(self.connections.items())
+            for receiver_id, conn in connections:
+                seq = self.cursors.committed_seq(receiver_id)
+                if seq is None or last_acked.get(receiver_id) == seq:
+                    continue
+                try:
+                    conn.send_bytes(_ACK.pack(seq))
+                    last_acked[receiver_id] = seq
+                except OSError:
+                    pass
+
+    def stop(self):
+        self._stop.set()
+        if self.listener is not None:
+            self.listener.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['connected'] = len(self.connections)
+        stats['queued_batches'] = self.batches.qsize()
+        return stats
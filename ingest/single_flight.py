@@ -0,0 +1,69 @@
+"""
+Single-flight registry for DID resolutions.
+
+Every post by an author without a known handle wants the author's DID
+resolved. The first post for a DID starts a flight (the caller queues the
+DID once); posts for the same DID that arrive while it is queued or being
+resolved only count as coalesced instead of queueing it again. When the
+resolution worker is done it completes the flight, and the next post for
+the DID starts a new one.
+
+Memory is bounded to max_keys flights. A DID rejected because too many
+flights are open stays unresolved in authors until its next_retry_at comes
+due (ingest/retry_schedule.py). A flight older than stale_after (a lost
+queue entry) is restarted by the next join.
+"""
+import threading
+import time
+
+
+class SingleFlight:
+    """Coalesces concurrent work on the same key"""
+
+    def __init__(self, max_keys=50000, stale_after=300.0):
+        self.max_keys = max_keys
+        self.stale_after = stale_after
+
+        self._flights = {}  # key -> started_at
+        self._lock = threading.Lock()
+        self._stats = {
+            'started': 0,
+            'coalesced': 0,
+            'completed': 0,
+            'keys_rejected': 0,
+            'stale_restarted': 0,
+            'max_flights': 0,
+        }
+
+    def join(self, key):
+        """Join the flight for key; True when the caller must start the work"""
+        now = time.monotonic()
+        with self._lock:
+            started_at = self._flights.get(key)
+            if started_at is None:
+                if len(self._flights) >= self.max_keys:
+                    self._stats['keys_rejected'] += 1
+                    return False
+                self._flights[key] = now
+                self._stats['started'] += 1
+                self._stats['max_flights'] = max(self._stats['max_flights'], len(self._flights))
+                return True
+            if now - started_at > self.stale_after:
+                # Nobody completed it in time; queue the key again
+                self._flights[key] = now
+                self._stats['stale_restarted'] += 1
+                return True
+            self._stats['coalesced'] += 1
+            return False
+
+    def complete(self, key):
+        """Remove the flight for key"""
+        with self._lock:
+            if self._flights.pop(key, None) is not None:
+                self._stats['completed'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['flights'] = len(self._flights)
+        return stats
@@ -0,0 +1,208 @@
+"""
+Disk-backed spill queue for the post writer.
+
+When MariaDB is unreachable, or the writer queue is deeper than its spill
+threshold, rows are appended to length-prefixed segment files instead of
+being dropped or blocking the firehose callback. PostWriter's drainer
+thread replays them in bulk once the database keeps up again.
+
+Each record is a big-endian (uint32 length, uint32 crc32) header followed
+by the pickled row. Files are named NNNNNNNN.spill. Every append is
+fsynced before it returns, so spilled rows count as durable for the
+firehose cursor. The drain position is kept in drain.pos and advanced only
+after the drained rows are committed; a crash in between replays those
+rows once more.
+"""
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+
+DEFAULT_SPILL_DIR = 'spill'
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+_HEADER = struct.Struct('>II')
+_SEGMENT_RE = re.compile(r'^(\d{8})\.spill$')
+_POSITION_FILE = 'drain.pos'
+
+
+class SpillQueue:
+    """Append-only spill segments with a single drain position"""
+
+    def __init__(self, directory=DEFAULT_SPILL_DIR, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._write_segment = None
+        self._write_size = 0
+        self._stats = {
+            'rows_spilled': 0,
+            'rows_drained': 0,
+            'bytes_spilled': 0,
+            'corrupt_tails': 0,
+        }
+        self._drain_window = []  # (time, rows) of recent drains, for the drain rate
+
+        self._read_segment, self._read_offset = self._load_position()
+        # Rows left over from a previous run are part of the backlog
+        self.backlog_rows, self.backlog_bytes = self._scan_backlog()
+
+    # --- segment files -------------------------------------------------
+
+    def _path(self, segment_id):
+        return os.path.join(self.directory, f"{segment_id:08d}.spill")
+
+    def _segments(self):
+        return sorted(int(m.group(1)) for m in map(_SEGMENT_RE.match, os.listdir(self.directory)) if m)
+
+    def _load_position(self):
+        segments = self._segments()
+        try:
+            with open(os.path.join(self.directory, _POSITION_FILE)) as f:
+                segment_id, offset = (int(v) for v in f.read().split())
+            if segment_id in segments:
+                return segment_id, offset
+        except (FileNotFoundError, ValueError):
+            pass
+        return (segments[0] if segments else None), 0
+
+    def _save_position(self):
+        path = os.path.join(self.directory, _POSITION_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self._read_segment} {self._read_offset}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _scan_backlog(self):
+        rows = size = 0
+        for segment_id in self._segments():
+            if self._read_segment is not None and segment_id < self._read_segment:
+                continue
+            offset = self._read_offset if segment_id == self._read_segment else 0
+            for _, end in self._iter_records(segment_id, offset):
+                rows += 1
+            size += max(0, os.path.getsize(self._path(segment_id)) - offset)
+        return rows, size
+
+    def _iter_records(self, segment_id, offset, max_rows=None):
+        """Yield (row, end offset) from a segment, stopping at a torn or corrupt tail"""
+        with open(self._path(segment_id), 'rb') as f:
+            f.seek(offset)
+            count = 0
+            while max_rows is None or count < max_rows:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    if segment_id != self._write_segment:
+                        self._stats['corrupt_tails'] += 1
+                    return
+                offset += _HEADER.size + length
+                count += 1
+                yield pickle.loads(payload), offset
+
+    def _open_write_segment(self):
+        segments = self._segments()
+        self._write_segment = (segments[-1] + 1) if segments else 1
+        self._file = open(self._path(self._write_segment), 'ab')
+        self._write_size = 0
+        if self._read_segment is None:
+            self._read_segment, self._read_offset = self._write_segment, 0
+
+    # --- producer side ---------------------------------------------------
+
+    def append(self, rows):
+        """Append rows and fsync; they are durable once this returns"""
+        if not rows:
+            return 0
+        with self._lock:
+            if self._file is None or self._write_size >= self.max_segment_bytes:
+                if self._file is not None:
+                    self._file.close()
+                self._open_write_segment()
+            written = 0
+            for row in rows:
+                payload = pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL)
+                self._file.write(_HEADER.pack(len(payload), zlib.crc32(payload)))
+                self._file.write(payload)
+                written += _HEADER.size + len(payload)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._write_size += written
+            self.backlog_rows += len(rows)
+            self.backlog_bytes += written
+            self._stats['rows_spilled'] += len(rows)
+            self._stats['bytes_spilled'] += written
+        return len(rows)
+
+    # --- drain side --------------------------------------------------------
+
+    def read_batch(self, max_rows):
+        """Return (rows, position) from the drain position without consuming them"""
+        with self._lock:
+            segment_id, offset = self._read_segment, self._read_offset
+            if segment_id is None:
+                return [], None
+            while True:
+                rows = []
+                end = offset
+                for row, end in self._iter_records(segment_id, offset, max_rows):
+                    rows.append(row)
+                if rows:
+                    return rows, (segment_id, end)
+                # Nothing (more) here: move on if a newer segment exists
+                newer = [s for s in self._segments() if s > segment_id]
+                if not newer:
+                    return [], None
+                segment_id, offset = newer[0], 0
+
+    def commit(self, position, rows):
+        """Mark everything up to position as drained and delete finished segments"""
+        segment_id, offset = position
+        with self._lock:
+            consumed_bytes = 0
+            for old in self._segments():
+                if old < segment_id:
+                    consumed_bytes += os.path.getsize(self._path(old)) - (self._read_offset if old == self._read_segment else 0)
+                    os.remove(self._path(old))
+            if segment_id == self._read_segment:
+                consumed_bytes += offset - self._read_offset
+            else:
+                consumed_bytes += offset
+            self._read_segment, self._read_offset = segment_id, offset
+            self._save_position()
+
+            self.backlog_rows = max(0, self.backlog_rows - rows)
+            self.backlog_bytes = max(0, self.backlog_bytes - consumed_bytes)
+            self._stats['rows_drained'] += rows
+            now = time.monotonic()
+            self._drain_window.append((now, rows))
+            self._drain_window = [(t, n) for t, n in self._drain_window if now - t <= 60]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['backlog_rows'] = self.backlog_rows
+            stats['backlog_bytes'] = self.backlog_bytes
+            window = self._drain_window
+            if window:
+                span = max(time.monotonic() - window[0][0], 1.0)
+                stats['drain_rate'] = sum(n for _, n in window) / span
+            else:
+                stats['drain_rate'] = 0.0
+        return stats
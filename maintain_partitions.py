@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Partition maintenance for the posts table (RANGE on saved_at).
+
+posts is partitioned by RANGE (UNIX_TIMESTAMP(saved_at)) with one partition
+per day (pYYYYMMDD) or hour (pYYYYMMDDHH) and a catch-all p_future at
+MAXVALUE. Run this from cron, e.g. hourly:
+
+    python maintain_partitions.py --ahead-days 7 --retention-days 30
+
+It splits empty time ranges off p_future so the next --ahead-days always
+have their own partition (cheap while p_future holds no rows), and drops
+whole partitions whose range ended more than --retention-days ago
+instead of running DELETEs. Segment bytes of dropped rows
+(--raw-store segments) are reclaimed by compact_segments.py. post_uris
+entries (live posts and tombstones) and dashboard rollup rows older than
+the oldest remaining post are purged with them, so the rollup totals only
+count posts that are still stored.
+"""
+import argparse
+from datetime import timedelta
+
+import mysql.connector
+
+# Database configuration
+MYSQL_CONFIG = {
+    'host': 'mariadb',
+    'database': 'bsky_db',
+    'user': 'bsky_user',
+    'password': 'bsky_password',
+    'port': 3306,
+    'autocommit': True
+}
+
+FUTURE_PARTITION = 'p_future'
+PURGE_CHUNK = 10000
+ROLLUP_TABLES = ('post_rollup_language', 'post_rollup_author')
+GRANULARITY = {
+    'day': (timedelta(days=1), '%Y%m%d'),
+    'hour': (timedelta(hours=1), '%Y%m%d%H'),
+}
+
+def list_partitions(cursor, table):
+    """[(name, upper bound as a datetime or None for MAXVALUE)] in partition order"""
+    cursor.execute('''
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    ''', (table,))
+    partitions = []
+    for name, description in cursor.fetchall():
+        if description == 'MAXVALUE':
+            partitions.append((name, None))
+            continue
+        cursor.execute('SELECT FROM_UNIXTIME(%s)', (int(description),))
+        partitions.append((name, cursor.fetchone()[0]))
+    return partitions
+
+def partition_definition(start, granularity):
+    """PARTITION clause for the range starting at `start`"""
+    step, name_format = GRANULARITY[granularity]
+    end = start + step
+    return (f"PARTITION p{start.strftime(name_format)} "
+            f"VALUES LESS THAN (UNIX_TIMESTAMP('{end.strftime('%Y-%m-%d %H:%M:%S')}'))"), end
+
+def truncate(moment, granularity):
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def ensure_future_partitions(cursor, table, ahead, granularity, dry_run=False):
+    """Split p_future so every range up to now + ahead has its own partition"""
+    partitions = list_partitions(cursor, table)
+    if not partitions:
+        raise RuntimeError(f"{table} is not partitioned (run alembic upgrade head first)")
+    if partitions[-1][0] != FUTURE_PARTITION:
+        raise RuntimeError(f"{table} has no {FUTURE_PARTITION} partition to split")
+
+    bounds = [bound for _, bound in partitions if bound is not None]
+    cursor.execute('SELECT NOW()')
+    now = cursor.fetchone()[0]
+    start = bounds[-1] if bounds else truncate(now, granularity)
+    horizon = now + ahead
+
+    definitions = []
+    while start < horizon:
+        definition, start = partition_definition(start, granularity)
+        definitions.append(definition)
+    if not definitions:
+        return 0
+
+    definitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    sql = (f"ALTER TABLE {table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO (\n    "
+           + ",\n    ".join(definitions) + "\n)")
+    if dry_run:
+        print(sql)
+    else:
+        cursor.execute(sql)
+    return len(definitions) - 1
+
+def drop_expired_partitions(cursor, table, retention, dry_run=False):
+    """Drop partitions whose whole range is older than the retention window"""
+    cursor.execute('SELECT NOW()')
+    cutoff = cursor.fetchone()[0] - retention
+    expired = [name for name, bound in list_partitions(cursor, table)
+               if bound is not None and bound <= cutoff]
+    if not expired:
+        return []
+    sql = f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"
+    if dry_run:
+        print(sql)
+    else:
+        cursor.execute(sql)
+    return expired
+
+def oldest_post(cursor):
+    cursor.execute('SELECT MIN(saved_at) FROM posts')
+    return cursor.fetchone()[0]
+
+def purge_before(cursor, table, column, cutoff, dry_run=False):
+    """Delete rows of table with column < cutoff, in chunks"""
+    if dry_run:
+        print(f"DELETE FROM {table} WHERE {column} < '{cutoff}'")
+        return 0
+    purged = 0
+    while True:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} < %s LIMIT %s', (cutoff, PURGE_CHUNK))
+        purged += cursor.rowcount
+        if cursor.rowcount < PURGE_CHUNK:
+            return purged
+
+def purge_post_uris(cursor, oldest, dry_run=False):
+    """Drop post_uris rows older than every remaining post"""
+    return purge_before(cursor, 'post_uris', 'updated_at', oldest, dry_run)
+
+def purge_rollups(cursor, oldest, dry_run=False):
+    """Drop rollup buckets that end before the oldest remaining post; returns rows per table"""
+    # A bucket is the minute starting at `bucket`: keep the one holding the oldest post
+    cutoff = oldest.replace(second=0, microsecond=0)
+    return {table: purge_before(cursor, table, 'bucket', cutoff, dry_run) for table in ROLLUP_TABLES}
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-create future posts partitions and drop expired ones")
+    parser.add_argument('--table', default='posts')
+    parser.add_argument('--granularity', choices=sorted(GRANULARITY), default='day',
+                        help="size of newly created partitions (existing ones are left as they are)")
+    parser.add_argument('--ahead-days', type=float, default=7,
+                        help="keep partitions ready this far into the future")
+    parser.add_argument('--retention-days', type=float, default=0,
+                        help="drop partitions older than this (0 = keep everything)")
+    parser.add_argument('--dry-run', action='store_true', help="print the ALTER statements instead of running them")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**MYSQL_CONFIG)
+    cursor = conn.cursor()
+    try:
+        created = ensure_future_partitions(cursor, args.table, timedelta(days=args.ahead_days),
+                                           args.granularity, args.dry_run)
+        print(f"✅ Created {created} future partitions" if created else "✅ Future partitions already in place")
+
+        if args.retention_days > 0:
+            dropped = drop_expired_partitions(cursor, args.table, timedelta(days=args.retention_days), args.dry_run)
+            if dropped:
+                print(f"🔄 Dropped {len(dropped)} expired partitions: {', '.join(dropped)}")
+            else:
+                print("✅ No partitions past retention")
+            oldest = oldest_post(cursor) if args.table == 'posts' else None
+            if oldest is not None:
+                purged = purge_post_uris(cursor, oldest, args.dry_run)
+                if purged:
+                    print(f"🔄 Purged {purged} post_uris entries older than the oldest post")
+                for table, purged in purge_rollups(cursor, oldest, args.dry_run).items():
+                    if purged:
+                        print(f"🔄 Purged {purged} {table} rows older than the oldest post")
+
+        partitions = list_partitions(cursor, args.table)
+        print(f"{args.table} has {len(partitions)} partitions, "
+              f"newest bound {max((b for _, b in partitions if b is not None), default=None)}")
+    except (mysql.connector.Error, RuntimeError) as e:
+        print(f"Error maintaining partitions: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
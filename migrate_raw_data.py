@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Backfill posts.raw_record from the legacy JSON posts.raw_data column.
+
+Walks the table in primary key chunks, re-encodes each JSON record with the
+raw record codec (DAG-CBOR + zstd, see ingest/codec.py) and clears raw_data
+in the same UPDATE. Safe to stop and re-run: only rows that still have
+raw_data and no raw_record are touched. Run OPTIMIZE TABLE posts afterwards
+to give the freed LONGTEXT space back.
+
+Note: legacy JSON stored CIDs as repr() strings, so those fields stay
+strings in the converted records.
+"""
+import argparse
+import json
+import time
+
+import mysql.connector
+
+from ingest.codec import encode_record
+
+# Database configuration
+MYSQL_CONFIG = {
+    'host': 'mariadb',
+    'database': 'bsky_db',
+    'user': 'bsky_user',
+    'password': 'bsky_password',
+    'port': 3306,
+    'autocommit': True
+}
+
+def get_id_range(cursor):
+    cursor.execute('''
+        SELECT MIN(id), MAX(id) FROM posts
+        WHERE raw_record IS NULL AND raw_data IS NOT NULL
+    ''')
+    return cursor.fetchone()
+
+def convert_chunk(conn, start_id, end_id):
+    """Convert one id range; returns (rows converted, rows failed, json bytes, blob bytes)"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, raw_data FROM posts
+        WHERE id >= %s AND id < %s
+        AND raw_record IS NULL AND raw_data IS NOT NULL
+    ''', (start_id, end_id))
+    rows = cursor.fetchall()
+    
+    updates = []
+    failed = 0
+    json_bytes = 0
+    blob_bytes = 0
+    for post_id, raw_data in rows:
+        try:
+            blob = encode_record(json.loads(raw_data))
+        except (ValueError, TypeError) as e:
+            print(f"Skipping post {post_id}: {e}")
+            failed += 1
+            continue
+        json_bytes += len(raw_data.encode('utf-8'))
+        blob_bytes += len(blob)
+        updates.append((blob, post_id))
+    
+    if updates:
+        cursor.executemany('UPDATE posts SET raw_record = %s, raw_data = NULL WHERE id = %s', updates)
+        conn.commit()
+    cursor.close()
+    return len(updates), failed, json_bytes, blob_bytes
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert posts.raw_data JSON to compressed raw_record blobs")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="ids per chunk")
+    parser.add_argument('--sleep', type=float, default=0.1,
+                        help="pause between chunks to leave room for live ingest")
+    args = parser.parse_args()
+    
+    conn = mysql.connector.connect(**MYSQL_CONFIG)
+    cursor = conn.cursor()
+    min_id, max_id = get_id_range(cursor)
+    cursor.close()
+    if min_id is None:
+        print("✅ Nothing to migrate")
+        return
+    
+    print(f"Migrating raw_data for ids {min_id}..{max_id} in chunks of {args.chunk_size}")
+    totals = [0, 0, 0, 0]
+    started = time.time()
+    for start_id in range(min_id, max_id + 1, args.chunk_size):
+        result = convert_chunk(conn, start_id, start_id + args.chunk_size)
+        totals = [t + r for t, r in zip(totals, result)]
+        converted, failed, json_bytes, blob_bytes = totals
+        elapsed = time.time() - started
+        print(f"  up to id {start_id + args.chunk_size - 1}: {converted:,} converted, {failed} failed, "
+              f"{converted / elapsed if elapsed else 0:.0f} rows/s")
+        time.sleep(args.sleep)
+    
+    converted, failed, json_bytes, blob_bytes = totals
+    if converted:
+        print(f"✅ Converted {converted:,} rows: {json_bytes / converted:.0f} -> {blob_bytes / converted:.0f} "
+              f"bytes per post ({blob_bytes / json_bytes * 100:.1f}%)")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""add optional per-collection record tables (likes, reposts, follows, blocks)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RECORD_TABLES = ['likes', 'reposts', 'follows', 'blocks']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in RECORD_TABLES:
+        op.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                author_did VARCHAR(255) NOT NULL,
+                record_uri VARCHAR(500),
+                subject VARCHAR(500),
+                created_at TIMESTAMP NULL,
+                raw_data LONGTEXT,
+                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_author_did (author_did),
+                INDEX idx_subject (subject),
+                INDEX idx_saved_at (saved_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in RECORD_TABLES:
+        op.execute(f"DROP TABLE IF EXISTS {table}")
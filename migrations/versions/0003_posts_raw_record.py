@@ -0,0 +1,32 @@
+"""add posts.raw_record for compressed DAG-CBOR records
+
+Existing rows keep their JSON raw_data until migrate_raw_data.py converts
+them; readers go through ingest.codec, which accepts either column.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Appending a nullable column is an instant ALTER on MariaDB 10.3+
+    op.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS raw_record MEDIUMBLOB NULL AFTER raw_data")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE posts DROP COLUMN IF EXISTS raw_record")
@@ -0,0 +1,41 @@
+"""add posts segment file reference for raw records
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS raw_segment INT NULL AFTER raw_record,
+        ADD COLUMN IF NOT EXISTS raw_offset BIGINT NULL AFTER raw_segment,
+        ADD COLUMN IF NOT EXISTS raw_length INT NULL AFTER raw_offset
+    """)
+    # compact_segments.py looks up live records per segment
+    op.execute("ALTER TABLE posts ADD INDEX IF NOT EXISTS idx_raw_segment (raw_segment), ALGORITHM=INPLACE, LOCK=NONE")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE posts DROP INDEX IF EXISTS idx_raw_segment")
+    op.execute("""
+        ALTER TABLE posts
+        DROP COLUMN IF EXISTS raw_length,
+        DROP COLUMN IF EXISTS raw_offset,
+        DROP COLUMN IF EXISTS raw_segment
+    """)
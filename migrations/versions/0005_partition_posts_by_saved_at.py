@@ -0,0 +1,174 @@
+"""partition posts by RANGE on saved_at
+
+Rebuilds posts online: a partitioned copy is created, triggers mirror
+every insert/update/delete on posts into it, existing rows are copied in
+primary key chunks, and one atomic RENAME swaps the tables. Ingest keeps
+writing the whole time. The old table stays behind as posts_unpartitioned;
+drop it once the new one checks out. maintain_partitions.py keeps future
+partitions in place and applies retention afterwards.
+
+MariaDB cannot partition a table with a FULLTEXT index, and every unique
+key must contain the partitioning column, so idx_text_fulltext is dropped
+(post search uses LIKE) and the primary key becomes (id, saved_at).
+
+Needs online mode (no --sql): the copy loop reads from the database.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 5000
+CHUNK_SLEEP = 0.05  # seconds between chunks, leaves room for live ingest
+AHEAD_DAYS = 7
+TRIGGERS = ('posts_copy_insert', 'posts_copy_update', 'posts_copy_delete')
+
+
+def _table_exists(conn, table):
+    return conn.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+    ), {'t': table}).scalar() > 0
+
+
+def _is_partitioned(conn, table):
+    return conn.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL"
+    ), {'t': table}).scalar() > 0
+
+
+def _columns(conn, table):
+    return [row[0] for row in conn.execute(sa.text(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t ORDER BY ORDINAL_POSITION"
+    ), {'t': table})]
+
+
+def _daily_partitions(conn):
+    """One partition per day from the oldest saved_at to AHEAD_DAYS from now, plus p_future"""
+    oldest, now = conn.execute(sa.text("SELECT MIN(saved_at), NOW() FROM posts")).one()
+    day = datetime.combine((oldest or now).date(), datetime.min.time())
+    definitions = []
+    while day <= now + timedelta(days=AHEAD_DAYS):
+        end = day + timedelta(days=1)
+        definitions.append(f"PARTITION p{day:%Y%m%d} VALUES LESS THAN (UNIX_TIMESTAMP('{end:%Y-%m-%d %H:%M:%S}'))")
+        day = end
+    definitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    return ",\n".join(definitions)
+
+
+def _rebuild_online(conn, target, backup, prepare_statements):
+    """Copy posts into `target` while triggers mirror live writes, then swap names"""
+    if _table_exists(conn, backup):
+        raise RuntimeError(f"{backup} already exists; drop or rename it before running this migration")
+
+    columns = _columns(conn, 'posts')
+    column_list = ', '.join(columns)
+    # Partitioned posts needs a saved_at on every row
+    select_list = ', '.join('COALESCE(saved_at, created_at, NOW())' if c == 'saved_at' else c for c in columns)
+    new_values = ', '.join('COALESCE(NEW.saved_at, NOW())' if c == 'saved_at' else f'NEW.{c}' for c in columns)
+
+    for trigger in TRIGGERS:
+        conn.execute(sa.text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    conn.execute(sa.text(f"DROP TABLE IF EXISTS {target}"))
+    conn.execute(sa.text(f"CREATE TABLE {target} LIKE posts"))
+    for statement in prepare_statements:
+        # Driver level: partition bounds contain "HH:MM:SS", which sa.text would read as bind params
+        conn.exec_driver_sql(statement)
+
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER posts_copy_insert AFTER INSERT ON posts FOR EACH ROW
+        REPLACE INTO {target} ({column_list}) VALUES ({new_values})
+    """))
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER posts_copy_update AFTER UPDATE ON posts FOR EACH ROW
+        BEGIN
+            DELETE FROM {target} WHERE id = OLD.id;
+            REPLACE INTO {target} ({column_list}) VALUES ({new_values});
+        END
+    """))
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER posts_copy_delete AFTER DELETE ON posts FOR EACH ROW
+        DELETE FROM {target} WHERE id = OLD.id
+    """))
+
+    # Rows above max_id arrive through the insert trigger
+    min_id, max_id = conn.execute(sa.text("SELECT MIN(id), MAX(id) FROM posts")).one()
+    if min_id is not None:
+        started = time.time()
+        for start_id in range(min_id, max_id + 1, CHUNK_SIZE):
+            # IGNORE: a row the triggers already mirrored is newer than what we read here
+            conn.execute(sa.text(f"""
+                INSERT IGNORE INTO {target} ({column_list})
+                SELECT {select_list} FROM posts
+                WHERE id >= :start AND id < :end
+                LOCK IN SHARE MODE
+            """), {'start': start_id, 'end': start_id + CHUNK_SIZE})
+            done = min(start_id + CHUNK_SIZE - 1, max_id)
+            if (start_id - min_id) // CHUNK_SIZE % 20 == 0 or done == max_id:
+                elapsed = time.time() - started
+                print(f"  copied posts up to id {done} of {max_id} "
+                      f"({(done - min_id + 1) / elapsed if elapsed else 0:.0f} ids/s)")
+            time.sleep(CHUNK_SLEEP)
+
+    conn.execute(sa.text(f"RENAME TABLE posts TO {backup}, {target} TO posts"))
+    # The triggers moved with the old table and would only fire on writes to it
+    for trigger in TRIGGERS:
+        conn.execute(sa.text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    print(f"Swapped in the rebuilt posts table; the previous one is kept as {backup}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # Own autocommit connection so every chunk commits on its own
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if _is_partitioned(conn, 'posts'):
+            return
+        _rebuild_online(conn, 'posts_partitioned', 'posts_unpartitioned', [
+            """
+            ALTER TABLE posts_partitioned
+            DROP INDEX IF EXISTS idx_text_fulltext,
+            MODIFY saved_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, saved_at)
+            """,
+            f"""
+            ALTER TABLE posts_partitioned
+            PARTITION BY RANGE (UNIX_TIMESTAMP(saved_at)) (
+            {_daily_partitions(conn)}
+            )
+            """,
+        ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if not _is_partitioned(conn, 'posts'):
+            return
+        _rebuild_online(conn, 'posts_rebuilt', 'posts_partitioned_backup', [
+            "ALTER TABLE posts_rebuilt REMOVE PARTITIONING",
+            """
+            ALTER TABLE posts_rebuilt
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id),
+            MODIFY saved_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+            ADD FULLTEXT INDEX idx_text_fulltext (text)
+            """,
+        ])
@@ -0,0 +1,93 @@
+"""add per-minute post rollup tables
+
+post_rollup_language and post_rollup_author hold post counts per minute
+of saved_at, upserted by the ingester (ingest/rollups.py) every few
+seconds, so the dashboard reads a few hundred rollup rows instead of
+scanning posts.
+
+Existing posts are backfilled one day (one partition) at a time up to the
+start of the current minute. Minutes before that are complete in posts,
+so the backfill overwrites rather than adds and can be re-run. Apply it
+before starting an ingester that writes rollups.
+
+Needs online mode (no --sql): the backfill loop reads from the database.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# saved_at has no fractional seconds, so this is its minute
+MINUTE = "saved_at - INTERVAL SECOND(saved_at) SECOND"
+
+
+def _backfill(conn):
+    oldest, cutoff = conn.execute(sa.text(
+        "SELECT MIN(saved_at), NOW() - INTERVAL SECOND(NOW()) SECOND FROM posts"
+    )).one()
+    if oldest is None:
+        return
+    day = datetime.combine(oldest.date(), datetime.min.time())
+    while day < cutoff:
+        end = min(day + timedelta(days=1), cutoff)
+        params = {'start': day, 'end': end}
+        conn.execute(sa.text(f"""
+            INSERT INTO post_rollup_language (bucket, language, posts)
+            SELECT {MINUTE}, COALESCE(language, ''), COUNT(*) FROM posts
+            WHERE saved_at >= :start AND saved_at < :end
+            GROUP BY 1, 2
+            ON DUPLICATE KEY UPDATE posts = VALUES(posts)
+        """), params)
+        conn.execute(sa.text(f"""
+            INSERT INTO post_rollup_author (bucket, author_did, posts)
+            SELECT {MINUTE}, author_did, COUNT(*) FROM posts
+            WHERE saved_at >= :start AND saved_at < :end
+            GROUP BY 1, 2
+            ON DUPLICATE KEY UPDATE posts = VALUES(posts)
+        """), params)
+        print(f"  backfilled rollups for {day:%Y-%m-%d}")
+        day = end
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS post_rollup_language (
+            bucket DATETIME NOT NULL,
+            language VARCHAR(10) NOT NULL DEFAULT '',
+            posts INT UNSIGNED NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, language)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS post_rollup_author (
+            bucket DATETIME NOT NULL,
+            author_did VARCHAR(255) NOT NULL,
+            posts INT UNSIGNED NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, author_did),
+            INDEX idx_author_bucket (author_did, bucket)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    bind = op.get_bind()
+    # Own autocommit connection so every day commits on its own
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        _backfill(conn)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TABLE IF EXISTS post_rollup_author")
+    op.execute("DROP TABLE IF EXISTS post_rollup_language")
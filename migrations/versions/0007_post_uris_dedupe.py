@@ -0,0 +1,104 @@
+"""add post_uris for idempotent post ingestion
+
+posts is partitioned on saved_at, and MariaDB requires every unique key of
+a partitioned table to contain the partitioning column, so post_uri cannot
+be made unique on posts itself. post_uris is the unique key instead (see
+ingest/dedupe.py): one row per post URI with the live post id, or
+deleted = 1 for a tombstone.
+
+The upgrade registers existing posts in id order, so the oldest copy of a
+URI wins, and deletes the later duplicates in the same chunks, subtracting
+them from the per-minute rollups. The rollup counts become signed because
+the ingester now subtracts deleted posts from them.
+
+Stop the ingester while this runs: rows an older ingester inserts
+afterwards are not registered, and a replay would duplicate them.
+Needs online mode (no --sql): the chunk loop reads from the database.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, Sequence[str], None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 5000
+MINUTE = "p.saved_at - INTERVAL SECOND(p.saved_at) SECOND"
+DUPLICATES = """
+    FROM posts p
+    JOIN post_uris u ON u.post_uri = p.post_uri
+    WHERE p.id >= :start AND p.id < :end AND p.id <> u.post_id
+"""
+
+
+def _register_posts(conn):
+    min_id, max_id = conn.execute(sa.text("SELECT MIN(id), MAX(id) FROM posts")).one()
+    if min_id is None:
+        return
+    started = time.time()
+    removed = 0
+    for start_id in range(min_id, max_id + 1, CHUNK_SIZE):
+        params = {'start': start_id, 'end': start_id + CHUNK_SIZE}
+        conn.execute(sa.text("""
+            INSERT IGNORE INTO post_uris (post_uri, post_id)
+            SELECT post_uri, id FROM posts
+            WHERE id >= :start AND id < :end AND post_uri IS NOT NULL
+            ORDER BY id
+        """), params)
+        conn.execute(sa.text(f"""
+            INSERT INTO post_rollup_language (bucket, language, posts)
+            SELECT {MINUTE}, COALESCE(p.language, ''), -COUNT(*) {DUPLICATES}
+            GROUP BY 1, 2
+            ON DUPLICATE KEY UPDATE posts = posts + VALUES(posts)
+        """), params)
+        conn.execute(sa.text(f"""
+            INSERT INTO post_rollup_author (bucket, author_did, posts)
+            SELECT {MINUTE}, p.author_did, -COUNT(*) {DUPLICATES}
+            GROUP BY 1, 2
+            ON DUPLICATE KEY UPDATE posts = posts + VALUES(posts)
+        """), params)
+        removed += conn.execute(sa.text(f"DELETE p {DUPLICATES}"), params).rowcount
+        done = min(start_id + CHUNK_SIZE - 1, max_id)
+        if (start_id - min_id) // CHUNK_SIZE % 20 == 0 or done == max_id:
+            elapsed = time.time() - started
+            print(f"  registered posts up to id {done} of {max_id}, {removed} duplicates removed "
+                  f"({(done - min_id + 1) / elapsed if elapsed else 0:.0f} ids/s)")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS post_uris (
+            post_uri VARCHAR(500) NOT NULL PRIMARY KEY,
+            post_id BIGINT NULL,
+            deleted TINYINT(1) NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_updated_at (updated_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+    op.execute("ALTER TABLE post_rollup_language MODIFY posts INT NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE post_rollup_author MODIFY posts INT NOT NULL DEFAULT 0")
+    bind = op.get_bind()
+    # Own autocommit connection so every chunk commits on its own
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        _register_posts(conn)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TABLE IF EXISTS post_uris")
+    op.execute("UPDATE post_rollup_language SET posts = 0 WHERE posts < 0")
+    op.execute("UPDATE post_rollup_author SET posts = 0 WHERE posts < 0")
+    op.execute("ALTER TABLE post_rollup_language MODIFY posts INT UNSIGNED NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE post_rollup_author MODIFY posts INT UNSIGNED NOT NULL DEFAULT 0")
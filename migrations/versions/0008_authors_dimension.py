@@ -0,0 +1,388 @@
+"""move author DID and handle into an authors dimension table
+
+posts repeated the author's DID and handle on every row, both indexed, so
+resolving a handle meant updating every post by that author. authors holds
+one row per account (DID, handle, first_seen, last_seen and the resolution
+state that was did_cache); posts and post_rollup_author carry only the
+integer author_id.
+
+Runs online with the ingester up:
+
+  1. authors is created and filled from did_cache in DID chunks, while
+     triggers mirror did_cache writes into it.
+  2. posts is rebuilt like 0005: a copy with author_id instead of
+     author_did/author_handle, triggers that mirror live writes (creating
+     the author if needed), a primary key chunk copy that registers each
+     chunk's authors first, then the swap.
+  3. post_rollup_author is rebuilt the same way, one day of buckets at a
+     time.
+
+One atomic RENAME swaps all three tables. did_cache, posts and
+post_rollup_author stay behind as did_cache_backup, posts_author_did and
+post_rollup_author_did; drop them once the new tables check out. Restart
+the ingester on the new code right after the swap: writes from the old one
+fail from then on and are replayed from the firehose cursor (post_uris
+keeps them from being duplicated). Spilled rows from the old ingester have
+the old column layout; empty its spill directory before the restart.
+
+The downgrade copies back in chunks without triggers; stop the ingester
+first.
+
+Needs online mode (no --sql): the chunk loops read from the database.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, Sequence[str], None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 5000
+CHUNK_SLEEP = 0.05  # seconds between chunks, leaves room for live ingest
+TRIGGERS = (
+    'did_cache_authors_upsert_insert', 'did_cache_authors_upsert_update', 'did_cache_authors_delete',
+    'posts_authors_insert', 'posts_authors_update', 'posts_authors_delete',
+    'rollup_authors_insert', 'rollup_authors_update', 'rollup_authors_delete',
+)
+OLD_AUTHOR_COLUMNS = ('author_did', 'author_handle')
+
+# did_cache wins over what posts know about an author's handle: its values
+# replace a row until did_cache itself wrote one (resolved_at set)
+MERGE_DID_CACHE = """
+    ON DUPLICATE KEY UPDATE
+    handle = IF(authors.resolved_at IS NULL, VALUES(handle), authors.handle),
+    failed_attempts = IF(authors.resolved_at IS NULL, VALUES(failed_attempts), authors.failed_attempts),
+    resolved_at = COALESCE(authors.resolved_at, VALUES(resolved_at))
+"""
+MERGE_POSTS = """
+    ON DUPLICATE KEY UPDATE
+    handle = COALESCE(authors.handle, VALUES(handle)),
+    first_seen = LEAST(COALESCE(authors.first_seen, VALUES(first_seen)), VALUES(first_seen)),
+    last_seen = GREATEST(COALESCE(authors.last_seen, VALUES(last_seen)), VALUES(last_seen))
+"""
+
+
+def _table_exists(conn, table):
+    return conn.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+    ), {'t': table}).scalar() > 0
+
+
+def _columns(conn, table):
+    return [row[0] for row in conn.execute(sa.text(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t ORDER BY ORDINAL_POSITION"
+    ), {'t': table})]
+
+
+def _drop_triggers(conn):
+    for trigger in TRIGGERS:
+        conn.execute(sa.text(f"DROP TRIGGER IF EXISTS {trigger}"))
+
+
+def _id_chunks(conn, table, label):
+    """(start, end) primary key ranges of `table`, sleeping and reporting between them"""
+    min_id, max_id = conn.execute(sa.text(f"SELECT MIN(id), MAX(id) FROM {table}")).one()
+    if min_id is None:
+        return
+    started = time.time()
+    for start_id in range(min_id, max_id + 1, CHUNK_SIZE):
+        yield start_id, start_id + CHUNK_SIZE
+        done = min(start_id + CHUNK_SIZE - 1, max_id)
+        if (start_id - min_id) // CHUNK_SIZE % 20 == 0 or done == max_id:
+            elapsed = time.time() - started
+            print(f"  {label} up to id {done} of {max_id} "
+                  f"({(done - min_id + 1) / elapsed if elapsed else 0:.0f} ids/s)")
+        time.sleep(CHUNK_SLEEP)
+
+
+def _day_chunks(conn, table):
+    """(start, end) one-day bucket ranges of a rollup table"""
+    oldest, newest = conn.execute(sa.text(f"SELECT MIN(bucket), MAX(bucket) FROM {table}")).one()
+    if oldest is None:
+        return
+    day = datetime.combine(oldest.date(), datetime.min.time())
+    while day <= newest:
+        yield day, day + timedelta(days=1)
+        print(f"  copied {table} for {day:%Y-%m-%d}")
+        day += timedelta(days=1)
+        time.sleep(CHUNK_SLEEP)
+
+
+def _fill_from_did_cache(conn):
+    conn.execute(sa.text("""
+        CREATE TRIGGER did_cache_authors_upsert_insert AFTER INSERT ON did_cache FOR EACH ROW
+        INSERT INTO authors (did, handle, resolved_at, failed_attempts)
+        VALUES (NEW.did, NEW.handle, COALESCE(NEW.resolved_at, NOW()), COALESCE(NEW.failed_attempts, 0))
+        ON DUPLICATE KEY UPDATE
+        handle = VALUES(handle), failed_attempts = VALUES(failed_attempts), resolved_at = VALUES(resolved_at)
+    """))
+    conn.execute(sa.text("""
+        CREATE TRIGGER did_cache_authors_upsert_update AFTER UPDATE ON did_cache FOR EACH ROW
+        INSERT INTO authors (did, handle, resolved_at, failed_attempts)
+        VALUES (NEW.did, NEW.handle, COALESCE(NEW.resolved_at, NOW()), COALESCE(NEW.failed_attempts, 0))
+        ON DUPLICATE KEY UPDATE
+        handle = VALUES(handle), failed_attempts = VALUES(failed_attempts), resolved_at = VALUES(resolved_at)
+    """))
+    conn.execute(sa.text("""
+        CREATE TRIGGER did_cache_authors_delete AFTER DELETE ON did_cache FOR EACH ROW
+        UPDATE authors SET handle = NULL, resolved_at = NULL, failed_attempts = 0 WHERE did = OLD.did
+    """))
+
+    # did_cache is keyed by the DID string: walk it in key order
+    after = ''
+    chunks = 0
+    while True:
+        last = conn.execute(sa.text("""
+            SELECT MAX(did) FROM (
+                SELECT did FROM did_cache WHERE did > :after ORDER BY did LIMIT :limit
+            ) chunk
+        """), {'after': after, 'limit': CHUNK_SIZE}).scalar()
+        if last is None:
+            break
+        # The triggers already wrote anything newer than what is read here
+        conn.execute(sa.text(f"""
+            INSERT INTO authors (did, handle, resolved_at, failed_attempts)
+            SELECT did, handle, COALESCE(resolved_at, NOW()), COALESCE(failed_attempts, 0) FROM did_cache
+            WHERE did > :after AND did <= :last
+            {MERGE_DID_CACHE}
+        """), {'after': after, 'last': last})
+        chunks += 1
+        if chunks % 20 == 1:
+            print(f"  merged did_cache into authors up to {last}")
+        after = last
+        time.sleep(CHUNK_SLEEP)
+
+
+def _rebuild_posts(conn, target):
+    columns = [c for c in _columns(conn, 'posts') if c not in OLD_AUTHOR_COLUMNS]
+    column_list = ', '.join(['author_id'] + columns)
+    select_list = ', '.join(['a.author_id'] + [f'p.{c}' for c in columns])
+    new_values = ', '.join(['a.author_id'] + [f'NEW.{c}' for c in columns])
+    ensure_author = f"""
+        INSERT INTO authors (did, handle, first_seen, last_seen)
+        VALUES (NEW.author_did, NEW.author_handle, NEW.saved_at, NEW.saved_at)
+        {MERGE_POSTS}
+    """
+
+    conn.execute(sa.text(f"DROP TABLE IF EXISTS {target}"))
+    conn.execute(sa.text(f"CREATE TABLE {target} LIKE posts"))
+    conn.execute(sa.text(f"""
+        ALTER TABLE {target}
+        ADD COLUMN author_id INT NOT NULL AFTER id,
+        DROP INDEX idx_author_did,
+        DROP INDEX idx_author_handle,
+        DROP COLUMN author_did,
+        DROP COLUMN author_handle,
+        ADD INDEX idx_author_id (author_id)
+    """))
+
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER posts_authors_insert AFTER INSERT ON posts FOR EACH ROW
+        BEGIN
+            {ensure_author};
+            REPLACE INTO {target} ({column_list})
+            SELECT {new_values} FROM authors a WHERE a.did = NEW.author_did;
+        END
+    """))
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER posts_authors_update AFTER UPDATE ON posts FOR EACH ROW
+        BEGIN
+            {ensure_author};
+            DELETE FROM {target} WHERE id = OLD.id;
+            REPLACE INTO {target} ({column_list})
+            SELECT {new_values} FROM authors a WHERE a.did = NEW.author_did;
+        END
+    """))
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER posts_authors_delete AFTER DELETE ON posts FOR EACH ROW
+        DELETE FROM {target} WHERE id = OLD.id
+    """))
+
+    # Rows above the current max id arrive through the insert trigger
+    for start, end in _id_chunks(conn, 'posts', 'copied posts'):
+        params = {'start': start, 'end': end}
+        conn.execute(sa.text(f"""
+            INSERT INTO authors (did, handle, first_seen, last_seen)
+            SELECT author_did, MAX(author_handle), MIN(saved_at), MAX(saved_at) FROM posts
+            WHERE id >= :start AND id < :end
+            GROUP BY author_did
+            {MERGE_POSTS}
+        """), params)
+        # IGNORE: a row the triggers already mirrored is newer than what we read here
+        conn.execute(sa.text(f"""
+            INSERT IGNORE INTO {target} ({column_list})
+            SELECT {select_list} FROM posts p
+            JOIN authors a ON a.did = p.author_did
+            WHERE p.id >= :start AND p.id < :end
+            LOCK IN SHARE MODE
+        """), params)
+
+
+def _rebuild_rollup(conn, target):
+    conn.execute(sa.text(f"DROP TABLE IF EXISTS {target}"))
+    conn.execute(sa.text(f"""
+        CREATE TABLE {target} (
+            bucket DATETIME NOT NULL,
+            author_id INT NOT NULL,
+            posts INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, author_id),
+            INDEX idx_author_bucket (author_id, bucket)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+
+    # Rollups are upserted after their posts are written, but may outlive them (retention)
+    for event in ('INSERT', 'UPDATE'):
+        conn.execute(sa.text(f"""
+            CREATE TRIGGER rollup_authors_{event.lower()} AFTER {event} ON post_rollup_author FOR EACH ROW
+            BEGIN
+                INSERT IGNORE INTO authors (did) VALUES (NEW.author_did);
+                REPLACE INTO {target} (bucket, author_id, posts)
+                SELECT NEW.bucket, author_id, NEW.posts FROM authors WHERE did = NEW.author_did;
+            END
+        """))
+    conn.execute(sa.text(f"""
+        CREATE TRIGGER rollup_authors_delete AFTER DELETE ON post_rollup_author FOR EACH ROW
+        DELETE t FROM {target} t JOIN authors a ON a.author_id = t.author_id
+        WHERE t.bucket = OLD.bucket AND a.did = OLD.author_did
+    """))
+
+    for start, end in _day_chunks(conn, 'post_rollup_author'):
+        params = {'start': start, 'end': end}
+        conn.execute(sa.text("""
+            INSERT IGNORE INTO authors (did)
+            SELECT DISTINCT author_did FROM post_rollup_author
+            WHERE bucket >= :start AND bucket < :end
+        """), params)
+        conn.execute(sa.text(f"""
+            INSERT IGNORE INTO {target} (bucket, author_id, posts)
+            SELECT r.bucket, a.author_id, r.posts FROM post_rollup_author r
+            JOIN authors a ON a.did = r.author_did
+            WHERE r.bucket >= :start AND r.bucket < :end
+            LOCK IN SHARE MODE
+        """), params)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # Own autocommit connection so every chunk commits on its own
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if 'author_id' in _columns(conn, 'posts'):
+            return
+        for backup in ('did_cache_backup', 'posts_author_did', 'post_rollup_author_did'):
+            if _table_exists(conn, backup):
+                raise RuntimeError(f"{backup} already exists; drop or rename it before running this migration")
+
+        _drop_triggers(conn)
+        conn.execute(sa.text("""
+            CREATE TABLE IF NOT EXISTS authors (
+                author_id INT AUTO_INCREMENT PRIMARY KEY,
+                did VARCHAR(255) NOT NULL,
+                handle VARCHAR(255),
+                first_seen TIMESTAMP NULL DEFAULT NULL,
+                last_seen TIMESTAMP NULL DEFAULT NULL,
+                resolved_at TIMESTAMP NULL DEFAULT NULL,
+                failed_attempts INT NOT NULL DEFAULT 0,
+                UNIQUE KEY uk_did (did),
+                INDEX idx_handle (handle),
+                INDEX idx_first_seen (first_seen),
+                INDEX idx_last_seen (last_seen),
+                INDEX idx_resolved_at (resolved_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        if _table_exists(conn, 'did_cache'):
+            _fill_from_did_cache(conn)
+        _rebuild_posts(conn, 'posts_authors')
+        _rebuild_rollup(conn, 'post_rollup_author_ids')
+
+        renames = ["posts TO posts_author_did", "posts_authors TO posts",
+                   "post_rollup_author TO post_rollup_author_did", "post_rollup_author_ids TO post_rollup_author"]
+        if _table_exists(conn, 'did_cache'):
+            renames.append("did_cache TO did_cache_backup")
+        conn.execute(sa.text(f"RENAME TABLE {', '.join(renames)}"))
+        # The triggers moved with the old tables and would only fire on writes to them
+        _drop_triggers(conn)
+        print("Swapped in posts and post_rollup_author keyed by author_id; restart the ingester now")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if 'author_id' not in _columns(conn, 'posts'):
+            return
+        for table in ('posts_author_did', 'post_rollup_author_did', 'did_cache',
+                      'posts_authors_backup', 'post_rollup_author_ids_backup'):
+            if _table_exists(conn, table):
+                raise RuntimeError(f"{table} already exists; drop or rename it before downgrading")
+
+        columns = [c for c in _columns(conn, 'posts') if c != 'author_id']
+        conn.execute(sa.text("CREATE TABLE posts_author_did LIKE posts"))
+        conn.execute(sa.text("""
+            ALTER TABLE posts_author_did
+            ADD COLUMN author_did VARCHAR(255) NOT NULL AFTER id,
+            ADD COLUMN author_handle VARCHAR(255) AFTER author_did,
+            DROP INDEX idx_author_id,
+            DROP COLUMN author_id,
+            ADD INDEX idx_author_did (author_did),
+            ADD INDEX idx_author_handle (author_handle)
+        """))
+        for start, end in _id_chunks(conn, 'posts', 'copied posts'):
+            conn.execute(sa.text(f"""
+                INSERT IGNORE INTO posts_author_did (author_did, author_handle, {', '.join(columns)})
+                SELECT a.did, a.handle, {', '.join(f'p.{c}' for c in columns)} FROM posts p
+                JOIN authors a ON a.author_id = p.author_id
+                WHERE p.id >= :start AND p.id < :end
+            """), {'start': start, 'end': end})
+
+        conn.execute(sa.text("""
+            CREATE TABLE post_rollup_author_did (
+                bucket DATETIME NOT NULL,
+                author_did VARCHAR(255) NOT NULL,
+                posts INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, author_did),
+                INDEX idx_author_bucket (author_did, bucket)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        for start, end in _day_chunks(conn, 'post_rollup_author'):
+            conn.execute(sa.text("""
+                INSERT IGNORE INTO post_rollup_author_did (bucket, author_did, posts)
+                SELECT r.bucket, a.did, r.posts FROM post_rollup_author r
+                JOIN authors a ON a.author_id = r.author_id
+                WHERE r.bucket >= :start AND r.bucket < :end
+            """), {'start': start, 'end': end})
+
+        conn.execute(sa.text("""
+            CREATE TABLE did_cache (
+                did VARCHAR(255) PRIMARY KEY,
+                handle VARCHAR(255),
+                resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                failed_attempts INT DEFAULT 0,
+                INDEX idx_handle (handle),
+                INDEX idx_resolved_at (resolved_at),
+                INDEX idx_failed_attempts (failed_attempts)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        conn.execute(sa.text("""
+            INSERT INTO did_cache (did, handle, resolved_at, failed_attempts)
+            SELECT did, handle, resolved_at, failed_attempts FROM authors WHERE resolved_at IS NOT NULL
+        """))
+
+        conn.execute(sa.text(
+            "RENAME TABLE posts TO posts_authors_backup, posts_author_did TO posts, "
+            "post_rollup_author TO post_rollup_author_ids_backup, post_rollup_author_did TO post_rollup_author"
+        ))
+        print("Restored author_did/author_handle on posts; authors and the author_id tables are kept as backups")
@@ -0,0 +1,99 @@
+"""add the DID resolution retry schedule to authors
+
+next_retry_at replaces the fixed rule (retry an hour after a failure, give
+up after three) with jittered exponential backoff, and resolution_error
+records why the last attempt failed, so tombstoned DIDs stop being retried
+while transient failures keep backing off (see ingest/retry_schedule.py).
+
+Existing unresolved authors are scheduled in author_id chunks:
+
+  - never attempted: due within the next hour, spread at random
+  - failed once or twice: due an hour after the last attempt, as before
+  - given up after three failures: tombstones from a PLC export import
+    (never posted) stay given up as 'tombstoned'; the rest are due once
+    more within the next day, spread at random, so the resolver can tell
+    permanent failures from transient ones
+  - resolved_at set without a failure (PLC export operations without a
+    handle): 'no_handle', never retried
+
+Safe to run with the ingester up; restart it on the new code afterwards.
+Needs online mode (no --sql): the chunk loop reads from the database.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, Sequence[str], None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_SIZE = 5000
+CHUNK_SLEEP = 0.05  # seconds between chunks, leaves room for live ingest
+GIVEN_UP = "failed_attempts >= 3"
+IMPORTED_TOMBSTONE = f"{GIVEN_UP} AND last_seen IS NULL"
+
+
+def _schedule_unresolved(conn):
+    min_id, max_id = conn.execute(sa.text("SELECT MIN(author_id), MAX(author_id) FROM authors")).one()
+    if min_id is None:
+        return
+    started = time.time()
+    scheduled = 0
+    for start_id in range(min_id, max_id + 1, CHUNK_SIZE):
+        scheduled += conn.execute(sa.text(f"""
+            UPDATE authors SET
+            resolution_error = CASE
+                WHEN resolved_at IS NULL THEN NULL
+                WHEN failed_attempts = 0 THEN 'no_handle'
+                WHEN {IMPORTED_TOMBSTONE} THEN 'tombstoned'
+                ELSE 'errors' END,
+            next_retry_at = CASE
+                WHEN resolved_at IS NULL THEN NOW() + INTERVAL FLOOR(RAND() * 3600) SECOND
+                WHEN failed_attempts = 0 OR {IMPORTED_TOMBSTONE} THEN NULL
+                WHEN {GIVEN_UP} THEN NOW() + INTERVAL FLOOR(RAND() * 86400) SECOND
+                ELSE GREATEST(resolved_at + INTERVAL 1 HOUR, NOW()) END
+            WHERE author_id >= :start AND author_id < :end
+            AND handle IS NULL AND next_retry_at IS NULL AND resolution_error IS NULL
+        """), {'start': start_id, 'end': start_id + CHUNK_SIZE}).rowcount
+        done = min(start_id + CHUNK_SIZE - 1, max_id)
+        if (start_id - min_id) // CHUNK_SIZE % 20 == 0 or done == max_id:
+            elapsed = time.time() - started
+            print(f"  scheduled authors up to id {done} of {max_id}, {scheduled} unresolved "
+                  f"({(done - min_id + 1) / elapsed if elapsed else 0:.0f} ids/s)")
+        time.sleep(CHUNK_SLEEP)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        ALTER TABLE authors
+        ADD COLUMN IF NOT EXISTS resolution_error VARCHAR(32) NULL DEFAULT NULL AFTER failed_attempts,
+        ADD COLUMN IF NOT EXISTS next_retry_at TIMESTAMP NULL DEFAULT NULL AFTER resolution_error
+    """)
+    bind = op.get_bind()
+    # Own autocommit connection so every chunk commits on its own
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        _schedule_unresolved(conn)
+    # The retry scheduler's range scan (ingest/retry_schedule.py DUE_SQL)
+    op.execute("ALTER TABLE authors ADD INDEX IF NOT EXISTS idx_next_retry_at (next_retry_at), "
+               "ALGORITHM=INPLACE, LOCK=NONE")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE authors DROP INDEX IF EXISTS idx_next_retry_at")
+    op.execute("""
+        ALTER TABLE authors
+        DROP COLUMN IF EXISTS next_retry_at,
+        DROP COLUMN IF EXISTS resolution_error
+    """)
@@ -0,0 +1,35 @@
+"""make authors.did binary-collated
+
+Under utf8mb4_unicode_ci a case variant of a DID matched the stored one,
+so the author_id lookup in ingest/authors.py could hand back a DID other
+than the one it asked for. DIDs are case-sensitive identifiers; comparing
+them byte for byte makes the lookup return exactly what it was given.
+
+The unique key cannot hold case variants yet, so the conversion never
+fails on duplicates. The downgrade does if case variants were added since.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, Sequence[str], None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE authors MODIFY did VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE authors MODIFY did VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL")
@@ -0,0 +1,36 @@
+"""make post_uris.post_uri binary-collated
+
+Under utf8mb4_unicode_ci two post URIs whose record keys differ only in
+case claimed the same post_uris row, so the second post was skipped as a
+duplicate. Record keys are case-sensitive; comparing URIs byte for byte
+keeps them apart, and the bulk merge (ingest/bulk_load.py) joins on
+exactly the URIs the Python rules in ingest/dedupe.py looked at.
+
+The downgrade fails if case-variant URIs were recorded since.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, Sequence[str], None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE post_uris MODIFY post_uri VARCHAR(500) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE post_uris MODIFY post_uri VARCHAR(500) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci "
+               "NOT NULL")
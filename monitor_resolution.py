@@ -19,26 +19,39 @@ def get_resolution_stats():
     conn = mysql.connector.connect(**MYSQL_CONFIG)
     cursor = conn.cursor()
     
-    # Count posts with and without handles
-    cursor.execute('SELECT COUNT(*) FROM posts WHERE author_handle IS NOT NULL')
+    # Count posts whose author has / has no handle
+    cursor.execute('''
+        SELECT COUNT(*) FROM posts p
+        JOIN authors a ON a.author_id = p.author_id
+        WHERE a.handle IS NOT NULL
+    ''')
     resolved_count = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM posts WHERE author_handle IS NULL')
+    cursor.execute('''
+        SELECT COUNT(*) FROM posts p
+        JOIN authors a ON a.author_id = p.author_id
+        WHERE a.handle IS NULL
+    ''')
     unresolved_count = cursor.fetchone()[0]
     
-    # Count cached DIDs
-    cursor.execute('SELECT COUNT(*) FROM did_cache WHERE handle IS NOT NULL')
+    # Count resolved and failed authors
+    cursor.execute('SELECT COUNT(*) FROM authors WHERE handle IS NOT NULL')
     cached_success = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM did_cache WHERE handle IS NULL')
+    cursor.execute('SELECT COUNT(*) FROM authors WHERE handle IS NULL AND resolution_error IS NOT NULL')
     cached_failures = cursor.fetchone()[0]
     
-    # Get some recent unresolved posts
+    # Failed authors still on the retry schedule, and how many of them are due
+    cursor.execute('SELECT COUNT(*), SUM(next_retry_at <= NOW()) FROM authors WHERE next_retry_at IS NOT NULL')
+    scheduled_retries, due_retries = cursor.fetchone()
+    
+    # Get the unresolved authors with the most posts
     cursor.execute('''
-        SELECT author_did, COUNT(*) as post_count 
-        FROM posts 
-        WHERE author_handle IS NULL 
-        GROUP BY author_did 
+        SELECT a.did, COUNT(*) as post_count 
+        FROM posts p
+        JOIN authors a ON a.author_id = p.author_id
+        WHERE a.handle IS NULL 
+        GROUP BY a.author_id, a.did 
         ORDER BY post_count DESC 
         LIMIT 10
     ''')
@@ -51,6 +64,8 @@ def get_resolution_stats():
         'unresolved_posts': unresolved_count,
         'cached_successes': cached_success,
         'cached_failures': cached_failures,
+        'scheduled_retries': scheduled_retries,
+        'due_retries': due_retries or 0,
         'top_unresolved': top_unresolved
     }
 
@@ -70,6 +85,7 @@ def main():
             print(f"  Unresolved: {stats['unresolved_posts']}")
             print(f"  Cached successes: {stats['cached_successes']}")
             print(f"  Cached failures: {stats['cached_failures']}")
+            print(f"  Scheduled retries: {stats['scheduled_retries']} ({stats['due_retries']} due)")
             
             if stats['top_unresolved']:
                 print("\n  Top unresolved DIDs:")
@@ -17,9 +17,10 @@ def view_posts(limit=10):
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT author_did, author_handle, text, created_at, language, post_uri, saved_at 
-        FROM posts 
-        ORDER BY saved_at DESC 
+        SELECT a.did, a.handle, p.text, p.created_at, p.language, p.post_uri, p.saved_at 
+        FROM posts p
+        JOIN authors a ON a.author_id = p.author_id
+        ORDER BY p.saved_at DESC 
         LIMIT %s
     ''', (limit,))
     
@@ -46,7 +47,7 @@ def get_stats():
     cursor.execute('SELECT COUNT(*) FROM posts')
     total_posts = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(DISTINCT author_did) FROM posts')
+    cursor.execute('SELECT COUNT(DISTINCT author_id) FROM posts')
     unique_authors = cursor.fetchone()[0]
     
     cursor.execute('SELECT language, COUNT(*) FROM posts GROUP BY language ORDER BY COUNT(*) DESC LIMIT 10')
@@ -67,10 +68,11 @@ def search_posts(search_term, limit=10):
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT author_did, author_handle, text, created_at, language 
-        FROM posts 
-        WHERE text LIKE %s 
-        ORDER BY saved_at DESC 
+        SELECT a.did, a.handle, p.text, p.created_at, p.language 
+        FROM posts p
+        JOIN authors a ON a.author_id = p.author_id
+        WHERE p.text LIKE %s 
+        ORDER BY p.saved_at DESC 
         LIMIT %s
     ''', (f'%{search_term}%', limit))
     
@@ -0,0 +1,176 @@
+"""
+Tests for ingest.async_ingest.AsyncIngestor's post writer and identity
+event handling, with the SQLite stand-in behind a minimal aiomysql-shaped
+adapter.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('aiomysql')
+
+from conftest import count_posts, query
+
+from ingest.async_ingest import AsyncIngestor
+from ingest.dedupe import PostDelete
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+
+    async def execute(self, sql, args=None):
+        self.cursor.execute(sql, args or ())
+
+    async def executemany(self, sql, args):
+        self.cursor.executemany(sql, args)
+
+    async def fetchone(self):
+        return self.cursor.fetchone()
+
+    async def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+
+class Connection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def begin(self):
+        self.conn.start_transaction()
+
+    async def commit(self):
+        self.conn.commit()
+
+    async def rollback(self):
+        self.conn.rollback()
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield Cursor(self.conn)
+
+
+class Pool:
+    """aiomysql pool over SQLitePool; each acquire takes `delay` seconds, like a slow network"""
+
+    def __init__(self, pool, delay=0.0):
+        self.pool = pool
+        self.delay = delay
+
+    @asynccontextmanager
+    async def acquire(self):
+        await asyncio.sleep(self.delay)
+        with self.pool.connection() as conn:
+            yield Connection(conn)
+
+
+def post(n):
+    return (f'did:plc:author{n % 3}', f'post {n}', None, 'en', f'at://did:plc:author{n % 3}/app.bsky.feed.post/{n}',
+            b'\x01')
+
+
+def ingestor(pool, **kwargs):
+    ingest = AsyncIngestor({}, **kwargs)
+    ingest.pool = pool
+    return ingest
+
+
+def test_shutdown_commits_the_batch_in_flight(pool):
+    ingest = ingestor(Pool(pool, delay=0.05), batch_size=4, max_delay=0.01)
+
+    async def run():
+        ingest.writer_task = asyncio.create_task(ingest._writer())
+        for n in range(10):
+            await ingest.post_queue.put(post(n))
+        while not ingest.post_queue.empty():
+            await asyncio.sleep(0.001)
+        # The writer has taken the last batch off the queue and is still writing it
+        await ingest._drain_posts(timeout=10)
+
+    asyncio.run(run())
+    assert ingest.writer_task.done() and not ingest.writer_task.cancelled()
+    assert count_posts(pool) == 10
+    assert ingest.stats['rows_written'] == 10
+
+
+def test_writer_stops_after_queued_deletes(pool):
+    ingest = ingestor(Pool(pool), max_delay=0.01)
+
+    async def run():
+        ingest.writer_task = asyncio.create_task(ingest._writer())
+        await ingest.post_queue.put(post(1))
+        await ingest.post_queue.put(post(2))
+        await ingest.post_queue.put(PostDelete(post(1)[4]))
+        await ingest._drain_posts(timeout=10)
+
+    asyncio.run(run())
+    assert count_posts(pool) == 1
+
+
+class FlakyPool(Pool):
+    """Fails the first `failures` acquires with an error that is not an aiomysql.Error"""
+
+    def __init__(self, pool, failures):
+        super().__init__(pool)
+        self.failures = failures
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.failures:
+            self.failures -= 1
+            raise KeyError('connection lost')
+        async with super().acquire() as conn:
+            yield conn
+
+
+def test_failed_flush_is_retried(pool):
+    ingest = ingestor(FlakyPool(pool, failures=1))
+    rows = asyncio.run(ingest._flush_posts([post(1), post(2)]))
+
+    assert len(rows) == 2
+    assert count_posts(pool) == 2
+    assert ingest.stats['flush_errors'] == 1
+    assert ingest.stats['rows_dropped'] == 0
+
+
+def test_writer_survives_a_dropped_batch(pool):
+    ingest = ingestor(FlakyPool(pool, failures=2), max_delay=0.01)
+
+    async def run():
+        ingest.writer_task = asyncio.create_task(ingest._writer())
+        await ingest.post_queue.put(post(1))
+        while ingest.stats['rows_dropped'] == 0:
+            await asyncio.sleep(0.001)
+        await ingest.post_queue.put(post(2))
+        await ingest._drain_posts(timeout=10)
+
+    asyncio.run(run())
+    assert ingest.stats['flush_errors'] == 2
+    assert ingest.stats['rows_dropped'] == 1
+    assert ingest.stats['rows_written'] == 1
+    assert count_posts(pool) == 1
+
+
+def test_identity_events_update_authors(pool):
+    ingest = ingestor(Pool(pool))
+
+    async def run():
+        await ingest.on_message(SimpleNamespace(type='#identity', body={'did': 'did:plc:a', 'handle': 'alice.test'}))
+        await ingest.on_message(SimpleNamespace(type='#handle', body={'did': 'did:plc:b', 'handle': 'handle.invalid'}))
+        await ingest.flush_identities()
+
+    asyncio.run(run())
+    assert query(pool, 'SELECT did, handle FROM authors') == [('did:plc:a', 'alice.test')]
+    assert ingest.handle_cache.get('did:plc:a') == 'alice.test'
+    stats = ingest.identities.stats()
+    assert (stats['dids_updated'], stats['handles_cleared'], stats['pending']) == (1, 1, 0)
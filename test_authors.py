@@ -0,0 +1,100 @@
+"""
+Tests for ingest.authors.AuthorDirectory: author_id assignment for post
+rows, the bounded LRU and batched last_seen refreshes, against the SQLite
+stand-in.
+"""
+from conftest import post, query
+
+from ingest import authors as authors_module
+from ingest.authors import AuthorDirectory
+from ingest.dedupe import PostDelete, PostUpdate
+
+
+def test_assign_creates_authors_once(pool):
+    directory = AuthorDirectory(pool)
+    rows = [post(1, author='did:plc:a'), post(2, author='did:plc:b'),
+            PostDelete('at://did:plc:a/app.bsky.feed.post/0'), PostUpdate(post(3, author='did:plc:a'))]
+    with pool.connection() as conn:
+        assigned = directory.assign(conn, rows)
+        conn.commit()
+
+    ids = dict(query(pool, 'SELECT did, author_id FROM authors'))
+    assert sorted(ids) == ['did:plc:a', 'did:plc:b']
+    assert assigned[0] == (ids['did:plc:a'],) + post(1, author='did:plc:a')[1:]
+    assert assigned[1][0] == ids['did:plc:b']
+    assert assigned[2] is rows[2]
+    assert isinstance(assigned[3], PostUpdate) and assigned[3][0] == ids['did:plc:a']
+    # New authors are due for a scheduled resolution
+    assert query(pool, 'SELECT COUNT(*) FROM authors WHERE first_seen IS NULL OR next_retry_at IS NULL') == [(0,)]
+
+    # A second directory (another process) finds the same ids without inserting
+    with pool.connection() as conn:
+        again = AuthorDirectory(pool).assign(conn, [post(4, author='did:plc:b'), post(5, author='did:plc:c')])
+        conn.commit()
+    assert again[0][0] == ids['did:plc:b']
+    assert query(pool, 'SELECT COUNT(*), MAX(author_id) FROM authors') == [(3, again[1][0])]
+
+
+def test_cache_hits_skip_the_database(pool):
+    directory = AuthorDirectory(pool)
+    with pool.connection() as conn:
+        directory.assign(conn, [post(1, author='did:plc:a')])
+        directory.assign(conn, [post(2, author='did:plc:a'), post(3, author='did:plc:a')])
+
+    stats = directory.stats()
+    assert (stats['misses'], stats['hits']) == (1, 1)  # DIDs are looked up once per batch
+    assert stats['hit_rate'] == 0.5
+
+
+def test_lru_evicts_the_least_recently_used(pool):
+    directory = AuthorDirectory(pool, max_size=2)
+    directory.remember({'did:plc:a': 1, 'did:plc:b': 2})
+    directory.cached(['did:plc:a'])
+    directory.remember({'did:plc:c': 3})
+
+    ids, missing = directory.cached(['did:plc:a', 'did:plc:b', 'did:plc:c'])
+    assert ids == {'did:plc:a': 1, 'did:plc:c': 3}
+    assert missing == ['did:plc:b']
+    assert directory.stats()['evictions'] == 1
+
+
+def test_warm_keeps_the_most_recent_rows():
+    directory = AuthorDirectory(None, max_size=2)
+    assert directory.warm([('did:plc:new', 3), ('did:plc:mid', 2), ('did:plc:old', 1)]) == 2
+    directory.remember({'did:plc:other': 4})
+    assert directory.cached(['did:plc:new', 'did:plc:mid'])[1] == ['did:plc:mid']
+
+
+def test_touches_are_batched(pool, monkeypatch):
+    monkeypatch.setattr(authors_module, 'TOUCH_CHUNK', 2)
+    directory = AuthorDirectory(pool)
+    with pool.connection() as conn:
+        directory.assign(conn, [post(n, author=f'did:plc:{n}') for n in range(5)])
+        conn.commit()
+        conn.cursor().execute('UPDATE authors SET first_seen = NULL, last_seen = NULL')
+        conn.commit()
+
+    assert directory.stats()['pending_touches'] == 5
+    assert directory.touch() == 5
+    assert directory.touch() == 0  # nothing seen since
+    assert query(pool, 'SELECT COUNT(*) FROM authors WHERE first_seen IS NOT NULL AND last_seen IS NOT NULL') == [
+        (5,)]
+    assert directory.stats()['touched'] == 5
+
+    directory.cached(['did:plc:0', 'did:plc:1', 'did:plc:2'])
+    assert [len(chunk) for chunk in directory.take_touches()] == [2, 1]
+
+
+def test_rows_without_an_author_id_are_dropped(pool):
+    directory = AuthorDirectory(pool)
+    too_long = 'did:web:' + 'a' * 300
+    with pool.connection() as conn:
+        assigned = directory.assign(conn, [post(1, author=too_long), post(2, author='did:plc:a')])
+        conn.commit()
+
+    # Never inserted, where MariaDB would have stored it truncated
+    assert query(pool, 'SELECT did FROM authors') == [('did:plc:a',)]
+    assert [row[4] for row in assigned] == [post(2, author='did:plc:a')[4]]
+    # A DID the lookup did not hand back as given is dropped too, not a KeyError
+    assert directory.replace_dids([post(3, author='did:plc:b')], {'did:plc:B': 7}) == []
+    assert directory.stats()['unassigned'] == 2
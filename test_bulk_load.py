@@ -0,0 +1,101 @@
+"""
+Tests for ingest.bulk_load: TSV escaping, and the LOAD DATA merge picking
+the same rows as PostDeduplicator.resolve() for the same batches, against
+the SQLite stand-in.
+"""
+import pytest
+
+from conftest import post, uri
+from sqlite_standin import SQLitePool
+
+from ingest.bulk_load import BulkLoader, encode_tsv, insert_columns, tsv_field
+from ingest.dedupe import PostDeduplicator, PostDelete, PostUpdate
+from ingest.post_writer import INSERT_POSTS_SQL
+from ingest.segment_store import INSERT_POSTS_SEGMENT_SQL
+
+
+# Each batch exercises one resolve() rule: claims, duplicates within and
+# across batches, updates of live posts, deletes, tombstones and creates
+# cancelled by a delete in the same batch.
+BATCHES = [
+    [post(1), post(2), post(3), post(1)],
+    [post(1), PostUpdate(post(2, 'edited')), PostDelete(uri(3)), post(4), PostDelete(uri(4))],
+    [post(3), PostUpdate(post(3, 'edited')), PostDelete(uri(5)), post(5), post(6, 'tab\there\nnewline \\ \x00')],
+    [PostUpdate(post(7, 'update of an unseen post')), PostUpdate(post(1, 'edited')), PostDelete(uri(1))],
+]
+
+
+def test_tsv_escaping():
+    assert tsv_field(None) == b'\\N'
+    assert tsv_field(7) == b'7'
+    assert tsv_field('a\tb\nc\rd\\e\x00') == b'a\\tb\\nc\\rd\\\\e\\0'
+    assert tsv_field(b'\x01\t') == b'\x01\\t'
+    assert encode_tsv([(1, None, 'x'), (2, 'y', b'z')]) == b'1\t\\N\tx\n2\ty\tz\n'
+
+
+def test_insert_columns():
+    assert insert_columns(INSERT_POSTS_SQL)[-2:] == ['post_uri', 'raw_record']
+    assert insert_columns(INSERT_POSTS_SEGMENT_SQL)[-3:] == ['raw_segment', 'raw_offset', 'raw_length']
+    with pytest.raises(ValueError):
+        insert_columns('INSERT INTO authors (did) VALUES (%s)')
+
+
+def run_batches(tmp_path, name, bulk):
+    pool = SQLitePool(str(tmp_path / f'{name}.db'))
+    dedupe = PostDeduplicator()
+    results = []
+    with pool.connection() as conn:
+        for batch in BATCHES:
+            rows, post_ids = dedupe.write_batch(conn, batch, INSERT_POSTS_SQL, bulk=bulk)
+            results.append([tuple(row) for row in rows])
+            cursor = conn.cursor()
+            cursor.execute('SELECT text FROM posts WHERE id IN ({})'.format(', '.join('?' * len(post_ids))),
+                           post_ids)
+            # Post ids returned in row order point at those rows
+            assert sorted(text for text, in cursor.fetchall()) == sorted(row[1] for row in rows)
+        cursor = conn.cursor()
+        cursor.execute('SELECT post_uri, text, raw_record FROM posts ORDER BY post_uri')
+        posts = cursor.fetchall()
+        cursor.execute('SELECT post_uri, post_id IS NOT NULL, deleted FROM post_uris ORDER BY post_uri')
+        uris = cursor.fetchall()
+    return results, posts, uris, dedupe.stats()
+
+
+def test_bulk_merge_follows_the_resolve_rules(tmp_path):
+    bulk = BulkLoader(tsv_dir=str(tmp_path))
+    expected = run_batches(tmp_path, 'rows', None)
+    assert run_batches(tmp_path, 'bulk', bulk) == expected
+
+    _, posts, uris, stats = expected
+    assert [(post_uri, text) for post_uri, text, _ in posts] == [
+        (uri(2), 'edited'), (uri(6), 'tab\there\nnewline \\ \x00'), (uri(7), 'update of an unseen post')]
+    assert {raw for _, _, raw in posts} == {b'\x01'}
+    assert [(post_uri, deleted) for post_uri, _, deleted in uris if deleted] == [(uri(n), 1) for n in (1, 3, 4, 5)]
+    assert stats['updates'] == 1
+    assert stats['tombstone_hits'] == 1
+
+    bulk_stats = bulk.stats()
+    assert bulk_stats['loads'] == 4
+    assert bulk_stats['rows_merged'] == sum(len(rows) for rows in expected[0])
+
+
+class MissingMergeLoader(BulkLoader):
+    """A merge whose WHERE clause disagrees with resolve() about one URI"""
+
+    def merge(self, cursor, insert_sql):
+        new_ids = super().merge(cursor, insert_sql)
+        new_ids.pop(uri(2), None)
+        return new_ids
+
+
+def test_rows_the_merge_missed_are_counted_not_fatal(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'missed.db'))
+    dedupe = PostDeduplicator()
+    with pool.connection() as conn:
+        rows, post_ids = dedupe.write_batch(conn, [post(1), post(2)], INSERT_POSTS_SQL,
+                                            bulk=MissingMergeLoader(tsv_dir=str(tmp_path)))
+
+    assert [row[4] for row in rows] == [uri(1)]
+    assert len(post_ids) == 1 and post_ids[0] is not None
+    assert dedupe.stats()['merge_misses'] == 1
+    assert dedupe.stats()['inserted'] == 1
@@ -0,0 +1,97 @@
+"""
+Tests for ingest.car_reader: selective block extraction must return the
+same blocks as CAR.from_bytes for the CIDs asked for.
+"""
+import libipld
+import pytest
+from atproto import CAR, CID
+
+from synthetic_firehose import cid_for, encode_car, varint
+
+from ingest.car_reader import extract_blocks, iter_sections, read_varint
+
+
+def commit_car(record_count=3):
+    """A commit CAR laid out like a PDS sends it: signed commit, MST node, records"""
+    records = [libipld.encode_dag_cbor({'$type': 'app.bsky.feed.post', 'text': f'post {i}',
+                                        'createdAt': '2026-10-17T00:00:00Z'})
+               for i in range(record_count)]
+    record_cids = [cid_for(block) for block in records]
+    mst = libipld.encode_dag_cbor({'l': None, 'e': [{'p': 0, 'k': b'app.bsky.feed.post/1',
+                                                     'v': record_cids[0], 't': None}]})
+    commit = libipld.encode_dag_cbor({'did': 'did:plc:test', 'version': 3, 'data': cid_for(mst),
+                                      'rev': '3l2', 'prev': None, 'sig': b'\x00' * 64})
+    blocks = [(cid_for(commit), commit), (cid_for(mst), mst)] + list(zip(record_cids, records))
+    return encode_car(cid_for(commit), blocks), [CID.decode(cid) for cid in record_cids]
+
+
+def test_matches_car_from_bytes():
+    car, record_cids = commit_car()
+    wanted = record_cids[::2]
+    full = CAR.from_bytes(car)
+
+    extracted = extract_blocks(car, wanted)
+
+    assert extracted == {cid: full.blocks.get(cid) for cid in wanted}
+    # Keyed by the objects passed in, so an op.cid looks its block up directly
+    assert all(any(key is cid for key in extracted) for cid in wanted)
+
+
+def test_accepts_cid_strings_and_bytes():
+    car, record_cids = commit_car()
+    full = CAR.from_bytes(car)
+    as_string = str(record_cids[0])
+    as_bytes = libipld.decode_multibase(str(record_cids[1]))[1]
+
+    extracted = extract_blocks(car, [as_string, as_bytes])
+
+    assert extracted == {as_string: full.blocks.get(record_cids[0]),
+                         as_bytes: full.blocks.get(record_cids[1])}
+
+
+def test_missing_cids_are_left_out():
+    car, record_cids = commit_car()
+    missing = CID.decode(cid_for(b'not in this commit'))
+
+    extracted = extract_blocks(car, [record_cids[1], missing])
+
+    assert list(extracted) == [record_cids[1]]
+    assert extract_blocks(car, []) == {}
+
+
+def test_iter_sections_steps_over_every_block():
+    car, record_cids = commit_car()
+    sections = [(bytes(cid), bytes(block)) for cid, block in iter_sections(car)]
+
+    assert len(sections) == 2 + len(record_cids)
+    assert [CID.decode(cid) for cid, _ in sections[2:]] == record_cids
+    assert all(cid_for(block) == cid for cid, block in sections)
+
+
+def test_truncated_car_raises():
+    car, record_cids = commit_car()
+    with pytest.raises(ValueError):
+        extract_blocks(car[:-10], [record_cids[-1]])
+
+
+def test_read_varint():
+    for value in (0, 1, 127, 128, 300, 2 ** 32):
+        assert read_varint(memoryview(varint(value) + b'\xff'), 0) == (value, len(varint(value)))
+    with pytest.raises(ValueError):
+        read_varint(memoryview(b'\x80\x80'), 0)
+
+
+def test_duplicate_cids_share_one_entry():
+    car, record_cids = commit_car()
+    full = CAR.from_bytes(car)
+    # Two ops with identical records carry equal CIDs (here a separate object and its string form)
+    same = [record_cids[0], CID.decode(str(record_cids[0])), str(record_cids[0])]
+    ops = same + [record_cids[1]]
+
+    extracted = extract_blocks(car, ops)
+
+    # Every op finds its block
+    assert all(extracted.get(cid) == full.blocks.get(record_cids[0]) for cid in same)
+    assert extracted.get(record_cids[1]) == full.blocks.get(record_cids[1])
+    # but equal CIDs collapse into one entry
+    assert len(extracted) == len(set(ops)) < len(ops)
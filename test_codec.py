@@ -0,0 +1,113 @@
+"""
+Tests for ingest.codec and the API's reader (flask-app/libs/raw_record.py):
+raw record blobs round trip, and dictionary blobs are decoded with the
+dictionary named by the id in each frame.
+"""
+import json
+import os
+import random
+import sys
+
+import libipld
+import pytest
+
+from ingest.codec import (
+    FORMAT_ZSTD, FORMAT_ZSTD_DICT, LazyRecord, RecordCodec, blob_dict_id, dictionary_path, save_dictionary,
+    train_dictionary)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask-app'))
+
+from libs import raw_record as api_raw_record
+
+WORDS = "the a to and of is in it you that for on this with just be are my not so have but me what".split()
+
+
+def record(rng):
+    return {'$type': 'app.bsky.feed.post', 'text': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))),
+            'langs': [rng.choice(['en', 'ja', 'de'])], 'createdAt': f'2026-10-17T00:00:{rng.randint(10, 59)}.000Z'}
+
+
+def dictionary(seed):
+    rng = random.Random(seed)
+    return train_dictionary([libipld.encode_dag_cbor(record(rng)) for _ in range(500)], dict_size=4096)
+
+
+def test_round_trip_without_dictionary():
+    codec = RecordCodec()
+    post = record(random.Random(1))
+    blob = codec.encode(post)
+
+    assert blob[0] == FORMAT_ZSTD
+    assert codec.decode(blob) == post
+    # DAG-CBOR bytes are stored as they are, so CIDs and signatures stay intact
+    assert codec.decode_bytes(codec.encode(libipld.encode_dag_cbor(post))) == libipld.encode_dag_cbor(post)
+
+
+def test_round_trip_with_dictionary(tmp_path):
+    trained = dictionary(1)
+    codec = RecordCodec(trained, dictionary_dir=str(tmp_path))
+    post = record(random.Random(2))
+    blob = codec.encode(post)
+
+    assert blob[0] == FORMAT_ZSTD_DICT
+    assert blob_dict_id(blob) == trained.dict_id()
+    assert codec.decode(blob) == post
+    assert len(blob) < len(RecordCodec().encode(post))
+
+
+def test_older_dictionaries_are_loaded_by_id(tmp_path):
+    old, new = dictionary(1), dictionary(2)
+    assert old.dict_id() != new.dict_id()
+    save_dictionary(old, str(tmp_path))
+    post = record(random.Random(3))
+    old_blob = RecordCodec(old).encode(post)
+
+    # A reader set up with only the new dictionary finds the old one on disk
+    codec = RecordCodec(new, dictionary_dir=str(tmp_path))
+    assert codec.decode(old_blob) == post
+    assert codec.decode(codec.encode(post)) == post
+
+
+def test_missing_dictionary_raises(tmp_path):
+    blob = RecordCodec(dictionary(1)).encode(record(random.Random(4)))
+    with pytest.raises(ValueError, match='missing'):
+        RecordCodec(dictionary_dir=str(tmp_path)).decode(blob)
+
+
+def test_save_dictionary_never_overwrites(tmp_path):
+    trained = dictionary(1)
+    path = save_dictionary(trained, str(tmp_path))
+    assert path == dictionary_path(trained.dict_id(), str(tmp_path))
+    with pytest.raises(FileExistsError):
+        save_dictionary(trained, str(tmp_path))
+
+
+def test_legacy_json_and_unknown_formats():
+    codec = RecordCodec()
+    assert codec.decode('{"text": "hi"}') == {'text': 'hi'}
+    assert codec.decode(b'{"text": "hi"}') == {'text': 'hi'}
+    assert codec.decode(None) is None
+    with pytest.raises(ValueError, match='Unknown raw record format'):
+        codec.decode(b'\x07abc')
+
+
+def test_lazy_record_decodes_on_access():
+    post = record(random.Random(5))
+    lazy = LazyRecord(RecordCodec().encode(post), RecordCodec())
+    assert lazy._record is None
+    assert lazy['text'] == post['text']
+    assert lazy.get('missing', 'default') == 'default'
+    assert json.loads(lazy.to_json()) == post
+
+
+def test_api_reader_picks_the_dictionary_by_id(tmp_path, monkeypatch):
+    old, new = dictionary(1), dictionary(2)
+    save_dictionary(old, str(tmp_path))
+    save_dictionary(new, str(tmp_path))
+    monkeypatch.setattr(api_raw_record, 'DICTIONARY_DIR', str(tmp_path))
+    posts = [record(random.Random(seed)) for seed in (6, 7)]
+
+    for trained, post in zip((old, new), posts):
+        assert api_raw_record.decode_raw_record(RecordCodec(trained).encode(post)) == post
+    assert api_raw_record.decode_raw_record(RecordCodec().encode(posts[0])) == posts[0]
+    assert api_raw_record.decode_raw_record(None, '{"text": "hi"}') == {'text': 'hi'}
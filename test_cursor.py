@@ -0,0 +1,80 @@
+"""
+Tests for ingest.cursor.CursorTracker: the committed watermark only covers
+frames whose rows are all committed, and lost rows freeze it.
+"""
+from ingest.cursor import CursorTracker
+
+
+def test_watermark_waits_for_outstanding_rows():
+    tracker = CursorTracker(start_seq=10)
+    tracker.begin(11, 2)
+    tracker.begin(12, 1)
+    assert tracker.committed_seq == 10
+
+    tracker.rows_committed([12])
+    assert tracker.committed_seq == 10  # 11 still has both rows outstanding
+
+    tracker.rows_committed([11])
+    assert tracker.committed_seq == 10
+    tracker.rows_committed([11])
+    assert tracker.committed_seq == 12
+
+
+def test_frames_without_rows_advance_immediately():
+    tracker = CursorTracker()
+    tracker.begin(5, 0)
+    assert tracker.committed_seq == 5
+    tracker.begin(6, 1)
+    tracker.begin(7, 0)
+    assert tracker.committed_seq == 5
+    tracker.rows_committed([6])
+    assert tracker.committed_seq == 7
+    assert tracker.stats()['frames_in_flight'] == 0
+
+
+def test_none_seq_is_ignored():
+    tracker = CursorTracker(start_seq=3)
+    tracker.begin(None, 4)
+    tracker.rows_failed([None])
+    assert tracker.committed_seq == 3
+    assert tracker.stats()['rows_lost'] == 0
+
+
+def test_failed_rows_stall_the_watermark_below_them():
+    tracker = CursorTracker(start_seq=100)
+    for seq in (101, 102, 103):
+        tracker.begin(seq, 1)
+    tracker.rows_committed([101])
+    tracker.rows_failed([102])
+    tracker.rows_committed([103])
+
+    stats = tracker.stats()
+    assert stats['committed_seq'] == 101
+    assert stats['stalled_at'] == 102
+    assert stats['rows_lost'] == 1
+    assert stats['frames_in_flight'] == 0
+
+    # Later frames commit, but the checkpoint never moves past the lost rows
+    tracker.begin(104, 1)
+    tracker.rows_committed([104])
+    assert tracker.committed_seq == 101
+
+
+def test_earliest_failure_wins():
+    tracker = CursorTracker()
+    for seq in (1, 2, 3):
+        tracker.begin(seq, 1)
+    tracker.rows_failed([3])
+    tracker.rows_failed([2])
+    tracker.rows_committed([1])
+    assert tracker.stalled_at == 2
+    assert tracker.committed_seq == 1
+
+
+def test_stats_track_received_seq():
+    tracker = CursorTracker()
+    tracker.begin(42, 3)
+    stats = tracker.stats()
+    assert stats['received_seq'] == 42
+    assert stats['committed_seq'] is None
+    assert stats['frames_in_flight'] == 1
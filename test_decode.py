@@ -0,0 +1,32 @@
+"""
+Tests for ingest.decode: post rows from routed records, with the language
+tag taken from untrusted record content.
+"""
+from ingest.decode import add_record, new_result, post_language
+from ingest.routing import POST_COLLECTION
+
+
+def decode_post(**fields):
+    raw = {'$type': POST_COLLECTION, 'text': 'hello', 'createdAt': '2026-10-17T00:00:00Z', **fields}
+    result = new_result()
+    add_record(result, 'did:plc:test', f'{POST_COLLECTION}/1', POST_COLLECTION, 'create', raw)
+    assert result['errors'] == []
+    return result['posts']
+
+
+def test_post_language():
+    assert post_language(['en', 'de']) == 'en'
+    assert post_language(['zh-Hant-TW']) == 'zh-Hant-TW'
+    assert post_language(['x' * 11]) is None  # longer than posts.language VARCHAR(10)
+    assert post_language([123]) is None
+    assert post_language('en') is None
+    assert post_language([]) is None
+    assert post_language(None) is None
+
+
+def test_malformed_langs_keep_the_post():
+    for langs in (['x' * 40], [123], 'en', [None]):
+        posts = decode_post(langs=langs)
+        assert [(post['text'], post['language']) for post in posts] == [('hello', None)]
+    assert decode_post(langs=['ja'])[0]['language'] == 'ja'
+    assert decode_post()[0]['language'] is None
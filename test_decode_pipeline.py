@@ -0,0 +1,74 @@
+"""
+Tests for ingest.decode_pipeline.DecodePipeline failure handling, with
+thread pools standing in for the worker processes.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import libipld
+
+from ingest.decode_pipeline import DecodePipeline
+
+
+def identity_frame(seq):
+    return (libipld.encode_dag_cbor({'op': 1, 't': '#identity'})
+            + libipld.encode_dag_cbor({'seq': seq, 'did': f'did:plc:test{seq}',
+                                       'time': '2026-10-17T00:00:00Z', 'handle': f'h{seq}.test'}))
+
+
+class BrokenExecutor:
+    """A pool whose worker died: every submit raises"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def run_pipeline(executors, frames):
+    results = []
+    pipeline = DecodePipeline(results.append, processes=1, chunk_size=2, max_chunk_delay=0.01)
+    pipeline._new_executor = lambda: executors.pop(0)
+    pipeline.start()
+    for frame in frames:
+        pipeline.submit(frame)
+    pipeline.close(timeout=10)
+    return pipeline, results
+
+
+def test_broken_pool_is_replaced():
+    broken = BrokenExecutor()
+    pipeline, results = run_pipeline([broken, ThreadPoolExecutor(max_workers=1)],
+                                     [identity_frame(seq) for seq in range(1, 6)])
+
+    assert [result['seq'] for result in results] == [1, 2, 3, 4, 5]
+    assert broken.shut_down
+    stats = pipeline.stats()
+    assert stats['pool_restarts'] == 1
+    assert stats['frames_decoded'] == 5
+
+
+class FailingExecutor(ThreadPoolExecutor):
+    """Accepts chunks, but every future fails like one in a pool whose worker died"""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(self._fail)
+
+    @staticmethod
+    def _fail():
+        raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+
+
+def test_failed_chunks_are_decoded_inline_in_order():
+    pipeline, results = run_pipeline([FailingExecutor(max_workers=1)],
+                                     [identity_frame(seq) for seq in range(1, 6)])
+
+    # Every frame still reaches the callback, so its seq gets tracked by the cursor
+    assert [result['seq'] for result in results] == [1, 2, 3, 4, 5]
+    stats = pipeline.stats()
+    assert stats['decode_errors'] == 5
+    assert stats['frames_decoded'] == 5
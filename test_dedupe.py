@@ -0,0 +1,104 @@
+"""
+Tests for ingest.dedupe.PostDeduplicator: op collapsing within a batch and
+the post_uris rules across batches, against the SQLite stand-in.
+"""
+from conftest import post, query, uri
+
+from ingest.dedupe import PostDeduplicator, PostDelete, PostUpdate
+from ingest.post_writer import INSERT_POSTS_SQL
+
+
+def write(pool, dedupe, rows):
+    with pool.connection() as conn:
+        return dedupe.write_batch(conn, rows, INSERT_POSTS_SQL)
+
+
+def test_collapse_keeps_one_op_per_uri():
+    dedupe = PostDeduplicator()
+    counts = dedupe.new_counts()
+    ops, cancelled = dedupe.collapse([post(1), post(1), post(2), PostDelete(uri(2)), PostDelete(uri(2))], counts)
+
+    assert ops == {uri(1): ('create', post(1)), uri(2): ('delete', None)}
+    assert cancelled == {uri(2)}
+    assert counts['duplicates'] == 2
+
+
+def test_collapse_update_after_delete_is_a_tombstone_hit():
+    dedupe = PostDeduplicator()
+    counts = dedupe.new_counts()
+    ops, _ = dedupe.collapse([PostDelete(uri(1)), PostUpdate(post(1, 'edited'))], counts)
+
+    assert ops == {uri(1): ('delete', None)}
+    assert counts['tombstone_hits'] == 1
+
+
+def test_collapse_update_of_buffered_create_stays_a_create():
+    dedupe = PostDeduplicator()
+    ops, _ = dedupe.collapse([post(1), PostUpdate(post(1, 'edited'))], dedupe.new_counts())
+
+    assert ops[uri(1)] == ('create', PostUpdate(post(1, 'edited')))
+
+
+def test_create_and_delete_in_one_batch_never_reach_posts(pool):
+    dedupe = PostDeduplicator()
+    inserted, post_ids = write(pool, dedupe, [post(1), post(2), PostDelete(uri(1))])
+
+    assert inserted == [post(2)]
+    assert len(post_ids) == 1
+    assert query(pool, 'SELECT post_uri FROM posts') == [(uri(2),)]
+    assert query(pool, f"SELECT post_id, deleted FROM post_uris WHERE post_uri = '{uri(1)}'") == [(None, 1)]
+    assert dedupe.stats()['deletes_buffered'] == 1
+
+    # A replay of the create is a no-op against the tombstone
+    assert write(pool, dedupe, [post(1)]) == ([], [])
+    assert dedupe.stats()['tombstone_hits'] == 1
+
+
+def test_replayed_creates_are_duplicates(pool):
+    dedupe = PostDeduplicator()
+    write(pool, dedupe, [post(1), post(2)])
+    assert write(pool, dedupe, [post(1), post(2)]) == ([], [])
+
+    assert query(pool, 'SELECT COUNT(*) FROM posts') == [(2,)]
+    assert dedupe.stats()['duplicates'] == 2
+
+
+def test_delete_removes_the_post_and_reports_it(pool):
+    removed = []
+    dedupe = PostDeduplicator(on_deleted=removed.extend)
+    write(pool, dedupe, [post(1)])
+    write(pool, dedupe, [PostDelete(uri(1))])
+
+    assert query(pool, 'SELECT COUNT(*) FROM posts') == [(0,)]
+    assert len(removed) == 1
+    assert removed[0][1:] == ('en', 1)  # (saved_at, language, author_id)
+    assert dedupe.stats()['deletes'] == 1
+
+
+def test_update_after_delete_is_ignored(pool):
+    dedupe = PostDeduplicator()
+    write(pool, dedupe, [post(1)])
+    write(pool, dedupe, [PostDelete(uri(1))])
+    assert write(pool, dedupe, [PostUpdate(post(1, 'edited'))]) == ([], [])
+
+    assert query(pool, 'SELECT COUNT(*) FROM posts') == [(0,)]
+    assert dedupe.stats()['tombstone_hits'] == 1
+
+
+def test_update_replaces_the_post(pool):
+    dedupe = PostDeduplicator()
+    _, (first_id,) = write(pool, dedupe, [post(1)])
+    _, (second_id,) = write(pool, dedupe, [PostUpdate(post(1, 'edited'))])
+
+    assert query(pool, 'SELECT id, text FROM posts') == [(second_id, 'edited')]
+    assert second_id != first_id
+    assert query(pool, 'SELECT post_id, deleted FROM post_uris') == [(second_id, 0)]
+    assert dedupe.stats()['updates'] == 1
+
+
+def test_delete_of_unseen_post_leaves_a_tombstone(pool):
+    dedupe = PostDeduplicator()
+    write(pool, dedupe, [PostDelete(uri(9))])
+
+    assert query(pool, 'SELECT post_uri, post_id, deleted FROM post_uris') == [(uri(9), None, 1)]
+    assert dedupe.stats()['tombstones'] == 1
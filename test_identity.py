@@ -0,0 +1,91 @@
+"""
+Tests for ingest.identity.IdentityUpdater: handles from #identity events,
+handle.invalid clearing the stored one and events without a handle keeping
+it while the DID is re-resolved, against the SQLite stand-in.
+"""
+from conftest import query
+
+from ingest.handle_cache import MISS, HandleCache
+from ingest.identity import INVALID_HANDLE, IdentityUpdater, identity_from_body
+from ingest.jetstream import decode_jetstream_event
+
+DID = 'did:plc:test'
+
+
+def author(pool):
+    rows = query(pool, 'SELECT handle, resolved_at FROM authors WHERE did = %s', (DID,))
+    return rows[0] if rows else None
+
+
+def test_identity_from_body():
+    assert identity_from_body({'did': DID, 'handle': 'alice.test'}) == (DID, 'alice.test')
+    assert identity_from_body({'did': DID}) == (DID, None)
+    assert identity_from_body({'did': DID, 'handle': 'handle.invalid'}) == (DID, INVALID_HANDLE)
+
+
+def test_jetstream_identity_events_follow_the_same_rules():
+    def identity(**fields):
+        return decode_jetstream_event({'kind': 'identity', 'did': DID, 'time_us': 1, 'identity': fields})['identity']
+
+    assert identity(did=DID, handle='alice.test') == (DID, 'alice.test')
+    assert identity(did=DID) == (DID, None)
+    assert identity(handle='handle.invalid') == (DID, INVALID_HANDLE)
+
+
+def test_latest_handle_wins(pool):
+    cache = HandleCache()
+    updater = IdentityUpdater(pool, cache)
+    updater.submit(DID, 'alice.test')
+    updater.submit(DID, 'alice2.test')
+
+    assert updater.flush() == 1
+    assert author(pool)[0] == 'alice2.test'
+    assert cache.get(DID) == 'alice2.test'
+
+
+def test_invalid_handle_clears_the_stored_one(pool):
+    cache = HandleCache()
+    reresolved = []
+    updater = IdentityUpdater(pool, cache, reresolve=reresolved.append)
+    updater.submit(DID, 'alice.test')
+    updater.flush()
+
+    updater.submit(DID, INVALID_HANDLE)
+    assert cache.get(DID) is MISS
+    updater.flush()
+
+    # Back to never resolved, so the next post resolves the DID document again
+    assert author(pool) == (None, None)
+    assert cache.get(DID) is MISS
+    assert reresolved == []
+    assert updater.stats()['handles_cleared'] == 1
+
+
+def test_event_without_handle_keeps_the_stored_one_and_reresolves(pool):
+    cache = HandleCache()
+    reresolved = []
+    updater = IdentityUpdater(pool, cache, reresolve=lambda did: reresolved.append(did) or True)
+    updater.submit(DID, 'alice.test')
+    updater.flush()
+
+    # e.g. a key rotation: nothing to say about the handle
+    updater.submit(DID, None)
+    assert cache.get(DID) is MISS
+    assert reresolved == [DID]
+    assert updater.flush() == 0
+
+    assert author(pool)[0] == 'alice.test'
+    stats = updater.stats()
+    assert stats['handles_cleared'] == 0
+    assert stats['events_without_handle'] == 1
+    assert stats['reresolutions'] == 1
+
+
+def test_handle_after_a_clear_wins(pool):
+    updater = IdentityUpdater(pool, HandleCache())
+    updater.submit(DID, INVALID_HANDLE)
+    updater.submit(DID, 'alice.test')
+    updater.flush()
+
+    assert author(pool)[0] == 'alice.test'
+    assert updater.stats()['handles_cleared'] == 0
@@ -0,0 +1,117 @@
+"""
+Tests for ingest.jetstream: Jetstream JSON events decoded into the same
+result dicts as CBOR frames (ingest.decode.add_record), and the
+subscribe URL.
+"""
+import base64
+from datetime import datetime, timezone
+
+import libipld
+
+from ingest.codec import RecordCodec, encode_record
+from ingest.jetstream import JetstreamClient, decode_jetstream_event, event_time, record_from_json
+from ingest.routing import POST_COLLECTION, build_routes
+
+DID = 'did:plc:test'
+CID = 'bafyreie5737gdxlw5i64vzichcalba3z2v5n6icifvx5xytvske7mr3hpm'
+TIME_US = 1792238400000000
+
+POST = {'$type': 'app.bsky.feed.post', 'text': 'hello', 'langs': ['ja', 'en'],
+        'createdAt': '2026-10-17T01:02:03.456Z'}
+
+
+def commit_event(operation, collection=POST_COLLECTION, record=None, rkey='3k2abc'):
+    commit = {'rev': '3k2abd', 'operation': operation, 'collection': collection, 'rkey': rkey}
+    if record is not None:
+        commit.update(record=record, cid=CID)
+    return {'did': DID, 'time_us': TIME_US, 'kind': 'commit', 'commit': commit}
+
+
+def test_record_from_json_restores_links_and_bytes():
+    record = {'$type': 'app.bsky.feed.post', 'text': 'hi',
+              'embed': {'images': [{'image': {'$type': 'blob', 'ref': {'$link': CID}, 'size': 3}}]},
+              'sig': {'$bytes': base64.b64encode(b'\x00\x01\x02\x03').decode().rstrip('=')}}
+    raw = record_from_json(record)
+
+    assert raw['embed']['images'][0]['image']['ref'] == libipld.decode_multibase(CID)[1]
+    assert raw['sig'] == b'\x00\x01\x02\x03'
+    assert raw['text'] == 'hi'
+
+
+def test_post_create_matches_the_firehose_post_dict():
+    result = decode_jetstream_event(commit_event('create', record=POST))
+
+    assert result['type'] == '#commit'
+    assert result['seq'] == TIME_US
+    assert result['time'] == event_time(TIME_US)
+    assert result['repo'] == DID
+    assert result['errors'] == []
+    assert result['processed'] == {POST_COLLECTION: 1}
+    post, = result['posts']
+    assert post == {'author_did': DID, 'text': 'hello', 'created_at': '2026-10-17 01:02:03', 'language': 'ja',
+                    'post_uri': f'at://{DID}/{POST_COLLECTION}/3k2abc', 'raw_record': encode_record(POST),
+                    'action': 'create'}
+    assert RecordCodec().decode(post['raw_record']) == POST
+
+
+def test_post_update_and_delete():
+    update = decode_jetstream_event(commit_event('update', record=POST))
+    assert update['posts'][0]['action'] == 'update'
+
+    delete = decode_jetstream_event(commit_event('delete'))
+    assert delete['posts'] == []
+    assert delete['deletes'] == [f'at://{DID}/{POST_COLLECTION}/3k2abc']
+    assert delete['processed'] == {POST_COLLECTION: 1}
+
+
+def test_undecodable_record_is_an_error():
+    result = decode_jetstream_event(commit_event('create', record=dict(POST, embed={'$link': 'not a cid'})))
+    assert result['posts'] == []
+    message, raw_json = result['errors'][0]
+    assert message.startswith('Undecodable Jetstream record')
+    assert 'not a cid' in raw_json
+
+
+def test_other_collections_follow_the_routes():
+    like = {'$type': 'app.bsky.feed.like', 'subject': {'uri': 'at://did:plc:other/app.bsky.feed.post/1', 'cid': CID},
+            'createdAt': '2026-10-17T01:02:03.456Z'}
+
+    skipped = decode_jetstream_event(commit_event('create', 'app.bsky.feed.like', like))
+    assert skipped['records'] == {}
+    assert skipped['skipped'] == {'app.bsky.feed.like': 1}
+
+    routed = decode_jetstream_event(commit_event('create', 'app.bsky.feed.like', like),
+                                    build_routes(['app.bsky.feed.like']))
+    (author_did, record_uri, subject, created_at, _), = routed['records']['app.bsky.feed.like']
+    assert (author_did, record_uri, subject, created_at) == (
+        DID, f'at://{DID}/app.bsky.feed.like/3k2abc', 'at://did:plc:other/app.bsky.feed.post/1',
+        '2026-10-17 01:02:03')
+
+    # Like deletes and updates are not stored
+    routes = build_routes(['app.bsky.feed.like'])
+    assert decode_jetstream_event(commit_event('delete', 'app.bsky.feed.like'), routes)['skipped'] == {
+        'app.bsky.feed.like': 1}
+    assert decode_jetstream_event(commit_event('update', 'app.bsky.feed.like', like), routes)['skipped'] == {
+        'app.bsky.feed.like': 1}
+
+
+def test_account_events_carry_only_the_cursor():
+    result = decode_jetstream_event({'did': DID, 'time_us': TIME_US, 'kind': 'account',
+                                     'account': {'active': False, 'did': DID}})
+    assert result['type'] == '#account'
+    assert result['seq'] == TIME_US
+    assert (result['repo'], result['identity'], result['posts'], result['deletes']) == (None, None, [], [])
+
+
+def test_event_time():
+    assert event_time(TIME_US) == datetime.fromtimestamp(TIME_US / 1e6, timezone.utc).isoformat()
+    assert event_time(None) is None
+
+
+def test_url_asks_for_the_routed_collections_and_cursor():
+    client = JetstreamClient(base_uri='wss://jetstream.test/subscribe',
+                             collections=[POST_COLLECTION, 'app.bsky.feed.like'])
+    assert client.url() == ('wss://jetstream.test/subscribe?wantedCollections=app.bsky.feed.post'
+                            '&wantedCollections=app.bsky.feed.like')
+    client.update_params({'cursor': TIME_US})
+    assert client.url().endswith(f'&cursor={TIME_US}')
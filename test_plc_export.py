@@ -0,0 +1,129 @@
+"""
+Tests for ingest.plc_export.PlcExportImporter: handles from PLC operations,
+folding the export to the latest state per DID in bounded memory, and the
+authors merge rules, against the SQLite stand-in.
+"""
+import gzip
+import json
+
+from conftest import query
+
+from ingest.cursor import load_cursor, parse_event_time
+from ingest.plc_export import PLC_CURSOR_NAME, PlcExportImporter, micros, operation_handle
+
+
+def entry(did, created_at, handle=None, op_type='plc_operation', nullified=False):
+    operation = {'type': op_type}
+    if op_type == 'create':
+        operation['handle'] = handle
+    elif op_type == 'plc_operation':
+        operation['alsoKnownAs'] = [f'at://{handle}'] if handle else []
+    return {'did': did, 'operation': operation, 'cid': 'bafy', 'nullified': nullified,
+            'createdAt': f'2026-10-{created_at}Z'}
+
+
+EXPORT = [
+    entry('did:plc:alice', '01T00:00:00.000', 'alice.old.test', op_type='create'),
+    entry('did:plc:bob', '01T00:00:01.000', 'bob.test'),
+    entry('did:plc:alice', '02T00:00:00.000', 'alice.test'),
+    entry('did:plc:alice', '02T00:00:01.000', 'alice.fork.test', nullified=True),
+    entry('did:plc:carol', '03T00:00:00.000', 'carol.test'),
+    entry('did:plc:carol', '04T00:00:00.000', op_type='plc_tombstone'),
+    entry('did:plc:dave', '05T00:00:00.000'),
+]
+
+
+def write_export(path, entries, opener=open):
+    with opener(path, 'wt') as export:
+        for item in entries:
+            export.write(json.dumps(item) + '\n')
+    return str(path)
+
+
+def authors(pool):
+    return query(pool, 'SELECT did, handle, resolution_error, first_seen FROM authors ORDER BY did')
+
+
+def test_operation_handle():
+    operation = {'type': 'plc_operation', 'alsoKnownAs': ['https://a.test', 'at://a.test']}
+    assert operation_handle(operation) == ('a.test', False)
+    assert operation_handle({'type': 'create', 'handle': 'b.test'}) == ('b.test', False)
+    assert operation_handle({'type': 'plc_operation', 'alsoKnownAs': []}) == (None, False)
+    assert operation_handle({'type': 'plc_operation', 'alsoKnownAs': ['at://' + 'x' * 300]}) == (None, False)
+    assert operation_handle({'type': 'plc_tombstone'}) == (None, True)
+
+
+def test_import_keeps_the_latest_operation_per_did(tmp_path, pool):
+    importer = PlcExportImporter(pool, max_pending=2, tsv_dir=str(tmp_path))
+    importer.import_file(write_export(tmp_path / 'export.jsonl.gz', EXPORT, gzip.open))
+    importer.flush()
+
+    assert authors(pool) == [
+        ('did:plc:alice', 'alice.test', None, None),
+        ('did:plc:bob', 'bob.test', None, None),
+        ('did:plc:carol', None, 'tombstoned', None),
+        ('did:plc:dave', None, 'no_handle', None),
+    ]
+    stats = importer.stats()
+    assert stats['nullified'] == 1
+    assert (stats['tombstones'], stats['without_handle']) == (1, 1)
+    assert stats['flushes'] > 1  # max_pending bounds the pending dict
+    assert stats['pending'] == 0
+    assert load_cursor(pool, PLC_CURSOR_NAME) == micros(parse_event_time('2026-10-05T00:00:00.000Z'))
+
+
+def test_newer_handles_in_authors_are_kept(tmp_path, pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'INSERT INTO authors (did, handle, resolved_at, first_seen) VALUES (%s, %s, %s, %s)',
+            [('did:plc:alice', 'alice.resolved.test', '2026-10-10 00:00:00', '2026-10-09 00:00:00'),
+             ('did:plc:bob', 'bob.stale.test', '2026-09-01 00:00:00', '2026-09-01 00:00:00'),
+             ('did:plc:dave', None, '2026-10-10 00:00:00', '2026-10-09 00:00:00')])
+        conn.commit()
+
+    importer = PlcExportImporter(pool, tsv_dir=str(tmp_path))
+    importer.import_file(write_export(tmp_path / 'export.jsonl', EXPORT))
+    importer.flush()
+
+    rows = {did: (handle, error) for did, handle, error, _ in authors(pool)}
+    assert rows['did:plc:alice'] == ('alice.resolved.test', None)
+    assert rows['did:plc:bob'] == ('bob.test', None)
+    # A row without a handle always takes the export's state
+    assert rows['did:plc:dave'] == (None, 'no_handle')
+    # first_seen is left alone
+    assert all(first_seen is not None for did, _, _, first_seen in authors(pool) if did != 'did:plc:carol')
+
+
+def test_reimport_and_incremental_import(tmp_path, pool):
+    path = write_export(tmp_path / 'export.jsonl', EXPORT)
+    first = PlcExportImporter(pool, tsv_dir=str(tmp_path))
+    first.import_file(path)
+    first.flush()
+    before = authors(pool)
+
+    again = PlcExportImporter(pool, tsv_dir=str(tmp_path))
+    again.import_file(path)
+    again.flush()
+    assert authors(pool) == before
+
+    newer = EXPORT + [entry('did:plc:bob', '06T00:00:00.000', 'bob.new.test')]
+    incremental = PlcExportImporter(pool, since=load_cursor(pool, PLC_CURSOR_NAME), tsv_dir=str(tmp_path))
+    incremental.import_file(write_export(tmp_path / 'newer.jsonl', newer))
+    incremental.flush()
+    assert incremental.stats()['older_skipped'] == len(EXPORT) - 1  # the nullified one is counted apart
+    assert incremental.stats()['rows_loaded'] == 1
+    assert dict((did, handle) for did, handle, _, _ in authors(pool))['did:plc:bob'] == 'bob.new.test'
+
+
+def test_bad_lines_are_counted():
+    importer = PlcExportImporter(None, dry_run=True)
+    for line in [b'not json\n', b'\n', b'[1, 2]\n', b'{"did": "did:plc:x"}\n',
+                 json.dumps(entry('did:plc:x', '01T00:00:00.000', 'x.test')).encode()]:
+        importer.feed_line(line)
+
+    stats = importer.stats()
+    assert stats['lines'] == 5
+    assert stats['bad_lines'] == 3
+    assert stats['operations'] == 1
+    assert importer.flush() == 1  # dry run: nothing is written
@@ -0,0 +1,196 @@
+"""
+Tests for ingest.post_writer.PostWriter: group commits, seq callbacks and
+spilling while the database is down, against the SQLite stand-in.
+"""
+from contextlib import contextmanager
+
+import mysql.connector
+
+from conftest import DownPool, count_posts, post, uri
+
+from ingest.dedupe import PostDeduplicator, PostDelete
+from ingest.post_writer import PostWriter
+from ingest.spill import SpillQueue
+
+
+class Callbacks:
+    def __init__(self):
+        self.flushed = []
+        self.post_ids = []
+        self.committed = []
+        self.failed = []
+
+    def on_flushed(self, rows, post_ids):
+        self.flushed.extend(rows)
+        self.post_ids.extend(post_ids)
+
+    def kwargs(self):
+        return {'on_flushed': self.on_flushed, 'on_committed': self.committed.extend,
+                'on_failed': self.failed.extend}
+
+
+class StrictPool:
+    """The stand-in with MariaDB strict mode's error for a language over VARCHAR(10)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @contextmanager
+    def connection(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor
+
+            def strict_cursor():
+                real = cursor()
+                executemany = real.executemany
+
+                def checked(sql, rows):
+                    rows = list(rows)
+                    if any(len(row[3] or '') > 10 for row in rows):
+                        raise mysql.connector.errors.DataError("Data too long for column 'language'", errno=1406)
+                    return executemany(sql, rows)
+                real.executemany = checked
+                return real
+            conn.cursor = strict_cursor
+            try:
+                yield conn
+            finally:
+                conn.cursor = cursor
+
+
+def test_rows_are_group_committed(pool):
+    callbacks = Callbacks()
+    writer = PostWriter(pool, min_batch_size=50, max_batch_size=50, max_delay=5, **callbacks.kwargs())
+    for n in range(100):
+        writer.submit(post(n), seq=n)
+    writer.start()
+    writer.close()
+
+    stats = writer.stats()
+    assert stats['rows_written'] == 100
+    assert stats['batches'] == 2
+    assert count_posts(pool) == 100
+    assert callbacks.flushed == [post(n) for n in range(100)]
+    assert callbacks.post_ids == list(range(callbacks.post_ids[0], callbacks.post_ids[0] + 100))
+    assert callbacks.committed == list(range(100))
+    assert callbacks.failed == []
+
+
+def test_rows_written_counts_only_inserted_rows_with_dedupe(pool):
+    writer = PostWriter(pool, min_batch_size=100, max_batch_size=100, max_delay=5, dedupe=PostDeduplicator())
+    for row in [post(1), post(1), post(2), post(3), PostDelete(uri(3))]:
+        writer.submit(row)
+    writer.start()
+    writer.close()
+
+    stats = writer.stats()
+    assert stats['rows_flushed'] == 5
+    assert stats['rows_written'] == 2
+    assert stats['avg_batch_size'] == 5
+    assert count_posts(pool) == 2
+
+
+def test_close_flushes_a_partial_batch(pool):
+    callbacks = Callbacks()
+    writer = PostWriter(pool, min_batch_size=1000, max_batch_size=1000, max_delay=60, **callbacks.kwargs())
+    writer.start()
+    for n in range(3):
+        writer.submit(post(n), seq=n)
+    writer.close()
+
+    assert count_posts(pool) == 3
+    assert callbacks.committed == [0, 1, 2]
+
+
+def test_writer_survives_errors_that_are_not_database_errors(pool):
+    callbacks = Callbacks()
+    failures = [RuntimeError('boom')]
+
+    def prepare(batch):
+        if failures:
+            raise failures.pop()
+        return batch
+
+    writer = PostWriter(pool, min_batch_size=1, max_batch_size=1, max_delay=0.01, prepare_batch=prepare,
+                        **callbacks.kwargs())
+    writer.start()
+    writer.submit(post(1), seq=1)
+    writer.submit(post(2), seq=2)
+    writer.close()
+
+    assert callbacks.failed == [1]
+    assert callbacks.committed == [2]
+    assert count_posts(pool) == 1
+
+
+def test_failed_batches_are_reported_and_dropped():
+    callbacks = Callbacks()
+    writer = PostWriter(DownPool(), max_delay=0.01, **callbacks.kwargs())
+    writer.start()
+    writer.submit(post(1), seq=7)
+    writer.close()
+
+    assert callbacks.failed == [7]
+    assert callbacks.committed == []
+    stats = writer.stats()
+    assert stats['rows_dropped'] == 1
+    assert stats['flush_errors'] == 2  # one retry on a fresh connection
+
+
+def test_rows_spill_while_the_database_is_down(tmp_path, pool):
+    callbacks = Callbacks()
+    writer = PostWriter(DownPool(), max_delay=0.01, spill=SpillQueue(str(tmp_path / 'spill')),
+                        **callbacks.kwargs())
+    writer.start()
+    writer.submit(post(1), seq=1)
+    writer.submit(post(2), seq=2)
+    writer.close()
+
+    # Spilled rows are on disk, so the cursor may move past them
+    assert sorted(callbacks.committed) == [1, 2]
+    assert callbacks.failed == []
+    assert writer.stats()['rows_dropped'] == 0
+
+    # The next run drains them once the database is back
+    callbacks = Callbacks()
+    writer = PostWriter(pool, max_delay=0.01, spill=SpillQueue(str(tmp_path / 'spill')), **callbacks.kwargs())
+    assert writer._drain_once()
+    writer.close()
+    assert count_posts(pool) == 2
+    assert sorted(callbacks.flushed) == [post(1), post(2)]
+
+
+def test_a_bad_row_is_rejected_without_holding_up_the_rest(pool):
+    callbacks = Callbacks()
+    writer = PostWriter(StrictPool(pool), min_batch_size=50, max_batch_size=50, max_delay=5, **callbacks.kwargs())
+    writer.submit(post(0, language='x' * 11), seq=0)
+    for n in range(1, 50):
+        writer.submit(post(n), seq=n)
+    writer.start()
+    writer.close()
+
+    assert count_posts(pool) == 49
+    assert callbacks.committed == list(range(50))
+    stats = writer.stats()
+    assert (stats['rows_rejected'], stats['rows_written'], stats['db_down']) == (1, 49, False)
+
+
+def test_a_bad_spilled_row_does_not_block_the_drain(tmp_path, pool):
+    writer = PostWriter(DownPool(), max_delay=0.01, spill=SpillQueue(str(tmp_path / 'spill')))
+    writer.start()
+    writer.submit(post(0, language='x' * 11), seq=0)
+    for n in range(1, 200):
+        writer.submit(post(n), seq=n)
+    writer.close()
+    assert writer.stats()['rows_spilled'] == 200
+
+    writer = PostWriter(StrictPool(pool), max_batch_size=50, spill=SpillQueue(str(tmp_path / 'spill')))
+    writer.db_down = True
+    while writer._drain_once():
+        pass
+    writer.close()
+
+    assert count_posts(pool) == 199
+    stats = writer.stats()
+    assert (stats['rows_rejected'], stats['rows_drained'], stats['db_down']) == (1, 200, False)
+    assert stats['spill_backlog_rows'] == 0
@@ -0,0 +1,84 @@
+"""
+Tests for ingest.resolver: status outcomes, handles from DID documents and
+the pooled DidResolver against the local mock PLC directory.
+"""
+import pytest
+from atproto_core.did_doc import DidDocument
+
+from mock_plc import MockPlcDirectory, did_document, handle_for_did
+
+from ingest.resolver import DidResolver, did_document_url, handle_from_did_doc, status_outcome
+
+
+@pytest.fixture
+def directory():
+    directory = MockPlcDirectory(port=0, latency_ms=50, jitter_ms=0, not_found_rate=0.5, seed=1).start()
+    yield directory
+    directory.stop()
+
+
+def known_dids(directory, count, unknown=False):
+    dids = (f'did:plc:test{i}' for i in range(1000))
+    return [did for did in dids if directory._is_unknown(did) == unknown][:count]
+
+
+def test_status_outcome():
+    assert status_outcome(410) == 'tombstoned'
+    assert status_outcome(404) == 'not_found'
+    assert status_outcome(400) == 'invalid'
+    for status in (408, 429, 500, 503):
+        assert status_outcome(status) == 'errors'
+
+
+def test_did_document_url():
+    assert did_document_url('did:plc:abc', 'http://plc.test') == 'http://plc.test/did:plc:abc'
+    assert did_document_url('did:web:example.com%3A8443') == 'https://example.com:8443/.well-known/did.json'
+    with pytest.raises(ValueError):
+        did_document_url('did:key:z6Mk')
+
+
+def test_handle_from_did_doc():
+    assert handle_from_did_doc(DidDocument.from_dict(did_document('did:plc:abc'))) == handle_for_did('did:plc:abc')
+    document = dict(did_document('did:plc:abc'), alsoKnownAs=[])
+    assert handle_from_did_doc(DidDocument.from_dict(document)) is None
+    assert handle_from_did_doc(None) is None
+
+
+def test_resolve_outcomes(directory):
+    resolver = DidResolver(directory.url)
+    known, = known_dids(directory, 1)
+    unknown, = known_dids(directory, 1, unknown=True)
+    try:
+        outcomes = resolver.resolve_outcomes([known, unknown, 'did:key:z6Mk', known])
+    finally:
+        resolver.close()
+
+    assert outcomes == {known: (handle_for_did(known), 'resolved'), unknown: (None, 'not_found'),
+                        'did:key:z6Mk': (None, 'invalid')}
+    stats = resolver.stats()
+    assert stats['requests'] == 3  # the repeated DID is looked up once
+    assert (stats['resolved'], stats['not_found'], stats['invalid']) == (1, 1, 1)
+    assert stats['in_flight'] == 0
+
+
+def test_requests_are_bounded_by_max_in_flight(directory):
+    resolver = DidResolver(directory.url, max_in_flight=4)
+    dids = known_dids(directory, 16)
+    try:
+        handles = resolver.resolve_many(dids)
+    finally:
+        resolver.close()
+
+    assert handles == {did: handle_for_did(did) for did in dids}
+    assert resolver.stats()['max_in_flight_seen'] == 4
+    assert directory.stats['requests'] == 16
+
+
+def test_slow_lookups_time_out(directory):
+    resolver = DidResolver(directory.url, timeout=0.01)
+    did, = known_dids(directory, 1)
+    try:
+        assert resolver.resolve_outcomes([did]) == {did: (None, 'timeouts')}
+    finally:
+        resolver.close()
+    assert resolver.stats()['timeouts'] == 1
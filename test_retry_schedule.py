@@ -0,0 +1,92 @@
+"""
+Tests for ingest.retry_schedule: MARK_FAILED_SQL parameters and the backoff
+it computes, against the SQLite stand-in.
+"""
+import math
+import random
+
+import pytest
+
+from conftest import query
+
+from ingest.retry_schedule import (
+    BASE_DELAY, JITTER, MARK_FAILED_SQL, MAX_ATTEMPTS, MAX_DELAY, RETRY_STATE_SQL,
+    due_for_resolution, is_permanent, mark_failed_params)
+
+DID = 'did:plc:test'
+
+
+def mark_failed(pool, outcome, rng=random):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(MARK_FAILED_SQL, mark_failed_params(DID, outcome, rng))
+        conn.commit()
+
+
+def author_state(pool):
+    """(failed_attempts, resolution_error, seconds until next_retry_at or None)"""
+    return query(pool, "SELECT failed_attempts, resolution_error, "
+                       "(julianday(next_retry_at) - julianday(resolved_at)) * 86400 "
+                       "FROM authors WHERE did = %s", (DID,))[0]
+
+
+def test_permanent_failures_get_no_jitter():
+    for outcome in ('tombstoned', 'not_found', 'no_handle', 'invalid'):
+        assert is_permanent(outcome)
+        assert mark_failed_params(DID, outcome) == (DID, outcome, None, None)
+
+
+def test_transient_failures_share_one_jitter():
+    assert not is_permanent('timeout')
+    for seed in range(20):
+        did, outcome, insert_jitter, update_jitter = mark_failed_params(DID, 'timeout', random.Random(seed))
+        assert (did, outcome) == (DID, 'timeout')
+        assert insert_jitter == update_jitter
+        assert 1 - JITTER <= insert_jitter <= 1 + JITTER
+
+
+def test_transient_backoff_doubles(pool):
+    jitter = random.Random(7).uniform(1 - JITTER, 1 + JITTER)
+    for attempt in range(1, 4):
+        mark_failed(pool, 'timeout', random.Random(7))
+        attempts, error, delay = author_state(pool)
+        assert (attempts, error) == (attempt, 'timeout')
+        assert delay == pytest.approx(math.floor(min(MAX_DELAY, BASE_DELAY * 2 ** (attempt - 1)) * jitter), abs=1)
+
+
+def test_permanent_failure_clears_the_schedule(pool):
+    mark_failed(pool, 'timeout')
+    mark_failed(pool, 'tombstoned')
+    assert author_state(pool) == (2, 'tombstoned', None)
+
+
+def test_gives_up_after_max_attempts(pool):
+    mark_failed(pool, 'timeout')
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE authors SET failed_attempts = %s WHERE did = %s", (MAX_ATTEMPTS - 1, DID))
+        conn.commit()
+    mark_failed(pool, 'timeout')
+    assert author_state(pool) == (MAX_ATTEMPTS, 'timeout', None)
+
+
+def test_retry_state_reports_due_on_the_database_clock(pool):
+    mark_failed(pool, 'timeout')
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(RETRY_STATE_SQL.format(placeholders='%s'), (DID,))
+        _, handle, resolved_at, next_retry_at, retry_due = cursor.fetchone()
+        assert handle is None and next_retry_at is not None
+        assert not due_for_resolution(resolved_at, retry_due)
+
+        cursor.execute("UPDATE authors SET next_retry_at = DATE_ADD(NOW(), INTERVAL -60 SECOND)")
+        cursor.execute(RETRY_STATE_SQL.format(placeholders='%s'), (DID,))
+        _, _, resolved_at, _, retry_due = cursor.fetchone()
+        assert due_for_resolution(resolved_at, retry_due)
+
+
+def test_due_for_resolution():
+    assert due_for_resolution(None, None)  # never tried
+    assert not due_for_resolution('2026-10-17 00:00:00', None)  # no retry scheduled
+    assert not due_for_resolution('2026-10-17 00:00:00', 0)
+    assert due_for_resolution('2026-10-17 00:00:00', 1)
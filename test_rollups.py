@@ -0,0 +1,88 @@
+"""
+Tests for ingest.rollups.RollupAggregator: per-minute buckets on the
+database clock, take()/restore() around a failed flush and additive upserts
+against the SQLite stand-in.
+"""
+from datetime import datetime, timedelta
+
+from conftest import DownPool, post
+
+from ingest.rollups import RollupAggregator, minute_bucket
+
+
+def test_minute_bucket_floors_to_the_minute():
+    assert minute_bucket(datetime(2026, 10, 17, 12, 34, 56, 789)) == datetime(2026, 10, 17, 12, 34)
+
+
+def test_buckets_follow_the_database_clock():
+    rollups = RollupAggregator(DownPool())
+    db_now = datetime.now() + timedelta(hours=3, minutes=30)
+    rollups.set_db_time(db_now)
+    assert abs(rollups.now() - db_now) < timedelta(seconds=5)
+
+    rollups.add([post(1, author=1, language='en')])
+    (bucket, _, _), = rollups.take()[0]
+    # The ingester's own clock would be 3.5 hours off
+    assert abs(bucket - minute_bucket(db_now)) <= timedelta(minutes=1)
+
+
+def test_add_counts_per_language_and_author():
+    rollups = RollupAggregator(DownPool())
+    rollups.add([post(1, author=1, language='en'), post(1, author=1, language='ja'),
+                 post(2, author=2, language='en'), post(2, author=2, language=None)])
+    language_rows, author_rows = rollups.take()
+
+    assert sorted((language, posts) for _, language, posts in language_rows) == [('', 1), ('en', 2), ('ja', 1)]
+    assert sorted((author_id, posts) for _, author_id, posts in author_rows) == [(1, 2), (2, 2)]
+    assert rollups.take() == ([], [])
+    assert rollups.stats()['posts_counted'] == 4
+
+
+def test_remove_uses_the_saved_at_bucket_and_zero_rows_are_dropped():
+    rollups = RollupAggregator(DownPool())
+    now = datetime(2026, 10, 17, 12, 0, 30)
+    rollups.now = lambda: now
+    rollups.add([post(1, author=1, language='en')])
+    earlier = now - timedelta(hours=1)
+    rollups.remove([(now, 'en', 1), (earlier, None, 2)])
+    language_rows, author_rows = rollups.take()
+
+    # The fresh post cancels out; the old one is a negative delta for its own minute
+    assert language_rows == [(minute_bucket(earlier), '', -1)]
+    assert author_rows == [(minute_bucket(earlier), 2, -1)]
+    assert rollups.stats()['posts_uncounted'] == 2
+
+
+def test_failed_flush_restores_the_buckets():
+    rollups = RollupAggregator(DownPool())
+    rollups.now = lambda: datetime(2026, 10, 17, 12, 0, 30)
+    rollups.add([post(1, author=1, language='en'), post(2, author=2, language='en')])
+    assert rollups.flush() == 0
+
+    stats = rollups.stats()
+    assert stats['flush_errors'] == 1
+    assert stats['flushes'] == 0
+    assert stats['pending_buckets'] == 3
+    rollups.add([post(1, author=1, language='en')])
+    language_rows, author_rows = rollups.take()
+    assert [posts for _, _, posts in language_rows] == [3]
+    assert sorted(posts for _, _, posts in author_rows) == [1, 2]
+
+
+def test_flushes_are_additive_upserts(pool):
+    rollups = RollupAggregator(pool)
+    rollups.start()
+    rollups.add([post(1, author=1, language='en'), post(2, author=2, language='en')])
+    assert rollups.flush() == 3
+    rollups.add([post(1, author=1, language='en')])
+    rollups.stop()
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT language, SUM(posts) FROM post_rollup_language GROUP BY language')
+        assert cursor.fetchall() == [('en', 3)]
+        cursor.execute('SELECT author_id, SUM(posts) FROM post_rollup_author GROUP BY author_id ORDER BY author_id')
+        assert cursor.fetchall() == [(1, 2), (2, 1)]
+    stats = rollups.stats()
+    assert stats['flushes'] == 2
+    assert stats['pending_buckets'] == 0
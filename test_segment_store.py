@@ -0,0 +1,134 @@
+"""
+Tests for ingest.segment_store and compact_segments.py: appends, reads,
+rotation, sealing stale open segments and compaction against the SQLite
+stand-in.
+"""
+import os
+import time
+
+import pytest
+
+from compact_segments import compact_segment, live_records, seal_stale_segments
+from ingest.codec import RecordCodec
+from ingest.dedupe import PostDelete, PostUpdate
+from ingest.post_writer import PostWriter
+from ingest.segment_store import (
+    INSERT_POSTS_SEGMENT_SQL, SegmentReader, SegmentWriter, list_segments, segment_path)
+
+
+def blobs(count, size=100):
+    return [bytes([i % 256]) * size for i in range(count)]
+
+
+def test_append_and_read_back(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    reader = SegmentReader(str(tmp_path))
+    data = blobs(5)
+    refs = writer.append_many(data)
+
+    assert [(segment, offset) for segment, offset, _ in refs] == [(1, i * 100) for i in range(5)]
+    # Readable from the open segment before it is sealed
+    assert [reader.read(*ref) for ref in refs] == data
+    assert list_segments(str(tmp_path)) == [(1, False, segment_path(str(tmp_path), 1, sealed=False))]
+
+    # The open segment grows: a read past the current map remaps it
+    more = writer.append_many([b'x' * 50])
+    assert reader.read(*more[0]) == b'x' * 50
+
+    writer.close()
+    reader.close()
+    assert list_segments(str(tmp_path)) == [(1, True, segment_path(str(tmp_path), 1))]
+    assert SegmentReader(str(tmp_path)).read(*refs[2]) == data[2]
+
+
+def test_rotates_at_max_segment_bytes(tmp_path):
+    writer = SegmentWriter(str(tmp_path), max_segment_bytes=250)
+    refs = writer.append_many(blobs(5))
+    writer.close()
+
+    assert [segment for segment, _, _ in refs] == [1, 1, 2, 2, 3]
+    assert [(segment, sealed) for segment, sealed, _ in list_segments(str(tmp_path))] == [(1, True), (2, True),
+                                                                                          (3, True)]
+    assert writer.stats()['segments_sealed'] == 3
+
+
+def test_read_past_the_end_raises(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    segment, offset, length = writer.append_many(blobs(1))[0]
+    writer.close()
+    with pytest.raises(ValueError):
+        SegmentReader(str(tmp_path)).read(segment, offset, length + 1)
+    with pytest.raises(FileNotFoundError):
+        SegmentReader(str(tmp_path)).read(99, 0, 1)
+
+
+def test_externalize_rows_keeps_row_types(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    codec = RecordCodec()
+    post = (1, 'hello', None, 'en', 'at://did:plc:test/app.bsky.feed.post/1', codec.encode({'text': 'hello'}))
+    delete = PostDelete('at://did:plc:test/app.bsky.feed.post/2')
+
+    rows = writer.externalize_rows([post, delete, PostUpdate(post)])
+
+    assert rows[0][:5] == post[:5] and rows[0][5:] == (1, 0, len(post[5]))
+    assert rows[1] is delete
+    assert isinstance(rows[2], PostUpdate) and rows[2][5] == 1
+    assert SegmentReader(str(tmp_path)).record(*rows[2][5:])['text'] == 'hello'
+
+
+def make_stale(path):
+    stale = time.time() - 3600
+    os.utime(path, (stale, stale))
+
+
+def test_seal_stale_segments_skips_held_segments(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    writer.append_many(blobs(1))
+    open_path = segment_path(str(tmp_path), 1, sealed=False)
+    make_stale(open_path)
+
+    seal_stale_segments(str(tmp_path), stale_minutes=10)
+    assert os.path.exists(open_path)  # the writer still holds its flock
+
+    writer.close(seal=False)  # like a crashed writer: the lock goes, the file stays open-named
+    seal_stale_segments(str(tmp_path), stale_minutes=10)
+    assert list_segments(str(tmp_path)) == [(1, True, segment_path(str(tmp_path), 1))]
+
+
+def test_seal_stale_segments_leaves_recent_ones(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    writer.append_many(blobs(1))
+    writer.close(seal=False)
+    seal_stale_segments(str(tmp_path), stale_minutes=10)
+    assert list_segments(str(tmp_path))[0][1] is False
+
+
+def test_compaction_repoints_live_rows(tmp_path, pool):
+    directory = str(tmp_path / 'segments')
+    segments = SegmentWriter(directory)
+    writer = PostWriter(pool, insert_sql=INSERT_POSTS_SEGMENT_SQL, prepare_batch=segments.externalize_rows,
+                        max_delay=0.01)
+    writer.start()
+    codec = RecordCodec()
+    for n in range(4):
+        writer.submit((1, f'post {n}', None, 'en', f'at://did:plc:test/app.bsky.feed.post/{n}',
+                       codec.encode({'text': f'post {n}'})))
+    writer.close()
+    segments.close()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM posts WHERE text IN ('post 0', 'post 2')")  # retention
+        conn.commit()
+
+        records = live_records(cursor, 1)
+        assert len(records) == 2
+        reader = SegmentReader(directory)
+        compactor = SegmentWriter(directory)
+        compact_segment(conn, reader, compactor, 1, records)
+        compactor.close()
+
+        assert live_records(cursor, 1) == []
+        cursor.execute('SELECT text, raw_segment, raw_offset, raw_length FROM posts ORDER BY id')
+        rows = cursor.fetchall()
+    assert [segment for _, segment, _, _ in rows] == [2, 2]
+    assert [SegmentReader(directory).record(*ref)['text'] for _, *ref in rows] == ['post 1', 'post 3']
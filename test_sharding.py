@@ -0,0 +1,170 @@
+"""
+Tests for ingest.sharding: hash ring ownership and movement, batch framing,
+the TCP authkey rule, per-router cursors on a worker and a router losing a
+worker.
+"""
+import libipld
+import pytest
+
+from ingest import sharding
+from ingest.sharding import (
+    HashRing, ReceiverCursors, ShardRouter, _Shard, check_authkey, pack_frames, parse_address, unpack_frames)
+
+MEMBERS = ['/tmp/shard0.sock', '/tmp/shard1.sock', '/tmp/shard2.sock', '/tmp/shard3.sock']
+
+
+def test_owner_is_stable_and_uses_every_member():
+    ring = HashRing(MEMBERS)
+    same = HashRing(list(reversed(MEMBERS)))
+    keys = [f'did:plc:key{i}' for i in range(2000)]
+
+    assert [ring.owner(key) for key in keys] == [same.owner(key) for key in keys]
+    assert {ring.owner(key) for key in keys} == set(MEMBERS)
+
+
+def test_identical_rings_move_nothing():
+    assert HashRing(MEMBERS).moved_fraction(HashRing(MEMBERS)) == 0
+
+
+def test_adding_a_member_moves_about_its_share():
+    ring = HashRing(MEMBERS)
+    grown = HashRing(MEMBERS + ['/tmp/shard4.sock'])
+
+    # Consistent hashing: only the new member's share moves, about 1/5
+    assert 0.1 < ring.moved_fraction(grown) < 0.3
+    moved_to = {grown.owner(f'did:plc:key{i}') for i in range(2000)
+                if ring.owner(f'did:plc:key{i}') != grown.owner(f'did:plc:key{i}')}
+    assert moved_to == {'/tmp/shard4.sock'}
+
+
+def test_removing_a_member_moves_only_its_keys():
+    ring = HashRing(MEMBERS)
+    shrunk = HashRing(MEMBERS[:-1])
+    for i in range(2000):
+        key = f'did:plc:key{i}'
+        if ring.owner(key) != MEMBERS[-1]:
+            assert shrunk.owner(key) == ring.owner(key)
+
+
+def test_empty_ring_raises():
+    with pytest.raises(ValueError):
+        HashRing([]).owner('did:plc:key')
+
+
+def test_pack_unpack_round_trip():
+    frames = [b'', b'\x00' * 3, b'frame' * 100]
+    assert unpack_frames(pack_frames(frames)) == frames
+    assert unpack_frames(pack_frames([])) == []
+
+
+def test_unpack_rejects_overrun():
+    message = pack_frames([b'abcdef'])
+    with pytest.raises(ValueError):
+        unpack_frames(message[:-1])
+
+
+def test_parse_address():
+    assert parse_address('10.0.0.1:7000') == ('10.0.0.1', 7000)
+    assert parse_address(':7000') == ('localhost', 7000)
+    assert parse_address('/run/shard0.sock') == '/run/shard0.sock'
+
+
+def test_tcp_needs_an_authkey(monkeypatch):
+    monkeypatch.setattr(sharding, 'SHARD_AUTHKEY', None)
+    check_authkey('/run/shard0.sock')  # Unix sockets rely on file permissions
+    with pytest.raises(ValueError):
+        check_authkey(('10.0.0.1', 7000))
+
+    monkeypatch.setattr(sharding, 'SHARD_AUTHKEY', b'secret')
+    check_authkey(('10.0.0.1', 7000))
+
+
+def test_receiver_cursors_track_each_router():
+    cursors = ReceiverCursors()
+    cursors.add(1)
+    cursors.add(2)
+    cursors.begin((1, 10), 1)
+    cursors.begin((2, 500), 1)
+    cursors.begin(None, 1)
+    cursors.rows_committed([(1, 10), None])
+
+    assert cursors.committed_seq(1) == 10
+    assert cursors.committed_seq(2) is None
+    stats = cursors.stats()
+    assert stats['received_seq'] == 500
+    assert stats['frames_in_flight'] == 1
+
+    cursors.remove(2)
+    assert cursors.committed_seq(2) is None
+    assert cursors.stats()['frames_in_flight'] == 0
+
+
+def commit_frame(seq, did):
+    return libipld.encode_dag_cbor({'op': 1, 't': '#commit'}) + libipld.encode_dag_cbor({'seq': seq, 'repo': did})
+
+
+class Connection:
+    """Worker connection stand-in; fails every send once `broken` is set"""
+
+    def __init__(self):
+        self.sent = []
+        self.broken = False
+
+    def send_bytes(self, message):
+        if self.broken:
+            raise BrokenPipeError(32, 'Broken pipe')
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+def router_with_shards(addresses):
+    router = ShardRouter([], batch_size=1)
+    for address in addresses:
+        router.shards[address] = _Shard(address)
+        router.shards[address].conn = Connection()
+    router.ring = HashRing(router.shards)
+    return router
+
+
+def did_owned_by(router, address):
+    return next(f'did:plc:key{i}' for i in range(10000) if router.ring.owner(f'did:plc:key{i}') == address)
+
+
+def test_lost_worker_stalls_the_cursor_and_keeps_its_frames():
+    router = router_with_shards(['a', 'b'])
+    a, b = router.shards['a'], router.shards['b']
+    did_a, did_b = did_owned_by(router, 'a'), did_owned_by(router, 'b')
+
+    router.route(commit_frame(1, did_a))
+    router.route(commit_frame(2, did_b))
+    a.acked_seq, b.acked_seq = 1, 2
+    assert router.committed_seq == 2
+
+    a.conn.broken = True
+    router.route(commit_frame(3, did_a))  # the send fails: no exception reaches the receiver
+    assert not a.connected
+    assert a.buffer == [commit_frame(3, did_a)]
+
+    router.route(commit_frame(4, did_a))  # not routed to the lost worker at all
+    router.route(commit_frame(5, did_b))
+    b.acked_seq = 5
+    assert a.sent_seq == 3
+    assert unpack_frames(b.conn.sent[-1]) == [commit_frame(5, did_b)]
+    # Worker a only committed up to seq 1, and never got 3 and 4
+    assert router.committed_seq == 2
+    stats = router.stats()
+    assert stats['stalled'] and stats['stalled_at'] == 1
+    assert stats['frames_undelivered'] == 2
+
+
+def test_lost_worker_before_any_ack_freezes_the_cursor():
+    router = router_with_shards(['a'])
+    router.received_seq = router._committed_seq = None
+    router.shards['a'].conn.broken = True
+    router.route(commit_frame(1, did_owned_by(router, 'a')))
+
+    assert router.committed_seq is None
+    assert router.stats()['stalled_at'] is None
+    assert router.close(drain_timeout=0) is None
@@ -0,0 +1,79 @@
+"""
+Tests for ingest.single_flight.SingleFlight: one flight per key, the
+max_keys bound and restarting stale flights.
+"""
+import threading
+
+from ingest import single_flight
+from ingest.single_flight import SingleFlight
+
+
+def test_joins_coalesce_until_completed():
+    flights = SingleFlight()
+    assert flights.join('did:plc:a')
+    assert not flights.join('did:plc:a')
+    assert not flights.join('did:plc:a')
+    assert flights.join('did:plc:b')
+
+    flights.complete('did:plc:a')
+    flights.complete('did:plc:a')  # completing twice is harmless
+    assert flights.join('did:plc:a')
+
+    assert flights.stats() == {'started': 3, 'coalesced': 2, 'completed': 1, 'keys_rejected': 0,
+                               'stale_restarted': 0, 'max_flights': 2, 'flights': 2}
+
+
+def test_max_keys_rejects_new_keys_only():
+    flights = SingleFlight(max_keys=2)
+    assert flights.join('a') and flights.join('b')
+    assert not flights.join('c')
+    assert not flights.join('a')  # open flights still coalesce
+
+    flights.complete('a')
+    assert flights.join('c')
+    stats = flights.stats()
+    assert stats['keys_rejected'] == 1
+    assert stats['coalesced'] == 1
+    assert stats['max_flights'] == 2
+
+
+def test_stale_flights_are_restarted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(single_flight.time, 'monotonic', lambda: now[0])
+    flights = SingleFlight(stale_after=300)
+    assert flights.join('a')
+
+    now[0] += 299
+    assert not flights.join('a')
+    now[0] += 2
+    assert flights.join('a')
+    # The restart counts from now
+    now[0] += 299
+    assert not flights.join('a')
+
+    stats = flights.stats()
+    assert (stats['started'], stats['stale_restarted'], stats['coalesced']) == (1, 1, 2)
+    assert stats['flights'] == 1
+
+
+def test_one_caller_starts_each_flight_across_threads():
+    flights = SingleFlight()
+    starters = []
+    barrier = threading.Barrier(8)
+
+    def join():
+        barrier.wait()
+        for i in range(200):
+            if flights.join(f'did:plc:{i}'):
+                starters.append(i)
+
+    threads = [threading.Thread(target=join) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(starters) == list(range(200))
+    stats = flights.stats()
+    assert stats['started'] == 200
+    assert stats['coalesced'] == 7 * 200